@@ -1,5 +1,8 @@
-from typing import Generator
+import hmac
+from typing import Generator, Optional
+from fastapi import Header, HTTPException
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.core.database import SessionLocal
 
 
@@ -10,3 +13,15 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+        Admin dependency. Admin endpoints do not exist (404) unless
+        ADMIN_TOKEN is set, and need it in the X-Admin-Token header.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(
+            x_admin_token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
@@ -1,7 +1,13 @@
 from fastapi import APIRouter
 from app.api.v1.endpoints import birds
 from app.api.v1.endpoints import ai_agent
+from app.api.v1.endpoints import admin
+from app.api.v1.endpoints import images
+from app.api.v1.endpoints import audio
 api_router = APIRouter()
 
 api_router.include_router(birds.router, prefix="/birds", tags=["birds"])
 api_router.include_router(ai_agent.router, prefix="/ai", tags=["AI Agent"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
+api_router.include_router(images.router, prefix="/images", tags=["images"])
+api_router.include_router(audio.router, prefix="/audio", tags=["audio"])
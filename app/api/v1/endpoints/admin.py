@@ -0,0 +1,87 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.api import deps
+from app.core.profiling import collapse, continuous_profiler, profile_store
+from app.core.query_monitor import query_monitor
+from app.schemas.admin import (
+    ContinuousProfilingStatus,
+    ContinuousProfilingUpdate,
+    ProfileInfo,
+    SQLMonitorStatus,
+    SQLMonitorUpdate,
+)
+
+router = APIRouter(dependencies=[Depends(deps.require_admin)])
+
+
+@router.get("/sql", response_model=SQLMonitorStatus)
+def read_sql_monitor():
+    """
+        SQL instrumentation options and the recent slow queries.
+    """
+    return SQLMonitorStatus(**query_monitor.options(),
+                            slow_queries=query_monitor.slow_queries())
+
+
+@router.put("/sql", response_model=SQLMonitorStatus)
+def update_sql_monitor(options: SQLMonitorUpdate):
+    """
+        Switch SQL instrumentation options at runtime. Omitted fields are
+        left unchanged.
+    """
+    query_monitor.configure(**options.dict(exclude_unset=True))
+    return SQLMonitorStatus(**query_monitor.options(),
+                            slow_queries=query_monitor.slow_queries())
+
+
+@router.delete("/sql/slow-queries", response_model=SQLMonitorStatus)
+def clear_slow_queries():
+    """
+        Forget the recorded slow queries and cached query plans.
+    """
+    query_monitor.clear()
+    return SQLMonitorStatus(**query_monitor.options())
+
+
+@router.get("/profiles", response_model=List[ProfileInfo])
+def read_profiles():
+    """
+        Stored request profiles, newest first. Profile a request by adding
+        ``?profile=1`` and the X-Admin-Token header to it.
+    """
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def read_profile(profile_id: str):
+    """
+        Collapsed-stack report of a request profile.
+    """
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile["collapsed"]
+
+
+@router.get("/profiling/continuous", response_class=PlainTextResponse)
+def read_continuous_profile(
+    windows: Optional[int] = Query(None, ge=0,
+                                   description="Number of past windows"),
+):
+    """
+        Collapsed-stack report aggregated over the last ``windows``
+        windows of continuous sampling and the current one.
+    """
+    return collapse(continuous_profiler.counts(windows))
+
+
+@router.put("/profiling/continuous",
+            response_model=ContinuousProfilingStatus)
+def update_continuous_profiling(options: ContinuousProfilingUpdate):
+    """
+        Start, stop or retune continuous low-rate sampling.
+    """
+    return continuous_profiler.configure(**options.dict(exclude_unset=True))
@@ -1,41 +1,156 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from fastapi.security import HTTPBearer
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import hashlib
 import time
 import logging
-from typing import Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional
 
-from app.core.ai_agent import BirdNestAIAgent
-from app.schemas.ai_agent import ChatRequest, ChatResponse, HealthResponse
+from app.core.admission import EXPENSIVE, Overloaded, admission
+from app.core.ai_agent import (
+    BirdNestAIAgent,
+    upstream_breaker,
+    upstream_hedger,
+    upstream_limiter,
+)
+from app.core.analytics import CONVERSATION_LOG, record_conversation
+from app.core.config import settings
+from app.core.jobs import job_queue
+from app.core.query_monitor import TimedRoute
+from app.core.rate_limit import RateLimitExceeded, rate_limiter, usage_ledger
+from app.core.resilience import UpstreamUnavailableError, retry_after_header
+from app.core.sessions import session_store
+from app.core.tracing import traced
+from app.schemas.ai_agent import (
+    ChatBatchItem,
+    ChatBatchRequest,
+    ChatBatchResult,
+    ChatRequest,
+    ChatResponse,
+    HealthResponse,
+    UsageResponse,
+)
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 security = HTTPBearer(auto_error=False)
 
 # Global AI agent instance (initialize once)
 ai_agent: Optional[BirdNestAIAgent] = None
+# Monotonic time of the last failed initialization
+_init_failed_at: Optional[float] = None
 
 
 def get_ai_agent() -> BirdNestAIAgent:
     """
         Dependency to get AI agent instance
+
+        A failed initialization is not retried for
+        AGENT_INIT_RETRY_SECONDS, requests fail fast in the meantime.
     """
-    global ai_agent
+    global ai_agent, _init_failed_at
     if ai_agent is None:
+        if _init_failed_at is not None:
+            wait = (_init_failed_at + settings.AGENT_INIT_RETRY_SECONDS
+                    - time.monotonic())
+            if wait > 0:
+                raise HTTPException(
+                    status_code=503,
+                    detail="AI Agent service is currently unavailable",
+                    headers={"Retry-After": retry_after_header(wait)}
+                )
         try:
             ai_agent = BirdNestAIAgent()
+            _init_failed_at = None
         except Exception as e:
             logger.error(f"Failed to initialize AI agent: {str(e)}")
+            _init_failed_at = time.monotonic()
             raise HTTPException(
                 status_code=503,
-                detail="AI Agent service is currently unavailable"
+                detail="AI Agent service is currently unavailable",
+                headers={"Retry-After": retry_after_header(
+                    settings.AGENT_INIT_RETRY_SECONDS)}
             )
     return ai_agent
 
 
+def _rate_limit_identities(
+    http_request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials],
+    session_id: Optional[str] = None
+) -> Dict[str, Optional[str]]:
+    """
+        Identities a request is rate limited under. API keys are hashed so
+        raw credentials are never kept in the bucket store.
+    """
+    key = None
+    if credentials is not None:
+        key = hashlib.sha256(credentials.credentials.encode()).hexdigest()[:32]
+    return {
+        "key": key,
+        "ip": http_request.client.host if http_request.client else None,
+        "session": session_id,
+    }
+
+
+@traced("ai.rate_limit")
+def _enforce_rate_limit(identities: Dict[str, Optional[str]],
+                        cost: int = 1) -> Dict[str, str]:
+    """
+        Count a request against the rate limits or raise a 429.
+    """
+    try:
+        return rate_limiter.hit(identities, cost=cost)
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e),
+                            headers=e.headers())
+
+
+def _account_usage(identities: Dict[str, Optional[str]],
+                   session_id: Optional[str], result: Optional[dict]) -> None:
+    """
+        Charge upstream token usage to the rate limits and the session.
+    """
+    usage = (result or {}).get("usage")
+    if usage:
+        rate_limiter.charge_tokens(identities, usage.get("total_tokens", 0))
+    if session_id:
+        usage_ledger.record(session_id, usage)
+
+
+@traced("ai.query")
+def _query_with_session(agent: BirdNestAIAgent,
+                        request: ChatRequest) -> Optional[dict]:
+    """
+        Query the agent with the session's prior turns and record the new
+        exchange. Runs in the threadpool (the store may hit the database).
+    """
+    history = None
+    if request.session_id:
+        history = session_store.get_history(request.session_id)
+
+    result = agent.query_agent(
+        user_input=request.message,
+        include_retrieval=request.include_retrieval,
+        history=history
+    )
+
+    if (request.session_id and result and result.get("success")
+            and result.get("responses")):
+        session_store.append_exchange(request.session_id, request.message,
+                                      "\n\n".join(result["responses"]))
+    return result
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_agent(
     request: ChatRequest,
-    background_tasks: BackgroundTasks,
+    http_request: Request,
+    response: Response,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
     agent: BirdNestAIAgent = Depends(get_ai_agent),
 
 ):
@@ -45,18 +160,25 @@ async def chat_with_agent(
         - **message**: The message to send to the AI agent
         - **include_retrieval**: Whether to include
           retrieval information in the response
-        - **session_id**: Optional session ID for conversation tracking
+        - **session_id**: Optional session ID; earlier turns of the
+          session are sent along as conversation history
+
+        Requests are rate limited per API key, client IP and session, both
+        in requests and in upstream tokens; `429` responses carry
+        `Retry-After` and `X-RateLimit-*` headers.
     """
     start_time = time.time()
+    identities = _rate_limit_identities(http_request, credentials,
+                                        request.session_id)
+    # The limiter's store may be SQLite: off the event loop
+    response.headers.update(
+        await run_in_threadpool(_enforce_rate_limit, identities))
 
     try:
         logger.info(f"Processing chat request: {request.message[:50]}...")
 
-        # Query the AI agent
-        result = agent.query_agent(
-            user_input=request.message,
-            include_retrieval=request.include_retrieval
-        )
+        # Query the AI agent off the event loop
+        result = await run_in_threadpool(_query_with_session, agent, request)
 
         if not result:
             raise HTTPException(
@@ -64,10 +186,14 @@ async def chat_with_agent(
                 detail="Failed to get response from AI agent"
             )
 
+        await run_in_threadpool(_account_usage, identities,
+                                request.session_id, result)
+
         processing_time = time.time() - start_time
 
-        # Log conversation for analytics (background task)
-        background_tasks.add_task(
+        # Log conversation for analytics (queued, written in batches);
+        # queueing is a SQLite insert, so off the event loop
+        await run_in_threadpool(
             log_conversation,
             request.message,
             result,
@@ -82,11 +208,19 @@ async def chat_with_agent(
             message_count=result.get("message_count"),
             original_query=result.get("original_query"),
             error=result.get("error"),
-            processing_time=processing_time
+            processing_time=processing_time,
+            usage=result.get("usage")
         )
 
     except HTTPException:
         raise
+    except UpstreamUnavailableError as e:
+        logger.warning(f"AI agent call refused: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": retry_after_header(e.retry_after)}
+        )
     except Exception as e:
         logger.error(f"Unexpected error in chat endpoint: {str(e)}")
         raise HTTPException(
@@ -95,53 +229,252 @@ async def chat_with_agent(
         )
 
 
+@router.post("/chat/batch", response_class=StreamingResponse,
+             responses={200: {"content": {"application/x-ndjson": {}},
+                              "description": "One ChatBatchResult per line"}})
+async def chat_batch(
+    request: ChatBatchRequest,
+    http_request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    agent: BirdNestAIAgent = Depends(get_ai_agent),
+):
+    """
+        Run many chat requests with bounded parallelism.
+
+        Results are streamed as NDJSON, one `ChatBatchResult` per line in
+        completion order. A failing item produces an error line and does
+        not abort the batch.
+
+        - **items**: Chat requests, each with a unique `id`
+        - **parallelism**: Maximum concurrent items (capped by the server)
+        - **completed_ids**: Ids the client already has; send the ids
+          received so far to resume an interrupted batch
+
+        Each item takes an expensive admission slot while it runs; items
+        shed during overload produce retryable error lines.
+
+        Each item counts as one request against the API key and client IP
+        rate limits when it starts. A batch is refused only if those limits
+        are already exhausted; items that start once they run out produce
+        retryable error lines, to resend with `completed_ids` later.
+    """
+    if len(request.items) > settings.AI_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch may contain at most "
+                   f"{settings.AI_BATCH_MAX_ITEMS} items"
+        )
+
+    completed = set(request.completed_ids)
+    pending = [item for item in request.items if item.id not in completed]
+    parallelism = min(request.parallelism or settings.AI_BATCH_MAX_PARALLELISM,
+                      settings.AI_BATCH_MAX_PARALLELISM)
+    identities = _rate_limit_identities(http_request, credentials)
+    # Charges the first item; the others are charged as they start
+    headers = await run_in_threadpool(_enforce_rate_limit, identities)
+
+    logger.info(f"Processing chat batch: {len(pending)} items "
+                f"({len(completed)} already completed), "
+                f"parallelism {parallelism}")
+
+    return StreamingResponse(
+        _stream_batch(agent, pending, parallelism, identities,
+                      getattr(http_request.state, "release_admission", None)),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
+
+
+async def _run_batch_item(agent: BirdNestAIAgent, item: ChatBatchItem,
+                          identities: Dict[str, Optional[str]],
+                          charged: bool = False) -> ChatBatchResult:
+    """
+        Admit one batch item like a chat request and run it.
+    """
+    if not admission.enabled:
+        return await _process_batch_item(agent, item, identities, charged)
+    try:
+        await admission.acquire(EXPENSIVE)
+    except Overloaded:
+        return ChatBatchResult(
+            id=item.id, success=False, retryable=True,
+            error="Server is overloaded, please retry shortly")
+    try:
+        return await _process_batch_item(agent, item, identities, charged)
+    finally:
+        admission.release(EXPENSIVE)
+
+
+async def _process_batch_item(agent: BirdNestAIAgent, item: ChatBatchItem,
+                              identities: Dict[str, Optional[str]],
+                              charged: bool) -> ChatBatchResult:
+    """
+        Run one batch item, turning every failure into an error result.
+        Unless already ``charged``, the item counts as one request against
+        the rate limits first.
+    """
+    start_time = time.time()
+    if not charged:
+        try:
+            await run_in_threadpool(rate_limiter.hit, identities)
+        except RateLimitExceeded as e:
+            return ChatBatchResult(id=item.id, success=False, error=str(e),
+                                   retryable=True,
+                                   processing_time=time.time() - start_time)
+    try:
+        result = await run_in_threadpool(_query_with_session, agent, item)
+    except UpstreamUnavailableError as e:
+        return ChatBatchResult(id=item.id, success=False, error=str(e),
+                               retryable=True,
+                               processing_time=time.time() - start_time)
+    except Exception as e:
+        logger.error(f"Unexpected error in batch item {item.id}: {str(e)}")
+        return ChatBatchResult(
+            id=item.id, success=False,
+            error="An unexpected error occurred while processing this item",
+            processing_time=time.time() - start_time)
+
+    result = result or {"success": False,
+                        "error": "Failed to get response from AI agent"}
+    processing_time = time.time() - start_time
+    await run_in_threadpool(_account_usage, identities, item.session_id,
+                            result)
+    await run_in_threadpool(log_conversation, item.message, result,
+                            item.session_id, processing_time)
+
+    return ChatBatchResult(
+        id=item.id,
+        success=result.get("success", False),
+        responses=result.get("responses"),
+        message_count=result.get("message_count"),
+        original_query=result.get("original_query"),
+        error=result.get("error"),
+        processing_time=processing_time
+    )
+
+
+async def _stream_batch(agent: BirdNestAIAgent, items: List[ChatBatchItem],
+                        parallelism: int,
+                        identities: Dict[str, Optional[str]],
+                        release_admission: Optional[Callable[[], None]] = None
+                        ) -> AsyncIterator[str]:
+    """
+        Fan the items out to `parallelism` workers and yield NDJSON lines
+        as results complete. The batch's own admission slot is given back
+        first, each item is admitted as it starts.
+    """
+    if release_admission is not None:
+        release_admission()
+    results: asyncio.Queue = asyncio.Queue()
+    pending = enumerate(items)
+
+    async def worker():
+        # The iterator is shared, each worker pulls the next unstarted item.
+        # The first was charged when the batch was accepted
+        for position, item in pending:
+            await results.put(await _run_batch_item(
+                agent, item, identities, charged=position == 0))
+
+    workers = [asyncio.create_task(worker())
+               for _ in range(min(parallelism, len(items)))]
+    try:
+        for _ in range(len(items)):
+            result = await results.get()
+            yield result.model_dump_json() + "\n"
+    finally:
+        # Client went away or we are done: stop starting new items
+        for task in workers:
+            task.cancel()
+
+
+@router.get("/usage/{session_id}", response_model=UsageResponse)
+async def session_usage(session_id: str):
+    """
+        Upstream request and token usage of a session.
+    """
+    usage = usage_ledger.get(session_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return UsageResponse(session_id=session_id, **usage)
+
+
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
     """
         Check the health status of the AI agent service.
     """
+    circuit_state = upstream_breaker.state
+    upstream = {
+        "circuit": upstream_breaker.snapshot(),
+        "concurrency": upstream_limiter.snapshot(),
+    }
+    if settings.AGENT_HEDGING:
+        upstream["hedging"] = upstream_hedger.stats()
+    sessions = session_store.stats()
+    analytics = job_queue.stats(CONVERSATION_LOG)
+
     try:
         # Try to get AI agent instance
         agent = get_ai_agent()
-        ai_agent_available = agent is not None and agent.client is not None
+        ai_agent_available = (agent is not None and agent.client is not None
+                              and circuit_state != upstream_breaker.OPEN)
+
+        if not ai_agent_available:
+            status = "unhealthy"
+        elif circuit_state == upstream_breaker.HALF_OPEN:
+            status = "degraded"
+        else:
+            status = "healthy"
 
         return HealthResponse(
-            status="healthy" if ai_agent_available else "unhealthy",
-            ai_agent_available=ai_agent_available
+            status=status,
+            ai_agent_available=ai_agent_available,
+            circuit_state=circuit_state,
+            upstream=upstream,
+            sessions=sessions,
+            analytics=analytics
         )
 
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         return HealthResponse(
             status="unhealthy",
-            ai_agent_available=False
+            ai_agent_available=False,
+            circuit_state=circuit_state,
+            upstream=upstream,
+            sessions=sessions,
+            analytics=analytics
         )
 
 
-async def log_conversation(
+@traced("ai.log_conversation")
+def log_conversation(
     message: str,
     result: dict,
     session_id: Optional[str],
     processing_time: float
 ):
     """
-        Background task to log conversation for analytics.
+        Log conversation for analytics.
+
+        Only queues a conversation_log job; the job workers write the
+        records to the conversation_logs table in batches.
     """
     try:
         # Log conversation details
         log_data = {
             "message": message[:100],  # Truncate for privacy
-            "success": result.get("success", False),
-            "response_count": result.get("message_count", 0),
+            "success": bool(result.get("success", False)),
+            "response_count": result.get("message_count") or 0,
             "session_id": session_id,
             "processing_time": processing_time,
-            "timestamp": time.time()
+            "logged_at": time.time()
         }
 
-        logger.info(f"Conversation logged: {log_data}")
+        logger.debug(f"Conversation logged: {log_data}")
 
-        # Here you could save to database, send to analytics service or somen',
-        # but I dont have enough time rn.
+        # Queue depth and failed jobs are reported in /ai/health
+        record_conversation(log_data)
 
     except Exception as e:
         logger.error(f"Failed to log conversation: {str(e)}")
@@ -0,0 +1,83 @@
+import os
+from typing import Any, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
+
+from app.core.audio import (
+    RangeFileResponse,
+    RangeNotSatisfiable,
+    audio_bytes,
+    audio_requests,
+    audio_store,
+    parse_range,
+)
+from app.core.images import IMMUTABLE, REVALIDATE
+from app.core.query_monitor import TimedRoute
+from app.core.tracing import traced
+
+router = APIRouter(route_class=TimedRoute)
+
+
+def _source(path: str) -> str:
+    source = audio_store.original(path)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    return source
+
+
+# HEAD is left out of the schema: one operation id per route
+@router.get("/files/{path:path}")
+@router.head("/files/{path:path}", include_in_schema=False)
+async def read_audio(*, path: str, request: Request,
+                     v: Optional[str] = Query(
+                         None, description="File version; responses for "
+                         "the current one are immutable"),) -> Any:
+    """
+        An audio file, or the byte range asked for with ``Range``.
+    """
+    source = _source(path)
+    stat = os.stat(source)
+    version = audio_store.version(stat)
+    etag = f'"{version}"'
+    headers = {"ETag": etag,
+               "Cache-Control": IMMUTABLE if v == version else REVALIDATE}
+
+    if etag in request.headers.get("if-none-match", ""):
+        audio_requests.inc("not_modified")
+        return Response(status_code=304, headers=headers)
+    # A Range that applies to another version of the file is ignored
+    if_range = request.headers.get("if-range")
+    range_header = (request.headers.get("range")
+                    if if_range is None or if_range == etag else None)
+    try:
+        byte_range = parse_range(range_header, stat.st_size)
+    except RangeNotSatisfiable:
+        audio_requests.inc("unsatisfiable")
+        return Response(status_code=416, headers=dict(
+            headers, **{"Content-Range": f"bytes */{stat.st_size}"}))
+
+    response = RangeFileResponse(source, stat.st_size,
+                                 audio_store.media_type(source), byte_range,
+                                 headers)
+    audio_requests.inc("partial" if byte_range else "full")
+    audio_bytes.inc(amount=response.length)
+    return response
+
+
+@router.get("/metadata/{path:path}")
+@traced("audio.read_audio_metadata")
+def read_audio_metadata(*, path: str) -> Any:
+    """
+        Duration (seconds) and waveform peaks of an audio file; the
+        waveform is null for formats it cannot be read from.
+    """
+    source = _source(path)
+    metadata = audio_store.metadata(source, waveform=True)
+    return {
+        "path": path,
+        "media_type": audio_store.media_type(source),
+        "size": os.path.getsize(source),
+        "version": metadata["version"],
+        "duration": metadata["duration"],
+        "waveform": metadata["waveform"],
+    }
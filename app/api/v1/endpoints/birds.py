@@ -1,14 +1,87 @@
 from typing import List, Any
-from fastapi import APIRouter, Depends, HTTPException, Query
+import anyio
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.status import (
+    WS_1001_GOING_AWAY,
+    WS_1008_POLICY_VIOLATION,
+    WS_1013_TRY_AGAIN_LATER,
+)
 
 from app import crud, schemas
 from app.api import deps
+from app.core.compression import bird_documents
+from app.core.config import settings
+from app.core.events import (
+    SLOW_CONSUMER,
+    Subscription,
+    TooManySubscribers,
+    bird_events,
+)
+from app.core.query_monitor import TimedRoute
+from app.core.serialization import (
+    FastJSONResponse,
+    bird_to_dict,
+    dumps,
+    rewrite_media,
+    rewrite_media_raw,
+    rewrites_media,
+)
+from app.core.snapshot import catalog_snapshot
+from app.core.tracing import traced
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
+
+# Most bird_ids one batch read may ask for
+MAX_BATCH_IDS = 100
+
+
+def _raw_reads(db: Session) -> bool:
+    # The raw read path relies on SQLite's JSON functions
+    return (settings.RAW_SQL_READS
+            and db.get_bind().dialect.name == "sqlite")
+
+
+def _json(content: bytes) -> Response:
+    return Response(content, media_type="application/json")
+
+
+def _bird_data(bird) -> Any:
+    """
+        ``schemas.Bird`` content of a row, with local media rewritten.
+    """
+    if rewrites_media():
+        return rewrite_media(bird_to_dict(bird))
+    return bird_to_dict(bird) if settings.FAST_SERIALIZATION else bird
+
+
+def _render_bird(bird) -> bytes:
+    if settings.FAST_SERIALIZATION:
+        return dumps({"success": True, "data": _bird_data(bird)})
+    # The same bytes the response_model path produces
+    return JSONResponse(jsonable_encoder(
+        schemas.BirdResponse(success=True, data=_bird_data(bird)))).body
+
+
+def _birds(birds) -> Any:
+    if settings.FAST_SERIALIZATION:
+        return FastJSONResponse([_bird_data(bird) for bird in birds])
+    if rewrites_media():
+        return [_bird_data(bird) for bird in birds]
+    return birds
 
 
 @router.post("/", response_model=schemas.BirdResponse)
+@traced("birds.create_bird")
 def create_bird(*, db: Session = Depends(deps.get_db),
                 bird_in: schemas.BirdCreate,) -> Any:
     """
@@ -27,25 +100,207 @@ def create_bird(*, db: Session = Depends(deps.get_db),
 
 
 @router.get("/", response_model=List[schemas.Bird])
+@traced("birds.read_birds")
 def read_birds(db: Session = Depends(deps.get_db), skip: int = 0,
                limit: int = Query(default=100, le=100),) -> Any:
     """
         Retrieve birds.
     """
+    snapshot = catalog_snapshot.current()
+    if snapshot is not None:
+        return _json(snapshot.page(skip, limit))
+    if _raw_reads(db):
+        return Response(rewrite_media_raw(crud.bird.get_multi_raw(
+            db, skip=skip, limit=limit)), media_type="application/json")
     birds = crud.bird.get_multi(db, skip=skip, limit=limit)
-    return birds
+    return _birds(birds)
+
+
+@router.get("/batch", response_model=List[schemas.Bird])
+@traced("birds.read_birds_batch")
+def read_birds_batch(*, db: Session = Depends(deps.get_db),
+                     ids: List[str] = Query(
+                         ..., description="bird_ids to get, repeated; "
+                         "unknown ids are skipped"),) -> Any:
+    """
+        Get several birds by ID, in the order requested.
+    """
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {MAX_BATCH_IDS} ids per request"
+        )
+    snapshot = catalog_snapshot.current()
+    if snapshot is not None:
+        return _json(snapshot.batch(ids))
+    if _raw_reads(db):
+        return Response(rewrite_media_raw(crud.bird.get_batch_raw(
+            db, bird_ids=ids)), media_type="application/json")
+    birds = crud.bird.get_batch(db, bird_ids=ids)
+    return _birds(birds)
+
+
+@router.get("/changes", response_model=schemas.BirdChanges)
+@traced("birds.read_bird_changes")
+def read_bird_changes(*, db: Session = Depends(deps.get_db),
+                      since: str = Query(
+                          "0", description="next token of the previous "
+                          "page; 0 reads from the start"),
+                      limit: int = Query(default=100, ge=1, le=1000),) -> Any:
+    """
+        Birds created, updated and deleted since a token, in commit order.
+    """
+    if not since.isdigit():
+        raise HTTPException(status_code=422, detail="Invalid since token")
+    entries, next_seq, has_more = crud.bird.get_changes(
+        db, since=int(since), limit=limit)
+    content = {
+        "changes": [{
+            "seq": change.id,
+            "op": change.op,
+            "bird_id": change.bird_id,
+            "changed_at": change.created_at,
+            "data": _bird_data(bird) if bird is not None else None,
+        } for change, bird in entries],
+        "next": str(next_seq),
+        "has_more": has_more,
+    }
+    if settings.FAST_SERIALIZATION:
+        return FastJSONResponse(content)
+    return content
+
+
+def _subscribe(bird_id: List[str], status: List[str],
+               tag: List[str]) -> Subscription:
+    try:
+        return bird_events.subscribe(bird_ids=bird_id, statuses=status,
+                                     tags=tag)
+    except TooManySubscribers:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many event subscribers, please retry shortly"
+        )
+
+
+async def _event_stream(subscription: Subscription):
+    try:
+        # Sent straight away, so the client knows it is subscribed
+        yield b": subscribed\n\n"
+        while True:
+            event = await subscription.get(timeout=settings.EVENTS_KEEPALIVE)
+            if event is not None:
+                yield event.sse
+            elif subscription.closed is not None:
+                yield (b"event: closed\ndata: "
+                       + dumps({"reason": subscription.closed}) + b"\n\n")
+                return
+            else:
+                yield b": keepalive\n\n"
+    finally:
+        bird_events.unsubscribe(subscription)
+
+
+@router.get("/events", response_class=StreamingResponse,
+            responses={200: {"content": {"text/event-stream": {}},
+                             "description": "Server-Sent Events, one per "
+                             "bird write"}})
+async def stream_bird_events(*, bird_id: List[str] = Query([]),
+                             status: List[str] = Query(
+                                 [], description="Conservation status"),
+                             tag: List[str] = Query(
+                                 [], description="Tag text, any case"),
+                             ) -> Any:
+    """
+        Server-Sent Events for every bird created, updated or deleted,
+        optionally only for the given bird_ids, statuses or tags.
+
+        Each event is named after the operation, with data
+        `{"op", "bird_id", "data"}`; `data` is the bird, null for deletes.
+        A client too slow to keep up gets a final `closed` event and
+        should catch up with `/birds/changes` before subscribing again.
+    """
+    subscription = _subscribe(bird_id, status, tag)
+    return StreamingResponse(
+        _event_stream(subscription), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.websocket("/events")
+async def bird_events_socket(websocket: WebSocket, *,
+                             bird_id: List[str] = Query([]),
+                             status: List[str] = Query([]),
+                             tag: List[str] = Query([]),):
+    """
+        The events of GET /events as WebSocket text messages. The socket
+        is closed with 1008 when the client falls too far behind, and
+        with 1013 when there are too many subscribers.
+    """
+    try:
+        subscription = bird_events.subscribe(bird_ids=bird_id,
+                                             statuses=status, tags=tag)
+    except TooManySubscribers:
+        await websocket.close(code=WS_1013_TRY_AGAIN_LATER)
+        return
+    await websocket.accept()
+
+    async def watch_disconnect(scope: anyio.CancelScope):
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as tasks:
+            tasks.start_soon(watch_disconnect, tasks.cancel_scope)
+            async for event in subscription:
+                await websocket.send_text(event.text)
+            await websocket.close(
+                code=(WS_1008_POLICY_VIOLATION
+                      if subscription.closed == SLOW_CONSUMER
+                      else WS_1001_GOING_AWAY),
+                reason=subscription.closed)
+            tasks.cancel_scope.cancel()
+    finally:
+        bird_events.unsubscribe(subscription)
 
 
 @router.get("/{bird_id}", response_model=schemas.BirdResponse)
-def read_bird(*, db: Session = Depends(deps.get_db), bird_id: str,) -> Any:
+@traced("birds.read_bird")
+def read_bird(*, db: Session = Depends(deps.get_db), bird_id: str,
+              request: Request,) -> Any:
     """Get bird by ID."""
-    bird = crud.bird.get_by_bird_id(db, bird_id=bird_id)
-    if not bird:
+    accept_encoding = (request.headers.get("accept-encoding")
+                       if settings.COMPRESSION_ENABLED else None)
+    snapshot = catalog_snapshot.current()
+    if snapshot is not None:
+        row = snapshot.get(bird_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail="Bird not found")
+        # The document object changes whenever the bird does
+        return bird_documents.response(row.id, row.document,
+                                       lambda: snapshot.response(row),
+                                       accept_encoding)
+    if _raw_reads(db):
+        row = crud.bird.get_document_raw(db, bird_id=bird_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail="Bird not found")
+        id_, version, document = row
+        return bird_documents.response(id_, version,
+                                       lambda: rewrite_media_raw(
+                                           document).encode("utf-8"),
+                                       accept_encoding)
+
+    row = crud.bird.get_with_version(db, bird_id=bird_id)
+    if row is None:
         raise HTTPException(status_code=404, detail="Bird not found")
-    return schemas.BirdResponse(success=True, data=bird)
+    bird, version = row
+    # Serialized and compressed once per version of the bird
+    return bird_documents.response(bird.id, version,
+                                   lambda: _render_bird(bird),
+                                   accept_encoding)
 
 
 @router.put("/{bird_id}", response_model=schemas.BirdResponse)
+@traced("birds.update_bird")
 def update_bird(*, db: Session = Depends(deps.get_db), bird_id: str,
                 bird_in: schemas.BirdUpdate,
                 ) -> Any:
@@ -56,10 +311,13 @@ def update_bird(*, db: Session = Depends(deps.get_db), bird_id: str,
     if not bird:
         raise HTTPException(status_code=404, detail="Bird not found")
     bird = crud.bird.update(db, db_obj=bird, obj_in=bird_in)
+    # The new version misses anyway; this only frees the old entry
+    bird_documents.invalidate(bird.id)
     return schemas.BirdResponse(success=True, data=bird)
 
 
 @router.delete("/{bird_id}", response_model=schemas.BirdResponse)
+@traced("birds.delete_bird")
 def delete_bird(*, db: Session = Depends(deps.get_db), bird_id: str,) -> Any:
     """
         Delete a bird.
@@ -68,10 +326,12 @@ def delete_bird(*, db: Session = Depends(deps.get_db), bird_id: str,) -> Any:
     if not bird:
         raise HTTPException(status_code=404, detail="Bird not found")
     bird = crud.bird.remove(db, id=bird.id)
+    bird_documents.invalidate(bird.id)
     return schemas.BirdResponse(success=True, data=bird)
 
 
 @router.get("/search/name", response_model=List[schemas.Bird])
+@traced("birds.search_birds_by_name")
 def search_birds_by_name(
     *,
     db: Session = Depends(deps.get_db),
@@ -80,11 +340,15 @@ def search_birds_by_name(
     """
         Search birds by name.
     """
+    snapshot = catalog_snapshot.current()
+    if snapshot is not None:
+        return _json(snapshot.search_by_name(name))
     birds = crud.bird.search_by_name(db, name=name)
-    return birds
+    return _birds(birds)
 
 
 @router.get("/search/scientific", response_model=List[schemas.Bird])
+@traced("birds.search_birds_by_scientific_name")
 def search_birds_by_scientific_name(
     *,
     db: Session = Depends(deps.get_db),
@@ -94,12 +358,16 @@ def search_birds_by_scientific_name(
     """
         Search birds by scientific name.
     """
+    snapshot = catalog_snapshot.current()
+    if snapshot is not None:
+        return _json(snapshot.search_by_scientific_name(scientific_name))
     birds = crud.bird.search_by_scientific_name(
         db, scientific_name=scientific_name)
-    return birds
+    return _birds(birds)
 
 
 @router.get("/filter/conservation", response_model=List[schemas.Bird])
+@traced("birds.filter_birds_by_conservation_status")
 def filter_birds_by_conservation_status(
     *,
     db: Session = Depends(deps.get_db),
@@ -108,5 +376,8 @@ def filter_birds_by_conservation_status(
     """
         Filter birds by conservation status.
     """
+    snapshot = catalog_snapshot.current()
+    if snapshot is not None:
+        return _json(snapshot.get_by_conservation_status(status))
     birds = crud.bird.get_by_conservation_status(db, status=status)
-    return birds
+    return _birds(birds)
@@ -0,0 +1,59 @@
+import os
+from typing import Any, Optional
+import anyio
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response
+
+from app.core.images import (
+    FORMATS,
+    IMMUTABLE,
+    ORIGINAL,
+    REVALIDATE,
+    image_requests,
+    image_store,
+)
+from app.core.query_monitor import TimedRoute
+
+router = APIRouter(route_class=TimedRoute)
+
+
+@router.get("/{preset}/{path:path}")
+async def read_image(*, preset: str, path: str, request: Request,
+                     v: Optional[str] = Query(
+                         None, description="Digest of the original; "
+                         "responses for the current one are immutable"),
+                     format: Optional[str] = Query(
+                         None, description="webp or jpeg; negotiated from "
+                         "Accept when omitted"),) -> Any:
+    """
+        An original image, or a derivative scaled down to a preset width.
+    """
+    if preset != ORIGINAL and preset not in image_store.presets:
+        raise HTTPException(status_code=404, detail="Unknown image preset")
+    if format is not None and format not in FORMATS:
+        raise HTTPException(status_code=422,
+                            detail=f"format must be one of {list(FORMATS)}")
+    source = image_store.original(path)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    # Hashes the whole original on a miss
+    digest = await anyio.to_thread.run_sync(image_store.digest, source)
+    headers = {"Cache-Control": IMMUTABLE if v == digest else REVALIDATE}
+    if preset == ORIGINAL or not image_store.available:
+        image_requests.inc("original")
+        etag = f'"{digest}"'
+        target, media_type = source, None
+    else:
+        fmt = format or image_store.negotiate(request.headers.get("accept"))
+        if format is None:
+            headers["Vary"] = "Accept"
+        target = await image_store.derivative(source, preset, fmt, digest)
+        # The file name is the hash of the derivative's inputs
+        etag = f'"{os.path.basename(target).split(".")[0][:32]}"'
+        media_type = FORMATS[fmt]
+    headers["ETag"] = etag
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(target, media_type=media_type, headers=headers)
@@ -0,0 +1,352 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from .config import settings
+from .metrics import registry
+from .resilience import retry_after_header
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+READ = "read"
+EXPENSIVE = "expensive"
+PRIORITIES = (READ, EXPENSIVE)
+
+# Never queued or shed, so probes and scrapes see the overload
+EXEMPT_PATHS = frozenset({"/health", "/health/ready", "/metrics"})
+# Open for as long as the client listens, so they would hold a slot each;
+# capped by EVENTS_MAX_SUBSCRIBERS instead
+STREAM_PATHS = frozenset({f"{settings.API_V1_STR}/birds/events"})
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+QUEUE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                 1.0)
+
+
+class Overloaded(Exception):
+    """
+        Raised when a request is shed instead of admitted.
+    """
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def classify(scope) -> Optional[str]:
+    """
+        Priority of a request: cheap reads before /ai/chat and writes.
+        ``None`` for requests that bypass admission control.
+    """
+    if scope["path"] in EXEMPT_PATHS or scope["path"] in STREAM_PATHS:
+        return None
+    if scope["method"] in READ_METHODS:
+        return READ
+    return EXPENSIVE
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued_at", "future", "timer")
+
+    def __init__(self, priority: str, enqueued_at: float,
+                 future: asyncio.Future):
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+        self.future = future
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class AdmissionController:
+    """
+        Concurrency limit with a CoDel-style queue in front of it.
+
+        At most ``max_concurrency`` requests run at once, expensive ones
+        (``/ai/chat``, writes) at most ``expensive_share`` of them, so
+        reads always find a slot. Requests beyond that wait in one queue
+        per priority; a freed slot goes to a waiting read first.
+
+        Queueing delay is the signal, in two places. When the admission
+        queue has not been empty for a whole ``interval``, requests arrive
+        faster than they complete. Requests also queue before they reach
+        the app, as event loop callbacks; ``monitor`` samples the loop's
+        scheduling lag and keeps the minimum of each ``interval``. Either
+        standing queue means the controller is overloaded.
+
+        While overloaded, waiters are served newest first and give up
+        after ``target_delay`` instead of ``interval``, and new expensive
+        requests are shed straight away. Reads are shed on arrival only
+        while the loop lag exceeds a whole ``interval``. Shed requests
+        get a fast 503 with ``Retry-After``.
+
+        Runs on the event loop; not thread-safe.
+    """
+
+    PROBE_INTERVAL = 0.01
+
+    def __init__(self, enabled: bool = True, max_concurrency: int = 40,
+                 expensive_share: float = 0.5, max_queue: int = 512,
+                 target_delay: float = 0.01, interval: float = 0.1):
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.expensive_share = expensive_share
+        self.max_queue = max_queue
+        self.target_delay = target_delay
+        self.interval = interval
+        self._in_flight = {priority: 0 for priority in PRIORITIES}
+        self._queues: Dict[str, Deque[_Waiter]] = {
+            priority: deque() for priority in PRIORITIES}
+        self._last_empty = time.monotonic()
+        self._admitted = {priority: 0 for priority in PRIORITIES}
+        self._shed = {priority: 0 for priority in PRIORITIES}
+        # Minimum event loop lag of the last complete interval
+        self.loop_lag = 0.0
+        self._monitor: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+            Start sampling the loop lag; call from the running loop.
+        """
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.get_running_loop().create_task(
+                self.monitor())
+
+    def stop(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        self.loop_lag = 0.0
+
+    async def monitor(self) -> None:
+        window_start = time.monotonic()
+        window_min: Optional[float] = None
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.PROBE_INTERVAL)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.PROBE_INTERVAL)
+            window_min = lag if window_min is None else min(window_min, lag)
+            if now - window_start >= self.interval:
+                self.loop_lag = window_min
+                window_start, window_min = now, None
+
+    @property
+    def expensive_limit(self) -> int:
+        return max(1, int(self.max_concurrency * self.expensive_share))
+
+    @property
+    def in_flight(self) -> int:
+        return sum(self._in_flight.values())
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _queue_standing(self, now: float) -> bool:
+        if not self.queued:
+            self._last_empty = now
+            return False
+        return now - self._last_empty > self.interval
+
+    def overloaded(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return (self._queue_standing(now)
+                or self.loop_lag > self.target_delay)
+
+    def _has_slot(self, priority: str) -> bool:
+        if self.in_flight >= self.max_concurrency:
+            return False
+        return (priority == READ
+                or self._in_flight[EXPENSIVE] < self.expensive_limit)
+
+    def _start(self, priority: str, queue_delay: float) -> None:
+        self._in_flight[priority] += 1
+        self._admitted[priority] += 1
+        admission_requests.inc(priority, "admitted")
+        admission_queue_delay.observe(queue_delay, priority)
+
+    def _reject(self, priority: str, reason: str) -> Overloaded:
+        self._shed[priority] += 1
+        admission_requests.inc(priority, reason)
+        return Overloaded(reason, retry_after=max(1.0, self.interval))
+
+    async def acquire(self, priority: str) -> None:
+        """
+            Wait for a slot or raise Overloaded.
+        """
+        now = time.monotonic()
+        overloaded = self.overloaded(now)
+        if self.loop_lag > self.interval:
+            raise self._reject(priority, "shed_loop_lag")
+        if priority == EXPENSIVE and overloaded:
+            raise self._reject(priority, "shed_overload")
+        # Waiting reads go first, so nothing overtakes them
+        if (self._has_slot(priority) and not self._queues[priority]
+                and not self._queues[READ]):
+            self._start(priority, 0.0)
+            return
+        if self.queued >= self.max_queue:
+            raise self._reject(priority, "shed_queue_full")
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, now, loop.create_future())
+        self._queues[priority].append(waiter)
+        waiter.timer = loop.call_later(
+            self.target_delay if overloaded else self.interval,
+            self._expire, waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            # The client went away; give back a slot handed over meanwhile
+            if waiter.future.done() and not waiter.future.cancelled() \
+                    and waiter.future.exception() is None:
+                self.release(priority)
+            else:
+                self._remove(waiter)
+            raise
+
+    def release(self, priority: str) -> None:
+        self._in_flight[priority] -= 1
+        self._dispatch()
+
+    def _remove(self, waiter: _Waiter) -> None:
+        if waiter.timer is not None:
+            waiter.timer.cancel()
+        try:
+            self._queues[waiter.priority].remove(waiter)
+        except ValueError:
+            pass
+
+    def _expire(self, waiter: _Waiter) -> None:
+        if waiter.future.done():
+            return
+        self._remove(waiter)
+        waiter.future.set_exception(self._reject(waiter.priority,
+                                                 "shed_timeout"))
+
+    def _dispatch(self) -> None:
+        """
+            Hand freed slots to waiters, reads first.
+        """
+        now = time.monotonic()
+        overloaded = self.overloaded(now)
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._has_slot(priority):
+                # Adaptive LIFO: under overload the oldest waiters are the
+                # likeliest to have been given up on by their clients
+                waiter = queue.pop() if overloaded else queue.popleft()
+                waiter.timer.cancel()
+                if waiter.future.done():
+                    continue
+                delay = now - waiter.enqueued_at
+                if overloaded and delay > self.target_delay:
+                    waiter.future.set_exception(
+                        self._reject(priority, "shed_timeout"))
+                    continue
+                self._start(priority, delay)
+                waiter.future.set_result(None)
+        if not self.queued:
+            self._last_empty = now
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "overloaded": self.enabled and self.overloaded(),
+            "loop_lag_ms": round(self.loop_lag * 1000, 3),
+            "max_concurrency": self.max_concurrency,
+            "expensive_limit": self.expensive_limit,
+            "in_flight": dict(self._in_flight),
+            "queued": {priority: len(queue)
+                       for priority, queue in self._queues.items()},
+            "admitted": dict(self._admitted),
+            "shed": dict(self._shed),
+        }
+
+
+class AdmissionMiddleware:
+    """
+        Pure ASGI middleware admitting requests through the controller.
+        Shed requests are answered with 503 and ``Retry-After`` before any
+        other work is done for them.
+
+        An endpoint that streams for long and admits its own work can give
+        the request's slot back early with ``request.state.release_admission``.
+    """
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or admission
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+        priority = classify(scope)
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(priority)
+        except Overloaded as e:
+            response = JSONResponse(
+                {"detail": "Server is overloaded, please retry shortly"},
+                status_code=503,
+                headers={"Retry-After": retry_after_header(e.retry_after)})
+            await response(scope, receive, send)
+            return
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.controller.release(priority)
+
+        scope.setdefault("state", {})["release_admission"] = release
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            release()
+
+
+admission = AdmissionController(
+    enabled=settings.ADMISSION_ENABLED,
+    max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+    expensive_share=settings.ADMISSION_EXPENSIVE_SHARE,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    target_delay=settings.ADMISSION_TARGET_DELAY_MS / 1000.0,
+    interval=settings.ADMISSION_INTERVAL_MS / 1000.0,
+)
+
+
+def _collect_state() -> Dict[Tuple[str, ...], float]:
+    values: Dict[Tuple[str, ...], float] = {}
+    for priority in PRIORITIES:
+        values[(priority, "in_flight")] = admission._in_flight[priority]
+        values[(priority, "queued")] = len(admission._queues[priority])
+    return values
+
+
+admission_requests = registry.counter(
+    "birdnest_admission_requests_total",
+    "Requests admitted or shed by admission control",
+    ["priority", "result"])
+admission_queue_delay = registry.histogram(
+    "birdnest_admission_queue_seconds",
+    "Time requests waited for admission", ["priority"],
+    buckets=QUEUE_BUCKETS)
+admission_state = registry.gauge(
+    "birdnest_admission_requests", "Admitted and waiting requests",
+    ["priority", "state"], callback=_collect_state)
+admission_overloaded = registry.gauge(
+    "birdnest_admission_overloaded", "1 while admission control sheds load",
+    callback=lambda: {(): float(admission.enabled
+                                and admission.overloaded())})
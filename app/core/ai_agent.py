@@ -1,24 +1,73 @@
 import os
 import logging
-from typing import Optional, Dict, Any
-from openai import OpenAI
+from typing import Optional, Dict, Any, List
+import time
+from functools import partial
+from openai import OpenAI, APIConnectionError, APIStatusError
 import sys
 from .config import settings
+from .hedging import HedgeDeclined, Hedger
+from .metrics import upstream_errors, upstream_latency
+from . import tracing
+from .resilience import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    ConcurrencyLimitExceeded,
+    UpstreamUnavailableError,
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Upstream protection shared by every agent instance, so breaker state
+# survives re-initialization of the client.
+upstream_breaker = CircuitBreaker(
+    failure_threshold=settings.AGENT_BREAKER_FAILURE_THRESHOLD,
+    recovery_timeout=settings.AGENT_BREAKER_RECOVERY_SECONDS,
+)
+upstream_limiter = AdaptiveConcurrencyLimiter(
+    initial_limit=settings.AGENT_CONCURRENCY_INITIAL,
+    min_limit=settings.AGENT_CONCURRENCY_MIN,
+    max_limit=settings.AGENT_CONCURRENCY_MAX,
+    max_queue=settings.AGENT_QUEUE_SIZE,
+    queue_timeout=settings.AGENT_QUEUE_TIMEOUT,
+)
+upstream_hedger = Hedger(
+    quantile=settings.AGENT_HEDGE_QUANTILE,
+    budget_ratio=settings.AGENT_HEDGE_BUDGET,
+)
+
+
+def _is_upstream_failure(exc: Exception) -> bool:
+    """
+        Whether an exception means the upstream itself is unhealthy
+        (connection problems, timeouts, 429 and 5xx) rather than the
+        request being bad.
+    """
+    if isinstance(exc, APIConnectionError):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code >= 500 or exc.status_code == 429
+    return False
+
 
 class BirdNestAIAgent:
     """
         AI agent for BirdNest application.
     """
 
-    def __init__(self):
+    def __init__(self, breaker: Optional[CircuitBreaker] = None,
+                 limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 hedger: Optional[Hedger] = None):
         """
             Initialize the AI agent with environment variables and validation
         """
         self.client = None
+        self.breaker = breaker or upstream_breaker
+        self.limiter = limiter or upstream_limiter
+        if hedger is None and settings.AGENT_HEDGING:
+            hedger = upstream_hedger
+        self.hedger = hedger
         self._initialize_client()
 
     def _initialize_client(self) -> None:
@@ -45,6 +94,8 @@ class BirdNestAIAgent:
             self.client = OpenAI(
                 base_url=agent_endpoint,
                 api_key=agent_access_key,
+                timeout=settings.AGENT_TIMEOUT,
+                max_retries=settings.AGENT_MAX_RETRIES,
             )
 
             logger.info("AI Agent initialized successfully")
@@ -112,7 +163,76 @@ class BirdNestAIAgent:
 
         return sanitized
 
-    def query_agent(self, user_input: str, include_retrieval: bool = True
+    def _call_upstream(self, **kwargs):
+        """
+            Call the chat completions API through the circuit breaker, the
+            concurrency limiter and (when enabled) the hedger, within
+            AGENT_REQUEST_DEADLINE.
+
+            Raises:
+                UpstreamUnavailableError: when the call is refused locally
+        """
+        deadline = time.monotonic() + settings.AGENT_REQUEST_DEADLINE
+        generation = self.breaker.before_call()
+        try:
+            with tracing.span("ai.upstream_wait",
+                              hedged=self.hedger is not None):
+                if self.hedger is None:
+                    response = self._attempt(kwargs, deadline, False)
+                else:
+                    response = self.hedger.run(
+                        partial(self._attempt, kwargs), deadline)
+        except ConcurrencyLimitExceeded:
+            self.breaker.cancel(generation)
+            raise
+        except Exception as e:
+            if _is_upstream_failure(e):
+                self.breaker.record_failure(generation)
+            else:
+                self.breaker.record_success(generation)
+            raise
+
+        self.breaker.record_success(generation)
+        return response
+
+    def _attempt(self, kwargs: Dict[str, Any], deadline: float,
+                 is_hedge: bool):
+        """
+            One upstream call holding a concurrency slot. Hedges never
+            queue for a slot, they are declined instead.
+        """
+        with tracing.span("ai.limiter_acquire", hedge=is_hedge):
+            if is_hedge:
+                if not self.limiter.try_acquire():
+                    raise HedgeDeclined()
+            else:
+                self.limiter.acquire()
+
+        start = time.monotonic()
+        try:
+            timeout = min(settings.AGENT_TIMEOUT, deadline - start)
+            with tracing.span("ai.upstream_call", tracing.KIND_CLIENT,
+                              hedge=is_hedge) as span:
+                response = self.client.chat.completions.create(
+                    timeout=max(timeout, 0.001),
+                    extra_headers=tracing.outgoing_headers(), **kwargs)
+                span.set_attribute("timeout", timeout)
+        except Exception as e:
+            latency = time.monotonic() - start
+            self.limiter.release(latency, dropped=_is_upstream_failure(e))
+            upstream_latency.observe(latency, "error")
+            upstream_errors.inc(type(e).__name__)
+            raise
+
+        latency = time.monotonic() - start
+        self.limiter.release(latency)
+        upstream_latency.observe(latency, "success")
+        if self.hedger is not None:
+            self.hedger.observe(latency)
+        return response
+
+    def query_agent(self, user_input: str, include_retrieval: bool = True,
+                    history: Optional[List[Dict[str, str]]] = None
                     ) -> Optional[Dict[str, Any]]:
         """
             Send a query to the AI agent with proper error handling.
@@ -120,20 +240,28 @@ class BirdNestAIAgent:
             Args:
                 user_input: The user's question or prompt
                 include_retrieval: Whether to include retrieval information
+                history: Prior turns of the conversation as chat messages
 
             Returns:
                 Dict containing response and metadata, or None if error
+
+            Raises:
+                UpstreamUnavailableError: when the circuit breaker or the
+                    concurrency limiter refuses the call
         """
         try:
             # Validate and sanitize input
-            if not self._validate_input(user_input):
+            with tracing.span("ai.validate_input"):
+                valid = self._validate_input(user_input)
+            if not valid:
                 logger.error("Invalid input provided")
                 return {
                     "error": "Invalid input. Please provide a valid question.",
                     "success": False
                 }
 
-            sanitized_input = self._sanitize_input(user_input)
+            with tracing.span("ai.sanitize_input"):
+                sanitized_input = self._sanitize_input(user_input)
 
             # Prepare extra body parameters
             extra_body = {}
@@ -144,9 +272,9 @@ class BirdNestAIAgent:
             logger.info(
                 f"Sending query to AI agent: {sanitized_input[:100]}...")
 
-            response = self.client.chat.completions.create(
+            response = self._call_upstream(
                 model="n/a",  # Using default model
-                messages=[{
+                messages=(history or []) + [{
                     "role": "user",
                     "content": sanitized_input
                 }],
@@ -154,21 +282,34 @@ class BirdNestAIAgent:
             )
 
             # Process response
-            results = []
-            for choice in response.choices:
-                if choice.message and choice.message.content:
-                    results.append(choice.message.content)
-
-            logger.info("Query completed successfully")
+            with tracing.span("ai.process_response"):
+                results = []
+                for choice in response.choices:
+                    if choice.message and choice.message.content:
+                        results.append(choice.message.content)
+
+                logger.info("Query completed successfully")
+
+                usage = None
+                if getattr(response, "usage", None) is not None:
+                    usage = {
+                        "prompt_tokens": response.usage.prompt_tokens or 0,
+                        "completion_tokens": (
+                            response.usage.completion_tokens or 0),
+                        "total_tokens": response.usage.total_tokens or 0,
+                    }
 
             return {
                 "success": True,
                 "responses": results,
                 "message_count": len(results),
+                "usage": usage,
                 "original_query": sanitized_input[:100] + "..." if len(
                     sanitized_input) > 100 else sanitized_input
             }
 
+        except UpstreamUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"Error querying AI agent: {str(e)}")
             return {
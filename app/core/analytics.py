@@ -0,0 +1,33 @@
+import logging
+from typing import Any, Dict, List
+
+from sqlalchemy import insert
+
+from .config import settings
+from .database import engine
+from .jobs import job_queue
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CONVERSATION_LOG = "conversation_log"
+
+
+@job_queue.handler(CONVERSATION_LOG, batch_size=settings.ANALYTICS_BATCH_SIZE)
+def write_conversation_logs(records: List[Dict[str, Any]]) -> None:
+    """
+        Insert a batch of conversation analytics records into
+        ``conversation_logs``. A failed insert is retried by the job queue.
+    """
+    from app.models.conversation import ConversationLog
+    with engine.begin() as conn:
+        conn.execute(insert(ConversationLog.__table__), records)
+    logger.debug(f"Wrote {len(records)} conversation records")
+
+
+def record_conversation(record: Dict[str, Any]) -> None:
+    """
+        Queue a conversation analytics record; written in batches by the
+        background job workers.
+    """
+    job_queue.enqueue(CONVERSATION_LOG, record, priority=-1)
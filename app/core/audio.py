@@ -0,0 +1,429 @@
+import array
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import wave
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+
+from .config import settings
+from .jobs import job_queue
+from .metrics import registry
+
+try:
+    import mutagen
+except ImportError:  # optional
+    mutagen = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".ogg": "audio/ogg",
+    ".oga": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+    ".webm": "audio/webm",
+}
+
+ANALYZE_JOB = "audio.analyze"
+
+# Read size of the fallback body; a player's seek usually asks for less
+CHUNK_SIZE = 256 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: Optional[str], size: int
+                ) -> Optional[Tuple[int, int]]:
+    """
+        ``(start, end)`` (inclusive) of a single-range ``Range`` header, or
+        None to send the whole file: no header, a unit other than bytes or
+        several ranges, which a server may answer in full (RFC 9110 14.2).
+        Raises RangeNotSatisfiable for a range beyond the file.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def format_duration(seconds: float) -> str:
+    """
+        ``m:ss``, the format of ``sounds.calls[].duration``.
+    """
+    total = int(round(seconds))
+    return f"{total // 60}:{total % 60:02d}"
+
+
+# MPEG audio Layer III: bitrates (kbit/s) by version and index, sample
+# rates by version
+_MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000),
+                     2.5: (11025, 12000, 8000)}
+_MP3_VERSIONS = {3: 1, 2: 2, 0: 2.5}
+
+
+def mp3_duration(path: str) -> Optional[float]:
+    """
+        Duration of an MP3 from its first frame: the frame count of a
+        Xing/Info or VBRI header, else the size at the first frame's
+        (constant) bitrate. Reads a few KB.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(10)
+        offset = 0
+        if head[:3] == b"ID3" and len(head) == 10:
+            # ID3v2: syncsafe size, plus a footer if flagged
+            tag_size = ((head[6] & 0x7F) << 21 | (head[7] & 0x7F) << 14
+                        | (head[8] & 0x7F) << 7 | head[9] & 0x7F)
+            offset = 10 + tag_size + (10 if head[5] & 0x10 else 0)
+        f.seek(offset)
+        data = f.read(8192)
+        f.seek(max(0, size - 128))
+        has_id3v1 = f.read(3) == b"TAG"
+
+    for i in range(len(data) - 4):
+        if data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+            continue
+        b1, b2, b3 = data[i + 1], data[i + 2], data[i + 3]
+        version = _MP3_VERSIONS.get((b1 >> 3) & 3)
+        if version is None or (b1 >> 1) & 3 != 1:  # Layer III only
+            continue
+        bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+        if bitrate_index in (0, 15) or rate_index == 3:
+            continue
+        bitrate = _MP3_BITRATES[1 if version == 1 else 2][bitrate_index]
+        sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+        samples_per_frame = 1152 if version == 1 else 576
+        mono = b3 >> 6 == 3
+        side_info = (17 if mono else 32) if version == 1 else \
+            (9 if mono else 17)
+
+        frames = None
+        xing = data[i + 4 + side_info:i + 4 + side_info + 12]
+        if xing[:4] in (b"Xing", b"Info") and len(xing) == 12:
+            flags = struct.unpack(">I", xing[4:8])[0]
+            if flags & 1:
+                frames = struct.unpack(">I", xing[8:12])[0]
+        vbri = data[i + 36:i + 36 + 18]
+        if vbri[:4] == b"VBRI" and len(vbri) == 18:
+            frames = struct.unpack(">I", vbri[14:18])[0]
+        if frames:
+            return frames * samples_per_frame / sample_rate
+        audio_bytes = size - offset - i - (128 if has_id3v1 else 0)
+        return audio_bytes * 8 / (bitrate * 1000)
+    return None
+
+
+def wav_metadata(path: str, points: int
+                 ) -> Tuple[Optional[float], Optional[List[float]]]:
+    """
+        Duration of a PCM WAV file and its waveform: the peak amplitude
+        (0 to 1) of each of ``points`` equal slices.
+    """
+    with wave.open(path, "rb") as w:
+        frames, rate = w.getnframes(), w.getframerate()
+        width, channels = w.getsampwidth(), w.getnchannels()
+        duration = frames / rate if rate else None
+        if width not in (1, 2) or not frames or not points:
+            return duration, None
+        per_point = max(1, -(-frames // points))
+        scale = 128.0 if width == 1 else 32768.0
+        waveform = []
+        while True:
+            chunk = w.readframes(per_point)
+            if not chunk:
+                break
+            if width == 1:
+                # 8-bit PCM is unsigned
+                samples = [abs(s - 128) for s in chunk]
+            else:
+                samples = array.array("h", chunk)
+                if sys.byteorder == "big":
+                    samples.byteswap()
+            peak = max((abs(s) for s in samples), default=0)
+            waveform.append(round(min(1.0, peak / scale), 3))
+    return duration, waveform
+
+
+def analyze(path: str, points: int) -> Dict[str, Any]:
+    """
+        Duration (seconds) and waveform of an audio file, as far as they
+        can be read: WAV fully, MP3 duration from its headers, other
+        formats through mutagen when it is installed.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    duration, waveform = None, None
+    try:
+        if extension == ".wav":
+            duration, waveform = wav_metadata(path, points)
+        elif mutagen is not None:
+            info = getattr(mutagen.File(path), "info", None)
+            duration = getattr(info, "length", None)
+        elif extension == ".mp3":
+            duration = mp3_duration(path)
+    except (OSError, EOFError, wave.Error, struct.error) as e:
+        logger.warning(f"Could not analyze {path}: {str(e)}")
+    return {"duration": round(duration, 3) if duration else None,
+            "waveform": waveform}
+
+
+class AudioStore:
+    """
+        Locally stored bird sounds and their metadata.
+
+        Bird documents refer to a file as ``url_prefix`` plus its path
+        under ``root``. ``rewrite`` points ``sounds.calls[].audioSrc`` at
+        ``{base_url}/{path}?v={version}`` and fills ``duration`` from the
+        file's metadata. The version is derived from the file's mtime and
+        size, like the ETag, so a replaced file gets a new URL.
+
+        Metadata (duration and waveform) is read once per file version and
+        kept in memory and as JSON in ``cache_dir``. Bird writes queue an
+        ``audio.analyze`` job per referenced file, so it is usually
+        computed before the first read needs it. A duration alone comes
+        from the file headers and is cheap; the waveform needs the whole
+        file.
+    """
+
+    def __init__(self, root: str, cache_dir: str, url_prefix: str = "/audio/",
+                 base_url: str = "/audio/files", waveform_points: int = 200):
+        self.root = os.path.realpath(root)
+        self.cache_dir = cache_dir
+        self.url_prefix = url_prefix
+        self.base_url = base_url.rstrip("/")
+        self.waveform_points = waveform_points
+        self._lock = threading.Lock()
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+
+    def original(self, path: str) -> Optional[str]:
+        """
+            File at ``path`` under root, or None if there is none (or
+            ``path`` leads outside root).
+        """
+        source = os.path.realpath(os.path.join(self.root, path))
+        if not source.startswith(self.root + os.sep):
+            return None
+        return source if os.path.isfile(source) else None
+
+    @staticmethod
+    def version(stat: os.stat_result) -> str:
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def media_type(self, source: str) -> str:
+        return MEDIA_TYPES.get(os.path.splitext(source)[1].lower(),
+                               "application/octet-stream")
+
+    def _cache_file(self, source: str, version: str) -> str:
+        key = hashlib.sha256(f"{source}:{version}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def metadata(self, source: str, waveform: bool = True
+                 ) -> Dict[str, Any]:
+        """
+            Cached metadata of a file; reads the file on a miss. Without
+            ``waveform`` a header probe is enough, and its result is only
+            kept in memory.
+        """
+        version = self.version(os.stat(source))
+        key = f"{source}:{version}"
+        cached = self._metadata.get(key)
+        if cached is not None and (not waveform or cached["complete"]):
+            audio_metadata_requests.inc("hit")
+            return cached
+
+        path = self._cache_file(source, version)
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+            audio_metadata_requests.inc("disk")
+        except (OSError, ValueError):
+            audio_metadata_requests.inc("miss")
+            if waveform:
+                cached = dict(analyze(source, self.waveform_points),
+                              complete=True)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                partial = f"{path}.{os.getpid()}.partial"
+                with open(partial, "w") as f:
+                    json.dump(cached, f)
+                os.replace(partial, path)
+            else:
+                cached = dict(analyze(source, 0), complete=False)
+        cached["version"] = version
+        with self._lock:
+            self._metadata[key] = cached
+        return cached
+
+    # Rewriting bird documents
+
+    def _local(self, reference: Any) -> bool:
+        return (isinstance(reference, str)
+                and reference.startswith(self.url_prefix))
+
+    def references(self, bird: Any) -> List[str]:
+        """
+            Paths of the local files a bird (row or dict) refers to.
+        """
+        sounds = (bird.get("sounds") if isinstance(bird, dict)
+                  else getattr(bird, "sounds", None))
+        calls = sounds.get("calls") if isinstance(sounds, dict) else None
+        if not isinstance(calls, list):
+            return []
+        return [call["audioSrc"][len(self.url_prefix):] for call in calls
+                if isinstance(call, dict)
+                and self._local(call.get("audioSrc"))]
+
+    def _call(self, call: Dict[str, Any]) -> Dict[str, Any]:
+        path = call["audioSrc"][len(self.url_prefix):]
+        source = self.original(path)
+        if source is None:
+            return call
+        metadata = self.metadata(source, waveform=False)
+        call = dict(call, audioSrc=f"{self.base_url}/{path}"
+                                   f"?v={metadata['version']}")
+        if metadata["duration"]:
+            call["duration"] = format_duration(metadata["duration"])
+        return call
+
+    def rewrite(self, bird: Dict[str, Any]) -> Dict[str, Any]:
+        """
+            ``bird`` (a ``schemas.Bird`` dict) with its local sounds
+            pointing at the audio endpoint and their durations filled in.
+            Changed parts are copied; a bird without local sounds is
+            returned as it is.
+        """
+        if not self.references(bird):
+            return bird
+        sounds = bird["sounds"]
+        calls = [self._call(call) if isinstance(call, dict)
+                 and self._local(call.get("audioSrc")) else call
+                 for call in sounds["calls"]]
+        return dict(bird, sounds=dict(sounds, calls=calls))
+
+    def bird_written(self, event: str, bird: Any) -> None:
+        """
+            CRUD hook: queue metadata analysis of the files a created or
+            updated bird refers to.
+        """
+        if event == "remove":
+            return
+        for path in self.references(bird):
+            job_queue.enqueue(ANALYZE_JOB, path, priority=-1,
+                              key=f"{ANALYZE_JOB}:{path}")
+
+
+class RangeFileResponse(Response):
+    """
+        A file, or one byte range of it, streamed without going through
+        Python file objects.
+
+        With ``range`` set the response is ``206 Partial Content`` with a
+        ``Content-Range``. When the server offers the ASGI zero-copy
+        extension (``http.response.zerocopy``) the body is handed to it as
+        a file descriptor to ``sendfile``; otherwise it is read with
+        ``os.pread`` in a worker thread, ``CHUNK_SIZE`` at a time.
+    """
+
+    def __init__(self, path: str, size: int, media_type: str,
+                 range: Optional[Tuple[int, int]] = None,
+                 headers: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.media_type = media_type
+        self.background = None
+        self.status_code = 200
+        self.offset, self.length = 0, size
+        if range is not None:
+            start, end = range
+            self.status_code = 206
+            self.offset, self.length = start, end - start + 1
+        self.init_headers(dict(headers or {}, **{
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(self.length)}))
+        if range is not None:
+            self.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or not self.length:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopy", "file": f,
+                            "offset": self.offset, "count": self.length,
+                            "more_body": False})
+                return
+            fd = f.fileno()
+            offset, remaining = self.offset, self.length
+            while remaining:
+                chunk = await anyio.to_thread.run_sync(
+                    os.pread, fd, min(CHUNK_SIZE, remaining), offset)
+                if not chunk:  # truncated meanwhile
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk,
+                            "more_body": bool(remaining)})
+            if remaining:
+                await send({"type": "http.response.body", "body": b""})
+
+
+audio_store = AudioStore(
+    settings.AUDIO_DIR,
+    settings.AUDIO_CACHE_DIR,
+    url_prefix=settings.AUDIO_URL_PREFIX,
+    base_url=f"{settings.API_V1_STR}/audio/files",
+    waveform_points=settings.AUDIO_WAVEFORM_POINTS,
+)
+
+
+@job_queue.handler(ANALYZE_JOB)
+def analyze_audio(path: str) -> None:
+    source = audio_store.original(path)
+    if source is not None:
+        audio_store.metadata(source, waveform=True)
+
+
+audio_requests = registry.counter(
+    "birdnest_audio_requests_total",
+    "Audio file responses by kind (full, partial, not_modified, "
+    "unsatisfiable)", ["result"])
+audio_bytes = registry.counter(
+    "birdnest_audio_bytes_total", "Audio bytes sent (Content-Length)")
+audio_metadata_requests = registry.counter(
+    "birdnest_audio_metadata_requests_total",
+    "Audio metadata lookups by result (hit, disk, miss)", ["result"])
@@ -0,0 +1,348 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .snapshot import SEPARATOR, CatalogSnapshot, SnapshotRow
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+MAGIC = b"BIRDCAT\x00"
+# Bump on any change to the layout below; older files are rebuilt
+FORMAT_VERSION = 1
+
+# The file is a cache private to the host, so native byte order:
+#
+#   header     magic, version, birds, seq, then (offset, length) of each
+#              section in SECTIONS order
+#   documents  the schemas.Bird JSON of every bird, back to back
+#   entries    ENTRY per bird, in birds table order
+#   ids        the UTF-8 bird_ids, back to back
+#   names      lower-cased names joined by SEPARATOR, and the uint32
+#              byte offset where each one starts (name_starts); the same
+#              for scientific names
+#   hash       open addressing table of uint32 entry number + 1 (0 is
+#              empty) by crc32 of the bird_id, linear probing
+#   statuses   posting lists: a uint64 length, a JSON directory of
+#              [key, first, count], then the uint32 entry numbers;
+#              tags alike
+SECTIONS = ("documents", "entries", "ids", "names", "name_starts",
+            "scientific_names", "scientific_starts", "hash", "statuses",
+            "tags")
+HEADER = struct.Struct("=8sIIQ" + "QQ" * len(SECTIONS))
+# id, document offset, document length, bird_id offset, bird_id length,
+# status number
+ENTRY = struct.Struct("=QQIIIHxx")
+ALIGNMENT = 8
+
+
+class CatalogFileError(Exception):
+    """Not a catalog file of this format version."""
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+        Serializes compiling the catalog file at ``path`` across the
+        processes of the host.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _text(values: Iterable[str]) -> Tuple[bytes, array]:
+    starts, encoded, offset = array("I"), [], 0
+    for value in values:
+        value = value.encode("utf-8")
+        starts.append(offset)
+        encoded.append(value)
+        offset += len(value) + 1
+    return SEPARATOR.encode().join(encoded), starts
+
+
+def _hash_table(hashes: Sequence[int]) -> array:
+    size = 8
+    while size < 2 * len(hashes):
+        size *= 2
+    mask, slots = size - 1, array("I", bytes(4 * size))
+    for i, value in enumerate(hashes):
+        slot = value & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = i + 1
+    return slots
+
+
+def _postings(index: Dict[Any, List[int]]) -> bytes:
+    directory, positions = [], array("I")
+    for key, members in index.items():
+        directory.append([key, len(positions), len(members)])
+        positions.extend(members)
+    head = json.dumps(directory).encode()
+    head += b" " * (-len(head) % ALIGNMENT)
+    return struct.pack("=Q", len(head)) + head + positions.tobytes()
+
+
+def _write(f: BinaryIO, rows: Iterable[SnapshotRow], seq: int) -> int:
+    spans: Dict[str, Tuple[int, int]] = {}
+
+    def section(name: str, data: bytes) -> None:
+        f.write(bytes(-f.tell() % ALIGNMENT))
+        spans[name] = (f.tell(), len(data))
+        f.write(data)
+
+    f.write(bytes(HEADER.size))
+    start = f.tell()
+    entries, ids, hashes = bytearray(), bytearray(), []
+    names: List[str] = []
+    scientific_names: List[str] = []
+    status_numbers: Dict[Optional[str], int] = {}
+    statuses: Dict[Optional[str], List[int]] = {}
+    tags: Dict[str, List[int]] = {}
+    for i, row in enumerate(rows):
+        bird_id = row.bird_id.encode("utf-8")
+        number = status_numbers.setdefault(row.status, len(status_numbers))
+        entries += ENTRY.pack(row.id, f.tell(), len(row.document), len(ids),
+                              len(bird_id), number)
+        f.write(row.document)
+        ids += bird_id
+        hashes.append(zlib.crc32(bird_id))
+        names.append(row.name)
+        scientific_names.append(row.scientific_name)
+        statuses.setdefault(row.status, []).append(i)
+        for tag in dict.fromkeys(row.tags):
+            tags.setdefault(tag, []).append(i)
+    spans["documents"] = (start, f.tell() - start)
+    section("entries", entries)
+    section("ids", ids)
+    for name, starts_name, values in (
+            ("names", "name_starts", names),
+            ("scientific_names", "scientific_starts", scientific_names)):
+        text, starts = _text(values)
+        section(name, text)
+        section(starts_name, starts.tobytes())
+    section("hash", _hash_table(hashes).tobytes())
+    section("statuses", _postings(statuses))
+    section("tags", _postings(tags))
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(hashes), seq,
+                        *(value for name in SECTIONS
+                          for value in spans[name])))
+    return len(hashes)
+
+
+def compile_catalog(path: str, rows: Iterable[SnapshotRow], seq: int) -> int:
+    """
+        Write ``rows`` as the catalog file at ``path`` and return how many
+        birds it holds. The file is written and synced under a temporary
+        name, then renamed over ``path``: readers see the old file or the
+        new one, never a partial one, and keep their mapping of the old
+        file until they open the new one.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(prefix=".catalog-", suffix=".tmp",
+                                     dir=directory)
+    try:
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, "wb") as f:
+            count = _write(f, rows, seq)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.unlink(temporary)
+        except FileNotFoundError:
+            pass
+        raise
+    return count
+
+
+class CatalogFile:
+    """
+        Read-only view of a compiled catalog file, memory-mapped.
+
+        Opening only maps the file and reads its header and posting list
+        directories, whatever the size of the catalog; the pages are read
+        as requests touch them and are shared by every process mapping the
+        same file. Reads answer like ``CatalogSnapshot``, which the
+        snapshot manager serves interchangeably.
+
+        A rebuilt file replaces the one on disk under the same name; a view
+        keeps serving the file it opened (``inode``) until it is dropped.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < HEADER.size:
+                raise CatalogFileError(f"{path}: truncated")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self.inode = (stat.st_dev, stat.st_ino)
+        magic, version, self._count, self.seq, *spans = HEADER.unpack_from(
+            self._mm)
+        if magic != MAGIC:
+            raise CatalogFileError(f"{path}: not a catalog file")
+        if version != FORMAT_VERSION:
+            raise CatalogFileError(
+                f"{path}: format version {version}, expected "
+                f"{FORMAT_VERSION}")
+        self._spans = dict(zip(SECTIONS, zip(spans[::2], spans[1::2])))
+        if any(offset + length > len(self._mm)
+               for offset, length in self._spans.values()):
+            raise CatalogFileError(f"{path}: truncated")
+        self._entries = self._section("entries")
+        self._ids = self._section("ids")
+        self._name_starts = self._section("name_starts").cast("I")
+        self._scientific_starts = self._section("scientific_starts").cast(
+            "I")
+        self._hash = self._section("hash").cast("I")
+        self._statuses, self._by_status = self._read_postings("statuses")
+        _, self._by_tag = self._read_postings("tags")
+
+    def _section(self, name: str) -> memoryview:
+        offset, length = self._spans[name]
+        return memoryview(self._mm)[offset:offset + length]
+
+    def _read_postings(self, name: str
+                       ) -> Tuple[List[Any], Dict[Any, memoryview]]:
+        view = self._section(name)
+        (size,) = struct.unpack_from("=Q", view)
+        directory = json.loads(bytes(view[8:8 + size]))
+        positions = view[8 + size:].cast("I")
+        return ([key for key, _, _ in directory],
+                {key: positions[first:first + count]
+                 for key, first, count in directory})
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def document_bytes(self) -> int:
+        return self._spans["documents"][1]
+
+    def _entry(self, i: int) -> Tuple[int, int, int, int, int, int]:
+        return ENTRY.unpack_from(self._entries, i * ENTRY.size)
+
+    def _document(self, i: int) -> bytes:
+        _, offset, length, _, _, _ = self._entry(i)
+        return self._mm[offset:offset + length]
+
+    def _value(self, name: str, starts: memoryview, i: int) -> str:
+        offset, length = self._spans[name]
+        end = starts[i + 1] - 1 if i + 1 < self._count else length
+        return self._mm[offset + starts[i]:offset + end].decode("utf-8")
+
+    def _row(self, i: int, tags: Tuple[str, ...] = ()) -> SnapshotRow:
+        id_, offset, length, id_offset, id_length, status = self._entry(i)
+        return SnapshotRow(
+            id_, bytes(self._ids[id_offset:id_offset + id_length]).decode(
+                "utf-8"),
+            self._value("names", self._name_starts, i),
+            self._value("scientific_names", self._scientific_starts, i),
+            self._statuses[status], self._mm[offset:offset + length], tags)
+
+    def _position(self, bird_id: str) -> Optional[int]:
+        encoded = bird_id.encode("utf-8")
+        mask = len(self._hash) - 1
+        slot = zlib.crc32(encoded) & mask
+        # Never full, so a probe always ends at an empty slot
+        while self._hash[slot]:
+            i = self._hash[slot] - 1
+            _, _, _, offset, length, _ = self._entry(i)
+            if self._ids[offset:offset + length] == encoded:
+                return i
+            slot = (slot + 1) & mask
+        return None
+
+    def get(self, bird_id: str) -> Optional[SnapshotRow]:
+        # Without tags, which are only kept as posting lists; see rows()
+        i = self._position(bird_id)
+        return self._row(i) if i is not None else None
+
+    response = staticmethod(CatalogSnapshot.response)
+
+    def _array(self, positions: Iterable[int]) -> bytes:
+        return b"[" + b",".join(map(self._document, positions)) + b"]"
+
+    def page(self, skip: int = 0, limit: int = 100) -> bytes:
+        """JSON array of the birds get_multi returns."""
+        return self._array(range(self._count)[skip:skip + limit])
+
+    def batch(self, bird_ids: Sequence[str]) -> bytes:
+        """JSON array of the birds get_batch returns."""
+        positions = map(self._position, dict.fromkeys(bird_ids))
+        return self._array(i for i in positions if i is not None)
+
+    def _find(self, name: str, starts: memoryview, query: str) -> List[int]:
+        # As snapshot._find, on the mapped bytes: UTF-8 never matches
+        # across a character boundary
+        if not query or SEPARATOR in query:
+            return []
+        query_bytes = query.encode("utf-8")
+        base, length = self._spans[name]
+        end = base + length
+        positions: List[int] = []
+        offset = self._mm.find(query_bytes, base, end)
+        while offset != -1:
+            position = bisect_right(starts, offset - base) - 1
+            positions.append(position)
+            if position + 1 == self._count:
+                break
+            offset = self._mm.find(query_bytes,
+                                   base + starts[position + 1], end)
+        return positions
+
+    def search_by_name(self, name: str) -> bytes:
+        return self._array(self._find("names", self._name_starts,
+                                      name.lower()))
+
+    def search_by_scientific_name(self, scientific_name: str) -> bytes:
+        return self._array(self._find("scientific_names",
+                                      self._scientific_starts,
+                                      scientific_name.lower()))
+
+    def get_by_conservation_status(self, status: str) -> bytes:
+        return self._array(self._by_status.get(status, ()))
+
+    def get_by_tag(self, tag: str) -> bytes:
+        return self._array(self._by_tag.get(tag.lower(), ()))
+
+    def rows(self) -> Iterator[SnapshotRow]:
+        """
+            Every row, in order; the documents are copied out of the file.
+        """
+        tags: List[List[str]] = [[] for _ in range(self._count)]
+        for tag, positions in self._by_tag.items():
+            for i in positions:
+                tags[i].append(tag)
+        for i in range(self._count):
+            yield self._row(i, tuple(tags[i]))
@@ -0,0 +1,306 @@
+import gzip
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from starlette.responses import Response
+
+from .config import settings
+from .metrics import registry
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+document_cache_requests = registry.counter(
+    "birdnest_document_cache_requests_total",
+    "Precompressed document lookups by result (hit, miss, compress, "
+    "upgrade).",
+    ("result",))
+
+
+def _gzip(data: bytes, level: int) -> bytes:
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data: bytes, level: int) -> bytes:
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+# Content-coding -> compress(data, level), in server preference order
+CODECS: Dict[str, Callable[[bytes, int], bytes]] = {}
+if brotli is not None:
+    CODECS["br"] = _brotli
+if zstandard is not None:
+    CODECS["zstd"] = _zstd
+CODECS["gzip"] = _gzip
+
+
+# Cached variants are compressed once per document version, so they end up
+# at the strongest levels; see benchmarks/bench_compression.py
+CACHED_LEVELS = {"br": 11, "zstd": 19, "gzip": 9}
+
+
+def dynamic_levels() -> Dict[str, int]:
+    """
+        Levels for responses compressed on every request.
+    """
+    return {"br": settings.COMPRESSION_BROTLI_LEVEL,
+            "zstd": settings.COMPRESSION_ZSTD_LEVEL,
+            "gzip": settings.COMPRESSION_GZIP_LEVEL}
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+        The content-coding to use for an Accept-Encoding header, or None
+        for an uncompressed response.
+
+        The highest q-value wins; ties go to the server's preference
+        (brotli, zstd, gzip). ``*`` covers every coding not listed.
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in CODECS:
+        q = weights.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _header(headers, name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _compressible(content_type: Optional[bytes]) -> bool:
+    if not content_type:
+        return False
+    content_type = content_type.split(b";")[0].strip().lower()
+    return (content_type.startswith(b"text/")
+            or content_type == b"application/json")
+
+
+class CompressionMiddleware:
+    """
+        Pure ASGI middleware compressing JSON and text responses of at
+        least ``minimum_size`` bytes with the coding negotiated from
+        Accept-Encoding.
+
+        Streamed responses and responses that already carry a
+        Content-Encoding (see ``DocumentCache``) are passed through.
+    """
+
+    def __init__(self, app, minimum_size: Optional[int] = None,
+                 levels: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.minimum_size = (settings.COMPRESSION_MIN_SIZE
+                             if minimum_size is None else minimum_size)
+        self.levels = levels or dynamic_levels()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(
+            (_header(scope["headers"], b"accept-encoding") or b""
+             ).decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Dict[str, Any] = {}
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                start_message.update(message)
+                return
+            if message["type"] != "http.response.body" or streaming:
+                # e.g. http.response.zerocopy: passed through as it is
+                if not streaming:
+                    streaming = True
+                    await send(start_message)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = list(start_message.get("headers", []))
+            if (message.get("more_body", False)
+                    or len(body) < self.minimum_size
+                    or _header(headers, b"content-encoding") is not None
+                    or not _compressible(_header(headers,
+                                                 b"content-type"))):
+                streaming = True
+                await send(start_message)
+                await send(message)
+                return
+
+            body = CODECS[encoding](body, self.levels[encoding])
+            headers = [(key, value) for key, value in headers
+                       if key.lower() != b"content-length"]
+            headers += [(b"content-encoding", encoding.encode()),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"vary", b"Accept-Encoding")]
+            start_message["headers"] = headers
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class DocumentCache:
+    """
+        LRU cache of serialized documents and their compressed variants.
+
+        Entries are keyed by document and carry a version (for a bird, the
+        sequence number of its last bird_changes entry, so writes by other
+        processes are seen too); a lookup with a different version
+        re-renders the document.
+
+        A variant is first compressed on request at the cheap
+        ``fast_levels``, then recompressed at ``levels`` by a background
+        thread and swapped in, so no request waits for the strong levels.
+    """
+
+    def __init__(self, max_entries: int = 1024,
+                 minimum_size: Optional[int] = None,
+                 levels: Optional[Dict[str, int]] = None,
+                 fast_levels: Optional[Dict[str, int]] = None):
+        self.max_entries = max_entries
+        self.minimum_size = (settings.COMPRESSION_MIN_SIZE
+                             if minimum_size is None else minimum_size)
+        self.levels = levels or CACHED_LEVELS
+        self.fast_levels = fast_levels or dynamic_levels()
+        self._lock = threading.Lock()
+        self._upgrades = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="document-cache")
+        # key -> (version, {coding or "identity": body})
+        self._entries: "OrderedDict[Any, Tuple[Any, Dict[str, bytes]]]" = (
+            OrderedDict())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def invalidate(self, key: Any) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def variant(self, key: Any, version: Any, render: Callable[[], bytes],
+                encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        """
+            The body for ``encoding`` (None for identity) and the coding
+            actually applied; small documents are never compressed.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                variants = entry[1]
+            else:
+                variants = None
+        if variants is None:
+            document_cache_requests.inc("miss")
+            variants = {"identity": render()}
+            with self._lock:
+                self._entries[key] = (version, variants)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        else:
+            document_cache_requests.inc("hit")
+
+        identity = variants["identity"]
+        if encoding is None or len(identity) < self.minimum_size:
+            return identity, None
+        body = variants.get(encoding)
+        if body is None:
+            # Racing requests may both compress; the first result is kept
+            document_cache_requests.inc("compress")
+            body = CODECS[encoding](identity, self.fast_levels[encoding])
+            if (variants.setdefault(encoding, body) is body
+                    and self.fast_levels[encoding] != self.levels[encoding]):
+                self._upgrades.submit(self._upgrade, key, variants,
+                                      encoding)
+        return body, encoding
+
+    def _upgrade(self, key: Any, variants: Dict[str, bytes],
+                 encoding: str) -> None:
+        """
+            Recompress a variant at the strong level, unless its version
+            was replaced or evicted meanwhile.
+        """
+        if not self._current(key, variants):
+            return
+        try:
+            body = CODECS[encoding](variants["identity"],
+                                    self.levels[encoding])
+        except Exception as e:
+            logger.error(f"Recompressing {key!r} as {encoding} failed: {e}")
+            return
+        if self._current(key, variants):
+            document_cache_requests.inc("upgrade")
+            variants[encoding] = body
+
+    def _current(self, key: Any, variants: Dict[str, bytes]) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] is variants
+
+    def wait_for_upgrades(self) -> None:
+        """
+            Block until the recompressions queued so far are done.
+        """
+        self._upgrades.submit(lambda: None).result()
+
+    def response(self, key: Any, version: Any, render: Callable[[], bytes],
+                 accept_encoding: Optional[str],
+                 media_type: str = "application/json") -> Response:
+        body, encoding = self.variant(key, version, render,
+                                      negotiate(accept_encoding))
+        headers = {"Vary": "Accept-Encoding"}
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=media_type, headers=headers)
+
+
+bird_documents = DocumentCache(max_entries=settings.BIRD_DOCUMENT_CACHE_SIZE)
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Optional
 import os
 
 
@@ -10,6 +11,195 @@ class Settings(BaseSettings):
     AGENT_ENDPOINT: str = os.getenv("AGENT_ENDPOINT")
     AGENT_ACCESS_KEY: str = os.getenv("AGENT_ACCESS_KEY")
 
+    # Agent upstream protection
+    AGENT_TIMEOUT: float = os.getenv("AGENT_TIMEOUT", 30.0)
+    AGENT_MAX_RETRIES: int = os.getenv("AGENT_MAX_RETRIES", 0)
+    AGENT_INIT_RETRY_SECONDS: float = os.getenv(
+        "AGENT_INIT_RETRY_SECONDS", 30.0)
+    AGENT_CONCURRENCY_INITIAL: int = os.getenv(
+        "AGENT_CONCURRENCY_INITIAL", 8)
+    AGENT_CONCURRENCY_MIN: int = os.getenv("AGENT_CONCURRENCY_MIN", 1)
+    AGENT_CONCURRENCY_MAX: int = os.getenv("AGENT_CONCURRENCY_MAX", 32)
+    AGENT_QUEUE_SIZE: int = os.getenv("AGENT_QUEUE_SIZE", 16)
+    AGENT_QUEUE_TIMEOUT: float = os.getenv("AGENT_QUEUE_TIMEOUT", 5.0)
+    AGENT_BREAKER_FAILURE_THRESHOLD: int = os.getenv(
+        "AGENT_BREAKER_FAILURE_THRESHOLD", 5)
+    AGENT_BREAKER_RECOVERY_SECONDS: float = os.getenv(
+        "AGENT_BREAKER_RECOVERY_SECONDS", 30.0)
+    AGENT_REQUEST_DEADLINE: float = os.getenv("AGENT_REQUEST_DEADLINE", 30.0)
+    AGENT_HEDGING: bool = os.getenv("AGENT_HEDGING", False)
+    AGENT_HEDGE_QUANTILE: float = os.getenv("AGENT_HEDGE_QUANTILE", 0.95)
+    AGENT_HEDGE_BUDGET: float = os.getenv("AGENT_HEDGE_BUDGET", 0.05)
+
+    # Batch chat
+    AI_BATCH_MAX_ITEMS: int = os.getenv("AI_BATCH_MAX_ITEMS", 1000)
+    AI_BATCH_MAX_PARALLELISM: int = os.getenv("AI_BATCH_MAX_PARALLELISM", 4)
+
+    # Conversation sessions
+    AI_SESSION_MAX_SESSIONS: int = os.getenv("AI_SESSION_MAX_SESSIONS",
+                                             10000)
+    AI_SESSION_MAX_TOKENS: int = os.getenv("AI_SESSION_MAX_TOKENS", 2000)
+    AI_SESSION_PERSIST: bool = os.getenv("AI_SESSION_PERSIST", False)
+
+    # Rate limiting for /ai/chat
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", True)
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_SQLITE_PATH: str = os.getenv("RATE_LIMIT_SQLITE_PATH",
+                                            "./ratelimit.db")
+    RATE_LIMIT_MAX_BUCKETS: int = os.getenv("RATE_LIMIT_MAX_BUCKETS", 100000)
+    RATE_LIMIT_KEY_PER_MINUTE: int = os.getenv("RATE_LIMIT_KEY_PER_MINUTE",
+                                               600)
+    RATE_LIMIT_IP_PER_MINUTE: int = os.getenv("RATE_LIMIT_IP_PER_MINUTE", 120)
+    RATE_LIMIT_SESSION_PER_MINUTE: int = os.getenv(
+        "RATE_LIMIT_SESSION_PER_MINUTE", 60)
+    RATE_LIMIT_TOKENS_PER_HOUR: int = os.getenv("RATE_LIMIT_TOKENS_PER_HOUR",
+                                                200000)
+
+    # Background jobs (app/core/jobs.py), queued in a SQLite table shared
+    # by every worker process
+    JOBS_ENABLED: bool = os.getenv("JOBS_ENABLED", True)
+    JOBS_SQLITE_PATH: str = os.getenv("JOBS_SQLITE_PATH", "./jobs.db")
+    JOBS_WORKERS: int = os.getenv("JOBS_WORKERS", 2)
+    JOBS_POLL_INTERVAL: float = os.getenv("JOBS_POLL_INTERVAL", 1.0)
+    JOBS_MAX_ATTEMPTS: int = os.getenv("JOBS_MAX_ATTEMPTS", 5)
+    JOBS_BACKOFF_BASE: float = os.getenv("JOBS_BACKOFF_BASE", 1.0)
+    JOBS_BACKOFF_MAX: float = os.getenv("JOBS_BACKOFF_MAX", 300.0)
+    JOBS_LEASE_SECONDS: float = os.getenv("JOBS_LEASE_SECONDS", 300.0)
+
+    # Conversation analytics records per insert (a conversation_log job
+    # batch)
+    ANALYTICS_BATCH_SIZE: int = os.getenv("ANALYTICS_BATCH_SIZE", 500)
+
+    # Refresh SQLite planner statistics this many seconds after bird
+    # writes; writes in between share one job
+    DATABASE_OPTIMIZE_DELAY: float = os.getenv("DATABASE_OPTIMIZE_DELAY",
+                                               60.0)
+
+    # Drop superseded change feed entries this many seconds after bird
+    # writes (see GET /birds/changes); 0 keeps every entry
+    BIRD_CHANGES_COMPACT_DELAY: float = os.getenv(
+        "BIRD_CHANGES_COMPACT_DELAY", 3600.0)
+
+    # Metrics
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", True)
+
+    # Per-request SQL instrumentation (switchable at runtime through
+    # /admin/sql)
+    SQL_MONITOR_ENABLED: bool = os.getenv("SQL_MONITOR_ENABLED", False)
+    SQL_MONITOR_SERVER_TIMING: bool = os.getenv("SQL_MONITOR_SERVER_TIMING",
+                                                True)
+    SQL_N_PLUS_ONE_THRESHOLD: int = os.getenv("SQL_N_PLUS_ONE_THRESHOLD", 5)
+    SQL_SLOW_QUERY_MS: float = os.getenv("SQL_SLOW_QUERY_MS", 100.0)
+    SQL_EXPLAIN_SLOW_QUERIES: bool = os.getenv("SQL_EXPLAIN_SLOW_QUERIES",
+                                               True)
+
+    # Admin endpoints are disabled unless a token is set
+    ADMIN_TOKEN: Optional[str] = os.getenv("ADMIN_TOKEN")
+
+    # Profiling (admin token required, see ProfilingMiddleware)
+    PROFILING_INTERVAL_MS: float = os.getenv("PROFILING_INTERVAL_MS", 1.0)
+    PROFILING_MAX_STORED: int = os.getenv("PROFILING_MAX_STORED", 50)
+    PROFILING_DIR: Optional[str] = os.getenv("PROFILING_DIR")
+    PROFILING_CONTINUOUS: bool = os.getenv("PROFILING_CONTINUOUS", False)
+    PROFILING_CONTINUOUS_HZ: float = os.getenv("PROFILING_CONTINUOUS_HZ",
+                                               19.0)
+    PROFILING_WINDOW_SECONDS: float = os.getenv("PROFILING_WINDOW_SECONDS",
+                                                60.0)
+    PROFILING_WINDOWS: int = os.getenv("PROFILING_WINDOWS", 10)
+
+    # Response compression. The levels apply to responses compressed per
+    # request; cached bird documents are compressed once at the strongest
+    # levels.
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", True)
+    COMPRESSION_MIN_SIZE: int = os.getenv("COMPRESSION_MIN_SIZE", 1024)
+    COMPRESSION_GZIP_LEVEL: int = os.getenv("COMPRESSION_GZIP_LEVEL", 1)
+    COMPRESSION_BROTLI_LEVEL: int = os.getenv("COMPRESSION_BROTLI_LEVEL", 4)
+    COMPRESSION_ZSTD_LEVEL: int = os.getenv("COMPRESSION_ZSTD_LEVEL", 3)
+    BIRD_DOCUMENT_CACHE_SIZE: int = os.getenv("BIRD_DOCUMENT_CACHE_SIZE",
+                                              1024)
+
+    # Build bird read responses straight from the rows and encode them
+    # with orjson when installed, skipping response_model validation
+    FAST_SERIALIZATION: bool = os.getenv("FAST_SERIALIZATION", True)
+
+    # Have SQLite assemble bird read responses with its JSON functions
+    RAW_SQL_READS: bool = os.getenv("RAW_SQL_READS", False)
+
+    # Image derivatives. Bird image references starting with
+    # IMAGES_URL_PREFIX name originals under IMAGES_DIR and are rewritten
+    # to /images/{preset}/{path}; presets are name:width pairs.
+    IMAGES_DIR: str = os.getenv("IMAGES_DIR", "./media")
+    IMAGES_URL_PREFIX: str = os.getenv("IMAGES_URL_PREFIX", "/media/")
+    IMAGES_REWRITE_URLS: bool = os.getenv("IMAGES_REWRITE_URLS", True)
+    IMAGES_PRESETS: str = os.getenv(
+        "IMAGES_PRESETS", "thumb:160,small:320,medium:640,large:1280")
+    IMAGES_WEBP_QUALITY: int = os.getenv("IMAGES_WEBP_QUALITY", 80)
+    IMAGES_JPEG_QUALITY: int = os.getenv("IMAGES_JPEG_QUALITY", 82)
+    IMAGES_CACHE_DIR: str = os.getenv("IMAGES_CACHE_DIR", "./media-cache")
+    IMAGES_CACHE_MAX_MB: int = os.getenv("IMAGES_CACHE_MAX_MB", 1024)
+    IMAGES_WORKERS: int = os.getenv("IMAGES_WORKERS", 2)
+
+    # Bird sounds. References starting with AUDIO_URL_PREFIX name files
+    # under AUDIO_DIR and are served with Range support by /audio/files;
+    # duration/waveform metadata is cached in AUDIO_CACHE_DIR.
+    AUDIO_DIR: str = os.getenv("AUDIO_DIR", "./audio")
+    AUDIO_URL_PREFIX: str = os.getenv("AUDIO_URL_PREFIX", "/audio/")
+    AUDIO_REWRITE_URLS: bool = os.getenv("AUDIO_REWRITE_URLS", True)
+    AUDIO_CACHE_DIR: str = os.getenv("AUDIO_CACHE_DIR", "./audio-cache")
+    AUDIO_WAVEFORM_POINTS: int = os.getenv("AUDIO_WAVEFORM_POINTS", 200)
+
+    # Bird change events (GET /birds/events, WebSocket /birds/events):
+    # events buffered per subscriber before it is evicted as too slow,
+    # open subscriptions per worker, and seconds between SSE keepalives
+    EVENTS_BUFFER_SIZE: int = os.getenv("EVENTS_BUFFER_SIZE", 256)
+    EVENTS_MAX_SUBSCRIBERS: int = os.getenv("EVENTS_MAX_SUBSCRIBERS", 10000)
+    EVENTS_KEEPALIVE: float = os.getenv("EVENTS_KEEPALIVE", 15.0)
+
+    # Catalog snapshot: serve bird reads from an immutable in-memory copy
+    # of the catalog, loaded at startup and replaced after writes; writes
+    # by other workers are picked up every SNAPSHOT_REFRESH_INTERVAL
+    # seconds
+    SNAPSHOT_READS: bool = os.getenv("SNAPSHOT_READS", False)
+    SNAPSHOT_REFRESH_INTERVAL: float = os.getenv("SNAPSHOT_REFRESH_INTERVAL",
+                                                 1.0)
+    # With SNAPSHOT_FILE, the snapshot is a binary catalog file at that
+    # path, memory-mapped read-only and shared by all workers, so startup
+    # does not depend on the catalog size; writes rebuild it in the
+    # background, at most once per SNAPSHOT_FILE_REBUILD_DELAY seconds
+    SNAPSHOT_FILE: str = os.getenv("SNAPSHOT_FILE", "")
+    SNAPSHOT_FILE_REBUILD_DELAY: float = os.getenv(
+        "SNAPSHOT_FILE_REBUILD_DELAY", 1.0)
+
+    # Tracing; sampled traces are appended to TRACING_EXPORT_PATH as
+    # OTLP/JSON lines
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", False)
+    TRACING_SAMPLE_RATE: float = os.getenv("TRACING_SAMPLE_RATE", 0.01)
+    TRACING_EXPORT_PATH: str = os.getenv("TRACING_EXPORT_PATH",
+                                         "./traces.jsonl")
+
+    # Admission control: concurrency limit with a CoDel-style queue that
+    # sheds load (503) once requests have queued for a whole interval
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", True)
+    ADMISSION_MAX_CONCURRENCY: int = os.getenv("ADMISSION_MAX_CONCURRENCY",
+                                               40)
+    ADMISSION_EXPENSIVE_SHARE: float = os.getenv("ADMISSION_EXPENSIVE_SHARE",
+                                                 0.5)
+    ADMISSION_MAX_QUEUE: int = os.getenv("ADMISSION_MAX_QUEUE", 512)
+    ADMISSION_TARGET_DELAY_MS: float = os.getenv("ADMISSION_TARGET_DELAY_MS",
+                                                 10.0)
+    ADMISSION_INTERVAL_MS: float = os.getenv("ADMISSION_INTERVAL_MS", 100.0)
+
+    # Serving (run.py). With more than one worker, or a request limit,
+    # run.py starts the prefork supervisor in app/core/workers.py.
+    HOST: str = os.getenv("HOST", "0.0.0.0")
+    PORT: int = os.getenv("PORT", 8000)
+    WORKERS: int = os.getenv("WORKERS", 1)
+    WORKER_MAX_REQUESTS: int = os.getenv("WORKER_MAX_REQUESTS", 0)
+    WORKER_MAX_REQUESTS_JITTER: int = os.getenv("WORKER_MAX_REQUESTS_JITTER",
+                                                0)
+    WORKER_GRACEFUL_TIMEOUT: float = os.getenv("WORKER_GRACEFUL_TIMEOUT",
+                                               30.0)
+
     class Config:
         env_file = ".env"
 
@@ -1,7 +1,23 @@
-from sqlalchemy import create_engine
+import hashlib
+import os
+import tempfile
+import logging
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from .jobs import job_queue
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
 
 engine = create_engine(
     settings.DATABASE_URL,
@@ -20,3 +36,78 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def schema_lock_path(url: Optional[str] = None) -> str:
+    """
+        Lock file serializing schema changes to one database, shared by
+        every process on the host.
+    """
+    url = url or settings.DATABASE_URL
+    digest = hashlib.sha1(url.encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(),
+                        f"birdnest-schema-{digest}.lock")
+
+
+@contextmanager
+def schema_lock(url: Optional[str] = None) -> Iterator[None]:
+    if fcntl is None:
+        yield
+        return
+    with open(schema_lock_path(url), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def ensure_schema(bind: Engine = engine) -> None:
+    """
+        Create missing tables, and missing indexes of existing tables,
+        under the schema lock. Idempotent, so every process may call it;
+        the serving supervisor calls it once before forking workers.
+    """
+    with schema_lock(str(bind.url)):
+        inspector = inspect(bind)
+        existing = set(inspector.get_table_names())
+        Base.metadata.create_all(bind=bind)
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {index["name"]
+                       for index in inspector.get_indexes(table.name)}
+            # Columns are not migrated; indexes needing one are skipped
+            columns = {column["name"]
+                       for column in inspector.get_columns(table.name)}
+            for index in table.indexes:
+                if index.name not in present and all(
+                        column.name in columns for column in index.columns):
+                    logger.info(f"Creating index {index.name}")
+                    index.create(bind=bind)
+
+
+OPTIMIZE_JOB = "database.optimize"
+
+
+@job_queue.handler(OPTIMIZE_JOB)
+def optimize(payload=None, bind: Engine = engine) -> None:
+    """
+        Refresh the planner statistics the index choices depend on. Queued
+        after writes by the bird CRUD hook (see app/crud/bird.py).
+    """
+    if bind.dialect.name != "sqlite":
+        return
+    with bind.begin() as conn:
+        # Bounded sampling per index keeps ANALYZE cheap on large tables
+        conn.execute(text("PRAGMA analysis_limit=1000"))
+        conn.execute(text("ANALYZE"))
+
+
+def schedule_optimize() -> Optional[int]:
+    """
+        Queue a statistics refresh DATABASE_OPTIMIZE_DELAY seconds from
+        now, unless one is pending already.
+    """
+    return job_queue.enqueue(OPTIMIZE_JOB, key=OPTIMIZE_JOB,
+                             delay=settings.DATABASE_OPTIMIZE_DELAY)
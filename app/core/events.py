@@ -0,0 +1,262 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import settings
+from .metrics import registry
+from .serialization import bird_to_dict, dumps, rewrite_media
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+
+# CRUDBase hook events to the names clients see (as in GET /birds/changes)
+OPS = {"create": CREATE, "update": UPDATE, "remove": DELETE}
+
+SLOW_CONSUMER = "slow consumer"
+SHUTDOWN = "shutdown"
+
+
+class TooManySubscribers(Exception):
+    """
+        Raised by ``subscribe`` when the subscriber limit is reached.
+    """
+
+
+class BirdEvent:
+    """
+        One bird write, encoded once for every subscriber that gets it.
+    """
+    __slots__ = ("op", "bird_id", "status", "tags", "text", "sse")
+
+    def __init__(self, op: str, bird_id: str, status: Optional[str],
+                 tags: Iterable[str], data: Optional[Dict[str, Any]]):
+        self.op = op
+        self.bird_id = bird_id
+        self.status = status
+        self.tags = frozenset(tags)
+        # WebSocket message and Server-Sent Events frame
+        self.text = dumps({"op": op, "bird_id": bird_id,
+                           "data": data}).decode("utf-8")
+        self.sse = f"event: {op}\ndata: {self.text}\n\n".encode("utf-8")
+
+    @classmethod
+    def from_bird(cls, op: str, bird) -> "BirdEvent":
+        status = (bird.conservation_status or {}).get("status")
+        tags = [tag["text"].lower() for tag in bird.tags or []
+                if isinstance(tag, dict) and tag.get("text")]
+        data = None if op == DELETE else rewrite_media(bird_to_dict(bird))
+        return cls(op, bird.bird_id, status, tags, data)
+
+
+class Subscription:
+    """
+        Events matching a filter, buffered for one client. Each filter is
+        a set of accepted values, empty for any; an event must match all
+        three. Iterating yields events until the subscription is closed
+        and drained; ``closed`` then gives the reason.
+    """
+
+    def __init__(self, bird_ids: Iterable[str] = (),
+                 statuses: Iterable[str] = (), tags: Iterable[str] = (),
+                 buffer_size: int = 256):
+        self.bird_ids = frozenset(bird_ids)
+        self.statuses = frozenset(statuses)
+        self.tags = frozenset(tag.lower() for tag in tags)
+        self.buffer_size = buffer_size
+        self.closed: Optional[str] = None
+        self._subscribed = False
+        self._buffer: deque = deque()
+        self._waiter: Optional[asyncio.Future] = None
+
+    def matches(self, event: BirdEvent) -> bool:
+        return ((not self.bird_ids or event.bird_id in self.bird_ids)
+                and (not self.statuses or event.status in self.statuses)
+                and (not self.tags or not self.tags.isdisjoint(event.tags)))
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _push(self, event: BirdEvent) -> bool:
+        """
+            Buffer an event; False if the buffer is full.
+        """
+        if len(self._buffer) >= self.buffer_size:
+            return False
+        self._buffer.append(event)
+        self._wake()
+        return True
+
+    def _close(self, reason: str) -> None:
+        # Events buffered already are still handed out
+        if self.closed is None:
+            self.closed = reason
+            self._wake()
+
+    async def get(self, timeout: Optional[float] = None
+                  ) -> Optional[BirdEvent]:
+        """
+            The next event; None after ``timeout`` seconds without one, or
+            once the subscription is closed and its buffer drained.
+        """
+        if not self._buffer and self.closed is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiter = None
+        return self._buffer.popleft() if self._buffer else None
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> BirdEvent:
+        while True:
+            event = await self.get()
+            if event is not None:
+                return event
+            if self.closed is not None:
+                raise StopAsyncIteration
+
+
+class Broadcaster:
+    """
+        In-process fan-out of bird writes to subscribers.
+
+        ``publish`` may be called from any thread (the CRUD hooks run in
+        the threadpool); the event is encoded there, once, and handed to
+        the event loop the subscribers live on. Delivery only appends to
+        each matching subscriber's buffer, so a write costs the same
+        whatever the clients do. A subscriber whose buffer is full is
+        evicted rather than slowing down the others or growing without
+        bound.
+
+        Every worker process has its own broadcaster and only sees the
+        writes made through it.
+    """
+
+    def __init__(self, buffer_size: int = 256, max_subscribers: int = 10000):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Subscribers filtering on bird_id are only looked at for events
+        # of those birds
+        self._by_bird: Dict[str, Set[Subscription]] = {}
+        self._any_bird: Set[Subscription] = set()
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def subscribe(self, bird_ids: Iterable[str] = (),
+                  statuses: Iterable[str] = (), tags: Iterable[str] = ()
+                  ) -> Subscription:
+        """
+            Start buffering matching events. Subscribing, unsubscribing
+            and delivery all happen on the event loop the subscriptions
+            are read from.
+        """
+        if self._count >= self.max_subscribers:
+            raise TooManySubscribers()
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(bird_ids, statuses, tags,
+                                    self.buffer_size)
+        for bird_id in subscription.bird_ids:
+            self._by_bird.setdefault(bird_id, set()).add(subscription)
+        if not subscription.bird_ids:
+            self._any_bird.add(subscription)
+        subscription._subscribed = True
+        self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if not subscription._subscribed:
+            return
+        subscription._subscribed = False
+        for bird_id in subscription.bird_ids:
+            subscribers = self._by_bird[bird_id]
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._by_bird[bird_id]
+        self._any_bird.discard(subscription)
+        self._count -= 1
+
+    def publish(self, event: BirdEvent) -> None:
+        loop = self._loop
+        if loop is None or not self._count:
+            return
+        try:
+            loop.call_soon_threadsafe(self._deliver, event)
+        except RuntimeError:  # the loop has been closed
+            self._loop = None
+            return
+        events_published.inc(event.op)
+
+    def bird_written(self, event: str, bird) -> None:
+        """
+            CRUD hook (see app/crud/bird.py).
+        """
+        if self._count and event in OPS:
+            self.publish(BirdEvent.from_bird(OPS[event], bird))
+
+    def _deliver(self, event: BirdEvent) -> None:
+        slow: List[Subscription] = []
+        for subscribers in (self._any_bird,
+                            self._by_bird.get(event.bird_id, ())):
+            for subscription in subscribers:
+                if subscription.matches(event) and not subscription._push(
+                        event):
+                    slow.append(subscription)
+        for subscription in slow:
+            logger.info(f"Evicting slow event subscriber "
+                        f"({subscription.buffer_size} events behind)")
+            subscription._close(SLOW_CONSUMER)
+            self.unsubscribe(subscription)
+            events_evicted.inc()
+
+    def close(self, reason: str = SHUTDOWN) -> None:
+        """
+            Close every subscription, e.g. so streams end on shutdown.
+            May be called from any thread.
+        """
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._close_all, reason)
+        except RuntimeError:
+            self._loop = None
+
+    def _close_all(self, reason: str) -> None:
+        subscriptions = set(self._any_bird).union(*self._by_bird.values())
+        for subscription in subscriptions:
+            subscription._close(reason)
+            self.unsubscribe(subscription)
+
+
+bird_events = Broadcaster(
+    buffer_size=settings.EVENTS_BUFFER_SIZE,
+    max_subscribers=settings.EVENTS_MAX_SUBSCRIBERS,
+)
+
+
+def _collect_subscribers() -> Dict[Tuple[str, ...], float]:
+    return {(): len(bird_events)}
+
+
+events_published = registry.counter(
+    "birdnest_bird_events_total",
+    "Bird change events published to subscribers", ["op"])
+events_evicted = registry.counter(
+    "birdnest_bird_event_evictions_total",
+    "Event subscribers dropped for falling a full buffer behind")
+events_subscribers = registry.gauge(
+    "birdnest_bird_event_subscribers", "Open bird event subscriptions",
+    callback=_collect_subscribers)
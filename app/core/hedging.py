@@ -0,0 +1,237 @@
+import contextvars
+import math
+import threading
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class HedgeDeclined(Exception):
+    """
+        Raised by an attempt function when a hedge cannot be sent (for
+        example no free concurrency slot). Does not count as a failure.
+    """
+
+
+class LatencySketch:
+    """
+        Windowed log-bucket latency histogram.
+
+        Buckets grow geometrically by ``growth`` from ``min_value``, so any
+        quantile is accurate to within that relative error. Quantiles are
+        computed over the current and the previous window of ``window``
+        samples, which lets the estimate follow upstream changes.
+    """
+
+    def __init__(self, min_value: float = 0.001, max_value: float = 600.0,
+                 growth: float = 1.05, window: int = 1000):
+        self.min_value = min_value
+        self.growth = growth
+        self.window = window
+        self._log_growth = math.log(growth)
+        self._buckets = int(math.log(max_value / min_value)
+                            / self._log_growth) + 2
+        self._lock = threading.Lock()
+        self._current = [0] * self._buckets
+        self._previous = [0] * self._buckets
+        self._current_count = 0
+        self._previous_count = 0
+
+    def _index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        index = int(math.log(value / self.min_value) / self._log_growth) + 1
+        return min(index, self._buckets - 1)
+
+    def record(self, value: float) -> None:
+        with self._lock:
+            self._current[self._index(value)] += 1
+            self._current_count += 1
+            if self._current_count >= self.window:
+                self._previous = self._current
+                self._previous_count = self._current_count
+                self._current = [0] * self._buckets
+                self._current_count = 0
+
+    @property
+    def count(self) -> int:
+        return self._current_count + self._previous_count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+            Upper bound of the bucket holding quantile ``q``, or None
+            when no samples have been recorded.
+        """
+        with self._lock:
+            total = self._current_count + self._previous_count
+            if total == 0:
+                return None
+            rank = q * total
+            seen = 0
+            for index in range(self._buckets):
+                seen += self._current[index] + self._previous[index]
+                if seen >= rank:
+                    return self.min_value * self.growth ** index
+            return self.min_value * self.growth ** (self._buckets - 1)
+
+
+class HedgeBudget:
+    """
+        Token bucket limiting hedges to ``ratio`` of primary requests.
+
+        Every primary request earns ``ratio`` tokens (up to ``burst``),
+        every hedge spends one.
+    """
+
+    def __init__(self, ratio: float = 0.05, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+    def refund(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1.0)
+
+
+class Hedger:
+    """
+        Runs an attempt function and, if it has not returned by the
+        observed ``quantile`` latency, starts a second identical attempt.
+        The first successful attempt wins; the other is cancelled if it
+        has not started yet and otherwise abandoned (its result is
+        ignored and it is bounded by the attempt timeout).
+
+        Hedging only starts once ``min_samples`` latencies have been seen
+        and is capped by a HedgeBudget.
+    """
+
+    def __init__(self, quantile: float = 0.95, budget_ratio: float = 0.05,
+                 min_samples: int = 20, max_workers: int = 64,
+                 sketch: Optional[LatencySketch] = None):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.sketch = sketch or LatencySketch()
+        self.budget = HedgeBudget(ratio=budget_ratio)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._budget_denied = 0
+        self._capacity_denied = 0
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+            How long to wait for the primary attempt before hedging, or
+            None while there are too few samples.
+        """
+        if self.sketch.count < self.min_samples:
+            return None
+        return self.sketch.quantile(self.quantile)
+
+    def observe(self, latency: float) -> None:
+        """
+            Record the latency of a successful attempt.
+        """
+        self.sketch.record(latency)
+
+    def run(self, attempt: Callable[[float, bool], T], deadline: float) -> T:
+        """
+            Run ``attempt(deadline, is_hedge)`` with hedging.
+
+            Args:
+                attempt: Performs one upstream call that must end by
+                    ``deadline``; raises HedgeDeclined for a hedge that
+                    cannot be sent
+                deadline: time.monotonic() by which the request must end
+
+            Returns:
+                The result of the first successful attempt
+
+            Raises:
+                The primary attempt's exception if no attempt succeeded
+        """
+        self._count("_requests")
+        self.budget.deposit()
+
+        start = time.monotonic()
+        # Each attempt runs in a copy of the caller's context, so tracing
+        # spans and request state follow it into the executor
+        primary = self._executor.submit(contextvars.copy_context().run,
+                                        attempt, deadline, False)
+        pending = {primary}
+
+        delay = self.hedge_delay()
+        if delay is not None and delay < deadline - start:
+            done, _ = wait(pending, timeout=delay)
+            if not done:
+                if self.budget.try_spend():
+                    self._count("_hedges")
+                    pending.add(self._executor.submit(
+                        contextvars.copy_context().run, attempt, deadline,
+                        True))
+                else:
+                    self._count("_budget_denied")
+
+        first_error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is not primary:
+                        self._count("_hedge_wins")
+                    return future.result()
+                if isinstance(error, HedgeDeclined):
+                    # The hedge was never sent
+                    self.budget.refund()
+                    with self._lock:
+                        self._hedges -= 1
+                        self._capacity_denied += 1
+                elif future is primary or first_error is None:
+                    first_error = error
+        raise first_error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self._requests
+            hedges = self._hedges
+            wins = self._hedge_wins
+            return {
+                "requests": requests,
+                "hedges": hedges,
+                "hedge_wins": wins,
+                "hedge_rate": round(hedges / requests, 4) if requests else 0.0,
+                "win_rate": round(wins / hedges, 4) if hedges else 0.0,
+                "budget_denied": self._budget_denied,
+                "capacity_denied": self._capacity_denied,
+                "hedge_delay": self.hedge_delay(),
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
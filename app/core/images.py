@@ -0,0 +1,363 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import anyio
+
+from .config import settings
+from .metrics import registry
+
+try:
+    import PIL  # noqa: F401  (only probed; rendering imports it in the pool)
+except ImportError:  # optional
+    PIL = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+ORIGINAL = "original"
+
+# Derivative URLs carry the original's digest, so a changed original gets
+# a new URL and responses under a matching ``v`` never change
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=300"
+
+# Preset each bird image field is rewritten to
+FIELD_PRESETS = {
+    "main": "large",
+    "gallery": "medium",
+    "diet": "thumb",
+    "related": "small",
+}
+
+RENDER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def parse_presets(spec: str) -> Dict[str, int]:
+    """
+        ``"thumb:160,small:320"`` to ``{"thumb": 160, "small": 320}``.
+    """
+    presets = {}
+    for item in spec.split(","):
+        name, _, width = item.strip().partition(":")
+        presets[name] = int(width)
+    return presets
+
+
+def render_derivative(source: str, target: str, width: int, fmt: str,
+                      quality: int) -> int:
+    """
+        Scale ``source`` down to at most ``width`` pixels wide and write it
+        to ``target`` as ``fmt``. Runs in the image process pool; returns
+        the size written.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        options = {"quality": quality}
+        if fmt == "webp":
+            options["method"] = 4
+        else:
+            options.update(optimize=True, progressive=True)
+        image.save(target, format=fmt.upper(), **options)
+    return os.path.getsize(target)
+
+
+class ImageStore:
+    """
+        Locally stored originals and their resized derivatives.
+
+        Bird documents refer to an original as ``url_prefix`` plus its path
+        under ``root``. ``rewrite`` points those references at
+        ``{base_url}/{preset}/{path}?v={digest}``, the digest being a hash
+        of the original's content.
+
+        Derivatives are rendered on first request in a process pool, so
+        resizing never blocks the event loop or holds the GIL, and kept in
+        ``cache_dir`` under the hash of (original digest, width, format,
+        quality). Several processes may share the cache. Once it holds more
+        than ``max_bytes``, the least recently used files are deleted; a
+        cache hit refreshes the file's mtime at most once a minute.
+    """
+
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, root: str, cache_dir: str, max_bytes: int,
+                 presets: Dict[str, int], url_prefix: str = "/media/",
+                 base_url: str = "/images", webp_quality: int = 80,
+                 jpeg_quality: int = 82, workers: int = 2):
+        self.root = os.path.realpath(root)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.presets = presets
+        self.url_prefix = url_prefix
+        self.base_url = base_url.rstrip("/")
+        self.quality = {"webp": webp_quality, "jpeg": jpeg_quality}
+        self.workers = workers
+        self._lock = threading.Lock()
+        # (path, mtime_ns, size) -> content digest
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self._rendering: Dict[str, asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._cache_bytes: Optional[int] = None
+
+    @property
+    def available(self) -> bool:
+        """
+            True when derivatives can be rendered (Pillow is installed);
+            otherwise the original is served for every preset.
+        """
+        return PIL is not None
+
+    def original(self, path: str) -> Optional[str]:
+        """
+            File of the original at ``path`` under root, or None if there
+            is none (or ``path`` leads outside root).
+        """
+        source = os.path.realpath(os.path.join(self.root, path))
+        if not source.startswith(self.root + os.sep):
+            return None
+        return source if os.path.isfile(source) else None
+
+    def digest(self, source: str) -> str:
+        stat = os.stat(source)
+        key = (source, stat.st_mtime_ns, stat.st_size)
+        digest = self._digests.get(key)
+        if digest is None:
+            hasher = hashlib.sha256()
+            with open(source, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 16), b""):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()[:16]
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    # Rewriting bird documents
+
+    def url(self, reference: Any, preset: str) -> Any:
+        """
+            Derivative URL for an image reference in a bird document;
+            anything but a local original is returned unchanged.
+        """
+        if not self._local(reference):
+            return reference
+        path = reference[len(self.url_prefix):]
+        source = self.original(path)
+        if source is None:
+            return reference
+        return (f"{self.base_url}/{preset}/{path}"
+                f"?v={self.digest(source)}")
+
+    def _local(self, reference: Any) -> bool:
+        return (isinstance(reference, str)
+                and reference.startswith(self.url_prefix))
+
+    def _images(self, items: Any, key: str, preset: str) -> Any:
+        """
+            ``items`` with the ``key`` of each dict rewritten; the same
+            list if none of them refers to a local original.
+        """
+        if not isinstance(items, list) or not any(
+                isinstance(item, dict) and self._local(item.get(key))
+                for item in items):
+            return items
+        return [dict(item, **{key: self.url(item[key], preset)})
+                if isinstance(item, dict) and self._local(item.get(key))
+                else item for item in items]
+
+    def rewrite(self, bird: Dict[str, Any]) -> Dict[str, Any]:
+        """
+            ``bird`` (a ``schemas.Bird`` dict) with its local image
+            references pointing at derivatives. Changed parts are copied,
+            the input is never modified; a bird without local images is
+            returned as it is.
+        """
+        changes: Dict[str, Any] = {}
+        images = bird.get("images")
+        if isinstance(images, dict):
+            rewritten = {field: self._images(images[field], "url",
+                                             FIELD_PRESETS[field])
+                         for field in ("main", "gallery") if field in images}
+            if any(rewritten[field] is not images[field]
+                   for field in rewritten):
+                changes["images"] = dict(images, **rewritten)
+        diet_and_behavior = bird.get("diet_and_behavior")
+        diet = (diet_and_behavior.get("diet")
+                if isinstance(diet_and_behavior, dict) else None)
+        if isinstance(diet, dict) and "items" in diet:
+            items = self._images(diet["items"], "image",
+                                 FIELD_PRESETS["diet"])
+            if items is not diet["items"]:
+                changes["diet_and_behavior"] = dict(
+                    diet_and_behavior, diet=dict(diet, items=items))
+        related = self._images(bird.get("related_birds"), "image",
+                               FIELD_PRESETS["related"])
+        if related is not bird.get("related_birds"):
+            changes["related_birds"] = related
+        return dict(bird, **changes) if changes else bird
+
+    # Derivatives
+
+    def negotiate(self, accept: Optional[str]) -> str:
+        return "webp" if accept and "image/webp" in accept else "jpeg"
+
+    def cache_path(self, digest: str, preset: str, fmt: str) -> str:
+        key = hashlib.sha256(
+            f"{digest}:{self.presets[preset]}:{fmt}:{self.quality[fmt]}"
+            .encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key[2:4],
+                            f"{key}.{fmt}")
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Created lazily, so every prefork worker gets a pool of its own
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def derivative(self, source: str, preset: str, fmt: str,
+                         digest: Optional[str] = None) -> str:
+        """
+            Path of the cached derivative, rendering it first if needed.
+            Concurrent requests for the same derivative share one render.
+            Hashing the original (unless its ``digest`` is given) and
+            accounting the cache's size run in a thread, off the event
+            loop.
+        """
+        if digest is None:
+            digest = await anyio.to_thread.run_sync(self.digest, source)
+        target = self.cache_path(digest, preset, fmt)
+        try:
+            stat = os.stat(target)
+        except FileNotFoundError:
+            pass
+        else:
+            image_requests.inc("hit")
+            if time.time() - stat.st_mtime > self.TOUCH_INTERVAL:
+                os.utime(target)
+            return target
+
+        future = self._rendering.get(target)
+        if future is not None:
+            image_requests.inc("coalesced")
+            await asyncio.shield(future)
+            return target
+        future = asyncio.get_running_loop().create_future()
+        self._rendering[target] = future
+        try:
+            await self._render(source, target, preset, fmt)
+            future.set_result(None)
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved here, so a render nobody else waits for does not
+            # log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            del self._rendering[target]
+        return target
+
+    async def _render(self, source: str, target: str, preset: str,
+                      fmt: str) -> None:
+        image_requests.inc("miss")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, partial = tempfile.mkstemp(dir=os.path.dirname(target),
+                                       suffix=".partial")
+        os.close(fd)
+        start = time.perf_counter()
+        try:
+            size = await asyncio.get_running_loop().run_in_executor(
+                self._executor(), render_derivative, source, partial,
+                self.presets[preset], fmt, self.quality[fmt])
+            os.replace(partial, target)
+        except BaseException:
+            if os.path.exists(partial):
+                os.unlink(partial)
+            raise
+        image_render_seconds.observe(time.perf_counter() - start, preset)
+        # May walk the whole cache directory
+        await anyio.to_thread.run_sync(self._added, size)
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for directory, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def cache_bytes(self) -> int:
+        with self._lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(size for _, size, _ in self._scan())
+            return self._cache_bytes
+
+    def _added(self, size: int) -> None:
+        self.cache_bytes()
+        with self._lock:
+            self._cache_bytes += size
+            if self._cache_bytes <= self.max_bytes:
+                return
+            # Rescan: other processes write to the same cache
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            # Evict down to 90% so eviction does not run on every render
+            for _, size, path in entries:
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                image_evictions.inc()
+            self._cache_bytes = total
+
+
+image_store = ImageStore(
+    settings.IMAGES_DIR,
+    settings.IMAGES_CACHE_DIR,
+    max_bytes=settings.IMAGES_CACHE_MAX_MB * 1024 * 1024,
+    presets=parse_presets(settings.IMAGES_PRESETS),
+    url_prefix=settings.IMAGES_URL_PREFIX,
+    base_url=f"{settings.API_V1_STR}/images",
+    webp_quality=settings.IMAGES_WEBP_QUALITY,
+    jpeg_quality=settings.IMAGES_JPEG_QUALITY,
+    workers=settings.IMAGES_WORKERS,
+)
+
+image_requests = registry.counter(
+    "birdnest_image_requests_total",
+    "Derivative lookups by result (hit, miss, coalesced, original)",
+    ["result"])
+image_render_seconds = registry.histogram(
+    "birdnest_image_render_seconds", "Time to render a derivative",
+    ["preset"], buckets=RENDER_BUCKETS)
+image_evictions = registry.counter(
+    "birdnest_image_cache_evictions_total",
+    "Derivatives deleted to keep the cache under its size cap")
+image_cache_bytes = registry.gauge(
+    "birdnest_image_cache_bytes", "Size of the derivative cache",
+    callback=lambda: {(): float(image_store._cache_bytes or 0)})
@@ -0,0 +1,387 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+from .metrics import registry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DEAD = "dead"
+
+JOB_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0,
+                       300.0, 3600.0)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    key TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    locked_until REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_ready
+    ON jobs (state, kind, priority DESC, run_at);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_pending_key
+    ON jobs (key) WHERE key IS NOT NULL AND state = 'pending';
+"""
+
+
+class Job:
+    __slots__ = ("id", "kind", "payload", "attempts", "enqueued_at")
+
+    def __init__(self, id: int, kind: str, payload: Any, attempts: int,
+                 enqueued_at: float):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.enqueued_at = enqueued_at
+
+
+class _Handler:
+    __slots__ = ("function", "batch_size", "max_attempts")
+
+    def __init__(self, function: Callable, batch_size: int,
+                 max_attempts: int):
+        self.function = function
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+
+
+class JobQueue:
+    """
+        Durable background jobs in a SQLite table, run by a bounded pool
+        of worker threads.
+
+        ``enqueue`` inserts a row and returns, so queued work survives
+        restarts and crashes, and every process sharing ``path`` works the
+        same queue. A worker claims the most urgent ready job (highest
+        ``priority``, then oldest) together with more jobs of the same
+        kind, up to the handler's ``batch_size``, and runs the handler
+        once for the batch. A failed batch is retried with exponential
+        backoff and jitter; after ``max_attempts`` its jobs stay in the
+        table as ``dead``. Jobs of a worker that died are claimed again
+        once their ``lease`` expires.
+
+        A job ``key`` makes enqueueing idempotent: while a job with that
+        key is pending, enqueueing it again does nothing. With a
+        ``delay`` this coalesces bursts, e.g. one rebuild for many writes.
+
+        Each thread has its own connection, so concurrent enqueues and
+        claims only wait on each other inside SQLite, for the length of one
+        write transaction, and never on a lock held by another thread.
+    """
+
+    def __init__(self, path: str, workers: int = 2,
+                 poll_interval: float = 1.0, max_attempts: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 300.0,
+                 lease: float = 300.0):
+        self.path = path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self._handlers: Dict[str, _Handler] = {}
+        # Guards the counters only
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._completed = 0
+        self._retried = 0
+        self._dead = 0
+
+    def handler(self, kind: str, batch_size: int = 1,
+                max_attempts: Optional[int] = None):
+        """
+            Register the function running jobs of ``kind``. With a
+            ``batch_size`` above 1 it is called with a list of payloads,
+            otherwise with one payload.
+        """
+        def register(function: Callable) -> Callable:
+            self._handlers[kind] = _Handler(
+                function, batch_size, max_attempts or self.max_attempts)
+            return function
+        return register
+
+    def _connection(self) -> sqlite3.Connection:
+        # One per thread, opened lazily and again after a fork; a SQLite
+        # connection must not be shared between processes
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            local.conn, local.pid = conn, os.getpid()
+        return local.conn
+
+    def enqueue(self, kind: str, payload: Any = None, *, priority: int = 0,
+                key: Optional[str] = None, delay: float = 0.0
+                ) -> Optional[int]:
+        """
+            Queue a job. Returns its id, or None if a pending job with the
+            same ``key`` already exists.
+        """
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO jobs (kind, payload, priority, key, run_at, "
+            "enqueued_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT DO NOTHING",
+            (kind, json.dumps(payload), priority, key, now + delay, now))
+        if not cursor.rowcount:
+            return None
+        if delay <= 0:
+            self._wakeup.set()
+        return cursor.lastrowid
+
+    def _claim(self) -> Optional[Tuple[_Handler, List[Job]]]:
+        kinds = list(self._handlers)
+        if not kinds:
+            return None
+        marks = ", ".join("?" * len(kinds))
+        # Each kind's own max_attempts, the queue's for kinds without a
+        # handler here
+        attempts_limit = "CASE kind {} ELSE ? END".format(
+            " ".join("WHEN ? THEN ?" for _ in kinds))
+        limits = [value for kind in kinds
+                  for value in (kind, self._handlers[kind].max_attempts)]
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs of workers that died: retry, or give up on jobs that
+            # keep taking their worker down. A job whose key was queued
+            # again meanwhile is skipped here and dropped below; the
+            # pending one covers it
+            conn.execute(
+                f"UPDATE OR IGNORE jobs SET state = CASE WHEN attempts >= "
+                f"{attempts_limit} THEN 'dead' ELSE 'pending' END, "
+                f"locked_until = NULL, last_error = 'lease expired' "
+                f"WHERE state = 'running' AND locked_until < ?",
+                (*limits, self.max_attempts, now))
+            conn.execute("DELETE FROM jobs WHERE state = 'running' "
+                         "AND locked_until < ?", (now,))
+            row = conn.execute(
+                f"SELECT kind FROM jobs WHERE state = 'pending' "
+                f"AND run_at <= ? AND kind IN ({marks}) "
+                f"ORDER BY priority DESC, run_at, id LIMIT 1",
+                (now, *kinds)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            handler = self._handlers[row[0]]
+            rows = conn.execute(
+                "SELECT id, payload, attempts, enqueued_at FROM jobs "
+                "WHERE state = 'pending' AND kind = ? AND run_at <= ? "
+                "ORDER BY priority DESC, run_at, id LIMIT ?",
+                (row[0], now, handler.batch_size)).fetchall()
+            ids = [r[0] for r in rows]
+            conn.execute(
+                f"UPDATE jobs SET state = 'running', "
+                f"attempts = attempts + 1, locked_until = ? "
+                f"WHERE id IN ({', '.join('?' * len(ids))})",
+                (now + self.lease, *ids))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return handler, [Job(r[0], row[0], json.loads(r[1]), r[2] + 1, r[3])
+                         for r in rows]
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max,
+                    self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _run(self, handler: _Handler, jobs: List[Job]) -> bool:
+        kind = jobs[0].kind
+        start = time.perf_counter()
+        try:
+            if handler.batch_size > 1:
+                handler.function([job.payload for job in jobs])
+            else:
+                handler.function(jobs[0].payload)
+        except Exception as e:
+            job_run_seconds.observe(time.perf_counter() - start, kind)
+            self._fail(handler, jobs, e)
+            return False
+        job_run_seconds.observe(time.perf_counter() - start, kind)
+        self._complete(jobs)
+        return True
+
+    def _complete(self, jobs: List[Job]) -> None:
+        ids = [job.id for job in jobs]
+        self._connection().execute(
+            f"DELETE FROM jobs WHERE id IN ({', '.join('?' * len(ids))})",
+            ids)
+        with self._lock:
+            self._completed += len(jobs)
+        now = time.time()
+        for job in jobs:
+            job_latency.observe(now - job.enqueued_at, job.kind)
+        jobs_processed.inc(jobs[0].kind, "completed", amount=len(jobs))
+
+    def _fail(self, handler: _Handler, jobs: List[Job],
+              error: Exception) -> None:
+        kind = jobs[0].kind
+        message = f"{type(error).__name__}: {error}"[:1000]
+        now = time.time()
+        conn = self._connection()
+        dead, retried = [], []
+        for job in jobs:
+            (dead if job.attempts >= handler.max_attempts
+             else retried).append(job)
+        conn.executemany(
+            "UPDATE jobs SET state = 'dead', locked_until = NULL, "
+            "last_error = ? WHERE id = ?",
+            [(message, job.id) for job in dead])
+        # A job whose key was queued again while it ran is merged into
+        # the pending one (the unique key index allows one pending row)
+        conn.executemany(
+            "UPDATE OR IGNORE jobs SET state = 'pending', "
+            "locked_until = NULL, run_at = ?, last_error = ? WHERE id = ?",
+            [(now + self._backoff(job.attempts), message, job.id)
+             for job in retried])
+        conn.executemany(
+            "DELETE FROM jobs WHERE id = ? AND state = 'running'",
+            [(job.id,) for job in retried])
+        with self._lock:
+            self._dead += len(dead)
+            self._retried += len(retried)
+        if dead:
+            jobs_processed.inc(kind, "dead", amount=len(dead))
+        if retried:
+            jobs_processed.inc(kind, "retried", amount=len(retried))
+        logger.warning(f"{len(jobs)} {kind} job(s) failed: {message}")
+
+    def run_pending(self, limit: Optional[int] = None) -> int:
+        """
+            Run ready jobs in the calling thread until none are left (or
+            ``limit`` batches ran). Returns the number of batches.
+        """
+        batches = 0
+        while limit is None or batches < limit:
+            claimed = self._claim()
+            if claimed is None:
+                break
+            self._run(*claimed)
+            batches += 1
+        return batches
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                claimed = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Claiming jobs failed: {str(e)}")
+                claimed = None
+            if claimed is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self._run(*claimed)
+            except Exception as e:
+                # Left running; claimed again once the lease expires
+                logger.error(f"Running {claimed[1][0].kind} jobs failed: "
+                             f"{str(e)}")
+
+    def start(self) -> None:
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._work,
+                                          name=f"jobs-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+            Stop the workers once their current batches are done. Pending
+            jobs stay queued for the next start.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def counts(self) -> Dict[Tuple[str, str], int]:
+        """
+            Number of jobs per (kind, state).
+        """
+        rows = self._connection().execute(
+            "SELECT kind, state, COUNT(*) FROM jobs "
+            "GROUP BY kind, state").fetchall()
+        return {(kind, state): count for kind, state, count in rows}
+
+    def stats(self, kind: Optional[str] = None) -> Dict[str, Any]:
+        counts = self.counts()
+        oldest = self._connection().execute(
+            "SELECT MIN(enqueued_at) FROM jobs WHERE state = 'pending'"
+            + (" AND kind = ?" if kind else ""),
+            (kind,) if kind else ()).fetchone()[0]
+        return {
+            "pending": sum(n for (k, s), n in counts.items()
+                           if s == PENDING and kind in (None, k)),
+            "running": sum(n for (k, s), n in counts.items()
+                           if s == RUNNING and kind in (None, k)),
+            "dead": sum(n for (k, s), n in counts.items()
+                        if s == DEAD and kind in (None, k)),
+            "oldest_pending_seconds": None if oldest is None
+            else round(time.time() - oldest, 3),
+            "workers": sum(thread.is_alive() for thread in self._threads),
+            "completed": self._completed,
+            "retried": self._retried,
+            "failed": self._dead,
+        }
+
+
+job_queue = JobQueue(
+    settings.JOBS_SQLITE_PATH,
+    workers=settings.JOBS_WORKERS,
+    poll_interval=settings.JOBS_POLL_INTERVAL,
+    max_attempts=settings.JOBS_MAX_ATTEMPTS,
+    backoff_base=settings.JOBS_BACKOFF_BASE,
+    backoff_max=settings.JOBS_BACKOFF_MAX,
+    lease=settings.JOBS_LEASE_SECONDS,
+)
+
+
+def _collect_depth() -> Dict[Tuple[str, ...], float]:
+    return {labels: float(count)
+            for labels, count in job_queue.counts().items()}
+
+
+jobs_processed = registry.counter(
+    "birdnest_jobs_total", "Background jobs by outcome", ["kind", "result"])
+job_latency = registry.histogram(
+    "birdnest_job_latency_seconds",
+    "Time from enqueueing a job to its completion", ["kind"],
+    buckets=JOB_LATENCY_BUCKETS)
+job_run_seconds = registry.histogram(
+    "birdnest_job_run_seconds", "Handler run time per batch", ["kind"])
+jobs_queued = registry.gauge(
+    "birdnest_jobs", "Jobs in the queue table", ["kind", "state"],
+    callback=_collect_depth)
@@ -0,0 +1,405 @@
+import bisect
+import threading
+import time
+import logging
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Starlette appends "; charset=utf-8" to text/* media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1,
+                   0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str],
+                   extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"'
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Sequence[str] = (),
+                 lock: Optional[threading.Lock] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Metrics updated together may share one lock
+        self._lock = lock or threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+        Monotonic counter; label values are passed positionally.
+    """
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # labels -> [value]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def series(self, labels: Tuple[str, ...]) -> List[float]:
+        """
+            The mutable cell of ``labels``; only touch it holding the lock.
+        """
+        cell = self._values.get(labels)
+        if cell is None:
+            cell = self._values[labels] = [0.0]
+        return cell
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self.series(labels)[0] += amount
+
+    def value(self, *labels: str) -> float:
+        cell = self._values.get(labels)
+        return cell[0] if cell else 0.0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, cell[0])
+                     for labels, cell in self._values.items()]
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} "
+                f"{_format_value(value)}" for labels, value in items]
+
+
+class Gauge(_Metric):
+    """
+        Value that goes up and down. ``callback`` makes it a collector
+        that returns ``{label values: value}`` when scraped.
+    """
+    kind = "gauge"
+
+    def __init__(self, *args, callback: Optional[
+            Callable[[], Dict[Tuple[str, ...], float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # labels -> [value]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._callback = callback
+
+    series = Counter.series
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self.series(labels)[0] += amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self.series(labels)[0] = value
+
+    value = Counter.value
+
+    def render(self) -> List[str]:
+        if self._callback is not None:
+            try:
+                items = list(self._callback().items())
+            except Exception as e:
+                logger.warning(f"Collecting {self.name} failed: {e}")
+                items = []
+        else:
+            with self._lock:
+                items = [(labels, cell[0])
+                         for labels, cell in self._values.items()]
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} "
+                f"{_format_value(value)}" for labels, value in items]
+
+
+class Histogram(_Metric):
+    """
+        Cumulative histogram with fixed upper bounds.
+    """
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = LATENCY_BUCKETS,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def series(self, labels: Tuple[str, ...]) -> List[float]:
+        """
+            The mutable series of ``labels``; only touch it holding the
+            lock.
+        """
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 2)
+        return series
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series(labels)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._values.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def sum(self, *labels: str) -> float:
+        series = self._values.get(labels)
+        return series[-1] if series else 0.0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(series))
+                     for labels, series in self._values.items()]
+        lines = []
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket"
+                             f"{_format_labels(self.labelnames, labels, le)}"
+                             f" {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} "
+                         f"{_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+        Holds metrics and renders them in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str,
+                labelnames: Sequence[str] = (), lock=None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames,
+                                     lock=lock))
+
+    def gauge(self, name: str, documentation: str,
+              labelnames: Sequence[str] = (), callback=None,
+              lock=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames,
+                                   callback=callback, lock=lock))
+
+    def histogram(self, name: str, documentation: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS,
+                  lock=None) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames,
+                                       buckets=buckets, lock=lock))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Every per-request HTTP metric is updated under this one lock
+_http_lock = threading.Lock()
+
+http_requests = registry.counter(
+    "birdnest_http_requests_total", "HTTP requests by route and status.",
+    ("method", "route", "status"), lock=_http_lock)
+http_latency = registry.histogram(
+    "birdnest_http_request_duration_seconds",
+    "HTTP request latency by route.", ("method", "route"), lock=_http_lock)
+http_in_flight = registry.gauge(
+    "birdnest_http_requests_in_flight", "HTTP requests being served.",
+    ("method",), lock=_http_lock)
+db_queries = registry.counter(
+    "birdnest_db_queries_total", "SQL statements executed.")
+db_query_latency = registry.histogram(
+    "birdnest_db_query_duration_seconds", "SQL statement latency.")
+db_queries_per_request = registry.histogram(
+    "birdnest_http_request_db_queries",
+    "SQL statements executed per HTTP request.", ("route",),
+    buckets=COUNT_BUCKETS, lock=_http_lock)
+db_time_per_request = registry.histogram(
+    "birdnest_http_request_db_seconds",
+    "Time spent in SQL per HTTP request.", ("route",), lock=_http_lock)
+upstream_latency = registry.histogram(
+    "birdnest_ai_upstream_duration_seconds",
+    "AI agent upstream call latency by outcome.", ("outcome",))
+upstream_errors = registry.counter(
+    "birdnest_ai_upstream_errors_total",
+    "Failed AI agent upstream calls by error type.", ("error",))
+
+
+class RequestStats:
+    """
+        SQL work done on behalf of the current HTTP request.
+    """
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+# Shared with the threadpool, which runs handlers in a copy of the context
+current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "birdnest_request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    elapsed = time.perf_counter() - context._metrics_start
+    db_queries.inc()
+    db_query_latency.observe(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+        Count and time SQL statements and export the pool state of
+        ``engine``.
+    """
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    pool = engine.pool
+
+    def pool_stats() -> Dict[Tuple[str, ...], float]:
+        stats = {}
+        # Only QueuePool-like pools can report their state
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, name, None)
+            if method is not None:
+                stats[(name,)] = method()
+        return stats
+
+    registry.gauge("birdnest_db_pool_connections",
+                   "SQLAlchemy connection pool state.", ("state",),
+                   callback=pool_stats)
+
+
+# (method, route, status) -> the series a finished request updates
+_request_series: Dict[Tuple[str, str, str], tuple] = {}
+
+
+def record_request(method: str, route: str, status: str, elapsed: float,
+                   stats: RequestStats) -> None:
+    """
+        Record a finished request with a single lock round trip.
+    """
+    latency_index = bisect.bisect_left(http_latency.buckets, elapsed)
+    queries_index = bisect.bisect_left(db_queries_per_request.buckets,
+                                       stats.queries)
+    db_index = bisect.bisect_left(db_time_per_request.buckets,
+                                  stats.db_time)
+    with _http_lock:
+        series = _request_series.get((method, route, status))
+        if series is None:
+            series = _request_series[(method, route, status)] = (
+                http_requests.series((method, route, status)),
+                http_latency.series((method, route)),
+                db_queries_per_request.series((route,)),
+                db_time_per_request.series((route,)),
+                http_in_flight.series((method,)),
+            )
+        requests, latency, queries, db_time, in_flight = series
+        requests[0] += 1
+        latency[latency_index] += 1
+        latency[-1] += elapsed
+        queries[queries_index] += 1
+        queries[-1] += stats.queries
+        db_time[db_index] += 1
+        db_time[-1] += stats.db_time
+        in_flight[0] -= 1
+
+
+class MetricsMiddleware:
+    """
+        Pure ASGI middleware recording request counts, latency, in-flight
+        requests and per-request SQL work.
+
+        Routes are labelled with their path template (``/birds/{bird_id}``)
+        so label cardinality stays bounded; requests that match no route
+        are labelled ``unmatched``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        http_in_flight.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            record_request(method, route, str(status[0]), elapsed, stats)
@@ -0,0 +1,381 @@
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+import logging
+from collections import Counter, OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from .config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Leaf frames of a thread that is waiting rather than working
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("base_events.py", "_run_once"),
+}
+
+_labels: Dict[Any, str] = {}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        # Longest import root first, so site-packages wins over the stdlib
+        for path in sorted(set(sys.path + [os.getcwd()]), key=len,
+                           reverse=True):
+            if path and filename.startswith(path + os.sep):
+                filename = filename[len(path) + 1:]
+                break
+        label = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+        _labels[code] = label
+    return label
+
+
+def _stack(frame) -> Optional[Tuple[str, ...]]:
+    """
+        Root-to-leaf labels of a thread's stack, or None when idle.
+    """
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+
+def collapse(counts: Counter) -> str:
+    """
+        Collapsed-stack text (``frame;frame;frame count`` per line), the
+        input format of flamegraph.pl, speedscope and similar tools.
+    """
+    lines = [f"{';'.join(stack)} {count}"
+             for stack, count in counts.most_common()]
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+class StackSampler:
+    """
+        Samples the Python stacks of other threads every ``interval``
+        seconds from a background thread.
+
+        ``thread_filter(ident, name)`` selects the threads to sample; idle
+        threads (waiting on a lock, queue or selector) are skipped.
+    """
+
+    def __init__(self, interval: float,
+                 thread_filter: Optional[Callable[[int, str], bool]] = None,
+                 on_sample: Optional[Callable[["StackSampler"], None]] = None):
+        self.interval = interval
+        self.thread_filter = thread_filter
+        # Guards counts and samples, which other threads may read
+        self.lock = threading.Lock()
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._on_sample = on_sample
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self) -> None:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name
+                 for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            name = names.get(ident, str(ident))
+            if self.thread_filter and not self.thread_filter(ident, name):
+                continue
+            stack = _stack(frame)
+            if stack is not None:
+                stacks.append((name,) + stack)
+        with self.lock:
+            self.counts.update(stacks)
+            self.samples += 1
+        if self._on_sample is not None:
+            self._on_sample(self)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.debug(f"Stack sample failed: {e}")
+
+    def start(self) -> "StackSampler":
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="stack-sampler")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+
+
+class ProfileStore:
+    """
+        The last ``max_profiles`` request profiles, optionally also
+        written to ``directory`` as ``<id>.collapsed`` files.
+    """
+
+    def __init__(self, max_profiles: int = 50,
+                 directory: Optional[str] = None):
+        self.max_profiles = max_profiles
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def add(self, profile: Dict[str, Any]) -> None:
+        with self._lock:
+            self._profiles[profile["id"]] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory,
+                                    f"{profile['id']}.collapsed")
+                with open(path, "w") as f:
+                    f.write(profile["collapsed"])
+            except OSError as e:
+                logger.warning(f"Could not store profile: {e}")
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{k: v for k, v in profile.items() if k != "collapsed"}
+                    for profile in reversed(self._profiles.values())]
+
+
+class ContinuousProfiler:
+    """
+        Low-rate sampling of every busy thread, aggregated into windows of
+        ``window_seconds``; the last ``windows`` windows are kept.
+    """
+
+    def __init__(self, hz: float = 19.0, window_seconds: float = 60.0,
+                 windows: int = 10):
+        self.hz = hz
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._windows: deque = deque(maxlen=windows)
+        self._window_start = time.time()
+        self._sampler: Optional[StackSampler] = None
+
+    @property
+    def running(self) -> bool:
+        return self._sampler is not None
+
+    def _rotate(self, sampler: StackSampler) -> None:
+        now = time.time()
+        if now - self._window_start < self.window_seconds:
+            return
+        with sampler.lock:
+            counts = sampler.counts
+            sampler.counts = Counter()
+        with self._lock:
+            self._windows.append((self._window_start, counts))
+        self._window_start = now
+
+    def start(self) -> None:
+        if self._sampler is not None:
+            return
+        self._window_start = time.time()
+        self._sampler = StackSampler(1.0 / self.hz,
+                                     on_sample=self._rotate).start()
+
+    def stop(self) -> None:
+        sampler, self._sampler = self._sampler, None
+        if sampler is not None:
+            sampler.stop()
+            # Keep the unfinished window
+            with self._lock:
+                self._windows.append((self._window_start, sampler.counts))
+
+    def configure(self, enabled: Optional[bool] = None,
+                  hz: Optional[float] = None,
+                  window_seconds: Optional[float] = None) -> Dict[str, Any]:
+        restart = self.running and hz is not None and hz != self.hz
+        if hz is not None:
+            self.hz = hz
+        if window_seconds is not None:
+            self.window_seconds = window_seconds
+        if restart or enabled is False:
+            self.stop()
+        if enabled or (restart and enabled is None):
+            self.start()
+        return self.status()
+
+    def counts(self, windows: Optional[int] = None) -> Counter:
+        """
+            Samples of the last ``windows`` windows (all kept windows by
+            default) plus the current, unfinished one.
+        """
+        with self._lock:
+            kept = list(self._windows)
+        if windows is not None:
+            kept = kept[-windows:] if windows > 0 else []
+        total: Counter = Counter()
+        for _, counts in kept:
+            total.update(counts)
+        sampler = self._sampler
+        if sampler is not None:
+            with sampler.lock:
+                total.update(sampler.counts)
+        return total
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            windows = len(self._windows)
+        return {"enabled": self.running, "hz": self.hz,
+                "window_seconds": self.window_seconds,
+                "windows": windows}
+
+
+profile_store = ProfileStore(max_profiles=settings.PROFILING_MAX_STORED,
+                             directory=settings.PROFILING_DIR)
+continuous_profiler = ContinuousProfiler(
+    hz=settings.PROFILING_CONTINUOUS_HZ,
+    window_seconds=settings.PROFILING_WINDOW_SECONDS,
+    windows=settings.PROFILING_WINDOWS,
+)
+
+
+_switch_lock = threading.Lock()
+_switch_users = 0
+_switch_interval = sys.getswitchinterval()
+
+
+def _acquire_switch_interval(interval: float) -> None:
+    """
+        Make the interpreter switch threads at least every ``interval``
+        seconds; otherwise the sampler thread only gets the GIL every 5 ms
+        (the default switch interval) and short requests get few samples.
+    """
+    global _switch_users, _switch_interval
+    with _switch_lock:
+        if _switch_users == 0:
+            _switch_interval = sys.getswitchinterval()
+        _switch_users += 1
+        sys.setswitchinterval(min(_switch_interval, interval))
+
+
+def _release_switch_interval() -> None:
+    global _switch_users
+    with _switch_lock:
+        _switch_users -= 1
+        if _switch_users == 0:
+            sys.setswitchinterval(_switch_interval)
+
+
+def _is_admin(scope) -> bool:
+    if not settings.ADMIN_TOKEN:
+        return False
+    for name, value in scope["headers"]:
+        if name == b"x-admin-token":
+            return hmac.compare_digest(value,
+                                       settings.ADMIN_TOKEN.encode())
+    return False
+
+
+class ProfilingMiddleware:
+    """
+        Profiles single requests on demand.
+
+        A request with ``?profile=1`` and a valid X-Admin-Token header is
+        sampled every PROFILING_INTERVAL_MS on the event loop thread and
+        the threadpool workers, which covers the handler, response model
+        serialization and SQL. The collapsed-stack report is stored (see
+        ``/admin/profiles``) and its id returned in X-Profile-Id;
+        ``?profile=collapsed`` returns the report instead of the response.
+
+        Work of concurrent requests in the threadpool shows up in the
+        report too, so profile on a quiet instance where possible.
+    """
+
+    def __init__(self, app, store: ProfileStore = profile_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http"
+                or b"profile=" not in scope.get("query_string", b"")):
+            await self.app(scope, receive, send)
+            return
+        mode = parse_qs(scope["query_string"].decode("latin-1")).get(
+            "profile", [""])[0]
+        if mode not in ("1", "collapsed") or not _is_admin(scope):
+            await self.app(scope, receive, send)
+            return
+
+        loop_thread = threading.get_ident()
+        interval = settings.PROFILING_INTERVAL_MS / 1000.0
+        sampler = StackSampler(
+            interval,
+            thread_filter=lambda ident, name: (
+                ident == loop_thread
+                or name.startswith("AnyIO worker thread")))
+        profile_id = uuid.uuid4().hex
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if mode == "collapsed":
+                    return
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode())]
+            elif mode == "collapsed":
+                return
+            await send(message)
+
+        start = time.perf_counter()
+        _acquire_switch_interval(interval / 2)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            _release_switch_interval()
+            profile = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status[0],
+                "duration_ms": round((time.perf_counter() - start) * 1000,
+                                     3),
+                "samples": sampler.samples,
+                "created_at": time.time(),
+                "collapsed": collapse(sampler.counts),
+            }
+            self.store.add(profile)
+
+        if mode == "collapsed":
+            body = profile["collapsed"].encode()
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [
+                            (b"content-type", b"text/plain; charset=utf-8"),
+                            (b"content-length", str(len(body)).encode()),
+                            (b"x-profile-id", profile_id.encode()),
+                            (b"x-profile-status", str(status[0]).encode()),
+                        ]})
+            await send({"type": "http.response.body", "body": body})
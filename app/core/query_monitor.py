@@ -0,0 +1,278 @@
+import asyncio
+import functools
+import threading
+import time
+import logging
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+from .metrics import registry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+n_plus_one_warnings = registry.counter(
+    "birdnest_db_n_plus_one_total",
+    "Requests that repeated one SQL statement N+1 style.", ("route",))
+slow_queries_total = registry.counter(
+    "birdnest_db_slow_queries_total", "SQL statements over the slow "
+    "query threshold.")
+
+# Statement kinds SQLite can explain
+_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+
+
+class RequestQueries:
+    """
+        Statements issued while serving one request.
+    """
+    __slots__ = ("statements", "db_time", "handler_end")
+
+    def __init__(self):
+        self.statements: Counter = Counter()
+        self.db_time = 0.0
+        self.handler_end: Optional[float] = None
+
+    @property
+    def count(self) -> int:
+        return sum(self.statements.values())
+
+
+# Shared with the threadpool, which runs handlers in a copy of the context
+current_queries: ContextVar[Optional[RequestQueries]] = ContextVar(
+    "birdnest_request_queries", default=None)
+
+
+class QueryMonitor:
+    """
+        Per-request SQL statement counting and timing, N+1 detection and
+        a slow-query log with query plans.
+
+        Every option can be changed at runtime with ``configure``; the
+        SQLAlchemy hooks stay installed and return immediately while the
+        monitor is disabled.
+    """
+
+    OPTIONS = ("enabled", "server_timing", "n_plus_one_threshold",
+               "slow_query_ms", "explain")
+
+    def __init__(self, enabled: bool = False, server_timing: bool = True,
+                 n_plus_one_threshold: int = 5, slow_query_ms: float = 100.0,
+                 explain: bool = True, max_slow_queries: int = 100):
+        self.enabled = enabled
+        self.server_timing = server_timing
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_query_ms = slow_query_ms
+        self.explain = explain
+        self._lock = threading.Lock()
+        self._slow_queries: deque = deque(maxlen=max_slow_queries)
+        # statement -> plan, so each slow statement is explained once
+        self._plans: Dict[str, List[str]] = {}
+
+    def configure(self, **options: Any) -> Dict[str, Any]:
+        for name, value in options.items():
+            if name not in self.OPTIONS:
+                raise ValueError(f"Unknown query monitor option: {name}")
+            if value is not None:
+                setattr(self, name, value)
+        return self.options()
+
+    def options(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.OPTIONS}
+
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._slow_queries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slow_queries.clear()
+            self._plans.clear()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        if self.enabled:
+            context._query_monitor_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        start = getattr(context, "_query_monitor_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        queries = current_queries.get()
+        if queries is not None:
+            queries.statements[statement] += 1
+            queries.db_time += elapsed
+        if elapsed * 1000 >= self.slow_query_ms:
+            self._record_slow_query(conn, cursor, statement, parameters,
+                                    executemany, elapsed)
+
+    def _explain(self, conn, cursor, statement, parameters) -> List[str]:
+        plan = self._plans.get(statement)
+        if plan is not None:
+            return plan
+        if (conn.dialect.name != "sqlite"
+                or not statement.lstrip().upper().startswith(_EXPLAINABLE)):
+            return []
+        # A raw DBAPI cursor, so the EXPLAIN does not re-enter these hooks
+        explain_cursor = cursor.connection.cursor()
+        try:
+            explain_cursor.execute("EXPLAIN QUERY PLAN " + statement,
+                                   parameters)
+            plan = [row[-1] for row in explain_cursor.fetchall()]
+        finally:
+            explain_cursor.close()
+        with self._lock:
+            if len(self._plans) >= 1000:
+                self._plans.clear()
+            self._plans[statement] = plan
+        return plan
+
+    def _record_slow_query(self, conn, cursor, statement, parameters,
+                           executemany, elapsed) -> None:
+        plan: List[str] = []
+        if self.explain and not executemany:
+            try:
+                plan = self._explain(conn, cursor, statement, parameters)
+            except Exception as e:
+                logger.debug(f"EXPLAIN QUERY PLAN failed: {e}")
+        slow_queries_total.inc()
+        entry = {
+            "statement": statement,
+            "duration_ms": round(elapsed * 1000, 3),
+            "plan": plan,
+            "logged_at": time.time(),
+        }
+        with self._lock:
+            self._slow_queries.append(entry)
+        logger.warning(f"Slow query ({entry['duration_ms']} ms): "
+                       f"{statement} | plan: {'; '.join(plan) or 'n/a'}")
+
+    def instrument(self, engine: Engine) -> None:
+        if event.contains(engine, "after_cursor_execute",
+                          self._after_cursor_execute):
+            return
+        event.listen(engine, "before_cursor_execute",
+                     self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute",
+                     self._after_cursor_execute)
+
+    def check_n_plus_one(self, queries: RequestQueries, method: str,
+                         route: str) -> None:
+        threshold = self.n_plus_one_threshold
+        if not threshold:
+            return
+        repeated = [(statement, count)
+                    for statement, count in queries.statements.items()
+                    if count >= threshold]
+        if not repeated:
+            return
+        n_plus_one_warnings.inc(route)
+        for statement, count in repeated:
+            logger.warning(f"Possible N+1 in {method} {route}: statement "
+                           f"executed {count} times: {statement}")
+
+
+query_monitor = QueryMonitor(
+    enabled=settings.SQL_MONITOR_ENABLED,
+    server_timing=settings.SQL_MONITOR_SERVER_TIMING,
+    n_plus_one_threshold=settings.SQL_N_PLUS_ONE_THRESHOLD,
+    slow_query_ms=settings.SQL_SLOW_QUERY_MS,
+    explain=settings.SQL_EXPLAIN_SLOW_QUERIES,
+)
+
+
+def _timed_call(call):
+    """
+        Wrap an endpoint function so the time it returns is recorded;
+        everything after it until the response starts is serialization.
+    """
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def timed(*args, **kwargs):
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                queries = current_queries.get()
+                if queries is not None:
+                    queries.handler_end = time.perf_counter()
+    else:
+        @functools.wraps(call)
+        def timed(*args, **kwargs):
+            try:
+                return call(*args, **kwargs)
+            finally:
+                queries = current_queries.get()
+                if queries is not None:
+                    queries.handler_end = time.perf_counter()
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """
+        APIRoute that marks when its endpoint returns, for the
+        ``serialize`` entry of the Server-Timing header.
+    """
+
+    def get_route_handler(self):
+        if not getattr(self.dependant.call, "_timed", False):
+            self.dependant.call = _timed_call(self.dependant.call)
+            self.dependant.call._timed = True
+        return super().get_route_handler()
+
+
+def _server_timing(queries: RequestQueries, start: float,
+                   response_start: float) -> bytes:
+    total = (response_start - start) * 1000
+    parts = [f'db;dur={queries.db_time * 1000:.3f};desc="{queries.count} '
+             f'queries"']
+    if queries.handler_end is not None:
+        serialize = max(0.0, response_start - queries.handler_end) * 1000
+        parts.append(f"serialize;dur={serialize:.3f}")
+    parts.append(f"total;dur={total:.3f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class QueryMonitorMiddleware:
+    """
+        Pure ASGI middleware collecting the statements of each request
+        while the query monitor is enabled. Adds a Server-Timing header
+        (db, serialize, total) and reports N+1 patterns.
+    """
+
+    def __init__(self, app, monitor: QueryMonitor = query_monitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        monitor = self.monitor
+        if scope["type"] != "http" or not monitor.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if (message["type"] == "http.response.start"
+                    and monitor.server_timing):
+                timing = _server_timing(queries, start, time.perf_counter())
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", timing)]
+            await send(message)
+
+        token = current_queries.set(queries)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_queries.reset(token)
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            monitor.check_n_plus_one(queries, scope["method"], route)
@@ -0,0 +1,380 @@
+import math
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class Limit(NamedTuple):
+    """
+        ``capacity`` tokens, refilled continuously over ``period`` seconds.
+    """
+    capacity: float
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+
+class RateLimitExceeded(Exception):
+    """
+        Raised when a bucket has too few tokens.
+    """
+
+    def __init__(self, message: str, limit: Limit, retry_after: float,
+                 reset: float):
+        super().__init__(message)
+        self.limit = limit
+        self.retry_after = retry_after
+        self.reset = reset
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "Retry-After": str(max(1, math.ceil(self.retry_after))),
+            "X-RateLimit-Limit": str(int(self.limit.capacity)),
+            "X-RateLimit-Remaining": "0",
+            "X-RateLimit-Reset": str(max(1, math.ceil(self.reset))),
+        }
+
+
+def _refill(tokens: float, updated: float, limit: Limit,
+            now: float) -> float:
+    return min(limit.capacity, tokens + (now - updated) * limit.rate)
+
+
+class InMemoryBucketStore:
+    """
+        Token buckets in an OrderedDict kept in least-recently-used order.
+
+        Lookups are O(1). A bucket that has been idle long enough to refill
+        completely is equivalent to a missing one, so idle buckets are
+        evicted from the front of the dict as part of normal operations
+        (amortized O(1)), and at most ``max_buckets`` are ever kept.
+    """
+
+    def __init__(self, max_buckets: int = 100000, idle_ttl: float = 3600.0):
+        self.max_buckets = max_buckets
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if (len(self._buckets) <= self.max_buckets
+                    and now - bucket[1] < self.idle_ttl):
+                break
+            del self._buckets[key]
+
+    def apply(self, key: str, limit: Limit, cost: float, now: float,
+              force: bool = False) -> Tuple[bool, float]:
+        """
+            Take ``cost`` tokens from a bucket.
+
+            Without ``force`` the take only happens if enough tokens are
+            available (a zero cost take still needs a positive balance).
+            With ``force`` the tokens are always taken and the balance may
+            go negative, which is used to charge usage after the fact.
+
+            Returns:
+                (allowed, tokens left)
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [limit.capacity, now]
+                self._buckets[key] = bucket
+            else:
+                self._buckets.move_to_end(key)
+            tokens = _refill(bucket[0], bucket[1], limit, now)
+            allowed = tokens >= cost and tokens > 0
+            if allowed or force:
+                tokens -= cost
+            bucket[0] = tokens
+            bucket[1] = now
+            self._evict(now)
+            return allowed, tokens
+
+    def take(self, buckets: Sequence[Tuple[str, Limit]], cost: float,
+             now: float) -> Tuple[bool, List[float]]:
+        """
+            Take ``cost`` tokens from every bucket, or from none of them if
+            any is short.
+
+            Returns:
+                (allowed, tokens left in each bucket)
+        """
+        with self._lock:
+            entries = []
+            for key, limit in buckets:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = [limit.capacity, now]
+                    self._buckets[key] = bucket
+                else:
+                    self._buckets.move_to_end(key)
+                entries.append((bucket, _refill(bucket[0], bucket[1], limit,
+                                                now)))
+            allowed = all(tokens >= cost and tokens > 0
+                          for _, tokens in entries)
+            balances = []
+            for bucket, tokens in entries:
+                if allowed:
+                    tokens -= cost
+                bucket[0] = tokens
+                bucket[1] = now
+                balances.append(tokens)
+            self._evict(now)
+            return allowed, balances
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """
+        Token buckets in a local SQLite file, shared by every worker
+        process on the host. Each operation is one IMMEDIATE transaction;
+        idle rows are pruned every ``prune_every`` operations.
+    """
+
+    def __init__(self, path: str, idle_ttl: float = 3600.0,
+                 prune_every: int = 1000):
+        self.idle_ttl = idle_ttl
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._operations = 0
+        self._conn = sqlite3.connect(path, timeout=5.0,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+            "updated REAL NOT NULL)")
+
+    def apply(self, key: str, limit: Limit, cost: float, now: float,
+              force: bool = False) -> Tuple[bool, float]:
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated FROM rate_limit_buckets "
+                    "WHERE key = ?", (key,)).fetchone()
+                tokens = (limit.capacity if row is None
+                          else _refill(row[0], row[1], limit, now))
+                allowed = tokens >= cost and tokens > 0
+                if allowed or force:
+                    tokens -= cost
+                conn.execute(
+                    "INSERT INTO rate_limit_buckets (key, tokens, updated) "
+                    "VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                    "tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now))
+                self._operations += 1
+                if self._operations % self.prune_every == 0:
+                    conn.execute(
+                        "DELETE FROM rate_limit_buckets WHERE updated < ?",
+                        (now - self.idle_ttl,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return allowed, tokens
+
+    def take(self, buckets: Sequence[Tuple[str, Limit]], cost: float,
+             now: float) -> Tuple[bool, List[float]]:
+        """
+            As InMemoryBucketStore.take, in one transaction.
+        """
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                balances = []
+                for key, limit in buckets:
+                    row = conn.execute(
+                        "SELECT tokens, updated FROM rate_limit_buckets "
+                        "WHERE key = ?", (key,)).fetchone()
+                    balances.append(limit.capacity if row is None
+                                    else _refill(row[0], row[1], limit, now))
+                allowed = all(tokens >= cost and tokens > 0
+                              for tokens in balances)
+                if allowed:
+                    balances = [tokens - cost for tokens in balances]
+                conn.executemany(
+                    "INSERT INTO rate_limit_buckets (key, tokens, updated) "
+                    "VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                    "tokens = excluded.tokens, updated = excluded.updated",
+                    [(key, tokens, now) for (key, _), tokens
+                     in zip(buckets, balances)])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return allowed, balances
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM rate_limit_buckets").fetchone()[0]
+
+
+class RateLimiter:
+    """
+        Request and upstream-token limits per identity scope (for example
+        ``key``, ``ip`` and ``session``).
+
+        Request buckets are taken before a request runs. Token buckets
+        only need a positive balance up front; the actual usage reported
+        by the upstream is charged afterwards and may put a bucket into
+        debt, which blocks that identity until it refills.
+    """
+
+    def __init__(self, store, request_limits: Dict[str, Limit],
+                 token_limits: Dict[str, Limit], enabled: bool = True):
+        self.store = store
+        self.request_limits = request_limits
+        self.token_limits = token_limits
+        self.enabled = enabled
+
+    def _check(self, kind: str, limits: Dict[str, Limit],
+               identities: Dict[str, Optional[str]],
+               cost: float) -> Dict[str, str]:
+        scopes = [(scope, limits[scope]) for scope, identity
+                  in identities.items() if identity and scope in limits]
+        # All buckets or none: a refusal by one scope spends nothing
+        allowed, balances = self.store.take(
+            [(f"{kind}:{scope}:{identities[scope]}", limit)
+             for scope, limit in scopes], cost, time.time())
+        if not allowed:
+            for (scope, limit), tokens in zip(scopes, balances):
+                if tokens < cost or tokens <= 0:
+                    raise RateLimitExceeded(
+                        f"Rate limit exceeded for {scope} ({kind})", limit,
+                        retry_after=(max(cost, 1.0) - tokens) / limit.rate,
+                        reset=(limit.capacity - tokens) / limit.rate)
+
+        tightest: Optional[Tuple[float, Limit]] = None
+        for (_, limit), tokens in zip(scopes, balances):
+            if tightest is None or tokens / limit.capacity < (
+                    tightest[0] / tightest[1].capacity):
+                tightest = (tokens, limit)
+
+        if tightest is None:
+            return {}
+        tokens, limit = tightest
+        return {
+            "X-RateLimit-Limit": str(int(limit.capacity)),
+            "X-RateLimit-Remaining": str(max(0, int(tokens))),
+            "X-RateLimit-Reset": str(
+                math.ceil((limit.capacity - tokens) / limit.rate)),
+        }
+
+    def hit(self, identities: Dict[str, Optional[str]],
+            cost: int = 1) -> Dict[str, str]:
+        """
+            Count ``cost`` requests against every identity, all or none,
+            and make sure none of them is out of upstream tokens.
+
+            Returns:
+                X-RateLimit-* headers for the tightest request bucket
+
+            Raises:
+                RateLimitExceeded
+        """
+        if not self.enabled:
+            return {}
+        headers = self._check("req", self.request_limits, identities, cost)
+        self._check("tok", self.token_limits, identities, 0)
+        return headers
+
+    def charge_tokens(self, identities: Dict[str, Optional[str]],
+                      tokens: int) -> None:
+        """
+            Charge upstream token usage after a completion.
+        """
+        if not self.enabled or tokens <= 0:
+            return
+        now = time.time()
+        for scope, identity in identities.items():
+            limit = self.token_limits.get(scope)
+            if limit is not None and identity:
+                self.store.apply(f"tok:{scope}:{identity}", limit, tokens,
+                                 now, force=True)
+
+
+class UsageLedger:
+    """
+        Upstream usage per session, bounded to ``max_sessions`` entries
+        (least recently used are dropped).
+    """
+
+    FIELDS = ("requests", "prompt_tokens", "completion_tokens",
+              "total_tokens")
+
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()
+
+    def record(self, session_id: str, usage: Optional[Dict[str, int]]
+               ) -> None:
+        usage = usage or {}
+        with self._lock:
+            totals = self._sessions.get(session_id)
+            if totals is None:
+                totals = [0, 0, 0, 0]
+                self._sessions[session_id] = totals
+                if len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            totals[0] += 1
+            for i, field in enumerate(self.FIELDS[1:], start=1):
+                totals[i] += usage.get(field) or 0
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            totals = self._sessions.get(session_id)
+            if totals is None:
+                return None
+            return dict(zip(self.FIELDS, totals))
+
+
+def _build_rate_limiter() -> RateLimiter:
+    request_limits = {
+        "key": Limit(settings.RATE_LIMIT_KEY_PER_MINUTE, 60.0),
+        "ip": Limit(settings.RATE_LIMIT_IP_PER_MINUTE, 60.0),
+        "session": Limit(settings.RATE_LIMIT_SESSION_PER_MINUTE, 60.0),
+    }
+    token_limits = {
+        "key": Limit(settings.RATE_LIMIT_TOKENS_PER_HOUR, 3600.0),
+        "ip": Limit(settings.RATE_LIMIT_TOKENS_PER_HOUR, 3600.0),
+        "session": Limit(settings.RATE_LIMIT_TOKENS_PER_HOUR, 3600.0),
+    }
+    # A bucket idle for longer than its refill time is back to full
+    idle_ttl = max(limit.period for limit in
+                   list(request_limits.values()) + list(token_limits.values()))
+
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        store = SQLiteBucketStore(settings.RATE_LIMIT_SQLITE_PATH,
+                                  idle_ttl=idle_ttl)
+    else:
+        store = InMemoryBucketStore(
+            max_buckets=settings.RATE_LIMIT_MAX_BUCKETS, idle_ttl=idle_ttl)
+    return RateLimiter(store, request_limits, token_limits,
+                       enabled=settings.RATE_LIMIT_ENABLED)
+
+
+rate_limiter = _build_rate_limiter()
+usage_ledger = UsageLedger(max_sessions=settings.AI_SESSION_MAX_SESSIONS)
@@ -0,0 +1,287 @@
+import math
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailableError(Exception):
+    """
+        Raised when a call to the agent upstream is refused locally.
+
+        Carries a ``retry_after`` hint (seconds) for the ``Retry-After``
+        response header.
+    """
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """
+        Raised when the circuit breaker is open.
+    """
+
+
+class ConcurrencyLimitExceeded(UpstreamUnavailableError):
+    """
+        Raised when the concurrency limiter wait queue is full or the
+        wait timed out.
+    """
+
+
+class CircuitBreaker:
+    """
+        Consecutive-failure circuit breaker.
+
+        closed    -> calls pass through, failures are counted
+        open      -> calls fail fast until ``recovery_timeout`` elapses
+        half_open -> a limited number of probe calls decide whether the
+                     breaker closes again or re-opens
+
+        Every trip starts a new generation. ``before_call`` returns the
+        generation a call is admitted in; results reported with an older
+        generation are ignored, so a slow call admitted before the trip
+        cannot close the breaker in place of the half-open probe.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5,
+                 recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._rejected = 0
+        self._generation = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self) -> None:
+        if (self._state == self.OPEN and time.monotonic()
+                - self._opened_at >= self.recovery_timeout):
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info("Circuit breaker half-open, probing upstream")
+
+    def retry_after(self) -> float:
+        """
+            Seconds until the breaker will let a probe call through.
+        """
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.recovery_timeout
+                       - time.monotonic())
+
+    def _stale(self, generation: Optional[int]) -> bool:
+        return generation is not None and generation != self._generation
+
+    def before_call(self) -> int:
+        """
+            Reserve permission for one call or raise CircuitOpenError.
+
+            Returns:
+                The generation to report the call's outcome with
+        """
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.OPEN:
+                self._rejected += 1
+                raise CircuitOpenError(
+                    "AI Agent upstream is unavailable (circuit open)",
+                    retry_after=self._opened_at + self.recovery_timeout
+                    - time.monotonic())
+            if self._state == self.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self._rejected += 1
+                    raise CircuitOpenError(
+                        "AI Agent upstream is recovering (circuit half-open)",
+                        retry_after=1.0)
+                self._half_open_calls += 1
+            return self._generation
+
+    def cancel(self, generation: Optional[int] = None) -> None:
+        """
+            Give back a permission that was never used for a call.
+        """
+        with self._lock:
+            if self._stale(generation):
+                return
+            if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self, generation: Optional[int] = None) -> None:
+        with self._lock:
+            if self._stale(generation):
+                return
+            if self._state != self.CLOSED:
+                logger.info("Circuit breaker closed, upstream recovered")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self, generation: Optional[int] = None) -> None:
+        with self._lock:
+            if self._stale(generation):
+                return
+            self._failures += 1
+            if (self._state == self.HALF_OPEN
+                    or self._failures >= self.failure_threshold):
+                if self._state != self.OPEN:
+                    logger.warning(
+                        f"Circuit breaker opened after {self._failures} "
+                        f"consecutive failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._half_open_calls = 0
+                self._generation += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "rejected": self._rejected,
+            }
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+        Bulkhead with a bounded wait queue and an adaptive limit.
+
+        The limit follows AIMD driven by latency, in the spirit of TCP
+        Vegas: while completions stay within ``latency_tolerance`` times
+        the best observed latency the limit grows additively (about +1
+        per limit-many completions); when latency inflates or a call is
+        dropped (timeout, 5xx) it shrinks multiplicatively.
+
+        Callers that cannot get a slot wait in a queue of at most
+        ``max_queue`` entries for at most ``queue_timeout`` seconds,
+        anything beyond that is rejected immediately.
+    """
+
+    def __init__(self, initial_limit: int = 8, min_limit: int = 1,
+                 max_limit: int = 32, max_queue: int = 16,
+                 queue_timeout: float = 5.0, latency_tolerance: float = 2.0,
+                 backoff_ratio: float = 0.9, min_latency_drift: float = 0.001):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.min_latency_drift = min_latency_drift
+        self._cond = threading.Condition()
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._queued = 0
+        self._min_latency: Optional[float] = None
+        self._rejected = 0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    def _retry_hint(self) -> float:
+        if self._min_latency is None:
+            return 1.0
+        return max(1.0, self._min_latency * self.latency_tolerance)
+
+    def try_acquire(self) -> bool:
+        """
+            Take a slot only if one is free right now (never queues).
+        """
+        with self._cond:
+            if self._in_flight < self.limit and self._queued == 0:
+                self._in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        """
+            Take a slot, waiting in the bounded queue if necessary.
+        """
+        with self._cond:
+            if self._in_flight < self.limit and self._queued == 0:
+                self._in_flight += 1
+                return
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ConcurrencyLimitExceeded(
+                    "AI Agent is at capacity, please retry shortly",
+                    retry_after=self._retry_hint())
+            self._queued += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self._in_flight >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected += 1
+                        raise ConcurrencyLimitExceeded(
+                            "Timed out waiting for AI Agent capacity",
+                            retry_after=self._retry_hint())
+                    self._cond.wait(remaining)
+                self._in_flight += 1
+            finally:
+                self._queued -= 1
+
+    def release(self, latency: float, dropped: bool = False) -> None:
+        """
+            Return a slot and feed the observed latency into the limit.
+        """
+        with self._cond:
+            saturated = self._in_flight >= self.limit
+            self._in_flight -= 1
+            if dropped:
+                self._limit = max(float(self.min_limit),
+                                  self._limit * self.backoff_ratio)
+            else:
+                if self._min_latency is None or latency < self._min_latency:
+                    self._min_latency = latency
+                else:
+                    # Let the baseline drift up so a permanent shift in
+                    # upstream latency is eventually accepted as normal.
+                    self._min_latency *= 1.0 + self.min_latency_drift
+                if latency > self._min_latency * self.latency_tolerance:
+                    self._limit = max(float(self.min_limit),
+                                      self._limit * self.backoff_ratio)
+                elif saturated or self._queued:
+                    self._limit = min(float(self.max_limit),
+                                      self._limit + 1.0 / self._limit)
+            self._cond.notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "rejected": self._rejected,
+                "min_latency": (None if self._min_latency is None
+                                else round(self._min_latency, 6)),
+            }
+
+
+def retry_after_header(seconds: float) -> str:
+    """
+        Format a ``Retry-After`` value (whole seconds, at least 1).
+    """
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,106 @@
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+from starlette.responses import Response
+
+from .audio import audio_store
+from .config import settings
+from .images import image_store
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+# Columns of schemas.Bird in field order, so the output matches the
+# response_model path byte for byte (apart from float formatting)
+BIRD_FIELDS = (
+    "bird_id", "name", "scientific_name", "id", "created_at", "updated_at",
+    "conservation_status", "quick_facts", "tags", "images", "overview",
+    "habitat_and_distribution", "diet_and_behavior", "sounds",
+    "related_birds", "meta_data",
+)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON "
+                    f"serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+        Compact UTF-8 JSON, with orjson when it is installed. The output
+        of the fallback matches Starlette's JSONResponse.
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":"), default=_default
+                      ).encode("utf-8")
+
+
+def bird_to_dict(bird) -> Dict[str, Any]:
+    """
+        ``schemas.Bird`` content of a Bird row, without validation. The
+        JSON columns were validated by BirdCreate/BirdUpdate on the way in.
+    """
+    return {field: getattr(bird, field) for field in BIRD_FIELDS}
+
+
+def rewrites_media() -> bool:
+    return settings.IMAGES_REWRITE_URLS or settings.AUDIO_REWRITE_URLS
+
+
+def rewrite_media(bird: Dict[str, Any]) -> Dict[str, Any]:
+    """
+        Local images pointing at derivatives (app/core/images.py), local
+        sounds at the audio endpoint with their durations
+        (app/core/audio.py), as every bird read serves them.
+    """
+    if settings.IMAGES_REWRITE_URLS:
+        bird = image_store.rewrite(bird)
+    if settings.AUDIO_REWRITE_URLS:
+        bird = audio_store.rewrite(bird)
+    return bird
+
+
+def rewrite_media_raw(document: str) -> str:
+    """
+        ``rewrite_media`` for SQLite-built JSON: a bird, a list of birds or
+        a BirdResponse. Only parsed if it refers to local media.
+    """
+    if not ((settings.IMAGES_REWRITE_URLS
+             and image_store.url_prefix in document)
+            or (settings.AUDIO_REWRITE_URLS
+                and audio_store.url_prefix in document)):
+        return document
+    content = json.loads(document)
+    if isinstance(content, list):
+        content = [rewrite_media(bird) for bird in content]
+    elif "data" in content:
+        content["data"] = rewrite_media(content["data"])
+    else:
+        content = rewrite_media(content)
+    return dumps(content).decode("utf-8")
+
+
+def bird_list(birds: Iterable) -> List[Dict[str, Any]]:
+    return [bird_to_dict(bird) for bird in birds]
+
+
+def bird_response(bird) -> Dict[str, Any]:
+    return {"success": True, "data": bird_to_dict(bird)}
+
+
+class FastJSONResponse(Response):
+    """
+        JSON response for content that is trusted to match the endpoint's
+        response_model, encoded without going through Pydantic.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,261 @@
+import sys
+import threading
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rough per-object overheads (CPython, 64-bit) used for memory reporting
+_TURN_OVERHEAD = sys.getsizeof((None, None, 0, 0)) + sys.getsizeof(0) * 2
+_SESSION_OVERHEAD = (sys.getsizeof(deque()) + 64  # _Session with slots
+                     + 104)  # OrderedDict entry
+
+
+def estimate_tokens(text: str) -> int:
+    """
+        Cheap token estimate (about four characters per token).
+    """
+    return len(text) // 4 + 1
+
+
+class _Session:
+    __slots__ = ("turns", "tokens", "loaded", "lock")
+
+    def __init__(self):
+        # (role, content, tokens, row_id) tuples, oldest first
+        self.turns = deque()
+        self.tokens = 0
+        self.loaded = False
+        # Serializes the database work of this session only
+        self.lock = threading.Lock()
+
+
+class ConversationSessionStore:
+    """
+        Bounded server-side conversation history keyed by session_id.
+
+        Memory is bounded twice: at most ``max_sessions`` sessions are
+        kept (least recently used are evicted) and each session keeps a
+        rolling window of at most ``max_tokens`` estimated tokens (oldest
+        turns are dropped first).
+
+        With ``engine`` set, turns are written through to the
+        ``conversation_turns`` table so sessions survive eviction and
+        restarts; trimmed turns are deleted there as well.
+
+        Database reads and writes happen under the session's own lock;
+        the store-wide lock only guards the in-memory LRU and counters,
+        and is never held across a database round-trip.
+    """
+
+    def __init__(self, max_sessions: int = 10000, max_tokens: int = 2000,
+                 engine: Optional[Engine] = None):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._turn_count = 0
+        self._token_count = 0
+        self._content_bytes = 0
+        self._evicted = 0
+        self._trimmed = 0
+
+    def _table(self):
+        from app.models.conversation import ConversationTurn
+        return ConversationTurn.__table__
+
+    def _touch(self, session_id: str) -> _Session:
+        """
+            Get or create a session and mark it most recently used.
+            Caller holds the lock.
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = _Session()
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                _, evicted = self._sessions.popitem(last=False)
+                self._forget(evicted.turns)
+                self._evicted += 1
+        else:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def _remember(self, turn) -> None:
+        self._turn_count += 1
+        self._token_count += turn[2]
+        self._content_bytes += sys.getsizeof(turn[1])
+
+    def _forget(self, turns) -> None:
+        for turn in turns:
+            self._turn_count -= 1
+            self._token_count -= turn[2]
+            self._content_bytes -= sys.getsizeof(turn[1])
+
+    def _held(self, session_id: str, session: _Session) -> bool:
+        """
+            Whether the session is still in the store, so its turns are
+            counted. Caller holds the lock.
+        """
+        return self._sessions.get(session_id) is session
+
+    def _add(self, session_id: str, session: _Session, turns) -> None:
+        """
+            Append turns to a session. Caller holds the lock.
+        """
+        counted = self._held(session_id, session)
+        for turn in turns:
+            session.turns.append(turn)
+            session.tokens += turn[2]
+            if counted:
+                self._remember(turn)
+
+    def _trim(self, session_id: str, session: _Session) -> List[int]:
+        """
+            Drop the oldest turns until the session fits its token budget.
+            Returns the persisted row ids that were dropped. Caller holds
+            the lock.
+        """
+        dropped = []
+        counted = self._held(session_id, session)
+        # Always keep the newest turn even if it alone exceeds the budget
+        while session.tokens > self.max_tokens and len(session.turns) > 1:
+            turn = session.turns.popleft()
+            session.tokens -= turn[2]
+            if counted:
+                self._forget((turn,))
+            self._trimmed += 1
+            if turn[3] is not None:
+                dropped.append(turn[3])
+        return dropped
+
+    def _load(self, session_id: str, session: _Session) -> None:
+        """
+            Fill a session from the database, newest turns first until the
+            token budget is reached. Caller holds the session's lock, not
+            the store's.
+        """
+        if session.loaded:
+            return
+        session.loaded = True
+        if self.engine is None:
+            return
+        table = self._table()
+        query = (select(table.c.id, table.c.role, table.c.content,
+                        table.c.tokens)
+                 .where(table.c.session_id == session_id)
+                 .order_by(table.c.id.desc()))
+        budget = self.max_tokens
+        rows = []
+        with self.engine.connect() as conn:
+            for row in conn.execute(query):
+                if rows and budget - row.tokens < 0:
+                    break
+                budget -= row.tokens
+                rows.append(row)
+        with self._lock:
+            self._add(session_id, session,
+                      [(row.role, row.content, row.tokens, row.id)
+                       for row in reversed(rows)])
+
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        """
+            Prior turns of a session as a chat completions messages array.
+        """
+        with self._lock:
+            session = self._touch(session_id)
+        with session.lock:
+            self._load(session_id, session)
+            with self._lock:
+                return [{"role": role, "content": content}
+                        for role, content, _, _ in session.turns]
+
+    def append_exchange(self, session_id: str, user_message: str,
+                        assistant_message: str) -> None:
+        """
+            Record a user message and the agent's reply.
+        """
+        new_turns = [("user", user_message, estimate_tokens(user_message)),
+                     ("assistant", assistant_message,
+                      estimate_tokens(assistant_message))]
+        with self._lock:
+            session = self._touch(session_id)
+        with session.lock:
+            self._load(session_id, session)
+
+            row_ids = [None, None]
+            if self.engine is not None:
+                table = self._table()
+                with self.engine.begin() as conn:
+                    for i, (role, content, tokens) in enumerate(new_turns):
+                        row_ids[i] = conn.execute(insert(table).values(
+                            session_id=session_id, role=role,
+                            content=content, tokens=tokens
+                        )).inserted_primary_key[0]
+
+            with self._lock:
+                self._add(session_id, session,
+                          [(role, content, tokens, row_id)
+                           for (role, content, tokens), row_id
+                           in zip(new_turns, row_ids)])
+                dropped = self._trim(session_id, session)
+            if dropped and self.engine is not None:
+                table = self._table()
+                with self.engine.begin() as conn:
+                    conn.execute(delete(table).where(table.c.id.in_(dropped)))
+
+    def clear(self, session_id: str) -> None:
+        """
+            Forget a session, including its persisted turns.
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._forget(session.turns)
+        if self.engine is not None:
+            table = self._table()
+            with self.engine.begin() as conn:
+                conn.execute(delete(table).where(
+                    table.c.session_id == session_id))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+            Size of the store, including an estimate of its memory use.
+        """
+        with self._lock:
+            sessions = len(self._sessions)
+            approx_bytes = (self._content_bytes
+                            + self._turn_count * _TURN_OVERHEAD
+                            + sessions * _SESSION_OVERHEAD)
+            return {
+                "sessions": sessions,
+                "max_sessions": self.max_sessions,
+                "turns": self._turn_count,
+                "tokens": self._token_count,
+                "approx_bytes": approx_bytes,
+                "evicted_sessions": self._evicted,
+                "trimmed_turns": self._trimmed,
+                "persistent": self.engine is not None,
+            }
+
+
+def _build_session_store() -> ConversationSessionStore:
+    engine = None
+    if settings.AI_SESSION_PERSIST:
+        from .database import engine
+    return ConversationSessionStore(
+        max_sessions=settings.AI_SESSION_MAX_SESSIONS,
+        max_tokens=settings.AI_SESSION_MAX_TOKENS,
+        engine=engine,
+    )
+
+
+session_store = _build_session_store()
@@ -0,0 +1,521 @@
+import itertools
+import json
+import os
+import threading
+import time
+import logging
+from bisect import bisect_right
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from .config import settings
+from .database import engine
+from .jobs import job_queue
+from .metrics import registry
+from .serialization import (
+    bird_to_dict,
+    dumps,
+    rewrite_media,
+    rewrite_media_raw,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Separates names in the search text; never part of a query
+SEPARATOR = "\x00"
+
+REBUILD_FILE_JOB = "catalog_file.rebuild"
+
+RELOAD_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0,
+                  60.0)
+
+
+class SnapshotRow(NamedTuple):
+    id: int
+    bird_id: str
+    name: str  # lower case, for search
+    scientific_name: str  # lower case, for search
+    status: Optional[str]
+    document: bytes  # schemas.Bird JSON
+    tags: Tuple[str, ...] = ()  # lower case tag texts
+
+
+def _tags(tags: Optional[List[Any]]) -> Tuple[str, ...]:
+    return tuple(tag["text"].lower() for tag in tags or ()
+                 if isinstance(tag, dict) and tag.get("text"))
+
+
+def _search_text(values: Iterable[str]) -> Tuple[str, List[int]]:
+    """
+        The values joined into one string, and where each one starts.
+    """
+    starts, offset = [], 0
+    for value in values:
+        starts.append(offset)
+        offset += len(value) + 1
+    return SEPARATOR.join(values), starts
+
+
+def _find(text: str, starts: List[int], query: str) -> List[int]:
+    """
+        Positions of the values containing ``query``, in order. One
+        ``str.find`` per match rather than a comparison per value.
+    """
+    if not query or SEPARATOR in query:
+        return []
+    positions: List[int] = []
+    offset = text.find(query)
+    while offset != -1:
+        position = bisect_right(starts, offset) - 1
+        positions.append(position)
+        if position + 1 == len(starts):
+            break
+        offset = text.find(query, starts[position + 1])
+    return positions
+
+
+def snapshot_rows(db, bird_ids: Optional[List[str]] = None,
+                  chunk_size: int = 1000) -> Iterator[SnapshotRow]:
+    """
+        Snapshot rows of every bird, or of the given bird_ids, in table
+        order, read without creating ORM objects.
+    """
+    from app import crud
+    from app.models.bird import Bird
+    if db.get_bind().dialect.name == "sqlite":
+        # Documents assembled by SQLite, as RAW_SQL_READS does
+        for (id_, bird_id, name, scientific_name, status, tags,
+             document) in crud.bird.iter_documents_raw(db, bird_ids=bird_ids):
+            yield SnapshotRow(id_, bird_id, name.lower(),
+                              scientific_name.lower(), status,
+                              rewrite_media_raw(document).encode("utf-8"),
+                              tuple(tag.lower()
+                                    for tag in json.loads(tags) if tag))
+        return
+    query = select(Bird.__table__).order_by(Bird.id)
+    if bird_ids is not None:
+        query = query.where(Bird.bird_id.in_(bird_ids))
+    for bird in db.execute(query).yield_per(chunk_size):
+        yield SnapshotRow(
+            bird.id, bird.bird_id, bird.name.lower(),
+            bird.scientific_name.lower(),
+            (bird.conservation_status or {}).get("status"),
+            dumps(rewrite_media(bird_to_dict(bird))), _tags(bird.tags))
+
+
+def merge_rows(rows: Iterable[SnapshotRow],
+               changes: Dict[str, Optional[SnapshotRow]]
+               ) -> Iterator[SnapshotRow]:
+    """
+        ``rows`` with the birds in ``changes`` replaced or removed (None),
+        followed by the birds new to them in table order.
+    """
+    seen = set()
+    for row in rows:
+        if row.bird_id in changes:
+            seen.add(row.bird_id)
+            row = changes[row.bird_id]
+            if row is None:
+                continue
+        yield row
+    yield from sorted((row for bird_id, row in changes.items()
+                       if row is not None and bird_id not in seen),
+                      key=lambda row: row.id)
+
+
+class CatalogSnapshot:
+    """
+        Immutable copy of the whole catalog, built for reads.
+
+        Every bird is kept as the serialized document reads return, in the
+        order of the birds table, with indexes on bird_id, the lower-cased
+        names and the conservation status. Responses are joined from the
+        document bytes; nothing is decoded or validated per read.
+
+        ``apply`` never changes a snapshot; it returns a new one, which
+        shares the documents that did not change, and the indexes too when
+        no bird was added, removed, renamed or given another status.
+    """
+    __slots__ = ("seq", "_rows", "_positions", "_names", "_name_starts",
+                 "_scientific_names", "_scientific_starts", "_by_status")
+
+    def __init__(self, rows: Sequence[SnapshotRow], seq: int = 0):
+        # Last bird_changes entry reflected (see app/models/bird_change.py)
+        self.seq = seq
+        self._rows: Tuple[SnapshotRow, ...] = tuple(rows)
+        self._positions = {row.bird_id: i for i, row in enumerate(self._rows)}
+        self._names, self._name_starts = _search_text(
+            [row.name for row in self._rows])
+        self._scientific_names, self._scientific_starts = _search_text(
+            [row.scientific_name for row in self._rows])
+        by_status: Dict[Optional[str], List[int]] = {}
+        for i, row in enumerate(self._rows):
+            by_status.setdefault(row.status, []).append(i)
+        self._by_status = {status: tuple(positions)
+                           for status, positions in by_status.items()}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def document_bytes(self) -> int:
+        return sum(len(row.document) for row in self._rows)
+
+    def get(self, bird_id: str) -> Optional[SnapshotRow]:
+        position = self._positions.get(bird_id)
+        return self._rows[position] if position is not None else None
+
+    @staticmethod
+    def response(row: SnapshotRow) -> bytes:
+        """BirdResponse JSON of a row."""
+        return b'{"success":true,"data":' + row.document + b"}"
+
+    def _array(self, rows: Iterable[SnapshotRow]) -> bytes:
+        return b"[" + b",".join(row.document for row in rows) + b"]"
+
+    def page(self, skip: int = 0, limit: int = 100) -> bytes:
+        """JSON array of the birds get_multi returns."""
+        return self._array(self._rows[skip:skip + limit])
+
+    def batch(self, bird_ids: Sequence[str]) -> bytes:
+        """JSON array of the birds get_batch returns."""
+        return self._array(row for row in map(self.get,
+                                                dict.fromkeys(bird_ids))
+                           if row is not None)
+
+    def search_by_name(self, name: str) -> bytes:
+        return self._array(self._rows[i] for i in _find(
+            self._names, self._name_starts, name.lower()))
+
+    def search_by_scientific_name(self, scientific_name: str) -> bytes:
+        return self._array(self._rows[i] for i in _find(
+            self._scientific_names, self._scientific_starts,
+            scientific_name.lower()))
+
+    def get_by_conservation_status(self, status: str) -> bytes:
+        return self._array(self._rows[i]
+                           for i in self._by_status.get(status, ()))
+
+    def apply(self, changes: Dict[str, Optional[SnapshotRow]], seq: int
+              ) -> "CatalogSnapshot":
+        """
+            A new snapshot with the birds in ``changes`` replaced, added,
+            or removed (None).
+        """
+        if all(self._same_entries(bird_id, row)
+               for bird_id, row in changes.items()):
+            # Only documents changed: copy the row references, share the
+            # indexes
+            rows = list(self._rows)
+            for bird_id, row in changes.items():
+                rows[self._positions[bird_id]] = row
+            snapshot = CatalogSnapshot.__new__(CatalogSnapshot)
+            for name in self.__slots__:
+                setattr(snapshot, name, getattr(self, name))
+            snapshot.seq, snapshot._rows = seq, tuple(rows)
+            return snapshot
+        return CatalogSnapshot(list(merge_rows(self._rows, changes)), seq)
+
+    def _same_entries(self, bird_id: str, row: Optional[SnapshotRow]
+                      ) -> bool:
+        current = self.get(bird_id)
+        return (row is not None and current is not None
+                and (current.id, current.name, current.scientific_name,
+                     current.status)
+                == (row.id, row.name, row.scientific_name, row.status))
+
+
+class SnapshotManager:
+    """
+        Holds the current catalog snapshot and replaces it after writes.
+
+        Readers take ``snapshot`` once per request and keep using that
+        version; a refresh builds the next version off to the side and
+        swaps the reference. Writes through this process refresh it from
+        the first read after them (``current``), so a burst of writes is
+        applied once rather than once per write, and the next read still
+        sees them. Writes by other worker processes are picked up from the
+        bird_changes sequence every ``refresh_interval`` seconds.
+
+        With a ``path``, the snapshot is instead the catalog file there
+        (see app/core/catalog_file.py), memory-mapped and shared by every
+        worker. Writes schedule one rebuild of the file in the background
+        after ``rebuild_delay`` seconds, and each worker maps the new file
+        once it has replaced the old one; reads lag writes until then.
+    """
+
+    def __init__(self, bind: Engine = engine, refresh_interval: float = 1.0,
+                 chunk_size: int = 1000, path: Optional[str] = None,
+                 rebuild_delay: float = 1.0):
+        self.bind = bind
+        self.refresh_interval = refresh_interval
+        self.chunk_size = chunk_size
+        self.path = path or None
+        self.rebuild_delay = rebuild_delay
+        # CatalogSnapshot, or CatalogFile with a path
+        self.snapshot: Optional[Any] = None
+        self._session = sessionmaker(bind=bind)
+        self._lock = threading.Lock()
+        # Writes through this process, and how many current() applied
+        self._writes = itertools.count(1)
+        self._written = 0
+        self._applied = 0
+        self._catch_up = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _last_seq(self, db) -> int:
+        from app.models.bird_change import BirdChange
+        return db.query(func.max(BirdChange.id)).scalar() or 0
+
+    def _rows(self, db, bird_ids: Optional[List[str]] = None
+              ) -> Iterator[SnapshotRow]:
+        return snapshot_rows(db, bird_ids, self.chunk_size)
+
+    def _changes(self, db, since: int
+                 ) -> Tuple[Dict[str, Optional[SnapshotRow]], int]:
+        """
+            Rows of the birds changed after the ``since`` sequence number,
+            None for those deleted, and the last sequence number read.
+        """
+        from app.models.bird_change import BirdChange
+        entries = db.query(BirdChange.id, BirdChange.bird_id).filter(
+            BirdChange.id > since).order_by(BirdChange.id).all()
+        if not entries:
+            return {}, since
+        bird_ids = list(dict.fromkeys(bird_id for _, bird_id in entries))
+        # Birds no longer found have been deleted
+        changes: Dict[str, Optional[SnapshotRow]] = dict.fromkeys(bird_ids)
+        for i in range(0, len(bird_ids), self.chunk_size):
+            for row in self._rows(db, bird_ids[i:i + self.chunk_size]):
+                changes[row.bird_id] = row
+        return changes, entries[-1][0]
+
+    def load(self):
+        """
+            Build a snapshot of the whole catalog and serve from it; with
+            a path, map the catalog file, compiling it first if missing.
+        """
+        if self.path:
+            return self._load_file()
+        started = time.perf_counter()
+        with self._lock, self._session() as db:
+            # Read first: changes committed while loading are applied
+            # again by the next refresh, which is harmless
+            seq = self._last_seq(db)
+            self.snapshot = CatalogSnapshot(list(self._rows(db)), seq)
+        snapshot_reload_seconds.observe(time.perf_counter() - started,
+                                        "load")
+        logger.info(f"Loaded catalog snapshot of {len(self.snapshot)} birds")
+        return self.snapshot
+
+    def current(self):
+        """
+            The snapshot to serve, after applying the writes this process
+            made since the last read.
+        """
+        written = self._written
+        if written > self._applied and not self.path:
+            with self._catch_up:
+                if written > self._applied:
+                    target = self._written
+                    self.refresh()
+                    self._applied = target
+        return self.snapshot
+
+    def unload(self) -> None:
+        self.stop()
+        self.snapshot = None
+
+    def refresh(self):
+        """
+            Apply the bird_changes entries after the snapshot's sequence
+            number; returns the new snapshot, or None if there were none.
+            With a path, map the catalog file if it has been replaced.
+        """
+        if self.snapshot is None:
+            return None
+        if self.path:
+            return self._refresh_file()
+        started = time.perf_counter()
+        with self._lock, self._session() as db:
+            current = self.snapshot
+            if current is None:
+                return None
+            changes, seq = self._changes(db, current.seq)
+            if not changes:
+                return None
+            self.snapshot = current.apply(changes, seq)
+        snapshot_reload_seconds.observe(time.perf_counter() - started,
+                                        "refresh")
+        return self.snapshot
+
+    def _open_file(self):
+        from .catalog_file import CatalogFile, CatalogFileError
+        try:
+            return CatalogFile(self.path)
+        except FileNotFoundError:
+            return None
+        except CatalogFileError as e:
+            logger.warning(f"Rebuilding catalog file: {e}")
+            return None
+
+    def _load_file(self):
+        started = time.perf_counter()
+        with self._lock:
+            current = self._open_file()
+        if current is None:
+            self.rebuild()
+            with self._lock:
+                current = self._open_file()
+            if current is None:
+                raise RuntimeError(f"Catalog file {self.path} not built")
+        self.snapshot = current
+        snapshot_reload_seconds.observe(time.perf_counter() - started,
+                                        "open")
+        logger.info(f"Mapped catalog file of {len(current)} birds")
+        with self._session() as db:
+            if self._last_seq(db) > current.seq:
+                self.schedule_rebuild()
+        return current
+
+    def _refresh_file(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        started = time.perf_counter()
+        with self._lock:
+            current = self.snapshot
+            if current is None or current.inode == (stat.st_dev,
+                                                    stat.st_ino):
+                return None
+            replacement = self._open_file()
+            if replacement is None:
+                return None
+            # The old mapping goes once the requests using it are done
+            self.snapshot = replacement
+        snapshot_reload_seconds.observe(time.perf_counter() - started,
+                                        "open")
+        return replacement
+
+    def rebuild(self) -> bool:
+        """
+            Compile the catalog file unless it is already current; False
+            if it was. A previous file is patched with the changes since
+            it was compiled, copying the documents that did not change,
+            rather than rebuilt from the database.
+        """
+        from .catalog_file import compile_catalog, file_lock
+        started = time.perf_counter()
+        # One process compiles; the others then find the file current
+        with file_lock(self.path), self._session() as db:
+            seq = self._last_seq(db)
+            previous = self._open_file()
+            if previous is not None and previous.seq >= seq:
+                return False
+            if previous is None:
+                kind, rows = "compile", self._rows(db)
+            else:
+                changes, _ = self._changes(db, previous.seq)
+                kind, rows = "recompile", merge_rows(previous.rows(),
+                                                     changes)
+            count = compile_catalog(self.path, rows, seq)
+        snapshot_reload_seconds.observe(time.perf_counter() - started, kind)
+        logger.info(f"Compiled catalog file of {count} birds to {self.path}")
+        self.refresh()
+        return True
+
+    def schedule_rebuild(self) -> Optional[int]:
+        return job_queue.enqueue(REBUILD_FILE_JOB, key=REBUILD_FILE_JOB,
+                                 delay=self.rebuild_delay)
+
+    def bird_written(self, event: str, bird) -> None:
+        """
+            CRUD hook (see app/crud/bird.py).
+        """
+        if self.snapshot is None:
+            return
+        if self.path:
+            self.schedule_rebuild()
+        else:
+            # Applied by the next read (see current)
+            self._written = next(self._writes)
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.refresh_interval):
+            snapshot = self.snapshot
+            if snapshot is None:
+                continue
+            try:
+                if self.path:
+                    snapshot = self.refresh() or snapshot
+                with self._session() as db:
+                    behind = self._last_seq(db) > snapshot.seq
+                if behind and self.path:
+                    # Written by a worker whose rebuild never ran
+                    self.schedule_rebuild()
+                elif behind:
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"Catalog snapshot refresh failed: {e}")
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll,
+                                        name="catalog-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+catalog_snapshot = SnapshotManager(
+    refresh_interval=settings.SNAPSHOT_REFRESH_INTERVAL,
+    path=settings.SNAPSHOT_FILE,
+    rebuild_delay=settings.SNAPSHOT_FILE_REBUILD_DELAY)
+
+
+@job_queue.handler(REBUILD_FILE_JOB)
+def rebuild_catalog_file(payload=None) -> None:
+    if catalog_snapshot.path:
+        catalog_snapshot.rebuild()
+
+
+def _collect_snapshot() -> Dict[Tuple[str, ...], float]:
+    snapshot = catalog_snapshot.snapshot
+    if snapshot is None:
+        return {}
+    return {("birds",): len(snapshot),
+            ("document_bytes",): snapshot.document_bytes,
+            ("seq",): snapshot.seq}
+
+
+snapshot_state = registry.gauge(
+    "birdnest_catalog_snapshot", "Served catalog snapshot: birds, "
+    "document bytes and the last change applied", ["measure"],
+    callback=_collect_snapshot)
+snapshot_reload_seconds = registry.histogram(
+    "birdnest_catalog_snapshot_reload_seconds",
+    "Time to build a catalog snapshot (load) or apply changes (refresh); "
+    "to compile the catalog file (compile, recompile) or map it (open)",
+    ["kind"], buckets=RELOAD_BUCKETS)
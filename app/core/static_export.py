@@ -0,0 +1,299 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from .config import settings
+from .database import engine
+from .serialization import dumps
+from .snapshot import CatalogSnapshot, snapshot_rows
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# Bump on any change to the layout; an older export is rebuilt in full
+MANIFEST_VERSION = 1
+# The largest page GET /birds/ serves
+PAGE_SIZE = 100
+CHUNK_SIZE = 500
+DIRECTORIES = ("birds", "pages", "indexes")
+
+# What a bird's file wraps its document in (CatalogSnapshot.response)
+RESPONSE_PREFIX = b'{"success":true,"data":'
+RESPONSE_SUFFIX = b"}"
+
+# Engines of pool worker processes, by database URL
+_engines: Dict[str, Engine] = {}
+
+
+def _write_hashed(directory: str, stem: str, content: bytes) -> str:
+    """
+        Write ``content`` as ``<stem>.<hash>.json`` under ``directory``
+        unless that file already exists; returns its relative path. The
+        same content always has the same name, so files never change once
+        written and may be cached forever.
+    """
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    path = f"{stem}.{digest}.json"
+    target = os.path.join(directory, path)
+    if os.path.exists(target):
+        return path
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    _write_atomic(target, content)
+    return path
+
+
+def _write_atomic(target: str, content: bytes) -> None:
+    fd, temporary = tempfile.mkstemp(prefix=".export-", suffix=".tmp",
+                                     dir=os.path.dirname(target))
+    try:
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(temporary, target)
+    except BaseException:
+        try:
+            os.unlink(temporary)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _session(bind):
+    if isinstance(bind, str):
+        if bind not in _engines:
+            _engines[bind] = create_engine(bind)
+        bind = _engines[bind]
+    return sessionmaker(bind=bind)()
+
+
+def _render_birds(bind, directory: str, bird_ids: List[str]
+                  ) -> Dict[str, str]:
+    """
+        Write the BirdResponse of each bird; returns their files by
+        bird_id. Birds no longer found are left out.
+    """
+    files = {}
+    with _session(bind) as db:
+        for row in snapshot_rows(db, bird_ids):
+            files[row.bird_id] = _write_hashed(
+                directory, f"birds/{quote(row.bird_id, safe='')}",
+                CatalogSnapshot.response(row))
+    return files
+
+
+def _document(directory: str, path: str) -> bytes:
+    with open(os.path.join(directory, path), "rb") as f:
+        response = f.read()
+    return response[len(RESPONSE_PREFIX):-len(RESPONSE_SUFFIX)]
+
+
+def _render_pages(directory: str, pages: List[Tuple[int, List[str]]]
+                  ) -> Dict[int, str]:
+    """
+        Write list pages, joined from the documents in the bird files
+        already exported; returns their files by page number.
+    """
+    return {number: _write_hashed(
+                directory, f"pages/{number}",
+                b"[" + b",".join(_document(directory, path)
+                                 for path in paths) + b"]")
+            for number, paths in pages}
+
+
+def _chunks(items: Sequence[Any], size: int) -> Iterable[Sequence[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    """
+        The manifest of the export in ``directory``, or None if there is
+        none of this version.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST), "rb") as f:
+            manifest = json.loads(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def bird_route(bird_id: str) -> str:
+    return f"{settings.API_V1_STR}/birds/{quote(bird_id, safe='')}"
+
+
+def page_route(number: int) -> str:
+    return (f"{settings.API_V1_STR}/birds/?skip={number * PAGE_SIZE}"
+            f"&limit={PAGE_SIZE}")
+
+
+def export(directory: str, *, bind: Engine = engine, workers: int = 1,
+           full: bool = False) -> Dict[str, Any]:
+    """
+        Export the catalog as static files under ``directory``:
+
+        - ``birds/``: the GET /birds/{bird_id} response of each bird;
+        - ``pages/``: the GET /birds/ responses, ``PAGE_SIZE`` birds each;
+        - ``indexes/``: a search index of every bird's names, and the
+          bird_ids of each conservation status;
+        - ``manifest.json``: the file serving each route, and the state
+          the next export starts from.
+
+        Files are named by the hash of their content. An export after a
+        previous one only renders the birds whose ``updated_at`` is not
+        before the time the previous one read the catalog, and the pages
+        whose birds changed; ``full`` renders everything. With ``workers``
+        above 1, birds and pages are rendered by a pool of processes.
+
+        The manifest is replaced last, atomically, so the directory always
+        serves one complete export. Files referenced by neither the new
+        manifest nor the one it replaces are removed.
+    """
+    from app.models.bird import Bird
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    previous = None if full else read_manifest(directory)
+    previous_birds: Dict[str, List[Any]] = (previous or {}).get("birds", {})
+    watermark = (datetime.fromisoformat(previous["watermark"])
+                 if previous and previous.get("watermark") else None)
+
+    # Everything but the documents, which are only read for changed birds.
+    # updated_at is set from the database clock with whole seconds, so the
+    # next export starts from that clock's reading now, inclusive
+    with sessionmaker(bind=bind)() as db:
+        scanned_at = db.execute(select(func.now())).scalar()
+        birds = db.query(
+            Bird.bird_id, Bird.name, Bird.scientific_name,
+            Bird.conservation_status["status"].as_string().label("status"),
+            Bird.updated_at).order_by(Bird.id).all()
+    changed = [bird.bird_id for bird in birds
+               if bird.bird_id not in previous_birds or (
+                   watermark is None or bird.updated_at is None
+                   or bird.updated_at >= watermark)]
+
+    files = {bird_id: path for bird_id, (_, path) in previous_birds.items()}
+    pages = [[bird.bird_id for bird in page]
+             for page in _chunks(birds, PAGE_SIZE)] or [[]]
+    previous_pages = (previous or {}).get("pages", [])
+    changed_set = set(changed)
+    dirty = [number for number, page in enumerate(pages)
+             if number >= len(previous_pages)
+             or previous_pages[number][0] != page
+             or changed_set.intersection(page)]
+
+    page_files = {number: previous_pages[number][1]
+                  for number in range(min(len(pages), len(previous_pages)))}
+    # Worker processes connect by URL; one process uses the engine itself
+    source = (bind.url.render_as_string(hide_password=False)
+              if workers > 1 else bind)
+    with ProcessPoolExecutor(workers) if workers > 1 else _Inline() as pool:
+        chunks = [list(chunk) for chunk in _chunks(changed, CHUNK_SIZE)]
+        for rendered in pool.map(_render_birds, [source] * len(chunks),
+                                 [directory] * len(chunks), chunks):
+            files.update(rendered)
+        # Pages are rendered once every bird file exists; a bird deleted
+        # since the scan above is left out until the next export
+        tasks = [[(number, [files[bird_id] for bird_id in pages[number]
+                            if bird_id in files])
+                  for number in chunk]
+                 for chunk in _chunks(dirty, CHUNK_SIZE // PAGE_SIZE)]
+        for rendered in pool.map(_render_pages, [directory] * len(tasks),
+                                 tasks):
+            page_files.update(rendered)
+
+    birds = [bird for bird in birds if bird.bird_id in files]
+    statuses: Dict[str, List[str]] = {}
+    for bird in birds:
+        if bird.status:
+            statuses.setdefault(bird.status, []).append(bird.bird_id)
+    indexes = {
+        "search": _write_hashed(directory, "indexes/search", dumps(
+            [[bird.bird_id, bird.name, bird.scientific_name]
+             for bird in birds])),
+        "status": {status: _write_hashed(
+            directory, f"indexes/status/{quote(status, safe='')}",
+            dumps(bird_ids))
+            for status, bird_ids in statuses.items()},
+    }
+
+    current = {bird.bird_id for bird in birds}
+    routes = {bird_route(bird_id): files[bird_id] for bird_id in current}
+    routes.update({page_route(number): page_files[number]
+                   for number in range(len(pages))})
+    routes[f"{settings.API_V1_STR}/birds/"] = page_files[0]
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "watermark": scanned_at.isoformat(),
+        "page_size": PAGE_SIZE,
+        "routes": routes,
+        "indexes": indexes,
+        "birds": {bird.bird_id: [bird.updated_at.isoformat()
+                                 if bird.updated_at else None,
+                                 files[bird.bird_id]] for bird in birds},
+        "pages": [[pages[number], page_files[number]]
+                  for number in range(len(pages))],
+    }
+    _write_atomic(os.path.join(directory, MANIFEST),
+                  dumps(manifest))
+    removed = _remove_unreferenced(directory, [manifest, previous])
+    result = {
+        "birds": len(birds),
+        "birds_rendered": len(changed),
+        "birds_removed": len(set(previous_birds) - current),
+        "pages": len(pages),
+        "pages_rendered": len(dirty),
+        "files_removed": removed,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(f"Exported {directory}: {result}")
+    return result
+
+
+def _referenced(manifest: Dict[str, Any]) -> Iterable[str]:
+    yield from manifest["routes"].values()
+    yield manifest["indexes"]["search"]
+    yield from manifest["indexes"]["status"].values()
+
+
+def _remove_unreferenced(directory: str,
+                         manifests: List[Optional[Dict[str, Any]]]) -> int:
+    keep = {path for manifest in manifests if manifest
+            for path in _referenced(manifest)}
+    removed = 0
+    for name in DIRECTORIES:
+        for root, _, filenames in os.walk(os.path.join(directory, name)):
+            # Manifest paths are relative, with forward slashes
+            relative = os.path.relpath(root, directory).replace(os.sep, "/")
+            for filename in filenames:
+                if f"{relative}/{filename}" not in keep:
+                    os.unlink(os.path.join(root, filename))
+                    removed += 1
+    return removed
+
+
+class _Inline:
+    """Runs a pool's work in this process, for a single worker."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, function, *iterables):
+        return map(function, *iterables)
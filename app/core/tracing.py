@@ -0,0 +1,379 @@
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+import logging
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(
+    r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def parse_traceparent(value: Optional[str]
+                      ) -> Optional[Tuple[str, str, bool]]:
+    """
+        ``(trace_id, parent_span_id, sampled)`` of a W3C traceparent
+        header, or None when it is missing or malformed.
+    """
+    if not value:
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+def format_traceparent(trace_id: str, span_id: str, sampled: bool) -> str:
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+class Trace:
+    """
+        The finished spans of one sampled trace, exported together when
+        its local root span ends.
+    """
+    __slots__ = ("trace_id", "spans", "_lock")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: "Span") -> None:
+        with self._lock:
+            self.spans.append(span)
+
+
+class Span:
+    """
+        A timed operation within a sampled trace.
+    """
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind",
+                 "attributes", "start_ns", "end_ns", "status", "message")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str],
+                 kind: int = KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = STATUS_UNSET
+        self.message = ""
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    @property
+    def traceparent(self) -> str:
+        return format_traceparent(self.trace.trace_id, self.span_id, True)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, exc: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.message = f"{type(exc).__name__}: {exc}"
+
+    def end(self) -> None:
+        self.end_ns = time.time_ns()
+        self.trace.add(self)
+
+
+class _NoopSpan:
+    """
+        Stands in for a span outside sampled traces; every call is a no-op.
+    """
+    __slots__ = ()
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_error(self, exc: BaseException) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+# The innermost open span of a sampled trace. The threadpool runs sync
+# handlers in a copy of the context, so spans opened there nest under the
+# request's span without leaking back.
+current_span: ContextVar[Optional[Span]] = ContextVar(
+    "birdnest_current_span", default=None)
+
+
+class _SpanContext:
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span_: Span):
+        self.span = span_
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        current_span.reset(self._token)
+        if exc is not None:
+            self.span.set_error(exc)
+        self.span.end()
+        return False
+
+
+def span(name: str, kind: int = KIND_INTERNAL, **attributes: Any):
+    """
+        Context manager timing ``name`` as a child of the current span.
+
+        Outside a sampled trace (tracing disabled, request not sampled, or
+        work not started from a request) this returns a shared no-op, so
+        instrumentation costs one context variable lookup.
+    """
+    parent = current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return _SpanContext(Span(parent.trace, name, parent.span_id, kind,
+                             attributes))
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """
+        Decorator running the function in a span, named after the function
+        unless ``name`` is given.
+    """
+    def decorate(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            parent = current_span.get()
+            if parent is None:
+                return func(*args, **kwargs)
+            with _SpanContext(Span(parent.trace, span_name, parent.span_id)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def outgoing_headers() -> Dict[str, str]:
+    """
+        Headers propagating the current trace to an upstream call.
+    """
+    parent = current_span.get()
+    if parent is None:
+        return {}
+    return {"traceparent": parent.traceparent}
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def _otlp_span(span_: Span) -> Dict[str, Any]:
+    data = {
+        "traceId": span_.trace_id,
+        "spanId": span_.span_id,
+        "name": span_.name,
+        "kind": span_.kind,
+        "startTimeUnixNano": str(span_.start_ns),
+        "endTimeUnixNano": str(span_.end_ns),
+        "attributes": [_attribute(key, value)
+                       for key, value in span_.attributes.items()],
+        "status": {"code": span_.status},
+    }
+    if span_.parent_id:
+        data["parentSpanId"] = span_.parent_id
+    if span_.message:
+        data["status"]["message"] = span_.message
+    return data
+
+
+def to_otlp(spans: List[Span], service_name: str) -> Dict[str, Any]:
+    """
+        OTLP/JSON ``ExportTraceServiceRequest`` for ``spans``, readable by
+        the OpenTelemetry collector's file receiver and similar tools.
+    """
+    return {"resourceSpans": [{
+        "resource": {"attributes": [
+            _attribute("service.name", service_name)]},
+        "scopeSpans": [{
+            "scope": {"name": "birdnest.tracing"},
+            "spans": [_otlp_span(span_) for span_ in spans],
+        }],
+    }]}
+
+
+class FileSpanExporter:
+    """
+        Appends each finished trace to ``path`` as one line of OTLP/JSON.
+
+        Only sampled traces get here, so the write happens inline.
+    """
+
+    def __init__(self, path: str, service_name: str = "birdnest"):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        line = json.dumps(to_otlp(spans, self.service_name),
+                          separators=(",", ":"))
+        try:
+            with self._lock:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Could not export trace: {e}")
+
+
+class Tracer:
+    """
+        Starts request root spans and exports sampled traces.
+
+        A request carrying a traceparent header keeps its trace id and
+        follows the caller's sampling decision; other requests are sampled
+        with probability ``sample_rate``.
+    """
+
+    def __init__(self, enabled: bool = False, sample_rate: float = 0.01,
+                 exporter: Optional[FileSpanExporter] = None):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    def should_sample(self) -> bool:
+        return random.random() < self.sample_rate
+
+    def start_root(self, name: str, incoming: Optional[str] = None,
+                   **attributes: Any) -> Tuple[Optional[Span], str]:
+        """
+            The root span of a request (None when not sampled) and the
+            traceparent to send back.
+        """
+        parent = parse_traceparent(incoming)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = _new_id(128), None
+            sampled = self.should_sample()
+        if not sampled:
+            return None, format_traceparent(trace_id, _new_id(64), False)
+        root = Span(Trace(trace_id), name, parent_id, KIND_SERVER,
+                    attributes)
+        return root, root.traceparent
+
+    def finish(self, root: Span) -> None:
+        root.end()
+        if self.exporter is not None:
+            self.exporter.export(root.trace.spans)
+
+
+tracer = Tracer(
+    enabled=settings.TRACING_ENABLED,
+    sample_rate=settings.TRACING_SAMPLE_RATE,
+    exporter=FileSpanExporter(settings.TRACING_EXPORT_PATH,
+                              settings.PROJECT_NAME),
+)
+
+
+class TracingMiddleware:
+    """
+        Pure ASGI middleware opening the root span of each request while
+        tracing is enabled, and returning the trace id in a traceparent
+        response header.
+    """
+
+    def __init__(self, app, tracer_: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer_
+
+    async def __call__(self, scope, receive, send):
+        tracer_ = self.tracer
+        if scope["type"] != "http" or not tracer_.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                incoming = value.decode("latin-1")
+                break
+        root, traceparent = tracer_.start_root(
+            f"{scope['method']} {scope['path']}", incoming,
+            **{"http.method": scope["method"], "http.target": scope["path"]})
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                if root is not None:
+                    root.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        root.status = STATUS_ERROR
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"traceparent", traceparent.encode())]
+            await send(message)
+
+        if root is None:
+            await self.app(scope, receive, send_wrapper)
+            return
+
+        token = current_span.set(root)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            root.set_error(e)
+            raise
+        finally:
+            current_span.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                # Low-cardinality name once the router has matched
+                root.name = f"{scope['method']} {route.path}"
+                root.set_attribute("http.route", route.path)
+            tracer_.finish(root)
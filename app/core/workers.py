@@ -0,0 +1,262 @@
+"""
+Multi-worker serving.
+
+``Supervisor`` is a small prefork server built on uvicorn. The parent
+imports the application once (which also creates the schema, under the
+schema lock), binds the listening socket and forks the workers, which
+share both. Workers are recycled after ``max_requests`` requests (plus a
+random jitter, so they do not all restart together), crashed workers are
+replaced, and SIGTERM/SIGINT drain every worker before the parent exits.
+SIGHUP recycles all workers.
+
+Each worker reports readiness through ``worker_state``: the application's
+startup hook marks it ready, which ``/health/ready`` reports and which the
+parent logs through a pipe.
+"""
+
+import importlib
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerState:
+    """
+        Lifecycle of the serving process.
+    """
+
+    def __init__(self):
+        self.reset()
+        self.on_ready: Optional[Callable[[], None]] = None
+
+    def reset(self) -> None:
+        self.pid = os.getpid()
+        self.started_at = time.time()
+        self.ready = False
+        self.draining = False
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.draining = False
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def mark_draining(self) -> None:
+        self.ready = False
+        self.draining = True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pid": self.pid,
+            "ready": self.ready,
+            "draining": self.draining,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+        }
+
+
+worker_state = WorkerState()
+
+
+def _load(app_path: str):
+    module, _, attribute = app_path.partition(":")
+    return getattr(importlib.import_module(module), attribute or "app")
+
+
+class Supervisor:
+    """
+        Prefork parent of ``workers`` uvicorn workers serving ``app_path``
+        (``"module:attribute"``) on one shared socket.
+    """
+
+    # A worker exiting sooner than this after its start counts as a crash
+    # and delays the next spawn, so a broken app does not fork in a loop
+    MIN_WORKER_LIFETIME = 1.0
+    RESPAWN_DELAY = 1.0
+
+    def __init__(self, app_path: str, host: str = "0.0.0.0",
+                 port: int = 8000, workers: int = 1,
+                 max_requests: int = 0, max_requests_jitter: int = 0,
+                 graceful_timeout: float = 30.0, backlog: int = 2048,
+                 log_level: str = "info", access_log: bool = True):
+        self.app_path = app_path
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.log_level = log_level
+        self.access_log = access_log
+        self.app = None
+        self.socket: Optional[socket.socket] = None
+        self.children: Dict[int, float] = {}
+        self.ready: set = set()
+        self.spawned = 0
+        self._stopping = False
+        self._reload = False
+        self._ready_read: Optional[int] = None
+        self._ready_write: Optional[int] = None
+
+    def bind(self) -> socket.socket:
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        sock.set_inheritable(True)
+        self.port = sock.getsockname()[1]
+        return sock
+
+    def _worker_max_requests(self) -> Optional[int]:
+        if self.max_requests <= 0:
+            return None
+        return self.max_requests + random.randint(
+            0, max(0, self.max_requests_jitter))
+
+    def _run_worker(self) -> None:
+        import uvicorn
+
+        from .database import engine
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP,
+                       signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        os.close(self._ready_read)
+        # Forked workers must not share the parent's random state (span and
+        # trace ids) or its pooled database connections
+        random.seed()
+        engine.dispose(close=False)
+        worker_state.reset()
+        ready_write = self._ready_write
+
+        def notify():
+            os.write(ready_write, f"{os.getpid()}\n".encode())
+        worker_state.on_ready = notify
+
+        config = uvicorn.Config(
+            self.app, lifespan="on", log_level=self.log_level,
+            access_log=self.access_log,
+            limit_max_requests=self._worker_max_requests(),
+            timeout_graceful_shutdown=self.graceful_timeout)
+        uvicorn.Server(config).run(sockets=[self.socket])
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                self._run_worker()
+            except BaseException:
+                logger.exception("Worker failed")
+                status = 1
+            finally:
+                os._exit(status)
+        self.children[pid] = time.monotonic()
+        self.spawned += 1
+        logger.info(f"Started worker {pid}")
+        return pid
+
+    def _on_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _on_reload(self, signum, frame) -> None:
+        self._reload = True
+
+    def _read_ready(self, timeout: float) -> None:
+        readable, _, _ = select.select([self._ready_read], [], [], timeout)
+        if not readable:
+            return
+        for line in os.read(self._ready_read, 4096).decode().split():
+            pid = int(line)
+            if pid in self.children:
+                self.ready.add(pid)
+                logger.info(f"Worker {pid} ready "
+                            f"({len(self.ready)}/{self.workers})")
+
+    def _reap(self) -> None:
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            self.ready.discard(pid)
+            if started is None or self._stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code == 0:
+                logger.info(f"Worker {pid} exited, replacing it")
+            else:
+                logger.warning(f"Worker {pid} exited with {code}, "
+                               f"replacing it")
+                if time.monotonic() - started < self.MIN_WORKER_LIFETIME:
+                    time.sleep(self.RESPAWN_DELAY)
+            self.spawn()
+
+    def _signal_children(self, signum: int) -> None:
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+
+    def stop(self) -> None:
+        """
+            Ask every worker to finish its requests, then kill whichever
+            are still running after ``graceful_timeout``.
+        """
+        self._stopping = True
+        self._signal_children(signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        self._signal_children(signal.SIGKILL)
+        while self.children:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self.children.pop(pid, None)
+
+    def run(self) -> None:
+        # Preload: the import builds the app and creates the schema once
+        from .database import engine
+
+        logging.basicConfig(level=self.log_level.upper(),
+                            format="%(levelname)s:     %(message)s")
+        self.app = _load(self.app_path)
+        engine.dispose()
+        self.socket = self.bind()
+        self._ready_read, self._ready_write = os.pipe()
+        logger.info(f"Serving {self.app_path} on {self.host}:{self.port} "
+                    f"with {self.workers} workers")
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+            while not self._stopping:
+                self._read_ready(0.5)
+                if self._reload:
+                    self._reload = False
+                    logger.info("Recycling all workers")
+                    self._signal_children(signal.SIGTERM)
+                self._reap()
+        finally:
+            self.stop()
+            self.socket.close()
+            os.close(self._ready_read)
+            os.close(self._ready_write)
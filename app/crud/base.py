@@ -1,14 +1,19 @@
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+import logging
+from typing import (Any, Callable, Dict, Generic, List, Optional, Type,
+                    TypeVar, Union)
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from app.core.database import Base
+from app.core.tracing import traced
 
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+logger = logging.getLogger(__name__)
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelType]):
@@ -20,28 +25,50 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         * `schema`: A Pydantic model (schema) class
         """
         self.model = model
+        self._hooks: List[Callable[[str, ModelType], None]] = []
+
+    def add_hook(self, hook: Callable[[str, ModelType], None]) -> None:
+        """
+        Call `hook(event, obj)` after every committed create, update and
+        remove ("create", "update", "remove"), e.g. to queue background
+        jobs. Errors in hooks are logged and never fail the write.
+        """
+        self._hooks.append(hook)
+
+    def _notify(self, event: str, obj: ModelType) -> None:
+        for hook in self._hooks:
+            try:
+                hook(event, obj)
+            except Exception as e:
+                logger.error(f"{event} hook {hook!r} failed: {str(e)}")
 
+    @traced()
     def get(self, db: Session, id: Any) -> Optional[ModelType]:
         return db.query(self.model).filter(self.model.id == id).first()
 
+    @traced()
     def get_by_field(self, db: Session, field_name: str, field_value: Any
                      ) -> Optional[ModelType]:
         return db.query(self.model).filter(getattr(self.model, field_name
                                                    ) == field_value).first()
 
+    @traced()
     def get_multi(
         self, db: Session, *, skip: int = 0, limit: int = 100
     ) -> List[ModelType]:
         return db.query(self.model).offset(skip).limit(limit).all()
 
+    @traced()
     def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(**obj_in_data)
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        self._notify("create", db_obj)
         return db_obj
 
+    @traced()
     def update(self, db: Session, *, db_obj: ModelType,
                obj_in: Union[UpdateSchemaType, Dict[str, Any]]) -> ModelType:
         obj_data = jsonable_encoder(db_obj)
@@ -55,10 +82,13 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        self._notify("update", db_obj)
         return db_obj
 
+    @traced()
     def remove(self, db: Session, *, id: int) -> ModelType:
         obj = db.query(self.model).get(id)
         db.delete(obj)
         db.commit()
+        self._notify("remove", obj)
         return obj
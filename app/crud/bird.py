@@ -1,29 +1,94 @@
-from typing import Optional, List
+import json
+from typing import Any, Iterator, Optional, List, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import JSON, DateTime, func, text
+from app.core.audio import audio_store
+from app.core.config import settings
+from app.core.database import SessionLocal, schedule_optimize
+from app.core.events import bird_events
+from app.core.jobs import job_queue
+from app.core.snapshot import catalog_snapshot
+from app.core.serialization import BIRD_FIELDS
+from app.core.tracing import traced
 from app.crud.base import CRUDBase
 from app.models.bird import Bird
+from app.models.bird_change import DELETE, BirdChange
 from app.schemas.bird import BirdCreate, BirdUpdate
 
 
+def _column_json(name: str) -> str:
+    """
+        SQLite expression rendering a birds column the way the response
+        model does.
+    """
+    column_type = Bird.__table__.columns[name].type
+    column = f"birds.{name}"
+    if isinstance(column_type, JSON):
+        # Stored as JSON text; json() embeds it instead of quoting it
+        return f"json({column})"
+    if isinstance(column_type, DateTime):
+        # '2025-01-01 00:00:00[.ffffff]' to ISO 8601, without zero
+        # microseconds like Pydantic
+        return (f"CASE WHEN substr({column}, 20) IN ('', '.000000') "
+                f"THEN replace(substr({column}, 1, 19), ' ', 'T') "
+                f"ELSE replace({column}, ' ', 'T') END")
+    return column
+
+
+# One schemas.Bird document, assembled by SQLite
+_DOCUMENT = "json_object({})".format(", ".join(
+    f"'{field}', {_column_json(field)}" for field in BIRD_FIELDS))
+
+# A bird's version: the sequence number of its last bird_changes entry,
+# which every ORM write adds in its own transaction
+_VERSION = ("(SELECT max(bird_changes.id) FROM bird_changes "
+            "WHERE bird_changes.bird_id = birds.bird_id)")
+
+
+def _contains(text: str) -> str:
+    """
+        LIKE pattern matching ``text`` anywhere, with ``%`` and ``_``
+        taken literally as the snapshot's substring search does.
+    """
+    text = (text.replace("\\", "\\\\").replace("%", "\\%")
+            .replace("_", "\\_"))
+    return f"%{text}%"
+
+
 class CRUDBird(CRUDBase[Bird, BirdCreate, BirdUpdate]):
+    @traced()
     def get_by_bird_id(self, db: Session, *, bird_id: str) -> Optional[Bird]:
         """Get bird by bird_id (e.g., 'peregrine-falcon')."""
         return db.query(Bird).filter(Bird.bird_id == bird_id).first()
 
+    @traced()
+    def get_with_version(self, db: Session, *, bird_id: str
+                         ) -> Optional[Tuple[Bird, Optional[int]]]:
+        """
+            ``(bird, version)`` by bird_id, or None. The version changes on
+            every write of the bird, whichever process makes it.
+        """
+        row = db.query(Bird, text(_VERSION)).filter(
+            Bird.bird_id == bird_id).first()
+        return tuple(row) if row is not None else None
+
+    @traced()
     def search_by_name(self, db: Session, *, name: str) -> List[Bird]:
         """Search birds by name (case-insensitive partial match)."""
         return db.query(Bird).filter(
-            Bird.name.ilike(f"%{name}%")
+            Bird.name.ilike(_contains(name), escape="\\")
         ).all()
 
+    @traced()
     def search_by_scientific_name(self, db: Session, *, scientific_name: str
                                   ) -> List[Bird]:
         """Search birds by scientific name (case-insensitive partial match)."""
         return db.query(Bird).filter(
-            Bird.scientific_name.ilike(f"%{scientific_name}%")
+            Bird.scientific_name.ilike(_contains(scientific_name),
+                                       escape="\\")
         ).all()
 
+    @traced()
     def get_by_conservation_status(self, db: Session, *, status: str
                                    ) -> List[Bird]:
         """Get birds by conservation status."""
@@ -31,5 +96,141 @@ class CRUDBird(CRUDBase[Bird, BirdCreate, BirdUpdate]):
             func.json_extract(Bird.conservation_status, '$.status') == status
         ).all()
 
+    @traced()
+    def get_batch(self, db: Session, *, bird_ids: List[str]) -> List[Bird]:
+        """Get the birds with the given bird_ids, in that order."""
+        found = {b.bird_id: b for b in db.query(Bird).filter(
+            Bird.bird_id.in_(bird_ids)).all()}
+        return [found[bird_id] for bird_id in dict.fromkeys(bird_ids)
+                if bird_id in found]
+
+    @traced()
+    def get_changes(self, db: Session, *, since: int = 0, limit: int = 100
+                    ) -> Tuple[List[Tuple[BirdChange, Optional[Bird]]], int,
+                               bool]:
+        """
+            Changelog entries after sequence number ``since``, in commit
+            order, each with the bird as it is now (None once deleted).
+            Returns ``(entries, next since, more pending)``; of several
+            entries for one bird in a page only the last is kept.
+        """
+        rows = db.query(BirdChange).filter(BirdChange.id > since).order_by(
+            BirdChange.id).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if not rows:
+            return [], since, False
+
+        latest = {row.bird_id: row for row in rows}
+        ids = [bird_id for bird_id, row in latest.items()
+               if row.op != DELETE]
+        found = {b.bird_id: b for b in db.query(Bird).filter(
+            Bird.bird_id.in_(ids)).all()} if ids else {}
+        entries = [(row, found.get(row.bird_id)) for row in rows
+                   if latest[row.bird_id] is row]
+        return entries, rows[-1].id, has_more
+
+    @traced()
+    def compact_changes(self, db: Session) -> int:
+        """
+            Delete changelog entries superseded by a later one for the
+            same bird. A client resuming from any token still sees every
+            bird's latest entry, tombstones included. Returns the number
+            deleted.
+        """
+        deleted = db.execute(text(
+            "DELETE FROM bird_changes WHERE id NOT IN "
+            "(SELECT max(id) FROM bird_changes GROUP BY bird_id)")).rowcount
+        db.commit()
+        return deleted
+
+    # Raw read path: SQLite builds the response JSON with json_object and
+    # json_group_array, so no ORM objects are created and no column is
+    # decoded in Python. The text is sent to the client as it is.
+
+    @traced()
+    def get_document_raw(self, db: Session, *, bird_id: str
+                         ) -> Optional[Tuple[int, Any, str]]:
+        """
+            ``(id, version, BirdResponse JSON)`` of a bird, or None; see
+            get_with_version.
+        """
+        row = db.execute(text(
+            f"SELECT id, {_VERSION}, json_object('success', json('true'), "
+            f"'data', {_DOCUMENT}) FROM birds WHERE bird_id = :bird_id "
+            f"LIMIT 1"), {"bird_id": bird_id}).first()
+        return tuple(row) if row is not None else None
+
+    @traced()
+    def get_multi_raw(self, db: Session, *, skip: int = 0, limit: int = 100
+                      ) -> str:
+        """JSON array of the birds get_multi returns."""
+        return db.execute(text(
+            f"SELECT json_group_array(json(doc)) FROM (SELECT {_DOCUMENT} "
+            f"AS doc FROM birds LIMIT :limit OFFSET :skip)"),
+            {"limit": limit, "skip": skip}).scalar()
+
+    @traced()
+    def get_batch_raw(self, db: Session, *, bird_ids: List[str]) -> str:
+        """JSON array of the birds get_batch returns."""
+        ids = json.dumps(list(dict.fromkeys(bird_ids)))
+        return db.execute(text(
+            f"SELECT json_group_array(json(doc)) FROM (SELECT {_DOCUMENT} "
+            f"AS doc FROM json_each(:ids) AS requested JOIN birds "
+            f"ON birds.bird_id = requested.value ORDER BY requested.key)"),
+            {"ids": ids}).scalar()
+
+    def iter_documents_raw(self, db: Session, *,
+                           bird_ids: Optional[List[str]] = None
+                           ) -> Iterator[Tuple[int, str, str, str,
+                                               Optional[str], str, str]]:
+        """
+            ``(id, bird_id, name, scientific_name, status, JSON array of
+            tag texts, schemas.Bird JSON)`` of every bird, or of the given
+            bird_ids, in table order. Rows are fetched as they are
+            consumed.
+        """
+        where, params = "", {}
+        if bird_ids is not None:
+            where = "WHERE bird_id IN (SELECT value FROM json_each(:ids))"
+            params["ids"] = json.dumps(list(bird_ids))
+        yield from db.execute(text(
+            f"SELECT id, bird_id, name, scientific_name, "
+            f"json_extract(conservation_status, '$.status'), "
+            f"(SELECT json_group_array(json_extract(value, '$.text')) "
+            f"FROM json_each(birds.tags) WHERE type = 'object'), "
+            f"{_DOCUMENT} "
+            f"FROM birds {where} ORDER BY id"), params)
+
+
+COMPACT_CHANGES_JOB = "bird_changes.compact"
+
+
+@job_queue.handler(COMPACT_CHANGES_JOB)
+def compact_changes(payload=None) -> None:
+    with SessionLocal() as db:
+        bird.compact_changes(db)
+
+
+def schedule_compact_changes() -> Optional[int]:
+    """
+        Queue a changelog compaction BIRD_CHANGES_COMPACT_DELAY seconds
+        from now, unless one is pending already.
+    """
+    if not settings.BIRD_CHANGES_COMPACT_DELAY:
+        return None
+    return job_queue.enqueue(COMPACT_CHANGES_JOB, key=COMPACT_CHANGES_JOB,
+                             delay=settings.BIRD_CHANGES_COMPACT_DELAY)
+
 
 bird = CRUDBird(Bird)
+# Writes change the index statistics; refresh them once things settle
+bird.add_hook(lambda event, obj: schedule_optimize())
+# Precompute duration and waveform of newly referenced sounds
+bird.add_hook(audio_store.bird_written)
+# Replace the served catalog snapshot, if any, before the write returns
+bird.add_hook(catalog_snapshot.bird_written)
+# Push the write to event subscribers (GET /birds/events)
+bird.add_hook(bird_events.bird_written)
+# Keep the change feed's log to about one entry per bird
+bird.add_hook(lambda event, obj: schedule_compact_changes())
@@ -1,13 +1,32 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 
 from app.api.v1.api import api_router
+from app.core.admission import AdmissionMiddleware, admission
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
-from app.core.database import engine
-from app.models.base import BaseModel
+from app.core.database import engine, ensure_schema
+from app.core.events import bird_events
+from app.core.images import image_store
+from app.core.jobs import job_queue
+from app.core.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    MetricsMiddleware,
+    instrument_engine,
+    registry as metrics_registry,
+)
+from app.core.profiling import ProfilingMiddleware, continuous_profiler
+from app.core.query_monitor import QueryMonitorMiddleware, query_monitor
+from app.core.snapshot import catalog_snapshot
+from app.core.tracing import TracingMiddleware
+from app.core.workers import worker_state
+from app import models  # noqa: F401  (registers every table)
 
-# Create database tables
-BaseModel.metadata.create_all(bind=engine)
+# Create missing tables and indexes. Runs under a file lock, so workers
+# starting together do not race; the multi-worker server runs it once in
+# the parent before forking (see app/core/workers.py).
+ensure_schema(engine)
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -23,9 +42,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+if settings.METRICS_ENABLED:
+    instrument_engine(engine)
+    app.add_middleware(MetricsMiddleware)
+
+# Outside the request metrics, which then describe admitted requests;
+# shed requests are counted by birdnest_admission_requests_total
+app.add_middleware(AdmissionMiddleware)
+
+# Always installed; these only do work while switched on at runtime
+query_monitor.instrument(engine)
+app.add_middleware(QueryMonitorMiddleware)
+app.add_middleware(TracingMiddleware)
+# Outermost, so a profile covers every other middleware too
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 
+@app.on_event("startup")
+def start_background_workers():
+    if settings.JOBS_ENABLED:
+        job_queue.start()
+    if admission.enabled:
+        admission.start()
+    if settings.PROFILING_CONTINUOUS:
+        continuous_profiler.start()
+    if settings.SNAPSHOT_READS:
+        catalog_snapshot.load()
+        catalog_snapshot.start()
+    worker_state.mark_ready()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    worker_state.mark_draining()
+    # End event streams, which would otherwise stay open
+    bird_events.close()
+    # Finish the running job batches; queued jobs wait in the table
+    job_queue.stop()
+    continuous_profiler.stop()
+    admission.stop()
+    catalog_snapshot.stop()
+    image_store.shutdown()
+
+
 @app.get("/")
 async def root():
     return {
@@ -37,4 +101,34 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    """
+        503 with status "overloaded" while admission control sheds load,
+        so load balancers can steer traffic to other instances.
+    """
+    state = admission.snapshot()
+    content = {"status": "overloaded" if state["overloaded"] else "healthy",
+               "worker": worker_state.status(), "admission": state}
+    if state["overloaded"]:
+        return JSONResponse(content, status_code=503)
+    return content
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """
+        200 once this worker has started up, 503 before that and while it
+        drains on shutdown.
+    """
+    status = worker_state.status()
+    if not worker_state.ready:
+        return JSONResponse(status, status_code=503)
+    return status
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+        Prometheus text exposition of the application metrics.
+    """
+    return Response(metrics_registry.render(),
+                    media_type=METRICS_CONTENT_TYPE)
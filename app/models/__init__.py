@@ -1 +1,3 @@
 from app.models.bird import Bird
+from app.models.bird_change import BirdChange
+from app.models.conversation import ConversationLog, ConversationTurn
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, JSON
+from sqlalchemy import Column, Index, String, JSON
 from .base import BaseModel
 
 
@@ -7,6 +7,7 @@ class Bird(BaseModel):
         Bird model based on the JSON structure.
     """
     __tablename__ = "birds"
+    __table_args__ = (Index("ix_birds_updated_at", "updated_at"),)
 
     # Basic info
     bird_id = Column(String, unique=True, index=True, nullable=False)
@@ -0,0 +1,52 @@
+from sqlalchemy import Column, String, event, inspect, text
+from sqlalchemy.orm import Session
+from .base import BaseModel
+from .bird import Bird
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+
+
+class BirdChange(BaseModel):
+    """
+        Changelog of the birds table, read by the change feed
+        (GET /birds/changes).
+
+        A row is added in the same flush, and so the same transaction, as
+        every ORM insert, update and delete of a bird; deletes leave a
+        tombstone. ``id`` is the sequence number: AUTOINCREMENT never
+        reuses one, and SQLite commits one writer at a time, so ids
+        increase in commit order.
+    """
+    __tablename__ = "bird_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    bird_id = Column(String, index=True, nullable=False)
+    op = Column(String, nullable=False)  # create, update or delete
+
+
+@event.listens_for(Session, "before_flush")
+def record_bird_changes(session: Session, flush_context, instances) -> None:
+    for obj in list(session.new):
+        if isinstance(obj, Bird):
+            session.add(BirdChange(bird_id=obj.bird_id, op=CREATE))
+    for obj in list(session.dirty):
+        if isinstance(obj, Bird) and session.is_modified(obj):
+            session.add(BirdChange(bird_id=obj.bird_id, op=UPDATE))
+    for obj in list(session.deleted):
+        if isinstance(obj, Bird):
+            session.add(BirdChange(bird_id=obj.bird_id, op=DELETE))
+
+
+@event.listens_for(BirdChange.__table__, "after_create")
+def backfill_bird_changes(table, connection, **kw) -> None:
+    """
+        Birds written before the changelog existed get a create entry, so
+        a feed read from the start covers the whole catalog.
+    """
+    if inspect(connection).has_table("birds"):
+        connection.execute(text(
+            "INSERT INTO bird_changes (bird_id, op, created_at, updated_at) "
+            "SELECT bird_id, 'create', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP "
+            "FROM birds ORDER BY id"))
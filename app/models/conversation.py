@@ -0,0 +1,30 @@
+from sqlalchemy import Boolean, Column, Float, Integer, String, Text
+from .base import BaseModel
+
+
+class ConversationTurn(BaseModel):
+    """
+        One message of a chat session, persisted when
+        AI_SESSION_PERSIST is enabled.
+    """
+    __tablename__ = "conversation_turns"
+
+    session_id = Column(String, index=True, nullable=False)
+    role = Column(String, nullable=False)  # "user" or "assistant"
+    content = Column(Text, nullable=False)
+    tokens = Column(Integer, nullable=False)  # Estimated token count
+
+
+class ConversationLog(BaseModel):
+    """
+        Analytics record of one chat request, written in batches by the
+        conversation_log background job.
+    """
+    __tablename__ = "conversation_logs"
+
+    session_id = Column(String, index=True)
+    message = Column(String, nullable=False)  # Truncated for privacy
+    success = Column(Boolean, nullable=False)
+    response_count = Column(Integer, nullable=False)
+    processing_time = Column(Float, nullable=False)  # Seconds
+    logged_at = Column(Float, nullable=False)  # Unix timestamp
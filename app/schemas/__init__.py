@@ -4,4 +4,6 @@ from app.schemas.bird import (
     BirdUpdate,
     BirdResponse,
     BirdInDB,
+    BirdChange,
+    BirdChanges,
 )
@@ -0,0 +1,52 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class SlowQuery(BaseModel):
+    statement: str
+    duration_ms: float
+    plan: List[str]
+    logged_at: float
+
+
+class SQLMonitorOptions(BaseModel):
+    enabled: bool
+    server_timing: bool
+    n_plus_one_threshold: int
+    slow_query_ms: float
+    explain: bool
+
+
+class SQLMonitorUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    server_timing: Optional[bool] = None
+    n_plus_one_threshold: Optional[int] = Field(None, ge=0)
+    slow_query_ms: Optional[float] = Field(None, ge=0)
+    explain: Optional[bool] = None
+
+
+class SQLMonitorStatus(SQLMonitorOptions):
+    slow_queries: List[SlowQuery] = []
+
+
+class ProfileInfo(BaseModel):
+    id: str
+    method: str
+    path: str
+    status: int
+    duration_ms: float
+    samples: int
+    created_at: float
+
+
+class ContinuousProfilingStatus(BaseModel):
+    enabled: bool
+    hz: float
+    window_seconds: float
+    windows: int
+
+
+class ContinuousProfilingUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    hz: Optional[float] = Field(None, gt=0, le=1000)
+    window_seconds: Optional[float] = Field(None, gt=0)
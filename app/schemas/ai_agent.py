@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 
@@ -14,7 +14,9 @@ class ChatRequest(BaseModel):
     include_retrieval: bool = Field(
         default=True, description="Whether to include retrieval information")
     session_id: Optional[str] = Field(
-        None, description="Optional session ID for conversation tracking")
+        None, max_length=128,
+        description="Optional session ID; prior turns of the session are "
+        "sent to the agent as conversation history")
 
     @validator('message')
     def validate_message(cls, v):
@@ -23,6 +25,62 @@ class ChatRequest(BaseModel):
         return v.strip()
 
 
+class ChatBatchItem(ChatRequest):
+    """
+        A single chat request inside a batch
+    """
+
+    id: str = Field(..., min_length=1, max_length=200,
+                    description="Client-chosen item id, unique in the batch")
+
+
+class ChatBatchRequest(BaseModel):
+    """
+        Request schema for the batch chat endpoint
+    """
+
+    items: List[ChatBatchItem] = Field(..., min_length=1,
+                                       description="Chat requests to run")
+    parallelism: Optional[int] = Field(
+        None, ge=1, description="Maximum number of items run concurrently "
+        "(capped by the server)")
+    completed_ids: List[str] = Field(
+        default_factory=list,
+        description="Ids already received by the client; these items are "
+        "skipped, which lets an interrupted batch be resumed")
+
+    @validator('items')
+    def validate_unique_ids(cls, v):
+        ids = [item.id for item in v]
+        if len(ids) != len(set(ids)):
+            raise ValueError('Item ids must be unique within a batch')
+        return v
+
+
+class ChatBatchResult(BaseModel):
+    """
+        One NDJSON line of the batch chat response
+    """
+
+    id: str = Field(..., description="Id of the batch item")
+    success: bool = Field(...,
+                          description="Whether the item was successful")
+    responses: Optional[List[str]] = Field(None,
+                                           description="AI agent responses")
+    message_count: Optional[int] = Field(
+        None, description="Number of responses returned")
+    original_query: Optional[str] = Field(
+        None, description="Sanitized version of original query")
+    error: Optional[str] = Field(
+        None, description="Error message if the item failed")
+    retryable: bool = Field(
+        default=False,
+        description="Whether the item failed because the upstream was "
+        "unavailable and can be retried later")
+    processing_time: Optional[float] = Field(
+        None, description="Processing time in seconds")
+
+
 class ChatResponse(BaseModel):
     """
         Response schema for chat endpoint
@@ -42,6 +100,21 @@ class ChatResponse(BaseModel):
                                 description="Response timestamp")
     processing_time: Optional[float] = Field(
         None, description="Processing time in seconds")
+    usage: Optional[Dict[str, int]] = Field(
+        None, description="Upstream token usage of this request")
+
+
+class UsageResponse(BaseModel):
+    """
+        Response schema for the session usage endpoint
+    """
+
+    session_id: str = Field(..., description="Session ID")
+    requests: int = Field(..., description="Chat requests in the session")
+    prompt_tokens: int = Field(..., description="Upstream prompt tokens")
+    completion_tokens: int = Field(
+        ..., description="Upstream completion tokens")
+    total_tokens: int = Field(..., description="Upstream tokens in total")
 
 
 class HealthResponse(BaseModel):
@@ -55,3 +128,11 @@ class HealthResponse(BaseModel):
     ai_agent_available: bool = Field(
         ..., description="Whether AI agent is available")
     version: str = Field(default="1.0.0", description="API version")
+    circuit_state: Optional[str] = Field(
+        None, description="Upstream circuit breaker state")
+    upstream: Optional[Dict[str, Any]] = Field(
+        None, description="Circuit breaker and concurrency limiter state")
+    sessions: Optional[Dict[str, Any]] = Field(
+        None, description="Conversation session store size and memory use")
+    analytics: Optional[Dict[str, Any]] = Field(
+        None, description="Conversation analytics job queue state")
@@ -146,3 +146,19 @@ class BirdInDB(BirdInDBBase):
 class BirdResponse(BaseModel):
     success: bool
     data: Bird
+
+
+class BirdChange(BaseModel):
+    seq: int
+    op: str  # create, update or delete
+    bird_id: str
+    changed_at: datetime
+    # The bird as it is now; None for deletes, and for birds deleted
+    # since (a later delete follows)
+    data: Optional[Bird] = None
+
+
+class BirdChanges(BaseModel):
+    changes: List[BirdChange]
+    next: str  # Token to pass as since for the following page
+    has_more: bool
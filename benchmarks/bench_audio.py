@@ -0,0 +1,159 @@
+"""
+Throughput of concurrent partial-content requests on the audio endpoint.
+
+Writes a synthetic audio file to ``--data-dir``, serves it with
+``run.py`` and fetches random byte ranges of it (what a player does while
+seeking) at each concurrency level, and whole-file downloads for
+comparison:
+
+    python -m benchmarks.bench_audio --file-mb 20 --range-kb 256 \\
+        --concurrency 1,8,32 --output audio.json
+
+For every mode and concurrency level the results give requests and
+megabytes per second, status counts and latency. Every 206 is checked for
+the requested length; a mismatch counts as ``short``.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import environment, summarize, write_results
+
+PREFIX = "/api/v1/audio/files"
+FILE_NAME = "bench/call.mp3"
+
+
+async def run_load(app_url: str, size: int, mode: str, concurrency: int,
+                   requests: int, range_size: int, seed: int = 0
+                   ) -> Dict[str, Any]:
+    """
+        ``requests`` fetches by ``concurrency`` concurrent clients, each
+        reading its response to the end.
+    """
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    received = 0
+    remaining = requests
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=app_url, timeout=60.0,
+                                 limits=limits) as client:
+        async def worker():
+            nonlocal received, remaining
+            while remaining > 0:
+                remaining -= 1
+                headers, expected = {}, size
+                if mode == "range":
+                    start = rng.randrange(max(1, size - range_size))
+                    end = min(size, start + range_size) - 1
+                    headers["Range"] = f"bytes={start}-{end}"
+                    expected = end - start + 1
+                began = time.perf_counter()
+                try:
+                    async with client.stream("GET", f"{PREFIX}/{FILE_NAME}",
+                                             headers=headers) as response:
+                        length = 0
+                        async for chunk in response.aiter_raw():
+                            length += len(chunk)
+                    status = str(response.status_code)
+                    if length != expected:
+                        status = "short"
+                except httpx.HTTPError as e:
+                    status, length = type(e).__name__, 0
+                latencies.append(time.perf_counter() - began)
+                statuses[status] += 1
+                received += length
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": requests,
+        "elapsed": round(elapsed, 3),
+        "ops_per_sec": round(requests / elapsed, 2),
+        "mb_per_sec": round(received / elapsed / 1e6, 2),
+        "status_counts": dict(statuses),
+        "latency_ms": summarize(latencies),
+    }
+
+
+def run(file_mb: float, range_kb: int, concurrency: List[int],
+        requests: int, modes: List[str], workers: int, data_dir: str,
+        seed: int) -> List[Dict[str, Any]]:
+    from benchmarks.bench_workers import _free_port, start_server, stop_server
+
+    data_dir = os.path.abspath(data_dir)
+    audio_dir = os.path.join(data_dir, "bench_audio")
+    path = os.path.join(audio_dir, FILE_NAME)
+    size = int(file_mb * 1e6)
+    if not os.path.exists(path) or os.path.getsize(path) != size:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(random.Random(seed).randbytes(size))
+
+    port = _free_port()
+    server = start_server(
+        os.path.join(data_dir, "bench_audio.db"), workers, port,
+        overrides={"AUDIO_DIR": audio_dir,
+                   "AUDIO_CACHE_DIR": os.path.join(data_dir,
+                                                   "bench_audio_cache"),
+                   "JOBS_SQLITE_PATH": os.path.join(data_dir,
+                                                    "bench_jobs.db"),
+                   "ADMISSION_ENABLED": "false",
+                   "COMPRESSION_ENABLED": "false"})
+    results = []
+    try:
+        for mode in modes:
+            for level in concurrency:
+                results.append(asyncio.run(run_load(
+                    f"http://127.0.0.1:{port}", size, mode, level,
+                    requests, range_kb * 1024, seed)))
+    finally:
+        stop_server(server)
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--file-mb", type=float, default=20.0,
+                        help="Size of the served file")
+    parser.add_argument("--range-kb", type=int, default=256,
+                        help="Bytes per range request")
+    parser.add_argument("--concurrency", default="1,8,32",
+                        help="Comma separated concurrent clients")
+    parser.add_argument("--requests", type=int, default=500,
+                        help="Requests per mode and concurrency level")
+    parser.add_argument("--modes", default="range,full",
+                        help="range and/or full")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    write_results({
+        "benchmark": "audio",
+        "environment": environment(),
+        "config": vars(args),
+        "results": run(args.file_mb, args.range_kb,
+                       [int(c) for c in args.concurrency.split(",")],
+                       args.requests, args.modes.split(","), args.workers,
+                       args.data_dir, args.seed),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
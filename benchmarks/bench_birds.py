@@ -0,0 +1,223 @@
+"""
+Benchmark every bird endpoint against synthetic catalogs of several sizes.
+
+For each scale a SQLite catalog is generated once with benchmarks.catalog
+(and reused by later runs), then list, get, search, filter, create,
+update and delete are driven in-process through the ASGI app:
+
+    python -m benchmarks.bench_birds --scales 1000,100000 --output new.json
+    python -m benchmarks.bench_birds --scales 1000 --baseline old.json
+
+Created birds are deleted again and updates rewrite the same values, so a
+cached catalog is unchanged by a run. ``--baseline`` compares p50 latency
+against an earlier result file and exits with status 1 when an endpoint
+got slower by more than ``--threshold``.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.catalog import generate_bird, populate
+from benchmarks.common import environment, summarize, write_results
+
+# Endpoints without a page size return every match, so their terms are
+# picked to match a small, scale-proportional share of the catalog.
+SEARCH_NAME = "Royal Albatross"
+SEARCH_SCIENTIFIC = "sternahiru"
+FILTER_STATUS = "extinct"
+
+
+def _configure_environment() -> None:
+    for name, default in (("PROJECT_NAME", "BirdNest"),
+                          ("API_V1_STR", "/api/v1"),
+                          ("DATABASE_URL", "sqlite:///./bench_birds.db"),
+                          ("DEBUG", "false"),
+                          ("AGENT_ENDPOINT", "http://127.0.0.1:9"),
+                          ("AGENT_ACCESS_KEY", "benchmark")):
+        os.environ.setdefault(name, default)
+
+
+def run_endpoint(call: Callable[[int], Any], iterations: int,
+                 max_seconds: float) -> Dict[str, Any]:
+    """
+        Call ``call(i)`` up to ``iterations`` times (or until
+        ``max_seconds`` have passed) and summarize the responses.
+    """
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    sizes: List[int] = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        response = call(i)
+        latencies.append(time.perf_counter() - start)
+        statuses[str(response.status_code)] += 1
+        sizes.append(len(response.content))
+        if time.perf_counter() - started > max_seconds:
+            break
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "ops_per_sec": round(len(latencies) / elapsed, 2),
+        "status_counts": dict(statuses),
+        "mean_response_bytes": int(sum(sizes) / len(sizes)),
+        "latency_ms": summarize(latencies),
+    }
+
+
+def bench_scale(client, scale: int, seed: int, iterations: int,
+                max_seconds: float) -> List[Dict[str, Any]]:
+    prefix = "/api/v1/birds"
+    rng = random.Random(seed)
+    sample = [generate_bird(rng.randrange(scale), seed)
+              for _ in range(min(iterations, 200))]
+    new_birds = [generate_bird(scale + i, seed) for i in range(iterations)]
+
+    def pick(i):
+        return sample[i % len(sample)]
+
+    cases = [
+        ("list", lambda i: client.get(
+            f"{prefix}/", params={"skip": rng.randrange(max(1, scale - 100)),
+                                  "limit": 100})),
+        ("get", lambda i: client.get(f"{prefix}/{pick(i)['bird_id']}")),
+        ("search_name", lambda i: client.get(
+            f"{prefix}/search/name", params={"name": SEARCH_NAME})),
+        ("search_scientific", lambda i: client.get(
+            f"{prefix}/search/scientific",
+            params={"scientific_name": SEARCH_SCIENTIFIC})),
+        ("filter_conservation", lambda i: client.get(
+            f"{prefix}/filter/conservation",
+            params={"status": FILTER_STATUS})),
+        ("create", lambda i: client.post(f"{prefix}/", json=new_birds[i])),
+        ("update", lambda i: client.put(f"{prefix}/{pick(i)['bird_id']}",
+                                        json={"name": pick(i)["name"]})),
+    ]
+
+    results = []
+    for endpoint, call in cases:
+        result = run_endpoint(call, iterations, max_seconds)
+        results.append({"scale": scale, "endpoint": endpoint, **result})
+        if endpoint == "create":
+            created = result["requests"]
+
+    # Delete exactly what was created so the cached catalog stays as is
+    result = run_endpoint(
+        lambda i: client.delete(f"{prefix}/{new_birds[i]['bird_id']}"),
+        created, float("inf"))
+    results.append({"scale": scale, "endpoint": "delete", **result})
+    return results
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any],
+            threshold: float) -> List[Dict[str, Any]]:
+    """
+        p50 latency change per (scale, endpoint) present in both result
+        files; ``regression`` is set when it grew by more than
+        ``threshold`` (a fraction).
+    """
+    old = {(r["scale"], r["endpoint"]): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        before = old.get((result["scale"], result["endpoint"]))
+        if before is None or not before["latency_ms"]["p50"]:
+            continue
+        p50_old = before["latency_ms"]["p50"]
+        p50_new = result["latency_ms"]["p50"]
+        change = (p50_new - p50_old) / p50_old
+        rows.append({
+            "scale": result["scale"],
+            "endpoint": result["endpoint"],
+            "p50_ms_baseline": p50_old,
+            "p50_ms": p50_new,
+            "change": round(change, 4),
+            "regression": change > threshold,
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scales", default="1000,100000",
+                        help="Comma separated catalog sizes, e.g. "
+                             "1000,100000,1000000")
+    parser.add_argument("--iterations", type=int, default=200,
+                        help="Requests per endpoint and scale")
+    parser.add_argument("--max-seconds", type=float, default=30.0,
+                        help="Time budget per endpoint and scale")
+    parser.add_argument("--data-dir", default=".",
+                        help="Where catalog databases are kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    parser.add_argument("--baseline", default=None,
+                        help="Earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed p50 slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    _configure_environment()
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.api import deps
+    from app.main import app
+
+    results = []
+    catalogs = {}
+    for scale in [int(s) for s in args.scales.split(",")]:
+        path = os.path.join(args.data_dir, f"bench_birds_{scale}.db")
+        engine = create_engine(f"sqlite:///{path}",
+                               connect_args={"check_same_thread": False})
+        start = time.perf_counter()
+        inserted = populate(engine, scale, args.seed)
+        catalogs[scale] = {"path": path, "inserted": inserted,
+                           "populate_seconds": round(
+                               time.perf_counter() - start, 2),
+                           "bytes": os.path.getsize(path)}
+
+        session_factory = sessionmaker(autocommit=False, autoflush=False,
+                                       bind=engine)
+
+        def get_db():
+            db = session_factory()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[deps.get_db] = get_db
+        try:
+            with TestClient(app) as client:
+                results.extend(bench_scale(client, scale, args.seed,
+                                           args.iterations, args.max_seconds))
+        finally:
+            app.dependency_overrides.pop(deps.get_db, None)
+            engine.dispose()
+
+    payload = {
+        "benchmark": "bird_endpoints",
+        "environment": environment(),
+        "config": vars(args),
+        "catalogs": catalogs,
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            payload["comparison"] = compare(json.load(f), payload,
+                                            args.threshold)
+    write_results(payload, args.output)
+    if any(row["regression"] for row in payload.get("comparison", [])):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+CPU cost versus bytes saved of response compression.
+
+Compresses synthetic single-bird documents (BirdResponse) and 100-bird
+list pages with every available codec at a range of levels:
+
+    python -m benchmarks.bench_compression --documents 200 \\
+        --output compression.json
+
+For each codec and level the results give the compression time per
+document, the compressed size, the share of bytes saved and the CPU
+microseconds spent per KB saved. ``cached_variant_us`` is the cost of
+serving an already compressed variant from the document cache instead.
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.catalog import generate_bird
+from benchmarks.common import environment, write_results
+
+
+LEVELS = {"gzip": [1, 3, 6, 9], "br": [1, 4, 5, 9, 11],
+          "zstd": [1, 3, 9, 19]}
+ROUNDS = 3
+TIMESTAMP = "2025-01-01T00:00:00"
+
+
+def _document(index: int, seed: int) -> Dict[str, Any]:
+    return dict(generate_bird(index, seed), id=index + 1,
+                created_at=TIMESTAMP, updated_at=TIMESTAMP)
+
+
+def _encode(content: Any) -> bytes:
+    # Starlette's JSONResponse rendering
+    return json.dumps(content, ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def build_documents(count: int, seed: int) -> Dict[str, List[bytes]]:
+    birds = [_document(i, seed) for i in range(count)]
+    single = [_encode({"success": True, "data": bird})
+              for bird in birds]
+    pages = [_encode(birds[start:start + 100])
+             for start in range(0, count, 100)]
+    return {"bird": single, "list_page": pages}
+
+
+def bench_codec(compress, level: int, documents: List[bytes]
+                ) -> Dict[str, float]:
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        compressed = [compress(document, level) for document in documents]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    raw = sum(len(document) for document in documents)
+    size = sum(len(document) for document in compressed)
+    saved_kb = (raw - size) / 1024
+    return {
+        "level": level,
+        "compress_us": round(best / len(documents) * 1e6, 2),
+        "mean_bytes": round(size / len(documents)),
+        "saved_ratio": round(1 - size / raw, 4),
+        "us_per_kb_saved": round(best * 1e6 / saved_kb, 2)
+        if saved_kb > 0 else None,
+    }
+
+
+def bench_cached_variant(documents: List[bytes]) -> float:
+    from app.core.compression import DocumentCache
+
+    cache = DocumentCache(max_entries=len(documents), minimum_size=0)
+    for key, document in enumerate(documents):
+        cache.variant(key, 1, lambda document=document: document, "gzip")
+    cache.wait_for_upgrades()
+    count = 0
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for key, document in enumerate(documents):
+            cache.variant(key, 1, lambda document=document: document,
+                          "gzip")
+            count += 1
+    return round((time.perf_counter() - start) / count * 1e6, 3)
+
+
+def run(documents: int, seed: int) -> Dict[str, Any]:
+    from app.core.compression import CODECS
+
+    results: Dict[str, Any] = {}
+    for kind, bodies in build_documents(documents, seed).items():
+        raw = sum(len(body) for body in bodies) / len(bodies)
+        codecs = {name: [bench_codec(compress, level, bodies)
+                         for level in LEVELS[name]]
+                  for name, compress in CODECS.items()}
+        results[kind] = {"documents": len(bodies), "mean_raw_bytes":
+                         round(raw), "codecs": codecs}
+    results["cached_variant_us"] = bench_cached_variant(
+        build_documents(min(documents, 100), seed)["bird"])
+    results["unavailable_codecs"] = sorted(set(LEVELS) - set(CODECS))
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=200,
+                        help="Synthetic birds; list pages hold 100 each")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    write_results({
+        "benchmark": "compression",
+        "environment": environment(),
+        "config": vars(args),
+        "results": run(args.documents, args.seed),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
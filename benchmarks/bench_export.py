@@ -0,0 +1,104 @@
+"""
+Full and incremental build time of the static export.
+
+Exports the synthetic catalog into ``--data-dir`` with one process and
+with a pool of ``--workers`` processes, then updates ``--changed`` birds
+and exports again incrementally:
+
+    python -m benchmarks.bench_export --count 100000 --workers 4 \\
+        --output export.json
+
+The catalog is generated once into ``--data-dir``; the export directories
+are rebuilt on every run.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, func, update
+
+from benchmarks.bench_birds import _configure_environment
+from benchmarks.catalog import populate
+from benchmarks.common import environment, write_results
+
+
+def _size_mb(directory: str) -> float:
+    return round(sum(os.path.getsize(os.path.join(root, name))
+                     for root, _, names in os.walk(directory)
+                     for name in names) / 1e6, 1)
+
+
+def run(count: int, workers: int, changed: int, seed: int, data_dir: str
+        ) -> Dict[str, Any]:
+    _configure_environment()
+    from app.core.static_export import export
+    from app.models.bird import Bird
+
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"bench_birds_{count}.db")
+    engine = create_engine(f"sqlite:///{path}",
+                           connect_args={"check_same_thread": False})
+    populate(engine, count, seed)
+
+    builds = {}
+    for processes in dict.fromkeys([1, workers]):
+        directory = os.path.join(data_dir, f"bench_export_{count}")
+        shutil.rmtree(directory, ignore_errors=True)
+        builds[processes] = export(directory, bind=engine,
+                                   workers=processes)
+
+    # Touch random birds, as the ORM would on update
+    with engine.begin() as connection:
+        ids = random.Random(seed).sample(range(1, count + 1),
+                                         min(changed, count))
+        connection.execute(update(Bird).where(Bird.id.in_(ids)).values(
+            updated_at=func.now()))
+    start = time.perf_counter()
+    incremental = export(directory, bind=engine, workers=workers)
+    incremental_seconds = time.perf_counter() - start
+
+    return {
+        "birds": builds[1]["birds"],
+        "export_mb": _size_mb(directory),
+        "full": [{"workers": processes, "seconds": result["seconds"],
+                  "birds_per_sec": round(result["birds"] / result["seconds"])}
+                 for processes, result in builds.items()],
+        "incremental": {
+            "workers": workers,
+            "changed": len(ids),
+            "birds_rendered": incremental["birds_rendered"],
+            "pages_rendered": incremental["pages_rendered"],
+            "seconds": round(incremental_seconds, 3),
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--count", type=int, default=100000,
+                        help="Birds in the synthetic catalog")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes of the pooled build")
+    parser.add_argument("--changed", type=int, default=100,
+                        help="Birds updated before the incremental build")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    write_results({
+        "benchmark": "export",
+        "environment": environment(),
+        "config": vars(args),
+        "results": run(args.count, args.workers, args.changed, args.seed,
+                       args.data_dir),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Overhead of metrics recording.
+
+Measures the cost of the individual metric operations, of the metrics
+middleware around a trivial ASGI app and of the SQL statement hooks:
+
+    python -m benchmarks.bench_metrics --requests 100000 --output metrics.json
+
+All figures are microseconds per operation (per request for the
+middleware, per statement for the SQL hooks).
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, event, text
+
+from benchmarks.common import environment, write_results
+
+
+ROUNDS = 5
+
+
+def _per_op_us(elapsed: float, count: int) -> float:
+    return round(elapsed / count * 1e6, 3)
+
+
+def _best_of(run, count: int) -> float:
+    """
+        Total time of ``count`` operations, taken from the fastest of
+        ROUNDS rounds to keep scheduler noise out.
+    """
+    return min(run(count // ROUNDS) for _ in range(ROUNDS)) * ROUNDS
+
+
+def bench_primitives(count: int) -> Dict[str, float]:
+    from app.core.metrics import MetricsRegistry
+
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_total", "bench", ("route", "status"))
+    histogram = registry.histogram("bench_seconds", "bench", ("route",))
+
+    start = time.perf_counter()
+    for _ in range(count):
+        counter.inc("/birds/{bird_id}", "200")
+    counter_us = _per_op_us(time.perf_counter() - start, count)
+
+    start = time.perf_counter()
+    for i in range(count):
+        histogram.observe(i * 1e-6, "/birds/{bird_id}")
+    histogram_us = _per_op_us(time.perf_counter() - start, count)
+    return {"counter_inc_us": counter_us,
+            "histogram_observe_us": histogram_us}
+
+
+async def _drive(app, count: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(count):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - start
+
+
+def bench_middleware(count: int) -> Dict[str, float]:
+    from app.core.metrics import MetricsMiddleware
+
+    async def endpoint(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    bare = _best_of(lambda n: asyncio.run(_drive(endpoint, n)), count)
+    wrapped = _best_of(lambda n: asyncio.run(
+        _drive(MetricsMiddleware(endpoint), n)), count)
+    return {
+        "bare_request_us": _per_op_us(bare, count),
+        "instrumented_request_us": _per_op_us(wrapped, count),
+        "middleware_overhead_us": _per_op_us(wrapped - bare, count),
+    }
+
+
+def bench_sql_hooks(count: int) -> Dict[str, float]:
+    from app.core import metrics
+
+    def run(engine, n: int) -> float:
+        with engine.connect() as conn:
+            statement = text("SELECT 1")
+            start = time.perf_counter()
+            for _ in range(n):
+                conn.execute(statement)
+            return time.perf_counter() - start
+
+    plain = create_engine("sqlite://")
+    bare = _best_of(lambda n: run(plain, n), count)
+    engine = create_engine("sqlite://")
+    event.listen(engine, "before_cursor_execute",
+                 metrics._before_cursor_execute)
+    event.listen(engine, "after_cursor_execute",
+                 metrics._after_cursor_execute)
+    token = metrics.current_request.set(metrics.RequestStats())
+    try:
+        hooked = _best_of(lambda n: run(engine, n), count)
+    finally:
+        metrics.current_request.reset(token)
+    return {
+        "bare_statement_us": _per_op_us(bare, count),
+        "instrumented_statement_us": _per_op_us(hooked, count),
+        "sql_hook_overhead_us": _per_op_us(hooked - bare, count),
+    }
+
+
+def run(requests: int, statements: int) -> Dict[str, Any]:
+    results = {}
+    results.update(bench_primitives(requests))
+    results.update(bench_middleware(requests))
+    results.update(bench_sql_hooks(statements))
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--statements", type=int, default=20000)
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    write_results({
+        "benchmark": "metrics_overhead",
+        "environment": environment(),
+        "config": vars(args),
+        "results": run(args.requests, args.statements),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Overload behaviour with and without admission control.
+
+Serves the app with ``run.py`` (against the fake agent and a synthetic
+catalog) and drives an open-loop mix of bird reads and ``/ai/chat``
+requests at each rate, once with admission control and once without:
+
+    python -m benchmarks.bench_overload --rates 50,200,400 --chat-share 0.2 \\
+        --output overload.json
+
+For every rate, mode and request class the results give goodput (200s
+per second), shed requests (503), other failures and the latency of
+successful requests. ``overloaded_share`` is the share of ``/health``
+polls, taken every 50 ms during the run, that reported overload.
+Rates above what the machine can serve show the difference: without
+admission control every request queues and latency grows for everyone,
+with it chat is shed and reads keep a bounded latency.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import environment, summarize, write_results
+
+PREFIX = "/api/v1"
+HEALTH_POLL_INTERVAL = 0.05
+
+
+async def run_load(app_url: str, rate: float, duration: float,
+                   chat_share: float, bird_ids: List[str], seed: int = 0,
+                   timeout: float = 30.0) -> Dict[str, Any]:
+    """
+        Open-loop load: arrivals are scheduled independently of
+        completions, so a saturated server shows up as latency and shed
+        requests rather than a lower send rate.
+    """
+    rng = random.Random(seed)
+    latencies: Dict[str, List[float]] = {"read": [], "chat": []}
+    statuses: Dict[str, Counter] = {"read": Counter(), "chat": Counter()}
+    health: Counter = Counter()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=512)
+
+    async with httpx.AsyncClient(base_url=app_url, timeout=timeout,
+                                 limits=limits) as client:
+        async def one(kind: str, method: str, url: str, body=None):
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, json=body)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            statuses[kind][status] += 1
+            if status == "200":
+                latencies[kind].append(time.perf_counter() - start)
+
+        async def poll_health(stop: asyncio.Event):
+            while not stop.is_set():
+                try:
+                    response = await client.get("/health")
+                    health[response.json()["status"]] += 1
+                except (httpx.HTTPError, ValueError, KeyError):
+                    health["error"] += 1
+                await asyncio.sleep(HEALTH_POLL_INTERVAL)
+
+        stop = asyncio.Event()
+        poller = asyncio.create_task(poll_health(stop))
+        total = int(rate * duration)
+        tasks = []
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if rng.random() < chat_share:
+                request = ("chat", "POST", f"{PREFIX}/ai/chat",
+                           {"message": "What does a Peregrine Falcon eat?"})
+            elif rng.random() < 0.5:
+                request = ("read", "GET",
+                           f"{PREFIX}/birds/{rng.choice(bird_ids)}")
+            else:
+                request = ("read", "GET",
+                           f"{PREFIX}/birds/?skip={rng.randrange(1000)}"
+                           f"&limit=20")
+            tasks.append(asyncio.create_task(one(*request)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await poller
+
+    polls = sum(health.values())
+    return {
+        "offered_rate": rate,
+        "requests": total,
+        "elapsed": round(elapsed, 3),
+        "overloaded_share": round(health["overloaded"] / polls, 3)
+        if polls else None,
+        "classes": {
+            kind: {
+                "goodput": round(statuses[kind].get("200", 0) / elapsed, 2),
+                "shed": statuses[kind].get("503", 0),
+                "status_counts": dict(statuses[kind]),
+                "latency_ms": summarize(latencies[kind]),
+            } for kind in statuses
+        },
+    }
+
+
+def run(rates: List[float], duration: float, chat_share: float,
+        modes: List[str], latency: str, count: int, workers: int,
+        data_dir: str, seed: int,
+        settings: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """
+        Serve the app with run.py, once per mode, and drive every rate.
+        ``settings`` are passed to the server as environment variables.
+    """
+    from sqlalchemy import create_engine, select
+
+    from benchmarks.bench_birds import _configure_environment
+    from benchmarks.bench_workers import _free_port, start_server, stop_server
+    from benchmarks.catalog import populate
+    from benchmarks.fake_agent import (
+        FakeAgentConfig,
+        FakeAgentServer,
+        LatencyDistribution,
+    )
+
+    _configure_environment()
+    from app.models.bird import Bird
+
+    os.makedirs(data_dir, exist_ok=True)
+    database = os.path.abspath(os.path.join(data_dir,
+                                            f"bench_birds_{count}.db"))
+    engine = create_engine(f"sqlite:///{database}")
+    populate(engine, count, seed)
+    with engine.connect() as conn:
+        bird_ids = list(conn.execute(
+            select(Bird.bird_id).limit(1000)).scalars())
+    engine.dispose()
+
+    fake = FakeAgentServer(FakeAgentConfig(
+        latency=LatencyDistribution(latency, seed=seed), seed=seed)).start()
+    results = []
+    try:
+        for mode in modes:
+            port = _free_port()
+            server = start_server(database, workers, port, overrides=dict(
+                settings or {}, AGENT_ENDPOINT=fake.url,
+                RATE_LIMIT_ENABLED="false",
+                ADMISSION_ENABLED=str(mode == "admission").lower()))
+            try:
+                for rate in rates:
+                    result = asyncio.run(run_load(
+                        f"http://127.0.0.1:{port}", rate, duration,
+                        chat_share, bird_ids, seed))
+                    result["mode"] = mode
+                    results.append(result)
+            finally:
+                stop_server(server)
+    finally:
+        fake.stop()
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rates", default="50,200,400",
+                        help="Comma separated arrival rates (requests/s)")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Seconds per rate and mode")
+    parser.add_argument("--chat-share", type=float, default=0.2,
+                        help="Share of requests that are /ai/chat")
+    parser.add_argument("--latency", default="lognormal:0.2,0.5",
+                        help="Fake agent latency distribution")
+    parser.add_argument("--count", type=int, default=10000,
+                        help="Birds in the synthetic catalog")
+    parser.add_argument("--modes", default="admission,unlimited",
+                        help="admission and/or unlimited")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    write_results({
+        "benchmark": "overload",
+        "environment": environment(),
+        "config": vars(args),
+        "results": run([float(r) for r in args.rates.split(",")],
+                       args.duration, args.chat_share,
+                       args.modes.split(","), args.latency, args.count,
+                       args.workers, args.data_dir, args.seed),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
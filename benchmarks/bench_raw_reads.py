@@ -0,0 +1,147 @@
+"""
+Throughput of the bird read paths.
+
+Compares, for list pages, single birds and batches, the three ways a
+read response can be produced:
+
+* ``response_model``: ORM rows validated and serialized by Pydantic
+* ``orm_fast``: ORM rows encoded directly (FAST_SERIALIZATION)
+* ``raw_sql``: JSON assembled by SQLite (RAW_SQL_READS)
+
+    python -m benchmarks.bench_raw_reads --count 10000 --output raw_reads.json
+
+Every operation opens its own session and runs its query, as a request
+does, but skips HTTP. The catalog is generated once into ``--data-dir``.
+"""
+
+import argparse
+import os
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_birds import _configure_environment
+from benchmarks.bench_serialization import _response_model_body, _route
+from benchmarks.catalog import populate
+from benchmarks.common import environment, write_results
+
+
+BATCH_SIZE = 50
+
+
+def _throughput(operation: Callable[[], bytes], seconds: float
+                ) -> Dict[str, float]:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        operation()
+        count += 1
+    elapsed = time.perf_counter() - start
+    return {"ops_per_sec": round(count / elapsed, 1),
+            "us_per_op": round(elapsed / count * 1e6, 1)}
+
+
+def run(count: int, seconds: float, seed: int, data_dir: str
+        ) -> Dict[str, Any]:
+    _configure_environment()
+    from app import crud, schemas
+    from app.core.config import settings
+    from app.core.serialization import (
+        bird_list,
+        bird_response,
+        dumps,
+    )
+    from app.main import app
+
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"bench_birds_{count}.db")
+    engine = create_engine(f"sqlite:///{path}",
+                           connect_args={"check_same_thread": False})
+    populate(engine, count, seed)
+    session = sessionmaker(bind=engine)
+    rng = random.Random(seed)
+    with session() as db:
+        bird_ids = [b.bird_id for b in crud.bird.get_multi(
+            db, limit=min(count, 5000))]
+
+    list_route = _route(app, f"{settings.API_V1_STR}/birds/")
+    get_route = _route(app, f"{settings.API_V1_STR}/birds/{{bird_id}}")
+
+    def offset() -> int:
+        return rng.randrange(max(1, count - 100))
+
+    def batch() -> List[str]:
+        return rng.sample(bird_ids, min(BATCH_SIZE, len(bird_ids)))
+
+    def with_db(read):
+        def operation():
+            with session() as db:
+                return read(db)
+        return operation
+
+    variants = {
+        "list": {
+            "response_model": lambda db: _response_model_body(
+                list_route, crud.bird.get_multi(db, skip=offset())),
+            "orm_fast": lambda db: dumps(bird_list(
+                crud.bird.get_multi(db, skip=offset()))),
+            "raw_sql": lambda db: crud.bird.get_multi_raw(
+                db, skip=offset()).encode(),
+        },
+        "get": {
+            "response_model": lambda db: _response_model_body(
+                get_route, schemas.BirdResponse(
+                    success=True, data=crud.bird.get_by_bird_id(
+                        db, bird_id=rng.choice(bird_ids)))),
+            "orm_fast": lambda db: dumps(bird_response(
+                crud.bird.get_by_bird_id(db, bird_id=rng.choice(bird_ids)))),
+            "raw_sql": lambda db: crud.bird.get_document_raw(
+                db, bird_id=rng.choice(bird_ids))[2].encode(),
+        },
+        "batch": {
+            "response_model": lambda db: _response_model_body(
+                list_route, crud.bird.get_batch(db, bird_ids=batch())),
+            "orm_fast": lambda db: dumps(bird_list(
+                crud.bird.get_batch(db, bird_ids=batch()))),
+            "raw_sql": lambda db: crud.bird.get_batch_raw(
+                db, bird_ids=batch()).encode(),
+        },
+    }
+
+    results: Dict[str, Any] = {}
+    for kind, reads in variants.items():
+        results[kind] = {name: _throughput(with_db(read), seconds)
+                         for name, read in reads.items()}
+        base = results[kind]["response_model"]["ops_per_sec"]
+        for name in ("orm_fast", "raw_sql"):
+            results[kind][name]["speedup"] = round(
+                results[kind][name]["ops_per_sec"] / base, 2)
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--count", type=int, default=10000,
+                        help="Birds in the synthetic catalog")
+    parser.add_argument("--seconds", type=float, default=3.0,
+                        help="Duration of each measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    write_results({
+        "benchmark": "raw_reads",
+        "environment": environment(),
+        "config": vars(args),
+        "results": run(args.count, args.seconds, args.seed, args.data_dir),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Serialization cost of bird read responses.
+
+Compares FastAPI's response_model path (Pydantic validation of the ORM
+rows, then JSON encoding) with the fast path that builds the response
+straight from the rows, for 100-row list pages and single-bird
+documents:
+
+    python -m benchmarks.bench_serialization --pages 20 \\
+        --output serialization.json
+
+Rows are loaded once from an in-memory synthetic catalog; only
+serialization is timed. Figures are microseconds per page (list) or per
+document (get), best of ROUNDS rounds.
+"""
+
+import argparse
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from benchmarks.bench_birds import _configure_environment
+from benchmarks.catalog import populate
+from benchmarks.common import environment, write_results
+
+
+PAGE_SIZE = 100
+ROUNDS = 5
+
+
+def _best_us(run: Callable[[], Any], count: int) -> float:
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(count):
+            run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best / count * 1e6, 2)
+
+
+def _route(app, path: str, method: str = "GET"):
+    for route in app.routes:
+        if getattr(route, "path", None) == path and method in route.methods:
+            return route
+    raise LookupError(path)
+
+
+def _response_model_body(route, content) -> bytes:
+    """
+        The steps of fastapi.routing.serialize_response (validate, then
+        serialize in JSON mode), followed by JSONResponse rendering.
+    """
+    from fastapi.responses import JSONResponse
+
+    field = route.secure_cloned_response_field
+    value, errors = field.validate(content, {}, loc=("response",))
+    assert not errors, errors
+    return JSONResponse(field.serialize(value, by_alias=True)).body
+
+
+def run(pages: int, seed: int) -> Dict[str, Any]:
+    _configure_environment()
+    from app import schemas
+    from app.core import serialization
+    from app.core.config import settings
+    from app.main import app
+    from app.models.bird import Bird
+
+    engine = create_engine("sqlite://", poolclass=StaticPool,
+                           connect_args={"check_same_thread": False})
+    populate(engine, PAGE_SIZE * pages, seed)
+    with Session(engine) as db:
+        rows = db.query(Bird).order_by(Bird.id).all()
+        db.expunge_all()
+    page_rows = [rows[i:i + PAGE_SIZE] for i in range(0, len(rows),
+                                                      PAGE_SIZE)]
+
+    list_route = _route(app, f"{settings.API_V1_STR}/birds/")
+    get_route = _route(app, f"{settings.API_V1_STR}/birds/{{bird_id}}")
+
+    def cycle(items):
+        state = {"i": 0}
+
+        def next_item():
+            state["i"] = (state["i"] + 1) % len(items)
+            return items[state["i"]]
+        return next_item
+
+    next_page, next_bird = cycle(page_rows), cycle(rows)
+    encoders = {"stdlib": None}
+    if serialization.orjson is not None:
+        encoders["orjson"] = serialization.orjson
+
+    results: Dict[str, Any] = {"page_size": PAGE_SIZE, "pages": pages,
+                               "orjson": serialization.orjson is not None}
+    page_count = max(pages, 10)
+    results["list_response_model_us"] = _best_us(
+        lambda: _response_model_body(list_route, next_page()), page_count)
+    results["get_response_model_us"] = _best_us(
+        lambda: _response_model_body(
+            get_route, schemas.BirdResponse(success=True, data=next_bird())),
+        page_count * 10)
+
+    original = serialization.orjson
+    try:
+        for name, module in encoders.items():
+            serialization.orjson = module
+            results[f"list_fast_{name}_us"] = _best_us(
+                lambda: serialization.dumps(
+                    serialization.bird_list(next_page())), page_count)
+            results[f"get_fast_{name}_us"] = _best_us(
+                lambda: serialization.dumps(
+                    serialization.bird_response(next_bird())),
+                page_count * 10)
+    finally:
+        serialization.orjson = original
+
+    fastest = "orjson" if "orjson" in encoders else "stdlib"
+    for kind in ("list", "get"):
+        results[f"{kind}_speedup"] = round(
+            results[f"{kind}_response_model_us"]
+            / results[f"{kind}_fast_{fastest}_us"], 1)
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=20,
+                        help=f"Distinct {PAGE_SIZE}-row pages to cycle "
+                             f"through")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    write_results({
+        "benchmark": "serialization",
+        "environment": environment(),
+        "config": vars(args),
+        "results": run(args.pages, args.seed),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
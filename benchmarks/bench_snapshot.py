@@ -0,0 +1,199 @@
+"""
+Memory, reload time and read throughput of the catalog snapshot.
+
+Loads the synthetic catalog into a ``CatalogSnapshot`` (SNAPSHOT_READS),
+applies one bird update copy-on-write, and compares reads from the
+snapshot with the same reads through the database (ORM rows with fast
+serialization):
+
+    python -m benchmarks.bench_snapshot --count 100000 --output snapshot.json
+
+Memory is the growth of the process's resident set over the load, and
+the document bytes the snapshot holds. The catalog is generated once into
+``--data-dir``.
+
+The catalog is also compiled to a memory-mapped catalog file
+(SNAPSHOT_FILE) in ``--data-dir``: the time to compile it, the time and
+resident memory to open it as each worker does at startup, and the same
+reads from the file.
+"""
+
+import argparse
+import gc
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_birds import _configure_environment
+from benchmarks.bench_raw_reads import _throughput
+from benchmarks.catalog import populate
+from benchmarks.common import environment, write_results
+
+BATCH_SIZE = 50
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):  # not Linux
+        return None
+
+
+def run(count: int, seconds: float, seed: int, data_dir: str
+        ) -> Dict[str, Any]:
+    _configure_environment()
+    from app import crud
+    from app.core.serialization import bird_list, bird_response, dumps
+    from app.core.catalog_file import CatalogFile
+    from app.core.snapshot import SnapshotManager
+    from app.models.bird import Bird
+
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"bench_birds_{count}.db")
+    engine = create_engine(f"sqlite:///{path}",
+                           connect_args={"check_same_thread": False})
+    populate(engine, count, seed)
+    session = sessionmaker(bind=engine)
+    rng = random.Random(seed)
+
+    gc.collect()
+    rss_before = _rss_bytes()
+    manager = SnapshotManager(bind=engine)
+    start = time.perf_counter()
+    snapshot = manager.load()
+    load_seconds = time.perf_counter() - start
+    gc.collect()
+    rss_after = _rss_bytes()
+    file_path = os.path.join(data_dir, f"bench_catalog_{count}.bin")
+    if os.path.exists(file_path):
+        os.unlink(file_path)
+    start = time.perf_counter()
+    SnapshotManager(bind=engine, path=file_path).rebuild()
+    compile_seconds = time.perf_counter() - start
+    gc.collect()
+    rss_before_open = _rss_bytes()
+    start = time.perf_counter()
+    mapped = CatalogFile(file_path)
+    open_seconds = time.perf_counter() - start
+    rss_after_open = _rss_bytes()
+
+    with session() as db:
+        bird_ids = [b.bird_id for b in crud.bird.get_multi(
+            db, limit=min(count, 5000))]
+
+    # One write, applied copy-on-write, then undone
+    with session() as db:
+        bird = db.query(Bird).filter(Bird.bird_id == bird_ids[0]).one()
+        name = bird.name
+        bird.name = f"{name} (edited)"
+        db.commit()
+        start = time.perf_counter()
+        manager.refresh()
+        refresh_seconds = time.perf_counter() - start
+        bird.name = name
+        db.commit()
+        manager.refresh()
+
+    def offset() -> int:
+        return rng.randrange(max(1, count - 100))
+
+    def batch() -> List[str]:
+        return rng.sample(bird_ids, min(BATCH_SIZE, len(bird_ids)))
+
+    def with_db(read):
+        def operation():
+            with session() as db:
+                return read(db)
+        return operation
+
+    def current():
+        return manager.snapshot
+
+    variants = {
+        "get": (
+            lambda: current().response(current().get(rng.choice(bird_ids))),
+            lambda: mapped.response(mapped.get(rng.choice(bird_ids))),
+            with_db(lambda db: dumps(bird_response(crud.bird.get_by_bird_id(
+                db, bird_id=rng.choice(bird_ids)))))),
+        "list": (
+            lambda: current().page(offset(), 100),
+            lambda: mapped.page(offset(), 100),
+            with_db(lambda db: dumps(bird_list(crud.bird.get_multi(
+                db, skip=offset()))))),
+        "batch": (
+            lambda: current().batch(batch()),
+            lambda: mapped.batch(batch()),
+            with_db(lambda db: dumps(bird_list(crud.bird.get_batch(
+                db, bird_ids=batch()))))),
+        "search_name": (
+            lambda: current().search_by_name("kestrel"),
+            lambda: mapped.search_by_name("kestrel"),
+            with_db(lambda db: dumps(bird_list(crud.bird.search_by_name(
+                db, name="kestrel"))))),
+        "filter_status": (
+            lambda: current().get_by_conservation_status("extinct"),
+            lambda: mapped.get_by_conservation_status("extinct"),
+            with_db(lambda db: dumps(bird_list(
+                crud.bird.get_by_conservation_status(db, status="extinct"))))),
+    }
+    reads = []
+    for operation, (from_snapshot, from_file,
+                    from_database) in variants.items():
+        result = {"operation": operation,
+                  "snapshot": _throughput(from_snapshot, seconds),
+                  "file": _throughput(from_file, seconds),
+                  "database": _throughput(from_database, seconds)}
+        result["speedup"] = round(result["snapshot"]["ops_per_sec"]
+                                  / result["database"]["ops_per_sec"], 1)
+        reads.append(result)
+
+    rss = (rss_after - rss_before
+           if rss_before is not None and rss_after is not None else None)
+    return {
+        "birds": len(snapshot),
+        "load_seconds": round(load_seconds, 3),
+        "refresh_seconds": round(refresh_seconds, 4),
+        "document_mb": round(snapshot.document_bytes / 1e6, 1),
+        "rss_growth_mb": round(rss / 1e6, 1) if rss is not None else None,
+        "rss_bytes_per_bird": (round(rss / len(snapshot))
+                               if rss is not None and len(snapshot) else None),
+        "file": {
+            "compile_seconds": round(compile_seconds, 3),
+            "open_seconds": round(open_seconds, 6),
+            "file_mb": round(os.path.getsize(file_path) / 1e6, 1),
+            "rss_growth_mb": (round((rss_after_open - rss_before_open) / 1e6,
+                                    1)
+                              if rss_before_open is not None
+                              and rss_after_open is not None else None),
+        },
+        "reads": reads,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--count", type=int, default=100000,
+                        help="Birds in the synthetic catalog")
+    parser.add_argument("--seconds", type=float, default=2.0,
+                        help="Duration of each read measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    write_results({
+        "benchmark": "snapshot",
+        "environment": environment(),
+        "config": vars(args),
+        "results": run(args.count, args.seconds, args.seed, args.data_dir),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Throughput scaling of the multi-worker server on the bird read endpoints.
+
+Starts ``run.py --workers N`` for each worker count against a synthetic
+catalog and drives it over HTTP with ``--clients`` load processes, half
+of the requests reading single birds and half reading list pages:
+
+    python -m benchmarks.bench_workers --workers 1,2,4 --count 10000 \\
+        --output workers.json
+
+For each count the results give requests per second, latency and the
+scaling efficiency against one worker (``ops_per_sec / (N * ops_per_sec
+of 1 worker)``). Load processes share the machine with the workers, so
+use fewer clients than cores where possible; on a single core there is
+nothing to scale to.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.bench_birds import _configure_environment
+from benchmarks.catalog import populate
+from benchmarks.common import environment, summarize, write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PREFIX = "/api/v1/birds"
+STARTUP_TIMEOUT = 30.0
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database: str, workers: int, port: int,
+                 max_requests: int = 0,
+                 overrides: Optional[Dict[str, str]] = None
+                 ) -> subprocess.Popen:
+    """
+        Start run.py and wait until ``workers`` distinct workers have
+        answered ``/health/ready``. ``overrides`` are settings passed as
+        environment variables.
+    """
+    import httpx
+
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}",
+               DEBUG="false", PROJECT_NAME="BirdNest", API_V1_STR="/api/v1",
+               AGENT_ENDPOINT="http://127.0.0.1:9",
+               AGENT_ACCESS_KEY="benchmark")
+    env.update(overrides or {})
+    process = subprocess.Popen(
+        [sys.executable, "run.py", "--host", "127.0.0.1", "--port",
+         str(port), "--workers", str(workers), "--max-requests",
+         str(max_requests), "--no-access-log"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    seen = set()
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+        while len(seen) < workers:
+            if time.monotonic() > deadline or process.poll() is not None:
+                stop_server(process)
+                raise RuntimeError(f"{workers} workers did not get ready")
+            try:
+                # A new connection per probe, so probes spread over workers
+                response = client.get("/health/ready",
+                                      headers={"Connection": "close"})
+                if response.status_code == 200:
+                    seen.add(response.json()["pid"])
+            except httpx.TransportError:
+                time.sleep(0.05)
+    return process
+
+
+def stop_server(process: subprocess.Popen) -> int:
+    process.send_signal(signal.SIGTERM)
+    try:
+        return process.wait(timeout=STARTUP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        return process.wait()
+
+
+def _client(port: int, bird_ids: List[str], count: int, seconds: float,
+            seed: int, queue) -> None:
+    import httpx
+
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            if rng.random() < 0.5:
+                url = f"{PREFIX}/{rng.choice(bird_ids)}"
+            else:
+                url = f"{PREFIX}/?skip={rng.randrange(max(1, count - 100))}"
+            start = time.perf_counter()
+            try:
+                ok = client.get(url).status_code == 200
+            except httpx.TransportError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+    queue.put((latencies, errors))
+
+
+def drive(port: int, bird_ids: List[str], count: int, clients: int,
+          seconds: float, seed: int) -> Dict[str, Any]:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    processes = [context.Process(target=_client, args=(
+        port, bird_ids, count, seconds, seed + i, queue))
+        for i in range(clients)]
+    for process in processes:
+        process.start()
+    latencies: List[float] = []
+    errors = 0
+    for _ in processes:
+        client_latencies, client_errors = queue.get()
+        latencies.extend(client_latencies)
+        errors += client_errors
+    for process in processes:
+        process.join()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "ops_per_sec": round(len(latencies) / seconds, 1),
+        "latency_ms": summarize(latencies),
+    }
+
+
+def run(worker_counts: List[int], count: int, clients: int, seconds: float,
+        seed: int, data_dir: str) -> Dict[str, Any]:
+    _configure_environment()
+    from sqlalchemy import create_engine, select
+
+    from app.models.bird import Bird
+
+    os.makedirs(data_dir, exist_ok=True)
+    database = os.path.abspath(os.path.join(data_dir,
+                                            f"bench_birds_{count}.db"))
+    engine = create_engine(f"sqlite:///{database}")
+    populate(engine, count, seed)
+    with engine.connect() as conn:
+        bird_ids = list(conn.execute(
+            select(Bird.bird_id).limit(5000)).scalars())
+    engine.dispose()
+
+    results: Dict[str, Any] = {"cpu_count": os.cpu_count(), "workers": {}}
+    for workers in worker_counts:
+        port = _free_port()
+        server = start_server(database, workers, port)
+        try:
+            results["workers"][str(workers)] = drive(
+                port, bird_ids, count, clients, seconds, seed)
+        finally:
+            stop_server(server)
+
+    base = results["workers"].get("1")
+    for workers, result in results["workers"].items():
+        if base and base["ops_per_sec"]:
+            result["speedup"] = round(result["ops_per_sec"]
+                                      / base["ops_per_sec"], 2)
+            result["efficiency"] = round(result["speedup"] / int(workers), 2)
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}",
+                        help="Comma-separated worker counts")
+    parser.add_argument("--count", type=int, default=10000,
+                        help="Birds in the synthetic catalog")
+    parser.add_argument("--clients", type=int, default=None,
+                        help="Load processes (default: the largest "
+                             "worker count)")
+    parser.add_argument("--seconds", type=float, default=10.0,
+                        help="Duration of each measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+    worker_counts = sorted({int(n) for n in args.workers.split(",")})
+    if args.clients is None:
+        args.clients = max(worker_counts)
+
+    write_results({
+        "benchmark": "workers",
+        "environment": environment(),
+        "config": vars(args),
+        "results": run(worker_counts, args.count, args.clients,
+                       args.seconds, args.seed, args.data_dir),
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Deterministic synthetic bird catalog for benchmarks.
+
+Documents follow the shape of ``populate_sample_data.py`` (every JSON
+section is present) with varied sizes and a skewed name distribution, so
+list, search and filter queries behave like they would on a real catalog.
+Bird ``i`` of seed ``s`` is always the same document, independent of the
+catalog size, so results at different scales are comparable.
+
+    python -m benchmarks.catalog --count 100000 \\
+        --database sqlite:///./bench_birds_100000.db
+"""
+
+import argparse
+import datetime
+import random
+import time
+from typing import Any, Dict, Iterator, List
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.engine import Engine
+
+# Zipf-like weights: earlier entries are much more common
+FAMILIES = [
+    "Sparrow", "Warbler", "Hawk", "Owl", "Finch", "Falcon", "Heron",
+    "Kingfisher", "Woodpecker", "Thrush", "Swallow", "Eagle", "Plover",
+    "Tern", "Gull", "Wren", "Dove", "Parrot", "Hummingbird", "Kestrel",
+    "Sandpiper", "Flycatcher", "Tanager", "Shrike", "Vireo", "Crane",
+    "Ibis", "Stork", "Petrel", "Albatross",
+]
+MODIFIERS = [
+    "Common", "Great", "Little", "Red-tailed", "Black-capped", "Eastern",
+    "Western", "Northern", "Lesser", "Spotted", "Crested", "Golden",
+    "White-throated", "Rufous", "Grey-headed", "Long-billed", "Mountain",
+    "Island", "Marsh", "Desert", "Pygmy", "Royal", "Striped", "Yellow-rumped",
+]
+REGIONS = ["North America", "South America", "Europe", "Africa", "Asia",
+           "Australia", "Oceania", "Antarctica"]
+STATUSES = [
+    ("least-concern", "Least Concern", 0.70),
+    ("near-threatened", "Near Threatened", 0.10),
+    ("vulnerable", "Vulnerable", 0.08),
+    ("endangered", "Endangered", 0.07),
+    ("critically-endangered", "Critically Endangered", 0.04),
+    ("extinct", "Extinct", 0.01),
+]
+TAGS = [("Migratory", "plane"), ("Raptor", "feather"),
+        ("Nocturnal", "moon"), ("Coastal", "water"), ("Urban", "city"),
+        ("Endemic", "map-pin"), ("Songbird", "music"),
+        ("Wading", "water")]
+WORDS = (
+    "the bird is known for its remarkable flight and distinctive call "
+    "populations have declined in many regions due to habitat loss while "
+    "conservation efforts help breeding pairs recover nests are built on "
+    "cliffs trees and tall buildings where chicks are raised during the "
+    "spring season adults feed on insects seeds fish and small mammals "
+    "depending on the habitat and time of year"
+).split()
+SYLLABLES = ["fal", "co", "pere", "gri", "nus", "acci", "pi", "ter",
+             "stri", "gi", "par", "us", "tur", "dus", "ar", "dea", "lar",
+             "sterna", "hiru", "ndo", "corv", "ana"]
+
+
+def _zipf_choice(rng: random.Random, items: List[str], s: float = 1.1):
+    weights = [1 / (rank ** s) for rank in range(1, len(items) + 1)]
+    return rng.choices(items, weights=weights)[0]
+
+
+def _sentence(rng: random.Random, min_words: int, max_words: int) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words,
+                                                          max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng, 8, 20) for _ in range(rng.randint(2, 5)))
+
+
+def _latin(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+
+
+def _image(rng: random.Random, name: str, size: str) -> Dict[str, str]:
+    return {"url": f"https://placehold.co/{size}",
+            "alt": name, "caption": _sentence(rng, 4, 10)}
+
+
+def generate_bird(index: int, seed: int = 0) -> Dict[str, Any]:
+    """
+        The ``index``-th synthetic bird as a BirdCreate-shaped dict.
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+    family = _zipf_choice(rng, FAMILIES)
+    modifier = _zipf_choice(rng, MODIFIERS)
+    name = f"{modifier} {family}"
+    genus = _latin(rng).capitalize()
+    scientific_name = f"{genus} {_latin(rng)}"
+    bird_id = f"{name.lower().replace(' ', '-')}-{index}"
+    status, label, _ = rng.choices(
+        STATUSES, weights=[w for _, _, w in STATUSES])[0]
+
+    return {
+        "bird_id": bird_id,
+        "name": name,
+        "scientific_name": scientific_name,
+        "conservation_status": {
+            "status": status,
+            "label": label,
+            "description": _paragraph(rng),
+            "currentThreats": [_sentence(rng, 2, 4)
+                               for _ in range(rng.randint(1, 4))],
+        },
+        "quick_facts": [
+            {"label": "Family", "value": f"{family}idae", "icon": "feather"},
+            {"label": "Wingspan", "value": f"{rng.randint(10, 300)} cm",
+             "icon": "ruler-horizontal"},
+            {"label": "Weight", "value": f"{rng.randint(5, 12000)} g",
+             "icon": "weight-hanging"},
+        ],
+        "tags": [{"text": text, "icon": icon}
+                 for text, icon in rng.sample(TAGS, rng.randint(1, 3))],
+        "images": {
+            "main": [_image(rng, name, "600x400")
+                     for _ in range(rng.randint(1, 3))],
+            "gallery": [_image(rng, name, "600x400")
+                        for _ in range(rng.randint(0, 8))],
+        },
+        "overview": {
+            "about": {"title": f"About the {name}",
+                      "paragraphs": [_paragraph(rng)
+                                     for _ in range(rng.randint(1, 4))]},
+            "physicalCharacteristics": {
+                "title": "Physical Characteristics",
+                "features": [{"name": _sentence(rng, 1, 2),
+                              "value": _sentence(rng, 3, 12)}
+                             for _ in range(rng.randint(2, 6))]},
+            "taxonomy": {"title": "Taxonomy", "levels": [
+                {"level": "Kingdom", "name": "Animalia"},
+                {"level": "Class", "name": "Aves"},
+                {"level": "Family", "name": f"{family}idae"},
+                {"level": "Genus", "name": genus},
+                {"level": "Species", "name": scientific_name},
+            ]},
+        },
+        "habitat_and_distribution": {
+            "habitat": {"title": "Habitat", "description": _paragraph(rng),
+                        "types": [{"name": _sentence(rng, 2, 6),
+                                   "icon": "tree"}
+                                  for _ in range(rng.randint(1, 5))]},
+            "distribution": {"title": "Geographic Distribution",
+                             "description": _paragraph(rng),
+                             "regions": rng.sample(REGIONS,
+                                                   rng.randint(1, 6))},
+            "migration": {"title": "Migration Patterns",
+                          "status": rng.choice(["Migratory", "Resident",
+                                                "Partially migratory"]),
+                          "description": [_sentence(rng, 5, 12)
+                                          for _ in range(rng.randint(1, 4))]},
+        },
+        "diet_and_behavior": {
+            "diet": {"title": "Diet", "description": _paragraph(rng),
+                     "items": [{"name": _sentence(rng, 1, 3),
+                                "image": "https://placehold.co/100x100",
+                                "alt": family}
+                               for _ in range(rng.randint(1, 5))]},
+            "hunting": {"title": "Hunting Technique",
+                        "subtitle": _sentence(rng, 2, 4),
+                        "steps": [{"number": i + 1,
+                                   "description": _sentence(rng, 4, 10)}
+                                  for i in range(rng.randint(0, 5))]},
+        },
+        "sounds": {
+            "title": f"{name} Sounds",
+            "introduction": _paragraph(rng),
+            "calls": [{"title": _sentence(rng, 1, 3),
+                       "description": _sentence(rng, 8, 16),
+                       "context": _sentence(rng, 6, 12),
+                       "audioSrc": f"https://example.com/{bird_id}-{i}.mp3",
+                       "duration": f"0:{rng.randint(5, 59):02d}"}
+                      for i in range(rng.randint(0, 5))],
+            "facts": [_sentence(rng, 6, 14)
+                      for _ in range(rng.randint(0, 4))],
+        },
+        "related_birds": [
+            {"name": f"{_zipf_choice(rng, MODIFIERS)} {family}",
+             "scientific_name": f"{genus} {_latin(rng)}",
+             "image": "https://placehold.co/300x200", "alt": family,
+             "profile_url": "#"}
+            for _ in range(rng.randint(0, 6))
+        ],
+        "meta_data": {
+            "last_updated": "2025-04-01T08:30:00Z",
+            "contributors": [_sentence(rng, 2, 4)
+                             for _ in range(rng.randint(1, 3))],
+            "sources": [_sentence(rng, 2, 6)
+                        for _ in range(rng.randint(1, 4))],
+            "tags": [family.lower(), status] + [t for t, _ in TAGS[:2]],
+        },
+    }
+
+
+def generate_catalog(count: int, seed: int = 0, start: int = 0
+                     ) -> Iterator[Dict[str, Any]]:
+    for index in range(start, start + count):
+        yield generate_bird(index, seed)
+
+
+def populate(bind: Engine, count: int, seed: int = 0,
+             batch_size: int = 2000) -> int:
+    """
+        Fill the birds table up to ``count`` rows (existing rows of the
+        same catalog are kept). Returns the number of rows inserted.
+    """
+    from app.models.base import BaseModel
+    from app.models.bird import Bird
+
+    BaseModel.metadata.create_all(bind=bind)
+    with bind.connect() as conn:
+        existing = conn.execute(select(func.count()).select_from(Bird)
+                                ).scalar()
+    if existing >= count:
+        return 0
+
+    now = datetime.datetime(2025, 1, 1)
+    table = Bird.__table__
+    inserted = 0
+    batch = []
+    with bind.begin() as conn:
+        for doc in generate_catalog(count - existing, seed, start=existing):
+            doc["created_at"] = doc["updated_at"] = now
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                conn.execute(insert(table), batch)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            conn.execute(insert(table), batch)
+            inserted += len(batch)
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", required=True,
+                        help="SQLAlchemy URL, e.g. sqlite:///./bench.db")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    inserted = populate(create_engine(args.database), args.count, args.seed)
+    print(f"Inserted {inserted} birds in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
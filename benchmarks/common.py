@@ -0,0 +1,75 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterable, Optional
+
+
+def percentile(sorted_values, q: float) -> Optional[float]:
+    """
+        Nearest-rank percentile of an already sorted sequence.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(values: Iterable[float], scale: float = 1000.0
+              ) -> Dict[str, Optional[float]]:
+    """
+        p50/p95/p99/max/mean of a sample, multiplied by ``scale``
+        (seconds to milliseconds by default).
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0, "p50": None, "p95": None, "p99": None,
+                "max": None, "mean": None}
+
+    def scaled(value):
+        return round(value * scale, 4)
+
+    return {
+        "count": len(ordered),
+        "p50": scaled(percentile(ordered, 50)),
+        "p95": scaled(percentile(ordered, 95)),
+        "p99": scaled(percentile(ordered, 99)),
+        "max": scaled(ordered[-1]),
+        "mean": scaled(sum(ordered) / len(ordered)),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """
+        Where and on which commit a benchmark ran, so result files can be
+        compared between commits.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def write_results(payload: Dict[str, Any], path: Optional[str]) -> None:
+    """
+        Print results as JSON and optionally write them to ``path``.
+    """
+    text = json.dumps(payload, indent=2)
+    print(text)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
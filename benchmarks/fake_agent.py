@@ -0,0 +1,241 @@
+"""
+OpenAI-compatible stub of the agent upstream for offline benchmarks.
+
+Serves ``POST /api/v1/chat/completions`` (plain and ``stream: true``)
+with configurable latency distributions, error injection and token
+counts. Run it standalone:
+
+    python -m benchmarks.fake_agent --port 8001 \\
+        --latency lognormal:0.4,0.6 --error-rate 0.01 --completion-tokens 80
+
+and point ``AGENT_ENDPOINT`` at ``http://127.0.0.1:8001``, or embed it in
+a test / harness with ``FakeAgentServer``.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Union
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+class LatencyDistribution:
+    """
+        Samples response latencies in seconds.
+
+        Specs (``kind:params``):
+            fixed:0.2
+            uniform:0.1,0.5
+            lognormal:0.3,0.5      median, sigma
+            pareto:0.2,1.5         minimum, shape (heavy tail)
+            bimodal:0.1,2.0,0.05   fast, slow, probability of slow
+    """
+
+    def __init__(self, spec: str = "fixed:0", seed: Optional[int] = None):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        self._random = random.Random(seed)
+        if kind not in ("fixed", "uniform", "lognormal", "pareto",
+                        "bimodal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        rnd, p = self._random, self.params
+        if self.kind == "fixed":
+            return p[0]
+        if self.kind == "uniform":
+            return rnd.uniform(p[0], p[1])
+        if self.kind == "lognormal":
+            return rnd.lognormvariate(math.log(p[0]), p[1])
+        if self.kind == "pareto":
+            return p[0] * rnd.paretovariate(p[1])
+        return p[1] if rnd.random() < p[2] else p[0]
+
+
+@dataclass
+class FakeAgentConfig:
+    """
+        Behaviour of the stub; may be changed while it is running.
+
+        ``latency`` is a LatencyDistribution, a number of seconds or a
+        callable taking the 1-based request number. ``status`` fails every
+        request with that HTTP status, ``error_rate`` fails that fraction
+        of requests with ``error_status``.
+    """
+    latency: Union[LatencyDistribution, float, Callable[[int], float]] = 0.0
+    status: Optional[int] = None
+    error_rate: float = 0.0
+    error_status: int = 500
+    completion_tokens: int = 20
+    stream_chunk_tokens: int = 5
+    seed: Optional[int] = None
+    _random: random.Random = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+
+    def sample_latency(self, number: int) -> float:
+        latency = self.latency
+        if isinstance(latency, LatencyDistribution):
+            return latency.sample()
+        if callable(latency):
+            return latency(number)
+        return latency
+
+    def sample_error(self) -> Optional[int]:
+        if self.status is not None:
+            return self.status
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self.error_status
+        return None
+
+
+def _estimate_tokens(messages) -> int:
+    return sum(len(str(m.get("content", ""))) // 4 + 1 for m in messages)
+
+
+def create_app(config: FakeAgentConfig, stats: dict) -> Starlette:
+    lock = threading.Lock()
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        with lock:
+            stats["requests"] += 1
+            number = stats["requests"]
+
+        latency = config.sample_latency(number)
+        error = config.sample_error()
+        messages = body.get("messages") or [{"content": ""}]
+        prompt_tokens = _estimate_tokens(messages)
+        completion_tokens = config.completion_tokens
+        words = ["chirp"] * completion_tokens
+        created = int(time.time())
+
+        if error is not None:
+            await asyncio.sleep(latency)
+            with lock:
+                stats["errors"] += 1
+            return JSONResponse({"error": {"message": "injected failure",
+                                           "type": "server_error"}},
+                                status_code=error)
+
+        if body.get("stream"):
+            async def chunks():
+                step = max(1, config.stream_chunk_tokens)
+                pieces = max(1, math.ceil(completion_tokens / step))
+                for i in range(0, completion_tokens or 1, step):
+                    await asyncio.sleep(latency / pieces)
+                    chunk = {
+                        "id": f"chatcmpl-fake-{number}",
+                        "object": "chat.completion.chunk",
+                        "created": created, "model": "fake",
+                        "choices": [{"index": 0, "finish_reason": None,
+                                     "delta": {"content": " ".join(
+                                         words[i:i + step]) + " "}}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        if completion_tokens:
+            content = " ".join(words)
+        else:
+            content = f"echo: {messages[-1].get('content')}"
+
+        await asyncio.sleep(latency)
+        return JSONResponse({
+            "id": f"chatcmpl-fake-{number}",
+            "object": "chat.completion",
+            "created": created,
+            "model": "fake",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": {"prompt_tokens": prompt_tokens,
+                      "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    routes = [
+        Route("/api/v1/chat/completions", chat_completions,
+              methods=["POST"]),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+    ]
+    return Starlette(routes=routes)
+
+
+class FakeAgentServer:
+    """
+        Runs the stub on a background thread (random port by default).
+    """
+
+    def __init__(self, config: Optional[FakeAgentConfig] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeAgentConfig()
+        self.stats = {"requests": 0, "errors": 0}
+        self._server = uvicorn.Server(uvicorn.Config(
+            create_app(self.config, self.stats), host=host, port=port,
+            log_level="warning", lifespan="off"))
+        self._thread = threading.Thread(target=self._server.run,
+                                        daemon=True)
+
+    @property
+    def requests(self) -> int:
+        return self.stats["requests"]
+
+    @property
+    def url(self) -> str:
+        sock = self._server.servers[0].sockets[0]
+        host, port = sock.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, timeout: float = 10.0) -> "FakeAgentServer":
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake agent did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(5.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="fixed:0.2",
+                        help="Latency distribution, e.g. lognormal:0.3,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--completion-tokens", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = FakeAgentConfig(
+        latency=LatencyDistribution(args.latency, seed=args.seed),
+        error_rate=args.error_rate, error_status=args.error_status,
+        completion_tokens=args.completion_tokens, seed=args.seed)
+    uvicorn.run(create_app(config, {"requests": 0, "errors": 0}),
+                host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Open-loop load test of the AI chat path against the local fake agent.
+
+Starts the fake agent and the BirdNest app (uvicorn, in this process),
+drives ``POST /api/v1/ai/chat`` at fixed arrival rates and reports
+throughput, latency percentiles and event-loop lag of the app:
+
+    python -m benchmarks.load_ai --rates 10,50,100 --duration 10 \\
+        --latency lognormal:0.2,0.5 --error-rate 0.01 --output ai.json
+
+Arrivals are scheduled independently of completions (open loop), so a
+saturated server shows up as growing latency instead of a lower send rate.
+The load generator shares the process with the app; use ``--app-url`` to
+target a separately started server (event-loop lag is then not reported).
+"""
+
+import argparse
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+
+from benchmarks.common import environment, summarize, write_results
+from benchmarks.fake_agent import (
+    FakeAgentConfig,
+    FakeAgentServer,
+    LatencyDistribution,
+)
+
+
+class LoopLagProbe:
+    """
+        Measures how late a periodic sleep wakes up on the app's event loop.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(
+                max(0.0, time.perf_counter() - start - self.interval))
+
+    def drain(self) -> List[float]:
+        samples, self.samples = self.samples, []
+        return samples
+
+
+def start_app(port: int, probe: LoopLagProbe) -> uvicorn.Server:
+    """
+        Import and serve the app in a background thread. The environment
+        must already point AGENT_ENDPOINT at the fake agent.
+    """
+    from app.main import app
+
+    app.router.on_startup.append(probe.start)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                           log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+async def run_rate(app_url: str, rate: float, duration: float,
+                   message: str, timeout: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+
+    async with httpx.AsyncClient(base_url=app_url, timeout=timeout,
+                                 limits=limits) as client:
+        async def one():
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/v1/ai/chat",
+                                             json={"message": message})
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+        total = int(rate * duration)
+        tasks = []
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one()))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "offered_rate": rate,
+        "requests": total,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(statuses.get("200", 0) / elapsed, 2),
+        "status_counts": dict(statuses),
+        "latency_ms": summarize(latencies),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rates", default="10,50,100",
+                        help="Comma separated arrival rates (requests/s)")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Seconds per rate")
+    parser.add_argument("--latency", default="lognormal:0.2,0.5",
+                        help="Fake agent latency distribution")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=80)
+    parser.add_argument("--message",
+                        default="What does a Peregrine Falcon eat?")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--app-url", default=None,
+                        help="Target an already running app instead")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None,
+                        help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    fake = None
+    probe = LoopLagProbe()
+    app_url = args.app_url
+    if app_url is None:
+        fake = FakeAgentServer(FakeAgentConfig(
+            latency=LatencyDistribution(args.latency, seed=args.seed),
+            error_rate=args.error_rate,
+            completion_tokens=args.completion_tokens,
+            seed=args.seed)).start()
+        os.environ.update({
+            "AGENT_ENDPOINT": fake.url,
+            "AGENT_ACCESS_KEY": "benchmark",
+            "RATE_LIMIT_ENABLED": "false",
+        })
+        for name, default in (("PROJECT_NAME", "BirdNest"),
+                              ("API_V1_STR", "/api/v1"),
+                              ("DATABASE_URL", "sqlite:///./bench_ai.db"),
+                              ("DEBUG", "false")):
+            os.environ.setdefault(name, default)
+        start_app(args.port, probe)
+        app_url = f"http://127.0.0.1:{args.port}"
+
+    results = []
+    for rate in [float(r) for r in args.rates.split(",")]:
+        probe.drain()
+        result = asyncio.run(run_rate(app_url, rate, args.duration,
+                                      args.message, args.timeout))
+        if fake is not None:
+            result["event_loop_lag_ms"] = summarize(probe.drain())
+        results.append(result)
+
+    write_results({
+        "benchmark": "ai_chat_load",
+        "environment": environment(),
+        "config": vars(args),
+        "results": results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
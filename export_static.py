@@ -0,0 +1,25 @@
+import argparse
+import json
+import os
+
+from app.core.static_export import export
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export the bird catalog as static files for a CDN")
+    parser.add_argument("directory", help="Export directory; a previous "
+                        "export there is updated incrementally")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes rendering birds and pages")
+    parser.add_argument("--full", action="store_true",
+                        help="Render every bird, not only those updated "
+                             "since the previous export")
+    args = parser.parse_args(argv)
+
+    print(json.dumps(export(args.directory, workers=args.workers,
+                            full=args.full), indent=2))
+
+
+if __name__ == "__main__":
+    main()
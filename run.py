@@ -1,10 +1,44 @@
+import argparse
+
 import uvicorn
 from app.core.config import settings
 
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the BirdNest API")
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=int(settings.PORT))
+    parser.add_argument("--workers", type=int, default=int(settings.WORKERS))
+    parser.add_argument("--max-requests", type=int,
+                        default=int(settings.WORKER_MAX_REQUESTS),
+                        help="Recycle a worker after this many requests")
+    parser.add_argument("--max-requests-jitter", type=int,
+                        default=int(settings.WORKER_MAX_REQUESTS_JITTER))
+    parser.add_argument("--no-access-log", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.workers > 1 or args.max_requests > 0:
+        from app.core.workers import Supervisor
+
+        Supervisor(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            max_requests=args.max_requests,
+            max_requests_jitter=args.max_requests_jitter,
+            graceful_timeout=float(settings.WORKER_GRACEFUL_TIMEOUT),
+            access_log=not args.no_access_log,
+        ).run()
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            reload=settings.DEBUG,
+            access_log=not args.no_access_log,
+        )
+
+
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=settings.DEBUG
-    )
+    main()
@@ -1,3 +1,4 @@
+import os
 import pytest
 from typing import Generator
 from fastapi.testclient import TestClient
@@ -5,6 +6,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.core.database import get_db
+from app.core.jobs import job_queue
 from app.models.base import BaseModel
 from app.main import app
 
@@ -25,6 +27,14 @@ def override_get_db():
         db.close()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def job_queue_path(tmp_path_factory):
+    """Keep the background job queue's database out of the working tree,
+    in this process and in the worker processes tests start."""
+    job_queue.path = str(tmp_path_factory.mktemp("jobs") / "jobs.db")
+    os.environ["JOBS_SQLITE_PATH"] = job_queue.path
+
+
 @pytest.fixture(scope="session")
 def db() -> Generator:
     BaseModel.metadata.create_all(bind=engine)
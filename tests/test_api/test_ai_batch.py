@@ -0,0 +1,157 @@
+import asyncio
+import json
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints.ai_agent import _run_batch_item, get_ai_agent
+from app.core.admission import EXPENSIVE, Overloaded, admission
+from app.core.config import settings
+from app.core.resilience import CircuitOpenError
+from app.main import app
+from app.schemas.ai_agent import ChatBatchItem
+
+
+def fake_query(user_input: str, include_retrieval: bool = True,
+               history=None):
+    if user_input.startswith("fail"):
+        return {"success": False, "error": "Agent processing error"}
+    if user_input.startswith("down"):
+        raise CircuitOpenError("AI Agent upstream is unavailable")
+    return {"success": True, "responses": [f"echo: {user_input}"],
+            "message_count": 1, "original_query": user_input}
+
+
+@pytest.fixture
+def agent():
+    mock_agent = MagicMock()
+    mock_agent.query_agent.side_effect = fake_query
+    app.dependency_overrides[get_ai_agent] = lambda: mock_agent
+    yield mock_agent
+    app.dependency_overrides.pop(get_ai_agent, None)
+
+
+def post_batch(payload):
+    client = TestClient(app)
+    response = client.post(f"{settings.API_V1_STR}/ai/chat/batch",
+                           json=payload)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return response, lines
+
+
+class TestChatBatch:
+
+    def test_batch_streams_ndjson(self, agent):
+        """Test every item produces one NDJSON result line."""
+        items = [{"id": f"q{i}", "message": f"question {i}"}
+                 for i in range(10)]
+        response, lines = post_batch({"items": items, "parallelism": 3})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith(
+            "application/x-ndjson")
+        assert sorted(line["id"] for line in lines) == sorted(
+            item["id"] for item in items)
+        assert all(line["success"] for line in lines)
+        by_id = {line["id"]: line for line in lines}
+        assert by_id["q3"]["responses"] == ["echo: question 3"]
+
+    def test_item_errors_do_not_abort_batch(self, agent):
+        """Test failing items are reported per item."""
+        items = [
+            {"id": "ok", "message": "hello"},
+            {"id": "bad", "message": "fail please"},
+            {"id": "down", "message": "down please"},
+        ]
+        response, lines = post_batch({"items": items})
+
+        by_id = {line["id"]: line for line in lines}
+        assert by_id["ok"]["success"] is True
+        assert by_id["bad"]["success"] is False
+        assert by_id["bad"]["error"] == "Agent processing error"
+        assert by_id["bad"]["retryable"] is False
+        assert by_id["down"]["success"] is False
+        assert by_id["down"]["retryable"] is True
+
+    def test_resume_skips_completed_ids(self, agent):
+        """Test completed ids are not run again."""
+        items = [{"id": f"q{i}", "message": f"question {i}"}
+                 for i in range(5)]
+        response, lines = post_batch({"items": items,
+                                      "completed_ids": ["q0", "q1"]})
+
+        assert sorted(line["id"] for line in lines) == ["q2", "q3", "q4"]
+        assert agent.query_agent.call_count == 3
+
+    def test_parallelism_is_capped(self, agent, monkeypatch):
+        """Test no more than the server cap run at once."""
+        monkeypatch.setattr(settings, "AI_BATCH_MAX_PARALLELISM", 2)
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def slow_query(user_input, include_retrieval=True, history=None):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.02)
+            with lock:
+                state["running"] -= 1
+            return fake_query(user_input)
+
+        agent.query_agent.side_effect = slow_query
+        items = [{"id": f"q{i}", "message": "hi"} for i in range(8)]
+        response, lines = post_batch({"items": items, "parallelism": 50})
+
+        assert len(lines) == 8
+        assert state["peak"] == 2
+
+    def test_duplicate_ids_rejected(self, agent):
+        """Test item ids must be unique."""
+        items = [{"id": "same", "message": "a"},
+                 {"id": "same", "message": "b"}]
+        response, _ = post_batch({"items": items})
+        assert response.status_code == 422
+
+    def test_too_many_items_rejected(self, agent, monkeypatch):
+        """Test the batch size limit."""
+        monkeypatch.setattr(settings, "AI_BATCH_MAX_ITEMS", 2)
+        items = [{"id": f"q{i}", "message": "hi"} for i in range(3)]
+        client = TestClient(app)
+        response = client.post(f"{settings.API_V1_STR}/ai/chat/batch",
+                               json={"items": items})
+        assert response.status_code == 400
+
+    def test_items_admitted_one_by_one(self, agent, monkeypatch):
+        """Test each running item holds an expensive slot and the batch
+        request holds none once it streams; shed items are retryable."""
+        monkeypatch.setattr(admission, "max_concurrency", 4)
+        barrier = threading.Barrier(2, timeout=5)
+        seen = []
+
+        def paired_query(user_input, include_retrieval=True, history=None):
+            barrier.wait()
+            seen.append(admission.snapshot()["in_flight"][EXPENSIVE])
+            return fake_query(user_input)
+
+        agent.query_agent.side_effect = paired_query
+        items = [{"id": f"q{i}", "message": "hi"} for i in range(2)]
+        response, lines = post_batch({"items": items, "parallelism": 2})
+
+        assert all(line["success"] for line in lines)
+        assert seen == [2, 2]
+        assert admission.snapshot()["in_flight"][EXPENSIVE] == 0
+
+    def test_shed_item_is_retryable(self, agent, monkeypatch):
+        """Test an item shed by admission control is not run."""
+        async def shed(priority):
+            raise Overloaded("shed_overload")
+
+        monkeypatch.setattr(admission, "acquire", shed)
+        item = ChatBatchItem(id="q0", message="hi")
+        result = asyncio.run(_run_batch_item(agent, item, {}))
+
+        assert result.success is False and result.retryable is True
+        assert agent.query_agent.call_count == 0
@@ -0,0 +1,251 @@
+import asyncio
+import math
+import os
+import struct
+import warnings
+import wave
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import audio as audio_endpoints
+from app.api.v1.endpoints import birds as bird_endpoints
+from app.core import audio, serialization
+from app.core.audio import (
+    CHUNK_SIZE,
+    AudioStore,
+    RangeFileResponse,
+    RangeNotSatisfiable,
+    format_duration,
+    mp3_duration,
+    parse_range,
+)
+from app.core.config import settings
+from app.core.jobs import JobQueue
+
+PREFIX = f"{settings.API_V1_STR}/audio"
+CONTENT = bytes(range(256)) * 40
+
+
+def write_wav(path, seconds=1.0, rate=8000, amplitude=0.5):
+    samples = [int(amplitude * 32767 * math.sin(2 * math.pi * 440 * i / rate))
+               for i in range(int(seconds * rate))]
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(struct.pack(f"<{len(samples)}h", *samples))
+
+
+def write_mp3(path, frames=100, xing_frames=None):
+    # MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, stereo: 417-byte frames
+    header = b"\xff\xfb\x90\x00"
+    first = bytearray(header + bytes(413))
+    if xing_frames is not None:
+        first[36:48] = b"Xing" + struct.pack(">II", 1, xing_frames)
+    with open(path, "wb") as f:
+        f.write(b"ID3\x03\x00\x00\x00\x00\x00\x0a" + bytes(10))
+        f.write(bytes(first))
+        for _ in range(frames - 1):
+            f.write(header + bytes(413))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    root = tmp_path / "audio"
+    (root / "falcon").mkdir(parents=True)
+    (root / "falcon" / "call.mp3").write_bytes(CONTENT)
+    write_wav(root / "falcon" / "alarm.wav")
+    store = AudioStore(str(root), str(tmp_path / "cache"),
+                       base_url=f"{PREFIX}/files", waveform_points=50)
+    for module in (audio, audio_endpoints, serialization):
+        monkeypatch.setattr(module, "audio_store", store)
+    return store
+
+
+class TestRanges:
+
+    @pytest.mark.parametrize("header,expected", [
+        (None, None),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=900-5000", (900, 999)),
+        ("bytes=0-1,5-9", None),
+        ("items=0-1", None),
+        ("bytes=x-y", None),
+    ])
+    def test_parse_range(self, header, expected):
+        """Test single ranges are parsed and clamped, others ignored."""
+        assert parse_range(header, 1000) == expected
+
+    @pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-4",
+                                        "bytes=-0"])
+    def test_unsatisfiable(self, header):
+        """Test ranges outside the file are rejected."""
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range(header, 1000)
+
+    def test_zero_copy_extension(self, tmp_path):
+        """Test the file is handed to the server when it offers
+        http.response.zerocopy."""
+        path = tmp_path / "a.bin"
+        path.write_bytes(CONTENT)
+        messages = []
+
+        async def send(message):
+            if message["type"] == "http.response.zerocopy":
+                message = dict(message, name=message["file"].name)
+                del message["file"]
+            messages.append(message)
+
+        response = RangeFileResponse(str(path), len(CONTENT), "audio/mpeg",
+                                     (100, 199))
+        scope = {"type": "http", "method": "GET",
+                 "extensions": {"http.response.zerocopy": {}}}
+        asyncio.run(response(scope, None, send))
+        assert messages[0]["status"] == 206
+        assert messages[1] == {"type": "http.response.zerocopy",
+                               "name": str(path), "offset": 100,
+                               "count": 100, "more_body": False}
+
+    def test_large_body_in_chunks(self, tmp_path):
+        """Test bodies larger than a chunk are read piecewise."""
+        path = tmp_path / "big.bin"
+        data = os.urandom(CHUNK_SIZE * 2 + 10)
+        path.write_bytes(data)
+        bodies = []
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                bodies.append(message)
+
+        asyncio.run(RangeFileResponse(str(path), len(data), "audio/mpeg")(
+            {"type": "http", "method": "GET"}, None, send))
+        assert len(bodies) == 3
+        assert b"".join(m["body"] for m in bodies) == data
+        assert not bodies[-1]["more_body"]
+
+
+class TestAudioEndpoint:
+
+    def test_full_file(self, client: TestClient, store):
+        """Test a plain GET returns the file and advertises ranges."""
+        response = client.get(f"{PREFIX}/files/falcon/call.mp3")
+        assert response.status_code == 200
+        assert response.content == CONTENT
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["content-type"] == "audio/mpeg"
+        assert response.headers["content-length"] == str(len(CONTENT))
+        assert response.headers["etag"]
+
+    def test_partial_content(self, client: TestClient, store):
+        """Test a Range is answered with 206 and only those bytes."""
+        response = client.get(f"{PREFIX}/files/falcon/call.mp3",
+                              headers={"Range": "bytes=1000-1999"})
+        assert response.status_code == 206
+        assert response.content == CONTENT[1000:2000]
+        assert response.headers["content-range"] == (
+            f"bytes 1000-1999/{len(CONTENT)}")
+        assert response.headers["content-length"] == "1000"
+
+        response = client.get(f"{PREFIX}/files/falcon/call.mp3",
+                              headers={"Range": "bytes=-10"})
+        assert response.content == CONTENT[-10:]
+
+    def test_unsatisfiable_range(self, client: TestClient, store):
+        """Test a range past the end gets 416 with the file size."""
+        response = client.get(f"{PREFIX}/files/falcon/call.mp3",
+                              headers={"Range": "bytes=999999-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+    def test_validators(self, client: TestClient, store):
+        """Test If-None-Match, If-Range and immutable caching under the
+        current version."""
+        url = f"{PREFIX}/files/falcon/call.mp3"
+        etag = client.get(url).headers["etag"]
+        assert client.get(url, headers={"If-None-Match": etag}
+                          ).status_code == 304
+
+        response = client.get(url, headers={"Range": "bytes=0-9",
+                                            "If-Range": '"stale"'})
+        assert response.status_code == 200
+        response = client.get(url, headers={"Range": "bytes=0-9",
+                                            "If-Range": etag})
+        assert response.status_code == 206
+
+        response = client.get(url, params={"v": etag.strip('"')})
+        assert "immutable" in response.headers["cache-control"]
+        assert client.get(f"{PREFIX}/files/../secret").status_code == 404
+
+    def test_head(self, client: TestClient, store):
+        """Test HEAD sends the headers of the range without a body."""
+        response = client.head(f"{PREFIX}/files/falcon/call.mp3",
+                               headers={"Range": "bytes=0-99"})
+        assert response.status_code == 206
+        assert response.headers["content-length"] == "100"
+        assert response.content == b""
+
+    def test_unique_operation_ids(self, client: TestClient, monkeypatch):
+        """Test the schema documents GET only, so no operation id is
+        shared with HEAD."""
+        monkeypatch.setattr(client.app, "openapi_schema", None)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            schema = client.app.openapi()
+        assert list(schema["paths"][f"{PREFIX}/files/{{path}}"]) == ["get"]
+
+
+class TestMetadata:
+
+    def test_wav_duration_and_waveform(self, client: TestClient, store):
+        """Test WAV metadata is read and cached on disk."""
+        response = client.get(f"{PREFIX}/metadata/falcon/alarm.wav")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["duration"] == pytest.approx(1.0)
+        assert len(data["waveform"]) == 50
+        assert all(0.45 <= peak <= 0.55 for peak in data["waveform"])
+        assert os.listdir(store.cache_dir)
+
+    def test_mp3_duration(self, tmp_path):
+        """Test MP3 durations from the frame size and a Xing header."""
+        cbr = tmp_path / "cbr.mp3"
+        write_mp3(cbr, frames=100)
+        assert mp3_duration(str(cbr)) == pytest.approx(
+            100 * 417 * 8 / 128000, rel=0.01)
+        vbr = tmp_path / "vbr.mp3"
+        write_mp3(vbr, frames=10, xing_frames=1000)
+        assert mp3_duration(str(vbr)) == pytest.approx(1000 * 1152 / 44100)
+        assert format_duration(26.12) == "0:26"
+        assert format_duration(125) == "2:05"
+
+    def test_bird_sounds_rewritten(self, store):
+        """Test local sounds point at the audio endpoint with their
+        duration filled in; remote ones are left alone."""
+        bird = {"sounds": {"calls": [
+            {"audioSrc": "/audio/falcon/alarm.wav", "duration": ""},
+            {"audioSrc": "https://example.com/x.mp3", "duration": "0:30"},
+        ]}}
+        calls = store.rewrite(bird)["sounds"]["calls"]
+        assert calls[0]["audioSrc"].startswith(
+            f"{PREFIX}/files/falcon/alarm.wav?v=")
+        assert calls[0]["duration"] == "0:01"
+        assert calls[1] == bird["sounds"]["calls"][1]
+        assert bird["sounds"]["calls"][0]["duration"] == ""
+
+    def test_bird_writes_queue_analysis(self, store, tmp_path, monkeypatch):
+        """Test created birds queue one analysis job per local sound."""
+        queue = JobQueue(str(tmp_path / "jobs.db"))
+        queue.handler(audio.ANALYZE_JOB)(audio.analyze_audio)
+        monkeypatch.setattr(audio, "job_queue", queue)
+        bird = {"sounds": {"calls": [
+            {"audioSrc": "/audio/falcon/alarm.wav"},
+            {"audioSrc": "/audio/falcon/alarm.wav"},
+            {"audioSrc": "https://example.com/x.mp3"}]}}
+        store.bird_written("create", bird)
+        store.bird_written("remove", bird)
+
+        assert queue.run_pending() == 1
+        assert os.listdir(store.cache_dir)
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.events import bird_events
+
+URL = f"{settings.API_V1_STR}/birds/events"
+
+
+def wait_for_subscribers(count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while len(bird_events) < count:
+        assert time.monotonic() < deadline, "subscriber did not connect"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def bird(client: TestClient, sample_bird_data):
+    data = dict(sample_bird_data, bird_id="events-bird")
+    client.delete(f"{settings.API_V1_STR}/birds/events-bird")
+    yield data
+    client.delete(f"{settings.API_V1_STR}/birds/events-bird")
+
+
+class TestBirdEvents:
+
+    def test_websocket(self, client: TestClient, bird):
+        """Test writes are pushed to a WebSocket subscriber, filtered."""
+        url = f"{settings.API_V1_STR}/birds"
+        ws_url = URL.replace("/api", "ws://testserver/api", 1)
+        with client.websocket_connect(f"{ws_url}?bird_id=events-bird"
+                                      f"&tag=migratory") as websocket:
+            client.post(f"{url}/", json=dict(bird, bird_id="events-other"))
+            client.post(f"{url}/", json=bird)
+            client.put(f"{url}/events-bird", json={"name": "Renamed"})
+            client.delete(f"{url}/events-bird")
+            messages = [websocket.receive_json() for _ in range(3)]
+        client.delete(f"{url}/events-other")
+
+        assert [(m["op"], m["bird_id"]) for m in messages] == [
+            ("create", "events-bird"), ("update", "events-bird"),
+            ("delete", "events-bird")]
+        assert messages[1]["data"]["name"] == "Renamed"
+        assert messages[2]["data"] is None
+
+    def test_server_sent_events(self, client: TestClient, bird):
+        """Test the SSE stream sends each write as a named event and ends
+        with a closed event."""
+        responses = []
+        reader = threading.Thread(target=lambda: responses.append(
+            client.get(URL, params={"status": "least-concern"})))
+        reader.start()
+        wait_for_subscribers(1)
+        client.post(f"{settings.API_V1_STR}/birds/", json=bird)
+        bird_events.close()
+        reader.join(timeout=5.0)
+
+        response = responses[0]
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith(
+            "text/event-stream")
+        frames = response.text.split("\n\n")
+        assert frames[0] == ": subscribed"
+        assert frames[1].startswith('event: create\ndata: {"op":"create",'
+                                    '"bird_id":"events-bird"')
+        assert frames[2] == 'event: closed\ndata: {"reason":"shutdown"}'
+        assert len(bird_events) == 0
+
+    def test_subscriber_limit(self, client: TestClient, monkeypatch):
+        """Test subscriptions past the limit are refused with 503."""
+        monkeypatch.setattr(bird_events, "max_subscribers", 0)
+        assert client.get(URL).status_code == 503
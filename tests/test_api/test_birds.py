@@ -150,3 +150,152 @@ class TestBirdsAPI:
         response = client.get(
             f"{settings.API_V1_STR}/birds/search/name?name=T")
         assert response.status_code == 422  # Validation error
+
+
+class TestBirdReadModes:
+
+    @pytest.fixture
+    def birds(self, client: TestClient, sample_bird_data):
+        ids = ["read-mode-bird-1", "read-mode-bird-2"]
+        for bird_id in ids:
+            client.delete(f"{settings.API_V1_STR}/birds/{bird_id}")
+            client.post(f"{settings.API_V1_STR}/birds/",
+                        json=dict(sample_bird_data, bird_id=bird_id))
+        yield ids
+        for bird_id in ids:
+            client.delete(f"{settings.API_V1_STR}/birds/{bird_id}")
+
+    def test_batch(self, client: TestClient, birds):
+        """Test batch reads keep the requested order."""
+        response = client.get(
+            f"{settings.API_V1_STR}/birds/batch",
+            params={"ids": [birds[1], "no-such-bird", birds[0]]})
+        assert response.status_code == 200
+        assert [b["bird_id"] for b in response.json()] == [birds[1],
+                                                           birds[0]]
+
+    def test_batch_limit(self, client: TestClient):
+        """Test batches over the limit are rejected."""
+        response = client.get(
+            f"{settings.API_V1_STR}/birds/batch",
+            params={"ids": [f"bird-{i}" for i in range(101)]})
+        assert response.status_code == 422
+
+    def test_raw_reads_match(self, client: TestClient, birds, monkeypatch):
+        """Test the SQLite JSON read path returns the same content."""
+        urls = [f"{settings.API_V1_STR}/birds/?limit=100",
+                f"{settings.API_V1_STR}/birds/{birds[0]}",
+                f"{settings.API_V1_STR}/birds/batch?ids={birds[1]}"
+                f"&ids={birds[0]}"]
+        orm = [client.get(url).json() for url in urls]
+        monkeypatch.setattr(settings, "RAW_SQL_READS", True)
+        raw = [client.get(url).json() for url in urls]
+        assert raw == orm
+        assert client.get(
+            f"{settings.API_V1_STR}/birds/no-such-bird").status_code == 404
+
+
+class TestBirdChanges:
+
+    URL = f"{settings.API_V1_STR}/birds/changes"
+
+    def _head(self, client: TestClient) -> str:
+        # Token past everything written so far
+        token = "0"
+        while True:
+            page = client.get(self.URL, params={"since": token,
+                                                "limit": 1000}).json()
+            token = page["next"]
+            if not page["has_more"]:
+                return token
+
+    def test_feed(self, client: TestClient, sample_bird_data):
+        """Test creates, updates and deletes appear in commit order, with
+        the current bird or a tombstone."""
+        since = self._head(client)
+        url = f"{settings.API_V1_STR}/birds"
+        for bird_id in ["changes-bird-1", "changes-bird-2"]:
+            client.post(f"{url}/", json=dict(sample_bird_data,
+                                             bird_id=bird_id))
+        client.put(f"{url}/changes-bird-1", json={"name": "Renamed"})
+        client.delete(f"{url}/changes-bird-2")
+
+        response = client.get(self.URL, params={"since": since})
+        assert response.status_code == 200
+        page = response.json()
+        # Entries superseded within the page are folded into the last one
+        assert [(c["bird_id"], c["op"]) for c in page["changes"]] == [
+            ("changes-bird-1", "update"), ("changes-bird-2", "delete")]
+        assert page["changes"][0]["data"]["name"] == "Renamed"
+        assert page["changes"][1]["data"] is None
+        assert page["changes"][0]["seq"] < page["changes"][1]["seq"]
+        assert page["next"] == str(page["changes"][1]["seq"])
+        assert page["has_more"] is False
+
+        page = client.get(self.URL, params={"since": page["next"]}).json()
+        assert page["changes"] == []
+        client.delete(f"{url}/changes-bird-1")
+
+    def test_pages(self, client: TestClient, sample_bird_data):
+        """Test a feed read page by page resumes where it stopped."""
+        since = self._head(client)
+        ids = [f"changes-page-{i}" for i in range(5)]
+        for bird_id in ids:
+            client.post(f"{settings.API_V1_STR}/birds/",
+                        json=dict(sample_bird_data, bird_id=bird_id))
+
+        seen, token = [], since
+        while True:
+            page = client.get(self.URL, params={"since": token,
+                                                "limit": 2}).json()
+            seen += [c["bird_id"] for c in page["changes"]]
+            token = page["next"]
+            if not page["has_more"]:
+                break
+        assert seen == ids
+        for bird_id in ids:
+            client.delete(f"{settings.API_V1_STR}/birds/{bird_id}")
+
+    def test_invalid_token(self, client: TestClient):
+        """Test a malformed token is rejected rather than read as a
+        bird_id."""
+        assert client.get(self.URL, params={"since": "abc"}
+                          ).status_code == 422
+        assert client.get(self.URL, params={"limit": 0}).status_code == 422
+
+    def test_compaction(self, client: TestClient, sample_bird_data):
+        """Test compaction keeps only the latest entry of each bird."""
+        from app.crud.bird import compact_changes
+
+        since = self._head(client)
+        bird_id = "changes-compact"
+        url = f"{settings.API_V1_STR}/birds"
+        client.post(f"{url}/", json=dict(sample_bird_data, bird_id=bird_id))
+        client.put(f"{url}/{bird_id}", json={"name": "Renamed"})
+        client.delete(f"{url}/{bird_id}")
+
+        compact_changes()
+        page = client.get(self.URL, params={"since": since}).json()
+        assert [(c["bird_id"], c["op"]) for c in page["changes"]] == [
+            (bird_id, "delete")]
+
+    def test_backfill(self, tmp_path):
+        """Test birds written before the changelog existed are listed as
+        creates when it is added."""
+        from sqlalchemy import create_engine, insert, select
+        from app.models.bird import Bird
+        from app.models.bird_change import BirdChange
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        Bird.__table__.create(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(Bird.__table__), [
+                {"bird_id": "old-1", "name": "Old", "scientific_name": "A"},
+                {"bird_id": "old-2", "name": "Older", "scientific_name": "B"}
+            ])
+        BirdChange.__table__.create(engine)
+        with engine.connect() as conn:
+            rows = conn.execute(select(BirdChange.bird_id, BirdChange.op
+                                       ).order_by(BirdChange.id)).all()
+        assert [tuple(row) for row in rows] == [("old-1", "create"),
+                                                 ("old-2", "create")]
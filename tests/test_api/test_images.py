@@ -0,0 +1,233 @@
+import asyncio
+import copy
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import birds as bird_endpoints
+from app.api.v1.endpoints import images as image_endpoints
+from app.core import images, serialization
+from app.core.config import settings
+from app.core.images import ImageStore
+from app.core.serialization import rewrite_media_raw
+
+PREFIX = f"{settings.API_V1_STR}/images"
+
+
+def fake_render(source, target, width, fmt, quality):
+    # Stands in for Pillow: records the request in the output
+    with open(target, "wb") as f:
+        f.write(f"{width}:{fmt}:{quality}:".encode() + b"x" * 100)
+    return 100 + len(f"{width}:{fmt}:{quality}:")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    root = tmp_path / "media"
+    (root / "falcon").mkdir(parents=True)
+    (root / "falcon" / "main.jpg").write_bytes(b"original main")
+    (root / "falcon" / "prey.jpg").write_bytes(b"original prey")
+    store = ImageStore(str(root), str(tmp_path / "cache"), max_bytes=10000,
+                       presets={"thumb": 160, "large": 1280},
+                       base_url=PREFIX)
+    for module in (image_endpoints, serialization):
+        monkeypatch.setattr(module, "image_store", store)
+    return store
+
+
+@pytest.fixture
+def renderer(store, monkeypatch):
+    """Derivatives rendered by fake_render in a thread."""
+    calls = []
+
+    def render(*args):
+        calls.append(args)
+        return fake_render(*args)
+
+    monkeypatch.setattr(images, "render_derivative", render)
+    monkeypatch.setattr(images, "PIL", object())
+    store._pool = ThreadPoolExecutor(1)
+    yield calls
+    store.shutdown()
+
+
+class TestRewrite:
+
+    def test_local_references_point_at_derivatives(self, store):
+        """Test local originals are rewritten per field, remote URLs and
+        the input are left alone."""
+        bird = {
+            "images": {"main": [{"url": "/media/falcon/main.jpg"}],
+                       "gallery": [{"url": "https://example.com/a.jpg"}]},
+            "diet_and_behavior": {"diet": {"items": [
+                {"name": "prey", "image": "/media/falcon/prey.jpg"}]}},
+            "related_birds": [{"image": "/media/missing.jpg"}],
+        }
+        original = copy.deepcopy(bird)
+        rewritten = store.rewrite(bird)
+
+        digest = store.digest(store.original("falcon/main.jpg"))
+        assert rewritten["images"]["main"][0]["url"] == (
+            f"{PREFIX}/large/falcon/main.jpg?v={digest}")
+        assert rewritten["images"]["gallery"] == bird["images"]["gallery"]
+        item = rewritten["diet_and_behavior"]["diet"]["items"][0]
+        assert item["image"].startswith(f"{PREFIX}/thumb/falcon/prey.jpg?v=")
+        # No original on disk: left as it is
+        assert rewritten["related_birds"] == bird["related_birds"]
+        assert bird == original
+
+    def test_bird_without_local_images_is_not_copied(self, store):
+        """Test rewriting costs nothing for remote-only birds."""
+        bird = {"images": {"main": [{"url": "https://example.com/a.jpg"}]},
+                "related_birds": []}
+        assert store.rewrite(bird) is bird
+        assert rewrite_media_raw('{"a":1}') == '{"a":1}'
+
+    def test_raw_documents(self, store):
+        """Test raw SQLite documents, single or lists, are rewritten."""
+        document = '{"success":true,"data":{"images":{"main":[{"url":' \
+                   '"/media/falcon/main.jpg"}]}}}'
+        assert f"{PREFIX}/large/falcon/main.jpg" in (
+            rewrite_media_raw(document))
+        listing = '[{"related_birds":[{"image":"/media/falcon/prey.jpg"}]}]'
+        assert f"{PREFIX}/" in rewrite_media_raw(listing)
+
+    def test_bird_reads_are_rewritten(self, client: TestClient,
+                                      sample_bird_data, store):
+        """Test the bird API returns derivative URLs."""
+        bird = dict(sample_bird_data, bird_id="image-rewrite-falcon")
+        bird["images"] = {"main": [{"url": "/media/falcon/main.jpg",
+                                    "alt": "Falcon"}]}
+        client.post(f"{settings.API_V1_STR}/birds/", json=bird)
+
+        response = client.get(
+            f"{settings.API_V1_STR}/birds/image-rewrite-falcon")
+        url = response.json()["data"]["images"]["main"][0]["url"]
+        assert url.startswith(f"{PREFIX}/large/falcon/main.jpg?v=")
+        listing = client.get(f"{settings.API_V1_STR}/birds/batch",
+                             params={"ids": "image-rewrite-falcon"}).json()
+        assert listing[0]["images"]["main"][0]["url"] == url
+
+
+class TestImageEndpoint:
+
+    def test_original_with_cache_headers(self, client: TestClient, store):
+        """Test originals are immutable under their digest and
+        revalidated otherwise."""
+        digest = store.digest(store.original("falcon/main.jpg"))
+        response = client.get(f"{PREFIX}/original/falcon/main.jpg",
+                              params={"v": digest})
+        assert response.status_code == 200
+        assert response.content == b"original main"
+        assert "immutable" in response.headers["cache-control"]
+
+        response = client.get(f"{PREFIX}/original/falcon/main.jpg",
+                              headers={"If-None-Match": f'"{digest}"'})
+        assert response.status_code == 304
+        assert response.headers["cache-control"] == images.REVALIDATE
+
+    def test_not_found(self, client: TestClient, store):
+        """Test unknown presets, missing files and paths outside the
+        originals directory are 404s."""
+        assert client.get(f"{PREFIX}/huge/falcon/main.jpg"
+                          ).status_code == 404
+        assert client.get(f"{PREFIX}/thumb/falcon/none.jpg"
+                          ).status_code == 404
+        assert client.get(f"{PREFIX}/thumb/..%2Fcache%2Fx"
+                          ).status_code == 404
+
+    def test_without_pillow_serves_original(self, client: TestClient, store,
+                                            monkeypatch):
+        """Test presets fall back to the original when Pillow is
+        missing."""
+        monkeypatch.setattr(images, "PIL", None)
+        response = client.get(f"{PREFIX}/thumb/falcon/main.jpg")
+        assert response.status_code == 200
+        assert response.content == b"original main"
+
+    def test_derivative_rendered_once(self, client: TestClient, store,
+                                      renderer):
+        """Test a derivative is rendered on first request, negotiated
+        from Accept, and served from the cache afterwards."""
+        url = f"{PREFIX}/thumb/falcon/main.jpg"
+        response = client.get(url, headers={"Accept": "image/webp,*/*"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert response.headers["vary"] == "Accept"
+        assert response.content.startswith(b"160:webp:80:")
+        etag = response.headers["etag"]
+
+        response = client.get(url, headers={"Accept": "image/webp"})
+        assert response.headers["etag"] == etag
+        assert len(renderer) == 1
+
+        response = client.get(url, params={"format": "jpeg"})
+        assert response.headers["content-type"] == "image/jpeg"
+        assert "vary" not in response.headers
+        assert len(renderer) == 2
+        assert client.get(url, headers={"If-None-Match": etag,
+                                        "Accept": "image/webp"}
+                          ).status_code == 304
+
+
+class TestDerivativeCache:
+
+    def test_concurrent_requests_share_a_render(self, store, renderer):
+        """Test simultaneous misses for one derivative render it once."""
+        source = store.original("falcon/main.jpg")
+
+        async def main():
+            return await asyncio.gather(*(
+                store.derivative(source, "thumb", "webp") for _ in range(5)))
+
+        paths = asyncio.run(main())
+        assert len(set(paths)) == 1
+        assert len(renderer) == 1
+
+    def test_blocking_work_off_the_loop(self, store, renderer, monkeypatch):
+        """Test hashing the original and accounting the cache run in
+        worker threads, not on the event loop."""
+        threads = []
+        for name in ("digest", "_added"):
+            def record(*args, method=getattr(store, name)):
+                threads.append(threading.current_thread())
+                return method(*args)
+            monkeypatch.setattr(store, name, record)
+
+        asyncio.run(store.derivative(store.original("falcon/main.jpg"),
+                                     "thumb", "webp"))
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+
+    def test_content_addressed(self, store):
+        """Test cache paths change with the original and the settings."""
+        path = store.cache_path("a" * 16, "thumb", "webp")
+        assert path != store.cache_path("b" * 16, "thumb", "webp")
+        assert path != store.cache_path("a" * 16, "large", "webp")
+        assert path != store.cache_path("a" * 16, "thumb", "jpeg")
+        assert path.startswith(store.cache_dir)
+
+    def test_lru_eviction(self, store, renderer):
+        """Test the least recently used derivatives go once the cache is
+        over its size cap."""
+        store.max_bytes = 250
+        source = store.original("falcon/main.jpg")
+
+        async def render(preset, fmt):
+            return await store.derivative(source, preset, fmt)
+
+        first = asyncio.run(render("thumb", "webp"))
+        second = asyncio.run(render("thumb", "jpeg"))
+        os.utime(first, (1, 1))
+        # A hit marks the first as recently used again
+        store.TOUCH_INTERVAL = 0
+        asyncio.run(render("thumb", "webp"))
+        os.utime(second, (2, 2))
+        third = asyncio.run(render("large", "webp"))
+
+        assert os.path.exists(first) and os.path.exists(third)
+        assert not os.path.exists(second)
+        assert store.cache_bytes() <= store.max_bytes
@@ -0,0 +1,56 @@
+from sqlalchemy import create_engine, func, select
+
+from app.models.bird import Bird
+from app.schemas.bird import BirdCreate
+from benchmarks.bench_birds import compare
+from benchmarks.catalog import generate_bird, generate_catalog, populate
+
+
+class TestSyntheticCatalog:
+
+    def test_generation_is_deterministic(self):
+        """Test a bird only depends on its index and the seed."""
+        assert generate_bird(42) == generate_bird(42)
+        assert generate_bird(42) != generate_bird(42, seed=1)
+        assert list(generate_catalog(3, start=40))[2] == generate_bird(42)
+
+    def test_birds_are_valid_and_unique(self):
+        """Test generated documents pass BirdCreate with unique ids."""
+        birds = list(generate_catalog(200))
+        for bird in birds:
+            BirdCreate(**bird)
+        assert len({bird["bird_id"] for bird in birds}) == 200
+        statuses = {bird["conservation_status"]["status"] for bird in birds}
+        assert "least-concern" in statuses and len(statuses) > 2
+
+    def test_populate_tops_up(self, tmp_path):
+        """Test populate only inserts the missing rows."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+        assert populate(engine, 30, batch_size=7) == 30
+        assert populate(engine, 50) == 20
+        assert populate(engine, 50) == 0
+        with engine.connect() as conn:
+            assert conn.execute(
+                select(func.count()).select_from(Bird)).scalar() == 50
+            last = conn.execute(
+                select(Bird.bird_id).order_by(Bird.id.desc())).first()
+        assert last.bird_id == generate_bird(49)["bird_id"]
+
+
+class TestBenchmarkComparison:
+
+    def test_regressions_are_flagged(self):
+        """Test p50 slowdowns above the threshold are regressions."""
+        def result(endpoint, p50):
+            return {"scale": 1000, "endpoint": endpoint,
+                    "latency_ms": {"p50": p50}}
+
+        baseline = {"results": [result("get", 2.0), result("list", 10.0)]}
+        current = {"results": [result("get", 2.1), result("list", 12.0),
+                               result("delete", 5.0)]}
+        rows = {row["endpoint"]: row
+                for row in compare(baseline, current, threshold=0.1)}
+        assert set(rows) == {"get", "list"}
+        assert not rows["get"]["regression"]
+        assert rows["list"]["regression"]
+        assert rows["list"]["change"] == 0.2
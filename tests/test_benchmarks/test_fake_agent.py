@@ -0,0 +1,72 @@
+import pytest
+from openai import InternalServerError, OpenAI
+
+from benchmarks.common import percentile, summarize
+from benchmarks.fake_agent import (
+    FakeAgentConfig,
+    FakeAgentServer,
+    LatencyDistribution,
+)
+
+
+@pytest.fixture
+def fake_agent():
+    server = FakeAgentServer(FakeAgentConfig(completion_tokens=12)).start()
+    yield server
+    server.stop()
+
+
+def make_client(server):
+    return OpenAI(base_url=server.url + "/api/v1/", api_key="x",
+                  max_retries=0)
+
+
+class TestFakeAgent:
+
+    def test_completion_with_usage(self, fake_agent):
+        """Test the stub answers like the chat completions API."""
+        response = make_client(fake_agent).chat.completions.create(
+            model="n/a", messages=[{"role": "user", "content": "Hello"}])
+
+        assert len(response.choices[0].message.content.split()) == 12
+        assert response.usage.completion_tokens == 12
+        assert response.usage.total_tokens == (
+            response.usage.prompt_tokens + 12)
+
+    def test_streaming(self, fake_agent):
+        """Test streamed chunks add up to the completion."""
+        stream = make_client(fake_agent).chat.completions.create(
+            model="n/a", messages=[{"role": "user", "content": "Hello"}],
+            stream=True)
+        text = "".join(chunk.choices[0].delta.content or ""
+                       for chunk in stream)
+        assert len(text.split()) == 12
+
+    def test_error_injection(self, fake_agent):
+        """Test injected errors surface as upstream 5xx."""
+        fake_agent.config.error_rate = 1.0
+        with pytest.raises(InternalServerError):
+            make_client(fake_agent).chat.completions.create(
+                model="n/a", messages=[{"role": "user", "content": "Hi"}])
+        assert fake_agent.stats["errors"] == 1
+
+
+class TestBenchmarkHelpers:
+
+    def test_latency_distributions_are_seeded(self):
+        """Test a seeded distribution is reproducible."""
+        first = LatencyDistribution("lognormal:0.2,0.5", seed=7)
+        second = LatencyDistribution("lognormal:0.2,0.5", seed=7)
+        assert ([first.sample() for _ in range(5)]
+                == [second.sample() for _ in range(5)])
+        with pytest.raises(ValueError):
+            LatencyDistribution("gaussian:1")
+
+    def test_percentiles(self):
+        """Test nearest-rank percentiles and the summary."""
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        summary = summarize([v / 1000 for v in values])
+        assert summary["p95"] == 95.0
+        assert summary["count"] == 100
@@ -0,0 +1,196 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.admission import (
+    EXPENSIVE,
+    READ,
+    AdmissionController,
+    Overloaded,
+    admission,
+    classify,
+)
+from app.core.config import settings
+from app.main import app
+from benchmarks import bench_overload
+
+
+def scope(method, path):
+    return {"type": "http", "method": method, "path": path}
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+class TestAdmissionController:
+
+    def test_classify(self):
+        """Test reads, expensive requests and exempt probes are told apart."""
+        assert classify(scope("GET", "/api/v1/birds/")) == READ
+        assert classify(scope("POST", "/api/v1/ai/chat")) == EXPENSIVE
+        assert classify(scope("PUT", "/api/v1/birds/x")) == EXPENSIVE
+        assert classify(scope("GET", "/health")) is None
+        assert classify(scope("GET", "/metrics")) is None
+
+    def test_queues_beyond_limit_and_hands_over(self):
+        """Test waiters get freed slots in arrival order."""
+        async def main():
+            controller = AdmissionController(max_concurrency=1,
+                                             interval=10.0)
+            await controller.acquire(READ)
+            order = []
+
+            async def request(name):
+                await controller.acquire(READ)
+                order.append(name)
+
+            tasks = [asyncio.create_task(request(n)) for n in "ab"]
+            await settle()
+            assert controller.queued == 2 and not order
+            controller.release(READ)
+            await settle()
+            assert order == ["a"]
+            controller.release(READ)
+            await settle()
+            assert order == ["a", "b"]
+            await asyncio.gather(*tasks)
+        asyncio.run(main())
+
+    def test_reads_before_expensive(self):
+        """Test a freed slot goes to a waiting read first and expensive
+        requests never take every slot."""
+        async def main():
+            controller = AdmissionController(max_concurrency=2,
+                                             expensive_share=0.5,
+                                             interval=10.0)
+            await controller.acquire(EXPENSIVE)
+            expensive = asyncio.create_task(controller.acquire(EXPENSIVE))
+            await settle()
+            # One of two slots is the expensive share; reads still get in
+            assert not expensive.done()
+            await controller.acquire(READ)
+            read = asyncio.create_task(controller.acquire(READ))
+            await settle()
+
+            controller.release(EXPENSIVE)
+            await settle()
+            assert read.done() and not expensive.done()
+            controller.release(READ)
+            await settle()
+            assert expensive.done()
+        asyncio.run(main())
+
+    def test_standing_queue_sheds(self):
+        """Test a queue that stays non-empty for an interval overloads the
+        controller: expensive requests are shed at once and waiters time
+        out after the target delay."""
+        async def main():
+            controller = AdmissionController(max_concurrency=1,
+                                             target_delay=0.01,
+                                             interval=0.05)
+            await controller.acquire(READ)
+            first = asyncio.create_task(controller.acquire(READ))
+            await asyncio.sleep(0.03)
+            assert not controller.overloaded()
+            second = asyncio.create_task(controller.acquire(READ))
+            await asyncio.sleep(0.03)
+            # first timed out after the interval, second keeps the queue busy
+            with pytest.raises(Overloaded):
+                await first
+            assert controller.overloaded()
+            with pytest.raises(Overloaded) as exc_info:
+                await controller.acquire(EXPENSIVE)
+            assert exc_info.value.reason == "shed_overload"
+
+            late = asyncio.create_task(controller.acquire(READ))
+            await asyncio.sleep(0.02)
+            with pytest.raises(Overloaded) as exc_info:
+                await late
+            assert exc_info.value.reason == "shed_timeout"
+            await asyncio.gather(second, return_exceptions=True)
+            controller.release(READ)
+            assert not controller.overloaded()
+            assert controller.snapshot()["shed"][READ] >= 2
+        asyncio.run(main())
+
+    def test_queue_full_sheds(self):
+        """Test arrivals beyond the queue bound are shed immediately."""
+        async def main():
+            controller = AdmissionController(max_concurrency=1, max_queue=1,
+                                             interval=10.0)
+            await controller.acquire(READ)
+            waiter = asyncio.create_task(controller.acquire(READ))
+            await settle()
+            with pytest.raises(Overloaded) as exc_info:
+                await controller.acquire(READ)
+            assert exc_info.value.reason == "shed_queue_full"
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            assert controller.queued == 0
+        asyncio.run(main())
+
+    def test_loop_lag_sheds(self):
+        """Test a standing event loop lag overloads the controller and,
+        beyond a whole interval, sheds reads too."""
+        async def main():
+            controller = AdmissionController(target_delay=0.01,
+                                             interval=0.1)
+            controller.loop_lag = 0.05
+            assert controller.overloaded()
+            with pytest.raises(Overloaded):
+                await controller.acquire(EXPENSIVE)
+            await controller.acquire(READ)
+            controller.loop_lag = 0.2
+            with pytest.raises(Overloaded) as exc_info:
+                await controller.acquire(READ)
+            assert exc_info.value.reason == "shed_loop_lag"
+        asyncio.run(main())
+
+    def test_monitor_measures_lag(self):
+        """Test the monitor reports the minimum lag of an interval."""
+        async def main():
+            controller = AdmissionController(interval=0.05)
+            controller.start()
+            await asyncio.sleep(0.12)
+            assert 0 <= controller.loop_lag < 0.01
+            controller.stop()
+        asyncio.run(main())
+
+
+class TestAdmissionMiddleware:
+
+    def test_overload_surfaces_in_health(self, monkeypatch):
+        """Test /health answers 503 "overloaded" while requests are shed,
+        and shed requests get a 503 with Retry-After."""
+        client = TestClient(app)
+        assert client.get("/health").json()["status"] == "healthy"
+
+        monkeypatch.setattr(admission, "loop_lag", 10.0)
+        response = client.get("/health")
+        assert response.status_code == 503
+        assert response.json()["status"] == "overloaded"
+        assert response.json()["admission"]["overloaded"] is True
+
+        response = client.get(f"{settings.API_V1_STR}/birds/")
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+        assert client.get("/health/ready").status_code in (200, 503)
+
+
+def test_overload_sheds_chat_and_keeps_reads(tmp_path):
+    """Test, with the overload benchmark, that chat beyond its share of
+    slots is shed while reads keep being served."""
+    results = bench_overload.run(
+        rates=[30.0], duration=3.0, chat_share=0.5, modes=["admission"],
+        latency="fixed:0.4", count=200, workers=1, data_dir=str(tmp_path),
+        seed=0, settings={"ADMISSION_MAX_CONCURRENCY": "4",
+                          "ADMISSION_EXPENSIVE_SHARE": "0.5"})
+    result = results[0]
+    chat, read = result["classes"]["chat"], result["classes"]["read"]
+    assert chat["shed"] > 0
+    assert read["status_counts"].get("200", 0) >= 0.9 * sum(
+        read["status_counts"].values())
+    assert result["overloaded_share"] > 0
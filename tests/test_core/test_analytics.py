@@ -0,0 +1,91 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from app.api.v1.endpoints import ai_agent as ai_endpoints
+from app.core import analytics
+from app.core.jobs import JobQueue
+from app.models.base import BaseModel
+from app.models.conversation import ConversationLog
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path}/analytics.db")
+    BaseModel.metadata.create_all(bind=engine)
+    monkeypatch.setattr(analytics, "engine", engine)
+    return engine
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    queue.handler(analytics.CONVERSATION_LOG, batch_size=10)(
+        analytics.write_conversation_logs)
+    monkeypatch.setattr(analytics, "job_queue", queue)
+    return queue
+
+
+def make_record(i=0):
+    return {"message": f"question {i}", "success": True,
+            "response_count": 1, "session_id": "s", "processing_time": 0.1,
+            "logged_at": time.time()}
+
+
+def count_rows(engine):
+    with engine.connect() as conn:
+        return conn.execute(
+            select(func.count()).select_from(ConversationLog)).scalar()
+
+
+class TestConversationLogJobs:
+
+    def test_written_in_batches(self, engine, queue):
+        """Test queued records are inserted batch_size at a time."""
+        for i in range(25):
+            analytics.record_conversation(make_record(i))
+        assert count_rows(engine) == 0
+        assert queue.stats(analytics.CONVERSATION_LOG)["pending"] == 25
+
+        assert queue.run_pending() == 3
+        assert count_rows(engine) == 25
+        assert queue.stats()["pending"] == 0
+
+    def test_worker_writes(self, engine, queue):
+        """Test the background workers pick up queued records."""
+        queue.start()
+        try:
+            analytics.record_conversation(make_record())
+            deadline = time.monotonic() + 5
+            while count_rows(engine) < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert count_rows(engine) == 1
+        finally:
+            queue.stop()
+
+    def test_failed_insert_is_retried(self, engine, queue):
+        """Test records survive a failed insert and are written later."""
+        ConversationLog.__table__.drop(engine)
+        analytics.record_conversation(make_record())
+        queue.run_pending()
+        stats = queue.stats()
+        assert stats["pending"] == 1 and stats["retried"] == 1
+
+        ConversationLog.__table__.create(engine)
+        queue._connection().execute("UPDATE jobs SET run_at = 0")
+        queue.run_pending()
+        assert count_rows(engine) == 1
+
+    def test_log_conversation_enqueues(self, engine, queue):
+        """Test the chat logging hook only queues a record."""
+        ai_endpoints.log_conversation(
+            "x" * 500, {"success": True, "message_count": 2}, "abc", 0.5)
+        assert count_rows(engine) == 0
+
+        queue.run_pending()
+        with engine.connect() as conn:
+            row = conn.execute(select(ConversationLog)).one()
+        assert len(row.message) == 100
+        assert row.response_count == 2
+        assert row.session_id == "abc"
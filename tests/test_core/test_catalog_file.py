@@ -0,0 +1,148 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core import catalog_file
+from app.core.catalog_file import (
+    CatalogFile,
+    CatalogFileError,
+    compile_catalog,
+)
+from app.core.database import Base
+from app.core.snapshot import CatalogSnapshot, SnapshotManager, SnapshotRow
+from app.models.bird import Bird
+
+
+def row(id_, bird_id, name, scientific_name="", status="least-concern",
+        tags=()):
+    return SnapshotRow(id_, bird_id, name.lower(), scientific_name.lower(),
+                       status, json.dumps({"bird_id": bird_id}).encode(),
+                       tags)
+
+
+def ids(content: bytes):
+    return [bird["bird_id"] for bird in json.loads(content)]
+
+
+ROWS = [
+    row(1, "falcon", "Peregrine Falcon", "Falco peregrinus",
+        tags=("raptor", "migratory")),
+    row(2, "kestrel", "American Kestrel", "Falco sparverius", "endangered",
+        tags=("raptor",)),
+    row(3, "owl", "Snowy Owl", "Bubo scandiacus", None),
+    row(4, "rhea", "Ñandú", "Rhea americana"),
+]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "catalog.bin")
+
+
+class TestCatalogFile:
+
+    def test_same_reads_as_snapshot(self, path):
+        """Test the mapped file answers every read as the in-memory
+        snapshot of the same rows does."""
+        compile_catalog(path, ROWS, seq=7)
+        mapped, snapshot = CatalogFile(path), CatalogSnapshot(ROWS, seq=7)
+        assert (len(mapped), mapped.seq) == (4, 7)
+        assert mapped.document_bytes == snapshot.document_bytes
+        for bird_id in ("falcon", "owl", "rhea"):
+            # Tags are only kept as posting lists
+            assert mapped.get(bird_id) == snapshot.get(bird_id)._replace(
+                tags=())
+        assert mapped.get("heron") is None and mapped.get("") is None
+        for read, argument in [
+                ("page", 1), ("page", 10),
+                ("batch", ["owl", "heron", "falcon", "owl"]),
+                ("search_by_name", "AN"), ("search_by_name", "ñan"),
+                ("search_by_name", "falcon\x00american"),
+                ("search_by_name", ""),
+                ("search_by_scientific_name", "falco "),
+                ("get_by_conservation_status", "endangered"),
+                ("get_by_conservation_status", None)]:
+            assert (getattr(mapped, read)(argument)
+                    == getattr(snapshot, read)(argument)), read
+        assert ids(mapped.get_by_tag("Raptor")) == ["falcon", "kestrel"]
+        assert list(mapped.rows()) == ROWS
+
+    def test_empty(self, path):
+        """Test a catalog without birds."""
+        compile_catalog(path, [], seq=0)
+        mapped = CatalogFile(path)
+        assert len(mapped) == 0
+        assert mapped.get("owl") is None
+        assert mapped.page() == b"[]"
+        assert mapped.search_by_name("owl") == b"[]"
+
+    def test_atomic_swap(self, path, tmp_path):
+        """Test a rebuild replaces the file while open views keep reading
+        the one they mapped, and leaves no temporary file behind."""
+        compile_catalog(path, ROWS, seq=7)
+        old = CatalogFile(path)
+        compile_catalog(path, ROWS[:1], seq=8)
+        new = CatalogFile(path)
+        assert old.inode != new.inode
+        assert ids(old.page()) == ["falcon", "kestrel", "owl", "rhea"]
+        assert ids(new.page()) == ["falcon"]
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["catalog.bin"]
+
+    def test_rejects_other_files(self, path, monkeypatch):
+        """Test truncated files and other format versions are refused."""
+        with open(path, "wb") as f:
+            f.write(b"BIRDCAT")
+        with pytest.raises(CatalogFileError):
+            CatalogFile(path)
+        compile_catalog(path, ROWS, seq=7)
+        monkeypatch.setattr(catalog_file, "FORMAT_VERSION", 2)
+        with pytest.raises(CatalogFileError, match="version 1"):
+            CatalogFile(path)
+
+
+class TestCatalogFileManager:
+
+    def test_compile_open_and_rebuild(self, tmp_path, path,
+                                      sample_bird_data):
+        """Test the first load compiles the file, later loads only map it,
+        and a rebuild patches it with the writes since."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+        Base.metadata.create_all(bind=engine)
+        session = sessionmaker(bind=engine)
+        fields = {key: value for key, value in sample_bird_data.items()
+                  if key != "id"}
+        with session() as db:
+            db.add(Bird(**fields))
+            db.add(Bird(**dict(fields, bird_id="second-falcon")))
+            db.commit()
+
+        first = SnapshotManager(bind=engine, path=path).load()
+        assert ids(first.page()) == ["peregrine-falcon", "second-falcon"]
+        assert ids(first.get_by_tag("migratory")) == ids(first.page())
+        manager = SnapshotManager(bind=engine, path=path)
+        mapped = manager.load()
+        assert mapped.inode == first.inode
+        assert manager.rebuild() is False
+
+        with session() as db:
+            db.add(Bird(**dict(fields, bird_id="third-falcon")))
+            db.query(Bird).filter(Bird.bird_id == "peregrine-falcon").one(
+                ).name = "Renamed"
+            db.delete(db.query(Bird).filter(
+                Bird.bird_id == "second-falcon").one())
+            db.commit()
+        assert manager.refresh() is None
+        assert manager.rebuild() is True
+        rebuilt = manager.snapshot
+        assert rebuilt.inode != mapped.inode
+        assert ids(rebuilt.page()) == ["peregrine-falcon", "third-falcon"]
+        assert ids(rebuilt.search_by_name("renamed")) == ["peregrine-falcon"]
+        assert ids(mapped.page()) == ["peregrine-falcon", "second-falcon"]
+
+        # Patched from the old file as a full compile would have built it
+        with session() as db:
+            full = CatalogSnapshot(list(manager._rows(db)))
+        assert list(rebuilt.rows()) == [
+            row._replace(tags=tuple(sorted(row.tags))) for row in full._rows]
@@ -0,0 +1,205 @@
+import asyncio
+import gzip
+import json
+import threading
+
+import pytest
+
+from app import crud
+from app.core import compression
+from app.core.compression import (
+    CompressionMiddleware,
+    DocumentCache,
+    bird_documents,
+    negotiate,
+)
+from app.core.config import settings
+from app.core.database import SessionLocal
+
+
+@pytest.fixture
+def bird(client, sample_bird_data):
+    data = dict(sample_bird_data, bird_id="compression-bird")
+    url = f"{settings.API_V1_STR}/birds/compression-bird"
+    client.delete(url)
+    client.post(f"{settings.API_V1_STR}/birds/", json=data)
+    yield url
+    client.delete(url)
+
+
+def raw_get(client, url, encoding):
+    """GET without httpx's transparent decoding."""
+    with client.stream("GET", url,
+                       headers={"Accept-Encoding": encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+
+class TestNegotiation:
+
+    @pytest.mark.parametrize("header, expected", [
+        (None, None),
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("GZIP;q=0.5", "gzip"),
+        ("gzip;q=0", None),
+        ("*", "gzip"),
+        ("*;q=0.1, gzip;q=0", None),
+        ("deflate, gzip;q=0.8", "gzip"),
+    ])
+    def test_negotiate(self, header, expected):
+        """Test Accept-Encoding q-values and wildcards."""
+        assert negotiate(header) == expected
+
+    def test_server_preference_breaks_ties(self, monkeypatch):
+        """Test equal q-values go to the preferred codec."""
+        monkeypatch.setattr(compression, "CODECS", {
+            "br": lambda data, level: data, "gzip": compression._gzip})
+        assert negotiate("gzip, br") == "br"
+        assert negotiate("gzip, br;q=0.5") == "gzip"
+
+
+class TestCompressionMiddleware:
+
+    def test_large_json_compressed(self, client, bird):
+        """Test large JSON responses are gzipped with Vary set."""
+        response, body = raw_get(client, f"{settings.API_V1_STR}/birds/",
+                                 "gzip")
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert int(response.headers["content-length"]) == len(body)
+        assert gzip.decompress(body).startswith(b"[")
+
+    def test_small_and_identity_untouched(self, client):
+        """Test small bodies and identity requests are not compressed."""
+        response, _ = raw_get(client, "/health", "gzip")
+        assert "content-encoding" not in response.headers
+        response, body = raw_get(client, f"{settings.API_V1_STR}/birds/",
+                                 "identity")
+        assert "content-encoding" not in response.headers
+        assert body.startswith(b"[")
+
+    def test_streamed_response_passed_through(self):
+        """Test multi-part bodies are sent as they come."""
+        sent = []
+
+        async def streaming_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type",
+                                     b"application/json")]})
+            await send({"type": "http.response.body", "body": b"x" * 2000,
+                        "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def send(message):
+            sent.append(message)
+
+        middleware = CompressionMiddleware(streaming_app, minimum_size=10)
+        scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+        asyncio.run(middleware(scope, None, send))
+        assert [m["type"] for m in sent] == [
+            "http.response.start", "http.response.body",
+            "http.response.body"]
+        assert sent[1]["body"] == b"x" * 2000
+
+
+class TestDocumentCache:
+
+    def test_rendered_and_compressed_once_per_version(self, monkeypatch):
+        """Test each variant is built once until the version changes."""
+        cache = DocumentCache(max_entries=2, minimum_size=0)
+        document = b'{"a": "' + b"b" * 500 + b'"}'
+        renders = []
+        compressions = []
+
+        def render():
+            renders.append(1)
+            return document
+
+        def compress(data, level):
+            compressions.append(level)
+            return compression._gzip(data, level)
+
+        monkeypatch.setitem(compression.CODECS, "gzip", compress)
+        fast = cache.variant("bird", 1, render, "gzip")[0]
+        cache.wait_for_upgrades()
+        for _ in range(2):
+            body, encoding = cache.variant("bird", 1, render, "gzip")
+        assert encoding == "gzip"
+        assert gzip.decompress(body) == gzip.decompress(fast) == document
+        assert body != fast
+        assert len(renders) == 1
+        assert compressions == [settings.COMPRESSION_GZIP_LEVEL,
+                                compression.CACHED_LEVELS["gzip"]]
+
+        cache.variant("bird", 2, render, "gzip")
+        cache.wait_for_upgrades()
+        assert len(renders) == 2
+        assert len(compressions) == 4
+
+    def test_upgrade_skips_replaced_version(self, monkeypatch):
+        """Test a version replaced before its recompression keeps only
+        the new version's variants."""
+        cache = DocumentCache(minimum_size=0)
+        started, proceed = threading.Event(), threading.Event()
+        cache._upgrades.submit(lambda: started.set() or proceed.wait(5))
+        started.wait(5)
+        cache.variant("bird", 1, lambda: b"old" * 100, "gzip")
+        fast, _ = cache.variant("bird", 2, lambda: b"new" * 100, "gzip")
+        proceed.set()
+        cache.wait_for_upgrades()
+        body, _ = cache.variant("bird", 2, lambda: b"", "gzip")
+        assert gzip.decompress(body) == b"new" * 100 and body != fast
+
+    def test_small_documents_not_compressed(self):
+        """Test documents under the minimum size stay identity."""
+        cache = DocumentCache(minimum_size=100)
+        assert cache.variant("a", 1, lambda: b"{}", "gzip") == (b"{}", None)
+
+    def test_lru_eviction(self):
+        """Test the least recently used document is evicted."""
+        cache = DocumentCache(max_entries=2, minimum_size=0)
+        cache.variant("a", 1, lambda: b"a", None)
+        cache.variant("b", 1, lambda: b"b", None)
+        cache.variant("a", 1, lambda: b"a", None)
+        cache.variant("c", 1, lambda: b"c", None)
+        assert len(cache) == 2
+        assert cache.variant("b", 1, lambda: b"new", None) == (b"new", None)
+
+
+class TestPrecompressedBirds:
+
+    def test_get_served_from_cache(self, client, bird):
+        """Test bird documents match the plain response in every coding."""
+        response, plain = raw_get(client, bird, "identity")
+        assert json.loads(plain)["data"]["bird_id"] == "compression-bird"
+        response, body = raw_get(client, bird, "gzip")
+        assert response.headers["content-encoding"] == "gzip"
+        assert gzip.decompress(body) == plain
+
+    def test_update_invalidates(self, client, bird):
+        """Test an update is visible straight away."""
+        client.get(bird)
+        client.put(bird, json={"name": "Renamed Falcon"})
+        assert client.get(bird).json()["data"]["name"] == "Renamed Falcon"
+        assert client.get(bird, headers={"Accept-Encoding": "identity"}
+                          ).json()["data"]["name"] == "Renamed Falcon"
+
+    def test_write_elsewhere_seen(self, client, bird):
+        """Test a write by another process is served straight away, even
+        within the same second and without an invalidation here."""
+        client.get(bird)
+        with SessionLocal() as db:
+            stored = crud.bird.get_by_bird_id(db, bird_id="compression-bird")
+            stored.name = "Renamed Elsewhere"
+            stored.updated_at = stored.updated_at
+            db.commit()
+        assert client.get(bird).json()["data"]["name"] == "Renamed Elsewhere"
+
+    def test_delete_invalidates(self, client, bird):
+        """Test a deleted bird is no longer served."""
+        client.get(bird)
+        cached = len(bird_documents)
+        client.delete(bird)
+        assert len(bird_documents) == cached - 1
+        assert client.get(bird).status_code == 404
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.admission import classify
+from app.core.config import settings
+from app.core.events import (
+    DELETE,
+    SLOW_CONSUMER,
+    UPDATE,
+    BirdEvent,
+    Broadcaster,
+    TooManySubscribers,
+)
+from app.models.bird import Bird
+
+
+def make_bird(bird_id="falcon", status="least-concern",
+              tags=("Migratory",)):
+    return Bird(bird_id=bird_id, name="Falcon", scientific_name="Falco",
+                conservation_status={"status": status},
+                tags=[{"text": text, "icon": "x"} for text in tags])
+
+
+def event(bird_id="falcon", status="least-concern", tags=("migratory",)):
+    return BirdEvent(UPDATE, bird_id, status, tags, {"bird_id": bird_id})
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+class TestBroadcaster:
+
+    def test_filters(self):
+        """Test bird_id, status and tag filters, combined with AND."""
+        async def main():
+            broadcaster = Broadcaster()
+            everything = broadcaster.subscribe()
+            by_id = broadcaster.subscribe(bird_ids=["owl"])
+            by_status = broadcaster.subscribe(statuses=["endangered"])
+            by_tag = broadcaster.subscribe(tags=["Nocturnal"])
+            both = broadcaster.subscribe(statuses=["endangered"],
+                                         tags=["nocturnal"])
+            broadcaster._deliver(event("falcon"))
+            broadcaster._deliver(event("owl", "endangered", ["nocturnal"]))
+            broadcaster._deliver(event("kiwi", "endangered", ["flightless"]))
+            return [[e.bird_id for e in s._buffer]
+                    for s in (everything, by_id, by_status, by_tag, both)]
+
+        assert asyncio.run(main()) == [["falcon", "owl", "kiwi"], ["owl"],
+                                       ["owl", "kiwi"], ["owl"], ["owl"]]
+
+    def test_hook_events(self):
+        """Test CRUD hook events are encoded once, deletes without data."""
+        async def main():
+            broadcaster = Broadcaster()
+            subscription = broadcaster.subscribe(tags=["migratory"])
+            bird = make_bird()
+            await asyncio.to_thread(broadcaster.bird_written, "update", bird)
+            await asyncio.to_thread(broadcaster.bird_written, "remove", bird)
+            return [await subscription.get() for _ in range(2)]
+
+        update, delete = asyncio.run(main())
+        assert update.op == UPDATE
+        assert '"name":"Falcon"' in update.text
+        assert update.sse.startswith(b"event: update\ndata: {")
+        assert delete.op == DELETE
+        assert '"data":null' in delete.text
+
+    def test_slow_consumer_evicted(self):
+        """Test a full buffer evicts its subscriber and not the others."""
+        async def main():
+            broadcaster = Broadcaster(buffer_size=2)
+            slow = broadcaster.subscribe()
+            fast = broadcaster.subscribe()
+            received = []
+            for i in range(3):
+                broadcaster._deliver(event(f"bird-{i}"))
+                received.append(await fast.get())
+            return slow, received, len(broadcaster), [
+                await slow.get() for _ in range(3)]
+
+        slow, received, subscribers, drained = asyncio.run(main())
+        assert slow.closed == SLOW_CONSUMER
+        # What it had buffered, then nothing
+        assert [e.bird_id for e in drained[:2]] == ["bird-0", "bird-1"]
+        assert drained[2] is None
+        assert [e.bird_id for e in received] == ["bird-0", "bird-1",
+                                                 "bird-2"]
+        assert subscribers == 1
+
+    def test_get_timeout_and_close(self):
+        """Test get returns None on timeout, and iteration ends on close."""
+        async def main():
+            broadcaster = Broadcaster()
+            subscription = broadcaster.subscribe()
+            assert await subscription.get(timeout=0.01) is None
+            assert subscription.closed is None
+            broadcaster._deliver(event())
+            threading.Timer(0.05, broadcaster.close).start()
+            return [e.bird_id async for e in subscription], subscription
+
+        received, subscription = asyncio.run(main())
+        assert received == ["falcon"]
+        assert subscription.closed == "shutdown"
+
+    def test_subscriber_limit(self):
+        """Test subscribing past the limit fails until one leaves."""
+        async def main():
+            broadcaster = Broadcaster(max_subscribers=2)
+            first = broadcaster.subscribe(bird_ids=["a", "b"])
+            broadcaster.subscribe()
+            with pytest.raises(TooManySubscribers):
+                broadcaster.subscribe()
+            broadcaster.unsubscribe(first)
+            broadcaster.unsubscribe(first)
+            broadcaster.subscribe()
+            return broadcaster
+
+        broadcaster = asyncio.run(main())
+        assert len(broadcaster) == 2
+        assert broadcaster._by_bird == {}
+
+    def test_ten_thousand_subscribers(self):
+        """Test one write reaches 10,000 waiting subscribers on one event
+        loop, published from another thread as the CRUD hooks are."""
+        count = 10000
+
+        async def main():
+            broadcaster = Broadcaster(buffer_size=8, max_subscribers=count)
+            subscriptions = [broadcaster.subscribe() for _ in range(count)]
+            received = []
+
+            async def listen(subscription):
+                received.append(await subscription.get())
+
+            listeners = [asyncio.create_task(listen(s))
+                         for s in subscriptions]
+            await settle()
+            started = time.perf_counter()
+            await asyncio.to_thread(broadcaster.bird_written, "update",
+                                    make_bird())
+            await asyncio.gather(*listeners)
+            return received, time.perf_counter() - started
+
+        received, elapsed = asyncio.run(main())
+        assert len(received) == count
+        # Encoded once and shared
+        assert len({id(e) for e in received}) == 1
+        assert elapsed < 5.0
+
+    def test_stream_exempt_from_admission(self):
+        """Test event streams do not hold admission slots."""
+        assert classify({"type": "http", "method": "GET",
+                         "path": f"{settings.API_V1_STR}/birds/events"}
+                        ) is None
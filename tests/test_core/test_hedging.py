@@ -0,0 +1,161 @@
+import time
+
+import pytest
+
+from app.core.ai_agent import BirdNestAIAgent
+from app.core.config import settings
+from app.core.hedging import HedgeDeclined, Hedger, LatencySketch
+from app.core.resilience import AdaptiveConcurrencyLimiter, CircuitBreaker
+from benchmarks.fake_agent import FakeAgentConfig, FakeAgentServer
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    upstream = FakeAgentServer(
+        FakeAgentConfig(completion_tokens=0)).start()
+    monkeypatch.setattr(settings, "AGENT_ENDPOINT", upstream.url)
+    monkeypatch.setattr(settings, "AGENT_ACCESS_KEY", "test-key")
+    monkeypatch.setattr(settings, "AGENT_REQUEST_DEADLINE", 2.0)
+    yield upstream
+    upstream.stop()
+
+
+def warm_up(hedger, latency=0.01, samples=40):
+    for _ in range(samples):
+        hedger.budget.deposit()
+        hedger.observe(latency)
+
+
+class TestLatencySketch:
+
+    def test_quantiles(self):
+        """Test quantiles are within the bucket growth factor."""
+        sketch = LatencySketch(growth=1.05)
+        for i in range(1, 1001):
+            sketch.record(i / 1000)
+
+        assert sketch.quantile(0.5) == pytest.approx(0.5, rel=0.06)
+        assert sketch.quantile(0.95) == pytest.approx(0.95, rel=0.06)
+
+    def test_window_follows_shift(self):
+        """Test old samples age out after two windows."""
+        sketch = LatencySketch(window=100)
+        for _ in range(100):
+            sketch.record(1.0)
+        for _ in range(200):
+            sketch.record(0.01)
+        assert sketch.quantile(0.95) < 0.02
+
+
+class TestHedger:
+
+    def test_no_hedge_before_min_samples(self):
+        """Test hedging waits for enough latency samples."""
+        hedger = Hedger(min_samples=20)
+        calls = []
+
+        def attempt(deadline, is_hedge):
+            calls.append(is_hedge)
+            time.sleep(0.05)
+            return "ok"
+
+        assert hedger.run(attempt, time.monotonic() + 1) == "ok"
+        assert calls == [False]
+
+    def test_hedge_wins_over_slow_primary(self):
+        """Test a hedge is sent after p95 and its result is used."""
+        hedger = Hedger(min_samples=20)
+        warm_up(hedger)
+
+        def attempt(deadline, is_hedge):
+            time.sleep(0.01 if is_hedge else 1.0)
+            return "hedge" if is_hedge else "primary"
+
+        start = time.monotonic()
+        assert hedger.run(attempt, time.monotonic() + 2) == "hedge"
+        assert time.monotonic() - start < 0.5
+        stats = hedger.stats()
+        assert stats["hedges"] == 1
+        assert stats["hedge_wins"] == 1
+        assert stats["win_rate"] == 1.0
+
+    def test_budget_caps_hedges(self):
+        """Test hedges stay within the budget ratio."""
+        hedger = Hedger(min_samples=20, budget_ratio=0.05)
+        warm_up(hedger, samples=20)  # Earns exactly one token
+
+        def attempt(deadline, is_hedge):
+            time.sleep(0.03)
+            return "ok"
+
+        for _ in range(40):
+            hedger.run(attempt, time.monotonic() + 1)
+
+        stats = hedger.stats()
+        # One token from warm-up plus 5% of 40 requests
+        assert stats["hedges"] <= 3
+        assert stats["budget_denied"] >= 37
+
+    def test_declined_hedge_is_refunded(self):
+        """Test a hedge without capacity does not count or spend budget."""
+        hedger = Hedger(min_samples=20)
+        warm_up(hedger)
+
+        def attempt(deadline, is_hedge):
+            if is_hedge:
+                raise HedgeDeclined()
+            time.sleep(0.1)
+            return "primary"
+
+        assert hedger.run(attempt, time.monotonic() + 1) == "primary"
+        stats = hedger.stats()
+        assert stats["hedges"] == 0
+        assert stats["capacity_denied"] == 1
+
+    def test_primary_error_when_all_fail(self):
+        """Test the primary's error is raised when every attempt fails."""
+        hedger = Hedger()
+
+        def attempt(deadline, is_hedge):
+            raise ValueError("primary" if not is_hedge else "hedge")
+
+        with pytest.raises(ValueError, match="primary"):
+            hedger.run(attempt, time.monotonic() + 1)
+
+
+class TestAgentHedging:
+
+    def test_hedged_query_against_fake_upstream(self, fake_upstream):
+        """Test a slow upstream response is hedged end to end."""
+        hedger = Hedger(min_samples=20)
+        agent = BirdNestAIAgent(
+            breaker=CircuitBreaker(),
+            limiter=AdaptiveConcurrencyLimiter(initial_limit=4),
+            hedger=hedger,
+        )
+        for _ in range(40):
+            assert agent.query_agent("warm up")["success"] is True
+
+        slow_request = fake_upstream.requests + 1
+        fake_upstream.config.latency = (
+            lambda number: 1.5 if number == slow_request else 0.0)
+
+        start = time.monotonic()
+        result = agent.query_agent("Is this hedged?")
+        elapsed = time.monotonic() - start
+
+        assert result["success"] is True
+        assert elapsed < 1.0
+        assert hedger.stats()["hedge_wins"] == 1
+
+    def test_deadline_bounds_attempts(self, fake_upstream, monkeypatch):
+        """Test the per-request deadline is applied without hedging."""
+        monkeypatch.setattr(settings, "AGENT_REQUEST_DEADLINE", 0.2)
+        agent = BirdNestAIAgent(breaker=CircuitBreaker(),
+                                limiter=AdaptiveConcurrencyLimiter())
+        fake_upstream.config.latency = 1.0
+
+        start = time.monotonic()
+        result = agent.query_agent("Too slow")
+        assert result["success"] is False
+        assert time.monotonic() - start < 0.8
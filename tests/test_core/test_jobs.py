@@ -0,0 +1,211 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.core import database
+from app.core.jobs import JobQueue
+from app.core.metrics import registry
+from app.crud.bird import bird as crud_bird
+from app.models.base import BaseModel
+from app.schemas.bird import BirdCreate
+from benchmarks.catalog import generate_bird
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), backoff_base=10.0,
+                    max_attempts=3)
+
+
+class TestJobQueue:
+
+    def test_priority_then_age(self, queue):
+        """Test higher priority jobs run first, equal ones oldest first."""
+        done = []
+        queue.handler("task")(done.append)
+        queue.enqueue("task", "low", priority=-1)
+        queue.enqueue("task", "first")
+        queue.enqueue("task", "second")
+        queue.enqueue("task", "urgent", priority=5)
+
+        assert queue.run_pending() == 4
+        assert done == ["urgent", "first", "second", "low"]
+
+    def test_batches_per_kind(self, queue):
+        """Test a batch handler gets up to batch_size payloads at once."""
+        batches = []
+        queue.handler("batch", batch_size=4)(batches.append)
+        for i in range(10):
+            queue.enqueue("batch", i)
+
+        assert queue.run_pending() == 3
+        assert batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+    def test_delayed_jobs_wait(self, queue):
+        """Test a delayed job is not run before its time."""
+        done = []
+        queue.handler("task")(done.append)
+        queue.enqueue("task", 1, delay=60)
+        assert queue.run_pending() == 0
+        assert queue.stats()["pending"] == 1
+
+    def test_retry_with_backoff_then_dead(self, queue):
+        """Test a failing job is retried later and kept as dead after
+        max_attempts."""
+        calls = []
+
+        @queue.handler("flaky")
+        def flaky(payload):
+            calls.append(payload)
+            raise RuntimeError("boom")
+
+        job_id = queue.enqueue("flaky", "x")
+        queue.run_pending()
+        assert calls == ["x"]
+        run_at, error = queue._connection().execute(
+            "SELECT run_at, last_error FROM jobs WHERE id = ?",
+            (job_id,)).fetchone()
+        # Backoff of 5 to 10 seconds with jitter
+        assert 4 < run_at - time.time() <= 10
+        assert "boom" in error
+
+        for _ in range(2):
+            queue._connection().execute("UPDATE jobs SET run_at = 0")
+            queue.run_pending()
+        stats = queue.stats("flaky")
+        assert len(calls) == 3
+        assert stats["dead"] == 1 and stats["pending"] == 0
+
+    def test_idempotent_keys(self, queue):
+        """Test a key is only queued once while its job is pending."""
+        done = []
+        queue.handler("task")(done.append)
+        first = queue.enqueue("task", 1, key="k")
+        assert first is not None
+        assert queue.enqueue("task", 2, key="k") is None
+        queue.run_pending()
+        assert done == [1]
+        assert queue.enqueue("task", 3, key="k") is not None
+
+    def test_failed_job_merges_into_requeued_key(self, queue):
+        """Test a keyed job that fails after being queued again while it
+        ran merges into the pending one, and other jobs keep running."""
+        done = []
+
+        def flaky(payload):
+            if payload == 1:
+                queue.enqueue("keyed", 2, key="K")
+                raise RuntimeError("boom")
+            done.append(payload)
+
+        queue.handler("keyed")(flaky)
+        queue.handler("other")(done.append)
+        queue.enqueue("keyed", 1, key="K")
+        queue.enqueue("other", "other", priority=-1)
+
+        assert queue.run_pending() == 3
+        assert done == [2, "other"]
+        assert queue.counts() == {}
+
+    def test_expired_lease_merges_into_requeued_key(self, queue):
+        """Test a reclaimed keyed job queued again meanwhile is dropped
+        in favour of the pending one."""
+        done = []
+        queue.handler("keyed")(done.append)
+        queue.enqueue("keyed", 1, key="K")
+        queue._claim()
+        queue.enqueue("keyed", 2, key="K")
+        queue._connection().execute("UPDATE jobs SET locked_until = 0")
+
+        assert queue.run_pending() == 1
+        assert done == [2]
+        assert queue.counts() == {}
+
+    def test_expired_lease_is_reclaimed(self, queue):
+        """Test jobs of a worker that died are run again."""
+        done = []
+        queue.handler("task")(done.append)
+        queue.enqueue("task", 1)
+        # Claimed by a worker that never finished
+        queue._claim()
+        assert queue.run_pending() == 0
+        queue._connection().execute("UPDATE jobs SET locked_until = 0")
+
+        assert queue.run_pending() == 1
+        assert done == [1]
+
+    def test_expired_lease_uses_handler_attempts(self, queue):
+        """Test a reclaimed job is given up after its handler's
+        max_attempts, not the queue's."""
+        queue.handler("once", max_attempts=1)(lambda payload: None)
+        queue.enqueue("once", 1)
+        queue._claim()
+        queue._connection().execute("UPDATE jobs SET locked_until = 0")
+
+        assert queue.run_pending() == 0
+        assert queue.counts() == {("once", "dead"): 1}
+
+    def test_enqueue_not_blocked_by_claim(self, queue):
+        """Test enqueueing does not wait for the lock a worker holds while
+        it claims or completes jobs."""
+        queue.handler("task")(lambda payload: None)
+        done = threading.Event()
+        with queue._lock:
+            thread = threading.Thread(
+                target=lambda: (queue.enqueue("task", 1), done.set()))
+            thread.start()
+            assert done.wait(1.0)
+        thread.join()
+        assert queue.run_pending() == 1
+
+    def test_workers_run_jobs(self, queue):
+        """Test the worker threads run jobs enqueued while they wait."""
+        done = []
+        queue.handler("task")(done.append)
+        queue.start()
+        try:
+            queue.enqueue("task", 1)
+            deadline = time.monotonic() + 5
+            while not done and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert done == [1]
+            assert queue.stats()["workers"] == 2
+        finally:
+            queue.stop()
+        assert queue.stats()["workers"] == 0
+
+    def test_metrics(self, queue):
+        """Test job outcomes and latency are exported."""
+        queue.handler("metrics-task")(lambda payload: None)
+        queue.enqueue("metrics-task")
+        queue.run_pending()
+        text = registry.render()
+        assert ('birdnest_jobs_total{kind="metrics-task",result="completed"}'
+                in text)
+        assert ('birdnest_job_latency_seconds_count{kind="metrics-task"}'
+                in text)
+
+
+def test_bird_writes_schedule_one_optimize(tmp_path, monkeypatch):
+    """Test bird writes queue a single delayed statistics refresh."""
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(database, "job_queue", queue)
+    engine = create_engine(f"sqlite:///{tmp_path / 'birds.db'}")
+    BaseModel.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        for i in range(3):
+            crud_bird.create(db, obj_in=BirdCreate(**generate_bird(i)))
+    rows = queue._connection().execute(
+        "SELECT kind, run_at - enqueued_at FROM jobs").fetchall()
+    assert len(rows) == 1
+    assert rows[0][0] == database.OPTIMIZE_JOB
+    assert rows[0][1] == pytest.approx(
+        database.settings.DATABASE_OPTIMIZE_DELAY)
+
+    database.optimize(bind=engine)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql(
+            "SELECT COUNT(*) FROM sqlite_stat1").scalar() > 0
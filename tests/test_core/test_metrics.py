@@ -0,0 +1,119 @@
+import pytest
+
+from app.core import metrics
+from app.core.ai_agent import BirdNestAIAgent
+from app.core.config import settings
+from app.core.metrics import MetricsRegistry
+from app.core.resilience import AdaptiveConcurrencyLimiter, CircuitBreaker
+from benchmarks.bench_metrics import bench_middleware
+from benchmarks.fake_agent import FakeAgentConfig, FakeAgentServer
+
+
+class TestMetricTypes:
+
+    def test_counter_and_gauge_render(self):
+        """Test counters and gauges in the text format."""
+        registry = MetricsRegistry()
+        counter = registry.counter("c_total", "A counter.", ("route",))
+        gauge = registry.gauge("g", "A gauge.")
+        counter.inc('/a"b')
+        counter.inc('/a"b', amount=2)
+        gauge.inc()
+        gauge.dec(amount=3)
+
+        text = registry.render()
+        assert "# TYPE c_total counter" in text
+        assert 'c_total{route="/a\\"b"} 3' in text
+        assert "# HELP g A gauge." in text
+        assert "\ng -2\n" in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test histogram buckets, sum and count."""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("h", "A histogram.",
+                                       buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        lines = registry.render().splitlines()
+        assert 'h_bucket{le="0.1"} 2' in lines
+        assert 'h_bucket{le="1"} 3' in lines
+        assert 'h_bucket{le="+Inf"} 4' in lines
+        assert "h_sum 3.65" in lines
+        assert "h_count 4" in lines
+        assert histogram.count() == 4
+
+    def test_duplicate_names_are_rejected(self):
+        """Test a metric name can only be registered once."""
+        registry = MetricsRegistry()
+        registry.counter("x_total", "X.")
+        with pytest.raises(ValueError):
+            registry.counter("x_total", "X.")
+
+
+class TestMetricsMiddleware:
+
+    def test_requests_are_recorded_per_route(self, client):
+        """Test route templates, statuses and SQL work are recorded."""
+        route = f"{settings.API_V1_STR}/birds/{{bird_id}}"
+        before = metrics.http_requests.value("GET", route, "404")
+        queries_before = metrics.db_queries_per_request.sum(route)
+
+        response = client.get(f"{settings.API_V1_STR}/birds/no-such-bird")
+        assert response.status_code == 404
+
+        assert metrics.http_requests.value("GET", route, "404") == before + 1
+        assert metrics.http_latency.count("GET", route) >= 1
+        assert metrics.db_queries_per_request.sum(route) > queries_before
+        assert metrics.http_in_flight.value("GET") == 0
+
+    def test_unmatched_requests(self, client):
+        """Test requests without a route share one label."""
+        before = metrics.http_requests.value("GET", "unmatched", "404")
+        client.get("/no/such/path")
+        assert metrics.http_requests.value(
+            "GET", "unmatched", "404") == before + 1
+
+    def test_metrics_endpoint(self, client):
+        """Test the exposition endpoint."""
+        client.get("/")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith(
+            "text/plain; version=0.0.4")
+        assert 'birdnest_http_requests_total{method="GET",route="/"' \
+            in response.text
+        assert "birdnest_db_pool_connections" in response.text
+        assert "birdnest_db_queries_total" in response.text
+
+    def test_recording_overhead(self):
+        """Test per-request recording cost stays in microseconds."""
+        result = bench_middleware(5000)
+        # Generous bound; see benchmarks/bench_metrics.py for real numbers
+        assert result["middleware_overhead_us"] < 100
+
+
+class TestUpstreamMetrics:
+
+    def test_upstream_latency_and_errors(self, monkeypatch):
+        """Test the agent records upstream latency and failures."""
+        upstream = FakeAgentServer(
+            FakeAgentConfig(completion_tokens=0)).start()
+        monkeypatch.setattr(settings, "AGENT_ENDPOINT", upstream.url)
+        monkeypatch.setattr(settings, "AGENT_ACCESS_KEY", "test-key")
+        try:
+            agent = BirdNestAIAgent(
+                breaker=CircuitBreaker(failure_threshold=100),
+                limiter=AdaptiveConcurrencyLimiter(initial_limit=2))
+            successes = metrics.upstream_latency.count("success")
+            errors = metrics.upstream_errors.value("InternalServerError")
+
+            assert agent.query_agent("Hello")["success"]
+            upstream.config.status = 500
+            agent.query_agent("Hello")
+
+            assert metrics.upstream_latency.count("success") == successes + 1
+            assert metrics.upstream_errors.value(
+                "InternalServerError") == errors + 1
+        finally:
+            upstream.stop()
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from app.core.config import settings
+from app.core.profiling import (
+    ContinuousProfiler,
+    StackSampler,
+    collapse,
+    profile_store,
+)
+
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+
+
+def spin_until(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=spin_until, args=(stop,),
+                              name="busy")
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+class TestSampling:
+
+    def test_collapse_format(self):
+        """Test collapsed stacks are frames joined by ';' and a count."""
+        counts = Counter({("main", "a", "b"): 3, ("main", "a"): 1})
+        assert collapse(counts) == "main;a;b 3\nmain;a 1\n"
+        assert collapse(Counter()) == ""
+
+    def test_sampler_sees_busy_thread(self, busy_thread):
+        """Test the sampler records the stacks of working threads."""
+        sampler = StackSampler(
+            0.001, thread_filter=lambda ident, name: name == "busy")
+        sampler.start()
+        time.sleep(0.1)
+        sampler.stop()
+
+        assert sampler.samples > 0
+        report = collapse(sampler.counts)
+        assert report.startswith("busy;")
+        assert "spin_until (tests/test_core/test_profiling.py" in report
+
+    def test_continuous_windows(self, busy_thread):
+        """Test continuous sampling aggregates windows and can stop."""
+        profiler = ContinuousProfiler(hz=200, window_seconds=0.05,
+                                      windows=3)
+        profiler.configure(enabled=True)
+        time.sleep(0.3)
+        status = profiler.configure(enabled=False)
+
+        assert status["enabled"] is False
+        assert status["windows"] == 3
+        counts = profiler.counts()
+        assert any("spin_until" in stack[-1] for stack in counts)
+        assert sum(profiler.counts(windows=1).values()) <= sum(
+            counts.values())
+
+
+class TestProfilingMiddleware:
+
+    def test_requires_admin_token(self, client):
+        """Test ?profile=1 is ignored without a valid admin token."""
+        response = client.get(f"{settings.API_V1_STR}/birds/?profile=1",
+                              headers={"X-Admin-Token": "wrong"})
+        assert response.status_code == 200
+        assert "x-profile-id" not in response.headers
+
+    def test_profile_is_stored(self, client):
+        """Test a profiled request keeps its response and stores a report."""
+        response = client.get(f"{settings.API_V1_STR}/birds/?profile=1",
+                              headers=ADMIN)
+        assert response.status_code == 200
+        assert isinstance(response.json(), list)
+        profile_id = response.headers["x-profile-id"]
+        assert profile_store.get(profile_id)["path"] == (
+            f"{settings.API_V1_STR}/birds/")
+
+        listed = client.get(f"{settings.API_V1_STR}/admin/profiles",
+                            headers=ADMIN).json()
+        assert listed[0]["id"] == profile_id
+        report = client.get(
+            f"{settings.API_V1_STR}/admin/profiles/{profile_id}",
+            headers=ADMIN)
+        assert report.status_code == 200
+        assert report.headers["content-type"].startswith("text/plain")
+
+    def test_collapsed_report_returned(self, client):
+        """Test ?profile=collapsed returns the report instead."""
+        response = client.get(
+            f"{settings.API_V1_STR}/birds/no-such-bird?profile=collapsed",
+            headers=ADMIN)
+        assert response.status_code == 200
+        assert response.headers["x-profile-status"] == "404"
+        assert response.headers["content-type"].startswith("text/plain")
+        for line in response.text.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0 and stack
+
+    def test_continuous_admin_endpoints(self, client):
+        """Test continuous sampling can be switched and read."""
+        url = f"{settings.API_V1_STR}/admin/profiling/continuous"
+        try:
+            status = client.put(url, headers=ADMIN,
+                                json={"enabled": True, "hz": 50}).json()
+            assert status["enabled"] is True
+            response = client.get(url, headers=ADMIN)
+            assert response.status_code == 200
+        finally:
+            status = client.put(url, headers=ADMIN,
+                                json={"enabled": False}).json()
+        assert status["enabled"] is False
@@ -0,0 +1,149 @@
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.core.query_monitor import (
+    QueryMonitor,
+    RequestQueries,
+    current_queries,
+    query_monitor,
+)
+
+
+@pytest.fixture
+def monitor():
+    options = query_monitor.options()
+    query_monitor.configure(enabled=True, slow_query_ms=10000.0)
+    yield query_monitor
+    query_monitor.configure(**options)
+    query_monitor.clear()
+
+
+def server_timing(response):
+    return dict(
+        (part.split(";")[0].strip(), part)
+        for part in response.headers["server-timing"].split(","))
+
+
+class TestServerTiming:
+
+    def test_header_when_enabled(self, client, monitor):
+        """Test db, serialize and total timings are reported."""
+        response = client.get(f"{settings.API_V1_STR}/birds/")
+        timing = server_timing(response)
+        assert set(timing) == {"db", "serialize", "total"}
+        assert 'desc="1 queries"' in timing["db"]
+
+    def test_update_statement_count(self, client, monitor, sample_bird_data):
+        """Test every statement of an update is counted."""
+        bird = dict(sample_bird_data, bird_id="query-monitor-bird")
+        client.delete(f"{settings.API_V1_STR}/birds/query-monitor-bird")
+        client.post(f"{settings.API_V1_STR}/birds/", json=bird)
+        try:
+            response = client.put(
+                f"{settings.API_V1_STR}/birds/query-monitor-bird",
+                json={"name": "Renamed"})
+            assert response.status_code == 200
+            # SELECT, UPDATE, the changelog INSERT and the refresh SELECT
+            assert 'desc="4 queries"' in server_timing(response)["db"]
+        finally:
+            client.delete(f"{settings.API_V1_STR}/birds/query-monitor-bird")
+
+    def test_switched_off(self, client, monitor):
+        """Test nothing is added while disabled."""
+        monitor.configure(enabled=False)
+        response = client.get(f"{settings.API_V1_STR}/birds/")
+        assert "server-timing" not in response.headers
+        monitor.configure(enabled=True, server_timing=False)
+        response = client.get(f"{settings.API_V1_STR}/birds/")
+        assert "server-timing" not in response.headers
+
+
+class TestQueryMonitor:
+
+    def test_n_plus_one_warning(self, caplog):
+        """Test repeated statements are reported."""
+        monitor = QueryMonitor(enabled=True, n_plus_one_threshold=3)
+        queries = RequestQueries()
+        queries.statements["SELECT 1"] = 2
+        with caplog.at_level(logging.WARNING):
+            monitor.check_n_plus_one(queries, "GET", "/a")
+        assert not caplog.records
+
+        queries.statements["SELECT * FROM t WHERE id = ?"] = 4
+        with caplog.at_level(logging.WARNING):
+            monitor.check_n_plus_one(queries, "GET", "/a")
+        assert "executed 4 times" in caplog.text
+
+    def test_statements_counted_per_request(self):
+        """Test statements are counted in the request context."""
+        monitor = QueryMonitor(enabled=True, slow_query_ms=10000.0)
+        engine = create_engine("sqlite://")
+        monitor.instrument(engine)
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+        try:
+            with engine.connect() as conn:
+                for i in range(3):
+                    conn.execute(text("SELECT :i"), {"i": i})
+        finally:
+            current_queries.reset(token)
+        assert queries.count == 3
+        assert queries.statements["SELECT ?"] == 3
+        assert queries.db_time > 0
+
+    def test_slow_query_log_with_plan(self, tmp_path):
+        """Test slow statements are logged with EXPLAIN QUERY PLAN."""
+        monitor = QueryMonitor(enabled=True, slow_query_ms=0.0)
+        engine = create_engine(f"sqlite:///{tmp_path / 'slow.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, "
+                              "name TEXT)"))
+        monitor.instrument(engine)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT * FROM t WHERE name = :n"), {"n": "x"})
+
+        slow = monitor.slow_queries()
+        assert slow[-1]["statement"] == "SELECT * FROM t WHERE name = ?"
+        assert slow[-1]["plan"] == ["SCAN t"]
+
+    def test_disabled_monitor_records_nothing(self):
+        """Test the hooks do nothing while disabled."""
+        monitor = QueryMonitor(enabled=False, slow_query_ms=0.0)
+        engine = create_engine("sqlite://")
+        monitor.instrument(engine)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        assert monitor.slow_queries() == []
+
+    def test_unknown_option(self):
+        """Test configure rejects unknown options."""
+        with pytest.raises(ValueError):
+            QueryMonitor().configure(colour="blue")
+
+
+class TestAdminSwitch:
+
+    def test_requires_token(self, client, monitor, monkeypatch):
+        """Test the admin endpoints are hidden or protected."""
+        monkeypatch.setattr(settings, "ADMIN_TOKEN", None)
+        assert client.get(f"{settings.API_V1_STR}/admin/sql"
+                          ).status_code == 404
+        monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+        response = client.get(f"{settings.API_V1_STR}/admin/sql",
+                              headers={"X-Admin-Token": "wrong"})
+        assert response.status_code == 403
+
+    def test_switch_at_runtime(self, client, monitor, monkeypatch):
+        """Test options can be changed through the admin endpoint."""
+        monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+        response = client.put(f"{settings.API_V1_STR}/admin/sql",
+                              headers={"X-Admin-Token": "secret"},
+                              json={"enabled": False,
+                                    "n_plus_one_threshold": 10})
+        assert response.status_code == 200
+        assert response.json()["enabled"] is False
+        assert monitor.n_plus_one_threshold == 10
+        assert monitor.slow_query_ms == 10000.0
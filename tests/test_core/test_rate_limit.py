@@ -0,0 +1,216 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import ai_agent as ai_endpoints
+from app.api.v1.endpoints.ai_agent import get_ai_agent
+from app.core.config import settings
+from app.core.rate_limit import (
+    InMemoryBucketStore,
+    Limit,
+    RateLimiter,
+    RateLimitExceeded,
+    SQLiteBucketStore,
+    UsageLedger,
+)
+from app.main import app
+
+
+def make_limiter(store=None, requests=3, tokens=100):
+    store = store or InMemoryBucketStore()
+    return RateLimiter(
+        store,
+        request_limits={"ip": Limit(requests, 60.0),
+                        "session": Limit(requests, 60.0)},
+        token_limits={"session": Limit(tokens, 3600.0)},
+    )
+
+
+class TestBucketStores:
+
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    def test_refill(self, backend, tmp_path):
+        """Test buckets drain and refill at the configured rate."""
+        store = (InMemoryBucketStore() if backend == "memory"
+                 else SQLiteBucketStore(str(tmp_path / "buckets.db")))
+        limit = Limit(2, 10.0)
+
+        assert store.apply("k", limit, 1, now=0.0) == (True, 1)
+        assert store.apply("k", limit, 1, now=0.0) == (True, 0)
+        assert store.apply("k", limit, 1, now=0.0)[0] is False
+        assert store.apply("k", limit, 1, now=5.0) == (True, 0)
+
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    def test_take_all_or_none(self, backend, tmp_path):
+        """Test a take short in one bucket takes from none of them."""
+        store = (InMemoryBucketStore() if backend == "memory"
+                 else SQLiteBucketStore(str(tmp_path / "buckets.db")))
+        wide, narrow = ("wide", Limit(5, 60.0)), ("narrow", Limit(1, 60.0))
+
+        assert store.take([wide, narrow], 1, now=0.0) == (True, [4, 0])
+        assert store.take([wide, narrow], 1, now=0.0) == (False, [4, 0])
+        assert store.take([wide], 4, now=0.0) == (True, [0])
+
+    def test_sqlite_shared_between_connections(self, tmp_path):
+        """Test two stores on one file see the same buckets."""
+        path = str(tmp_path / "buckets.db")
+        first, second = SQLiteBucketStore(path), SQLiteBucketStore(path)
+        limit = Limit(1, 60.0)
+
+        assert first.apply("k", limit, 1, now=0.0)[0] is True
+        assert second.apply("k", limit, 1, now=0.0)[0] is False
+
+    def test_idle_buckets_evicted(self):
+        """Test idle buckets are evicted so memory stays bounded."""
+        store = InMemoryBucketStore(max_buckets=1000, idle_ttl=60.0)
+        limit = Limit(10, 60.0)
+        for i in range(500):
+            store.apply(f"old-{i}", limit, 1, now=0.0)
+        store.apply("new", limit, 1, now=61.0)
+        assert len(store) == 1
+
+    def test_max_buckets(self):
+        """Test the bucket count never exceeds max_buckets."""
+        store = InMemoryBucketStore(max_buckets=100)
+        for i in range(1000):
+            store.apply(f"k{i}", Limit(10, 60.0), 1, now=float(i))
+        assert len(store) == 100
+
+
+class TestRateLimiter:
+
+    def test_request_limit(self):
+        """Test requests beyond capacity raise with a retry hint."""
+        limiter = make_limiter(requests=2)
+        identities = {"ip": "1.2.3.4"}
+        limiter.hit(identities)
+        headers = limiter.hit(identities)
+        assert headers["X-RateLimit-Remaining"] == "0"
+
+        with pytest.raises(RateLimitExceeded) as exc_info:
+            limiter.hit(identities)
+        assert exc_info.value.headers()["Retry-After"] == "30"
+
+    def test_refusal_spends_nothing(self):
+        """Test a request refused by one scope is not counted against the
+        others."""
+        limiter = RateLimiter(
+            InMemoryBucketStore(),
+            request_limits={"ip": Limit(3, 60.0),
+                            "session": Limit(1, 60.0)},
+            token_limits={})
+        limiter.hit({"ip": "1.2.3.4", "session": "s1"})
+        for _ in range(3):
+            with pytest.raises(RateLimitExceeded, match="session"):
+                limiter.hit({"ip": "1.2.3.4", "session": "s1"})
+        limiter.hit({"ip": "1.2.3.4", "session": "s2"})
+        limiter.hit({"ip": "1.2.3.4", "session": "s3"})
+        with pytest.raises(RateLimitExceeded, match="ip"):
+            limiter.hit({"ip": "1.2.3.4", "session": "s4"})
+
+    def test_token_debt_blocks(self):
+        """Test charged upstream tokens block once the budget is spent."""
+        limiter = make_limiter(requests=100, tokens=100)
+        identities = {"session": "s1"}
+        limiter.hit(identities)
+        limiter.charge_tokens(identities, 150)
+
+        with pytest.raises(RateLimitExceeded):
+            limiter.hit(identities)
+        # Other sessions are unaffected
+        limiter.hit({"session": "s2"})
+
+    def test_disabled(self):
+        """Test a disabled limiter lets everything through."""
+        limiter = make_limiter(requests=1)
+        limiter.enabled = False
+        for _ in range(5):
+            assert limiter.hit({"ip": "1.2.3.4"}) == {}
+
+
+class TestUsageLedger:
+
+    def test_accumulates_and_bounds(self):
+        """Test usage is summed per session and old sessions dropped."""
+        ledger = UsageLedger(max_sessions=2)
+        usage = {"prompt_tokens": 3, "completion_tokens": 4,
+                 "total_tokens": 7}
+        ledger.record("a", usage)
+        ledger.record("a", usage)
+        ledger.record("b", None)
+        ledger.record("c", usage)
+
+        assert ledger.get("a") is None
+        assert ledger.get("b")["requests"] == 1
+        assert ledger.get("c") == {"requests": 1, "prompt_tokens": 3,
+                                   "completion_tokens": 4, "total_tokens": 7}
+
+
+class TestChatRateLimit:
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(ai_endpoints, "rate_limiter",
+                            make_limiter(requests=2, tokens=10))
+        monkeypatch.setattr(ai_endpoints, "usage_ledger", UsageLedger())
+        mock_agent = MagicMock()
+        mock_agent.query_agent.return_value = {
+            "success": True, "responses": ["Answer"], "message_count": 1,
+            "original_query": "q",
+            "usage": {"prompt_tokens": 5, "completion_tokens": 7,
+                      "total_tokens": 12}}
+        app.dependency_overrides[get_ai_agent] = lambda: mock_agent
+        yield TestClient(app)
+        app.dependency_overrides.pop(get_ai_agent, None)
+
+    def test_429_with_headers(self, client):
+        """Test the chat endpoint returns 429 with reset headers."""
+        url = f"{settings.API_V1_STR}/ai/chat"
+        response = client.post(url, json={"message": "Hi"})
+        assert response.status_code == 200
+        assert response.headers["X-RateLimit-Limit"] == "2"
+        assert response.headers["X-RateLimit-Remaining"] == "1"
+
+        client.post(url, json={"message": "Hi"})
+        response = client.post(url, json={"message": "Hi"})
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+        assert "X-RateLimit-Reset" in response.headers
+
+    def test_session_usage(self, client):
+        """Test upstream tokens are accounted per session."""
+        url = f"{settings.API_V1_STR}/ai/chat"
+        response = client.post(url, json={"message": "Hi",
+                                          "session_id": "s1"})
+        assert response.json()["usage"]["total_tokens"] == 12
+
+        response = client.get(f"{settings.API_V1_STR}/ai/usage/s1")
+        assert response.json()["total_tokens"] == 12
+        assert response.json()["requests"] == 1
+
+        # 12 tokens exceed the session's 10 token budget
+        response = client.post(url, json={"message": "Hi",
+                                          "session_id": "s1"})
+        assert response.status_code == 429
+
+        response = client.get(f"{settings.API_V1_STR}/ai/usage/unknown")
+        assert response.status_code == 404
+
+    def test_batch_larger_than_limit(self, client):
+        """Test a batch of more items than the IP limit runs the items
+        within it and returns the rest as retryable errors."""
+        url = f"{settings.API_V1_STR}/ai/chat/batch"
+        items = [{"id": str(i), "message": "Hi"} for i in range(5)]
+        response = client.post(url, json={"items": items, "parallelism": 1})
+        assert response.status_code == 200
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert [result["success"] for result in results] == [
+            True, True, False, False, False]
+        assert all(result["retryable"] for result in results[2:])
+
+        # The limit is spent now, so a resumed batch is refused outright
+        response = client.post(url, json={"items": items,
+                                          "completed_ids": ["0", "1"]})
+        assert response.status_code == 429
@@ -0,0 +1,242 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import ai_agent as ai_endpoints
+from app.core.ai_agent import BirdNestAIAgent
+from app.core.config import settings
+from app.core.resilience import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConcurrencyLimitExceeded,
+)
+from app.main import app
+from benchmarks.fake_agent import FakeAgentConfig, FakeAgentServer
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    upstream = FakeAgentServer(
+        FakeAgentConfig(completion_tokens=0)).start()
+    monkeypatch.setattr(settings, "AGENT_ENDPOINT", upstream.url)
+    monkeypatch.setattr(settings, "AGENT_ACCESS_KEY", "test-key")
+    monkeypatch.setattr(settings, "AGENT_TIMEOUT", 0.5)
+    yield upstream
+    upstream.stop()
+
+
+@pytest.fixture
+def agent(fake_upstream):
+    return BirdNestAIAgent(
+        breaker=CircuitBreaker(failure_threshold=2, recovery_timeout=0.2),
+        limiter=AdaptiveConcurrencyLimiter(initial_limit=2, max_queue=1,
+                                           queue_timeout=0.2),
+    )
+
+
+class TestCircuitBreaker:
+
+    def test_opens_after_consecutive_failures(self):
+        """Test the breaker opens at the threshold and fails fast."""
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        with pytest.raises(CircuitOpenError) as exc_info:
+            breaker.before_call()
+        assert exc_info.value.retry_after > 0
+
+    def test_half_open_probe_closes_breaker(self):
+        """Test a successful probe after the recovery timeout closes it."""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+        breaker.before_call()
+        breaker.record_failure()
+        time.sleep(0.06)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        breaker.before_call()
+        # Only one probe is allowed at a time
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_call_from_before_trip_ignored(self):
+        """Test only the half-open probe decides, not calls admitted
+        before the breaker opened."""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+        slow = breaker.before_call()
+        breaker.record_failure(breaker.before_call())
+        breaker.record_success(slow)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        time.sleep(0.06)
+        probe = breaker.before_call()
+        breaker.record_failure(slow)
+        breaker.cancel(slow)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success(probe)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestAdaptiveConcurrencyLimiter:
+
+    def test_rejects_when_queue_full(self):
+        """Test callers beyond limit + queue are rejected immediately."""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_queue=1,
+                                             queue_timeout=1.0)
+        limiter.acquire()
+        waiter = threading.Thread(target=limiter.acquire)
+        waiter.start()
+        while limiter.snapshot()["queued"] == 0:
+            time.sleep(0.001)
+
+        with pytest.raises(ConcurrencyLimitExceeded):
+            limiter.acquire()
+
+        limiter.release(0.01)
+        waiter.join()
+        assert limiter.snapshot()["in_flight"] == 1
+
+    def test_queue_timeout(self):
+        """Test a queued caller gives up after queue_timeout."""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1,
+                                             queue_timeout=0.05)
+        limiter.acquire()
+        with pytest.raises(ConcurrencyLimitExceeded):
+            limiter.acquire()
+
+    def test_limit_adapts_to_latency(self):
+        """Test the limit shrinks on latency inflation and grows back."""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=10, max_limit=20)
+        limiter.acquire()
+        limiter.release(0.01)
+
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(0.5)
+        assert limiter.limit < 10
+
+        shrunk = limiter.limit
+        for _ in range(200):
+            for _ in range(limiter.limit):
+                limiter.acquire()
+            for _ in range(limiter.limit):
+                limiter.release(0.01)
+        assert limiter.limit > shrunk
+
+    def test_dropped_calls_shrink_limit(self):
+        """Test dropped calls back the limit off multiplicatively."""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=10)
+        limiter.acquire()
+        limiter.release(0.01, dropped=True)
+        assert limiter.limit == 9
+
+
+class TestAgentAgainstFakeUpstream:
+
+    def test_successful_query(self, agent, fake_upstream):
+        """Test a query goes through to the upstream."""
+        result = agent.query_agent("How fast is a falcon?")
+        assert result["success"] is True
+        assert result["responses"] == ["echo: How fast is a falcon?"]
+        assert agent.breaker.state == CircuitBreaker.CLOSED
+
+    def test_errors_open_circuit(self, agent, fake_upstream):
+        """Test upstream 5xx errors open the breaker and stop traffic."""
+        fake_upstream.config.status = 500
+        for _ in range(2):
+            result = agent.query_agent("Hello")
+            assert result["success"] is False
+        assert agent.breaker.state == CircuitBreaker.OPEN
+
+        requests_before = fake_upstream.requests
+        with pytest.raises(CircuitOpenError):
+            agent.query_agent("Hello")
+        assert fake_upstream.requests == requests_before
+
+    def test_circuit_recovers(self, agent, fake_upstream):
+        """Test the breaker closes once the upstream is healthy again."""
+        fake_upstream.config.status = 503
+        for _ in range(2):
+            agent.query_agent("Hello")
+        fake_upstream.config.status = None
+        time.sleep(0.25)
+
+        result = agent.query_agent("Hello")
+        assert result["success"] is True
+        assert agent.breaker.state == CircuitBreaker.CLOSED
+
+    def test_client_errors_do_not_open_circuit(self, agent, fake_upstream):
+        """Test 4xx responses are not counted as upstream failures."""
+        fake_upstream.config.status = 400
+        for _ in range(3):
+            assert agent.query_agent("Hello")["success"] is False
+        assert agent.breaker.state == CircuitBreaker.CLOSED
+
+    def test_latency_timeouts_open_circuit(self, agent, fake_upstream):
+        """Test slow responses time out and count as failures."""
+        fake_upstream.config.latency = 1.0
+        for _ in range(2):
+            result = agent.query_agent("Hello")
+            assert result["success"] is False
+        assert agent.breaker.state == CircuitBreaker.OPEN
+        assert agent.limiter.limit < 2
+
+
+class TestChatEndpointFailFast:
+
+    def test_open_circuit_returns_503(self, agent, fake_upstream, monkeypatch):
+        """Test /ai/chat fails fast with Retry-After and /ai/health
+        reports the open circuit."""
+        monkeypatch.setattr(ai_endpoints, "ai_agent", agent)
+        monkeypatch.setattr(ai_endpoints, "upstream_breaker", agent.breaker)
+        monkeypatch.setattr(ai_endpoints, "upstream_limiter", agent.limiter)
+        fake_upstream.config.status = 500
+        client = TestClient(app)
+
+        for _ in range(2):
+            response = client.post(f"{settings.API_V1_STR}/ai/chat",
+                                   json={"message": "Hello"})
+            assert response.status_code == 200
+
+        response = client.post(f"{settings.API_V1_STR}/ai/chat",
+                               json={"message": "Hello"})
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+
+        response = client.get(f"{settings.API_V1_STR}/ai/health")
+        data = response.json()
+        assert data["status"] == "unhealthy"
+        assert data["circuit_state"] == "open"
+        assert data["upstream"]["circuit"]["rejected"] == 1
+
+    def test_failed_init_is_not_retried(self, monkeypatch):
+        """Test a failed initialization fails fast until the backoff ends."""
+        monkeypatch.setattr(ai_endpoints, "ai_agent", None)
+        monkeypatch.setattr(ai_endpoints, "_init_failed_at", None)
+        monkeypatch.setattr(settings, "AGENT_ENDPOINT", "")
+        calls = []
+        original_init = BirdNestAIAgent.__init__
+
+        def counting_init(self, *args, **kwargs):
+            calls.append(1)
+            original_init(self, *args, **kwargs)
+
+        monkeypatch.setattr(BirdNestAIAgent, "__init__", counting_init)
+        client = TestClient(app)
+        for _ in range(3):
+            response = client.post(f"{settings.API_V1_STR}/ai/chat",
+                                   json={"message": "Hello"})
+            assert response.status_code == 503
+            assert "Retry-After" in response.headers
+        assert len(calls) == 1
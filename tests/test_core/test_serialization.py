@@ -0,0 +1,132 @@
+import json
+from datetime import datetime
+
+import pytest
+from starlette.responses import JSONResponse
+
+from app.core import serialization
+from app.core.compression import bird_documents
+from app.core.config import settings
+from benchmarks import bench_serialization
+
+PREFIX = settings.API_V1_STR
+
+
+@pytest.fixture
+def birds(client, sample_bird_data):
+    ids = ["serialization-bird-1", "serialization-bird-2"]
+    for bird_id in ids:
+        client.delete(f"{PREFIX}/birds/{bird_id}")
+        data = dict(sample_bird_data, bird_id=bird_id,
+                    name="Serialization Falcon")
+        assert client.post(f"{PREFIX}/birds/", json=data).status_code == 200
+    yield ids
+    for bird_id in ids:
+        client.delete(f"{PREFIX}/birds/{bird_id}")
+
+
+def check(schema, value, spec, path="$"):
+    """Validate ``value`` against the OpenAPI subset FastAPI emits."""
+    if "$ref" in schema:
+        name = schema["$ref"].rsplit("/", 1)[-1]
+        return check(spec["components"]["schemas"][name], value, spec, path)
+    if "anyOf" in schema:
+        errors = []
+        for option in schema["anyOf"]:
+            try:
+                return check(option, value, spec, path)
+            except AssertionError as e:
+                errors.append(str(e))
+        raise AssertionError(f"{path}: no anyOf option matched: {errors}")
+
+    kind = schema.get("type")
+    types = {"object": dict, "array": list, "string": str, "boolean": bool,
+             "integer": int, "number": (int, float), "null": type(None)}
+    if kind is not None:
+        assert isinstance(value, types[kind]), f"{path}: not {kind}"
+        assert kind == "boolean" or not isinstance(value, bool), path
+    if schema.get("format") == "date-time":
+        datetime.fromisoformat(value)
+    if kind == "object":
+        for name in schema.get("required", []):
+            assert name in value, f"{path}: missing {name}"
+        for name, item in value.items():
+            if name in schema.get("properties", {}):
+                check(schema["properties"][name], item, spec,
+                      f"{path}.{name}")
+    if kind == "array":
+        for i, item in enumerate(value):
+            check(schema.get("items", {}), item, spec, f"{path}[{i}]")
+
+
+def response_schema(spec, path):
+    return spec["paths"][path]["get"]["responses"]["200"]["content"][
+        "application/json"]["schema"]
+
+
+class TestOpenAPICompatibility:
+
+    @pytest.mark.parametrize("path, url", [
+        ("/birds/", "/birds/"),
+        ("/birds/{bird_id}", "/birds/serialization-bird-1"),
+        ("/birds/search/name", "/birds/search/name?name=Serialization"),
+        ("/birds/search/scientific",
+         "/birds/search/scientific?scientific_name=Falco"),
+        ("/birds/filter/conservation",
+         "/birds/filter/conservation?status=least-concern"),
+    ])
+    def test_fast_responses_match_schema(self, client, birds, path, url):
+        """Test fast-path responses validate against the OpenAPI schema."""
+        spec = client.get(f"{PREFIX}/openapi.json").json()
+        response = client.get(f"{PREFIX}{url}")
+        assert response.status_code == 200
+        body = response.json()
+        if isinstance(body, list):
+            assert body, "expected at least one bird"
+        check(response_schema(spec, f"{PREFIX}{path}"), body, spec)
+
+    def test_same_content_as_response_model(self, client, birds,
+                                            monkeypatch):
+        """Test the fast and response_model paths return the same JSON."""
+        urls = [f"{PREFIX}/birds/?limit=100",
+                f"{PREFIX}/birds/serialization-bird-2"]
+        fast = [client.get(url).json() for url in urls]
+        monkeypatch.setattr(settings, "FAST_SERIALIZATION", False)
+        bird_documents.clear()
+        try:
+            slow = [client.get(url).json() for url in urls]
+        finally:
+            bird_documents.clear()
+        assert fast == slow
+
+
+class TestEncoder:
+
+    def test_stdlib_fallback_matches_starlette(self, monkeypatch):
+        """Test the fallback encoder renders like JSONResponse."""
+        monkeypatch.setattr(serialization, "orjson", None)
+        content = {"name": "Faucon pèlerin", "values": [1, 2.5, None],
+                   "nested": {"ok": True}}
+        assert serialization.dumps(content) == JSONResponse(content).body
+        assert serialization.dumps(
+            {"at": datetime(2025, 1, 1, 12, 30, 0, 5)}) == (
+            b'{"at":"2025-01-01T12:30:00.000005"}')
+
+    @pytest.mark.skipif(serialization.orjson is None,
+                        reason="orjson not installed")
+    def test_orjson_matches_fallback(self, monkeypatch):
+        """Test orjson and the fallback agree on bird content."""
+        content = {"at": datetime(2025, 1, 1), "name": "Faucon pèlerin",
+                   "list": [{"a": 1}, {"b": [True, None]}]}
+        fast = serialization.dumps(content)
+        monkeypatch.setattr(serialization, "orjson", None)
+        assert fast == serialization.dumps(content)
+
+
+def test_serialization_benchmark_runs():
+    """Test the microbenchmark runs on a small catalog."""
+    results = bench_serialization.run(pages=1, seed=0)
+    assert results["page_size"] == 100
+    assert results["list_fast_stdlib_us"] > 0
+    assert results["get_response_model_us"] > 0
+    assert json.dumps(results)
@@ -0,0 +1,167 @@
+import threading
+import time
+import tracemalloc
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from app.api.v1.endpoints import ai_agent as ai_endpoints
+from app.api.v1.endpoints.ai_agent import get_ai_agent
+from app.core.config import settings
+from app.core.sessions import ConversationSessionStore, estimate_tokens
+from app.main import app
+from app.models.base import BaseModel
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/sessions.db")
+    BaseModel.metadata.create_all(bind=engine)
+    return engine
+
+
+class TestConversationSessionStore:
+
+    def test_history_as_messages(self):
+        """Test turns come back as a chat messages array."""
+        store = ConversationSessionStore()
+        store.append_exchange("s1", "Hi", "Hello!")
+        store.append_exchange("s1", "Falcon speed?", "320 km/h")
+
+        assert store.get_history("s1") == [
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "Hello!"},
+            {"role": "user", "content": "Falcon speed?"},
+            {"role": "assistant", "content": "320 km/h"},
+        ]
+        assert store.get_history("other") == []
+
+    def test_lru_eviction(self):
+        """Test the least recently used session is evicted."""
+        store = ConversationSessionStore(max_sessions=2)
+        store.append_exchange("a", "q", "r")
+        store.append_exchange("b", "q", "r")
+        store.get_history("a")
+        store.append_exchange("c", "q", "r")
+
+        stats = store.stats()
+        assert stats["sessions"] == 2
+        assert stats["evicted_sessions"] == 1
+        assert stats["turns"] == 4
+        assert store.get_history("a") != []
+        assert store.get_history("b") == []
+
+    def test_token_budget_rolls_window(self):
+        """Test oldest turns are dropped to fit the token budget."""
+        store = ConversationSessionStore(max_tokens=100)
+        message = "x" * 100  # 26 estimated tokens
+        for i in range(5):
+            store.append_exchange("s", f"{i} {message}", message)
+
+        history = store.get_history("s")
+        assert sum(estimate_tokens(m["content"]) for m in history) <= 100
+        assert history[-1]["content"] == message
+        assert history[-2]["content"].startswith("4 ")
+        assert store.stats()["trimmed_turns"] == 10 - len(history)
+
+    def test_persistence(self, engine):
+        """Test sessions are reloaded from SQLite after eviction."""
+        store = ConversationSessionStore(max_sessions=1, engine=engine)
+        store.append_exchange("a", "first", "reply")
+        store.append_exchange("b", "other", "reply")
+
+        assert store.get_history("a") == [
+            {"role": "user", "content": "first"},
+            {"role": "assistant", "content": "reply"},
+        ]
+
+        restarted = ConversationSessionStore(engine=engine)
+        assert len(restarted.get_history("b")) == 2
+
+    def test_persistence_trims_rows(self, engine):
+        """Test trimmed turns are deleted from SQLite too."""
+        store = ConversationSessionStore(max_tokens=30, engine=engine)
+        for i in range(5):
+            store.append_exchange("s", "y" * 40, "z" * 40)
+
+        restarted = ConversationSessionStore(max_tokens=1000, engine=engine)
+        assert restarted.get_history("s") == store.get_history("s")
+
+    def test_database_io_outside_store_lock(self, engine):
+        """Test one session's database round-trip does not block the
+        others, or the stats."""
+        store = ConversationSessionStore(engine=engine)
+        store.append_exchange("b", "q", "r")
+        table, entered, release = store._table(), threading.Event(), \
+            threading.Event()
+
+        def slow_table():
+            if threading.current_thread().name == "slow":
+                entered.set()
+                release.wait(5)
+            return table
+
+        store._table = slow_table
+        slow = threading.Thread(target=store.get_history, args=("a",),
+                                name="slow")
+        slow.start()
+        try:
+            assert entered.wait(5)
+            started = time.monotonic()
+            assert store.stats()["sessions"] == 2
+            store.append_exchange("b", "q2", "r2")
+            assert len(store.get_history("b")) == 4
+            assert time.monotonic() - started < 1
+        finally:
+            release.set()
+            slow.join(5)
+
+    def test_memory_report_at_10k_sessions(self):
+        """Test memory use is bounded and reported for 10k sessions."""
+        store = ConversationSessionStore(max_sessions=10000, max_tokens=200)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(12000):
+            for turn in range(3):
+                store.append_exchange(f"session-{i}", f"question {turn} " * 5,
+                                      f"answer {turn} " * 10)
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        stats = store.stats()
+        assert stats["sessions"] == 10000
+        assert stats["evicted_sessions"] == 2000
+        assert stats["tokens"] <= 10000 * 200
+        # The estimate should be in the right ballpark of real usage
+        assert used / 2 < stats["approx_bytes"] < used * 2
+
+
+class TestChatSessions:
+
+    def test_chat_sends_history(self, monkeypatch):
+        """Test /ai/chat sends prior session turns to the agent."""
+        store = ConversationSessionStore()
+        monkeypatch.setattr(ai_endpoints, "session_store", store)
+        mock_agent = MagicMock()
+        mock_agent.query_agent.return_value = {
+            "success": True, "responses": ["Answer"], "message_count": 1,
+            "original_query": "q"}
+        app.dependency_overrides[get_ai_agent] = lambda: mock_agent
+        try:
+            client = TestClient(app)
+            for message in ("first", "second"):
+                response = client.post(
+                    f"{settings.API_V1_STR}/ai/chat",
+                    json={"message": message, "session_id": "abc"})
+                assert response.status_code == 200
+        finally:
+            app.dependency_overrides.pop(get_ai_agent, None)
+
+        history = mock_agent.query_agent.call_args.kwargs["history"]
+        assert history == [
+            {"role": "user", "content": "first"},
+            {"role": "assistant", "content": "Answer"},
+        ]
+        assert store.stats()["turns"] == 4
@@ -0,0 +1,209 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.snapshot import (
+    CatalogSnapshot,
+    SnapshotManager,
+    SnapshotRow,
+    catalog_snapshot,
+)
+from app.core.database import Base
+from app.models.bird import Bird
+from benchmarks import bench_snapshot
+
+
+def row(id_, bird_id, name, scientific_name="", status="least-concern"):
+    return SnapshotRow(id_, bird_id, name.lower(), scientific_name.lower(),
+                       status, json.dumps({"bird_id": bird_id}).encode())
+
+
+def ids(content: bytes):
+    return [bird["bird_id"] for bird in json.loads(content)]
+
+
+@pytest.fixture
+def snapshot():
+    return CatalogSnapshot([
+        row(1, "falcon", "Peregrine Falcon", "Falco peregrinus"),
+        row(2, "kestrel", "American Kestrel", "Falco sparverius",
+            "endangered"),
+        row(3, "owl", "Snowy Owl", "Bubo scandiacus"),
+    ], seq=7)
+
+
+class TestCatalogSnapshot:
+
+    def test_reads(self, snapshot):
+        """Test every read is answered from the snapshot's documents."""
+        assert len(snapshot) == 3
+        assert json.loads(snapshot.response(snapshot.get("owl"))) == {
+            "success": True, "data": {"bird_id": "owl"}}
+        assert snapshot.get("heron") is None
+        assert ids(snapshot.page(1, 5)) == ["kestrel", "owl"]
+        assert ids(snapshot.batch(["owl", "heron", "falcon", "owl"])) == [
+            "owl", "falcon"]
+        assert ids(snapshot.get_by_conservation_status("endangered")) == [
+            "kestrel"]
+        assert snapshot.page(10, 5) == b"[]"
+
+    def test_search(self, snapshot):
+        """Test case-insensitive substring search, each bird once."""
+        assert ids(snapshot.search_by_name("FAL")) == ["falcon"]
+        assert ids(snapshot.search_by_name("e")) == ["falcon", "kestrel"]
+        assert ids(snapshot.search_by_name("l")) == ["falcon", "kestrel",
+                                                     "owl"]
+        assert ids(snapshot.search_by_scientific_name("falco ")) == [
+            "falcon", "kestrel"]
+        # A query never spans two names
+        assert ids(snapshot.search_by_name("falcon\x00american")) == []
+        assert ids(snapshot.search_by_name("nam")) == []
+
+    def test_apply_copy_on_write(self, snapshot):
+        """Test changes produce a new snapshot and leave the old one as
+        it was."""
+        updated = snapshot.apply({
+            "kestrel": row(2, "kestrel", "Kestrel", status="vulnerable"),
+            "falcon": None,
+            "heron": row(9, "heron", "Grey Heron"),
+        }, seq=12)
+        assert updated.seq == 12
+        assert ids(updated.page()) == ["kestrel", "owl", "heron"]
+        assert ids(updated.get_by_conservation_status("vulnerable")) == [
+            "kestrel"]
+        assert ids(updated.search_by_name("heron")) == ["heron"]
+        # Unchanged documents are shared
+        assert updated.get("owl").document is snapshot.get("owl").document
+
+        assert ids(snapshot.page()) == ["falcon", "kestrel", "owl"]
+        assert snapshot.seq == 7
+
+    def test_apply_document_changes_shares_indexes(self, snapshot):
+        """Test changes that keep names and statuses only replace the
+        documents."""
+        changed = SnapshotRow(*snapshot.get("owl")[:5], b'{"bird_id":"new"}')
+        updated = snapshot.apply({"owl": changed}, seq=8)
+        assert updated.get("owl") is changed
+        assert ids(updated.search_by_name("owl")) == ["new"]
+        assert updated._names is snapshot._names
+        assert updated._positions is snapshot._positions
+        assert ids(snapshot.page()) == ["falcon", "kestrel", "owl"]
+
+
+class TestSnapshotManager:
+
+    def test_load_and_refresh(self, tmp_path, sample_bird_data):
+        """Test a loaded snapshot picks up ORM writes from the change log."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'snapshot.db'}")
+        Base.metadata.create_all(bind=engine)
+        session = sessionmaker(bind=engine)
+        fields = {key: value for key, value in sample_bird_data.items()
+                  if key != "id"}
+        with session() as db:
+            db.add(Bird(**fields))
+            db.commit()
+
+        manager = SnapshotManager(bind=engine)
+        assert manager.refresh() is None
+        first = manager.load()
+        assert ids(first.page()) == ["peregrine-falcon"]
+        assert manager.refresh() is None
+
+        with session() as db:
+            db.add(Bird(**dict(fields, bird_id="second-falcon")))
+            db.query(Bird).filter(Bird.bird_id == "peregrine-falcon").one(
+                ).name = "Renamed"
+            db.commit()
+        second = manager.refresh()
+        assert manager.snapshot is second
+        assert second.seq > first.seq
+        assert ids(second.page()) == ["peregrine-falcon", "second-falcon"]
+        assert json.loads(second.get("peregrine-falcon").document)[
+            "name"] == "Renamed"
+        assert ids(first.page()) == ["peregrine-falcon"]
+
+        with session() as db:
+            db.delete(db.query(Bird).filter(
+                Bird.bird_id == "second-falcon").one())
+            db.commit()
+        assert ids(manager.refresh().page()) == ["peregrine-falcon"]
+
+    def test_writes_applied_by_next_read(self, tmp_path, sample_bird_data,
+                                         monkeypatch):
+        """Test writes through this process cost nothing until the next
+        read, which applies all of them at once."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'snapshot.db'}")
+        Base.metadata.create_all(bind=engine)
+        session = sessionmaker(bind=engine)
+        fields = {key: value for key, value in sample_bird_data.items()
+                  if key != "id"}
+        manager = SnapshotManager(bind=engine)
+        manager.load()
+        refreshes = []
+        refresh = manager.refresh
+        monkeypatch.setattr(manager, "refresh",
+                            lambda: refreshes.append(1) or refresh())
+
+        with session() as db:
+            for i in range(3):
+                bird = Bird(**dict(fields, bird_id=f"falcon-{i}"))
+                db.add(bird)
+                db.commit()
+                manager.bird_written("create", bird)
+        assert refreshes == []
+        assert len(manager.current()) == 3
+        assert len(manager.current()) == 3
+        assert refreshes == [1]
+
+
+class TestSnapshotReads:
+
+    @pytest.fixture
+    def birds(self, client: TestClient, sample_bird_data):
+        ids = ["snapshot-bird-1", "snapshot-bird-2"]
+        for bird_id in ids:
+            client.delete(f"{settings.API_V1_STR}/birds/{bird_id}")
+            client.post(f"{settings.API_V1_STR}/birds/",
+                        json=dict(sample_bird_data, bird_id=bird_id))
+        yield ids
+        catalog_snapshot.unload()
+        for bird_id in ids:
+            client.delete(f"{settings.API_V1_STR}/birds/{bird_id}")
+
+    def test_same_responses(self, client: TestClient, birds):
+        """Test reads from the snapshot return what the database does,
+        and writes are visible to the next read."""
+        prefix = f"{settings.API_V1_STR}/birds"
+        urls = [f"{prefix}/?limit=100", f"{prefix}/{birds[0]}",
+                f"{prefix}/batch?ids={birds[1]}&ids={birds[0]}",
+                f"{prefix}/search/name?name=peregrine",
+                f"{prefix}/search/scientific?scientific_name=falco",
+                f"{prefix}/filter/conservation?status=least-concern",
+                # Wildcards are literal on both paths
+                f"{prefix}/search/name?name=%25%25",
+                f"{prefix}/search/scientific?scientific_name=__"]
+        database = [client.get(url).json() for url in urls]
+        catalog_snapshot.load()
+        assert [client.get(url).json() for url in urls] == database
+
+        client.put(f"{prefix}/{birds[0]}", json={"name": "Renamed"})
+        assert client.get(f"{prefix}/{birds[0]}").json()["data"][
+            "name"] == "Renamed"
+        client.delete(f"{prefix}/{birds[1]}")
+        assert client.get(f"{prefix}/{birds[1]}").status_code == 404
+
+
+class TestBenchmark:
+
+    def test_smoke(self, tmp_path):
+        """Test the snapshot benchmark runs at a tiny scale."""
+        results = bench_snapshot.run(count=50, seconds=0.05, seed=1,
+                                     data_dir=str(tmp_path))
+        assert results["birds"] == 50
+        assert results["load_seconds"] > 0
+        assert results["file"]["compile_seconds"] > 0
+        assert {r["operation"] for r in results["reads"]} >= {"get", "list"}
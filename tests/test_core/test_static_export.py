@@ -0,0 +1,120 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core import static_export
+from app.core.config import settings
+from app.core.database import Base
+from app.core.static_export import export, read_manifest
+from app.models.bird import Bird
+from benchmarks import bench_export
+
+PREFIX = f"{settings.API_V1_STR}/birds"
+
+
+@pytest.fixture
+def catalog(tmp_path, sample_bird_data, monkeypatch):
+    """Three birds last updated in the past, in pages of two."""
+    monkeypatch.setattr(static_export, "PAGE_SIZE", 2)
+    engine = create_engine(f"sqlite:///{tmp_path / 'export.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)
+    fields = {key: value for key, value in sample_bird_data.items()
+              if key != "id"}
+    with session() as db:
+        for day, bird_id in enumerate(["falcon", "kestrel", "owl"], 1):
+            db.add(Bird(**dict(fields, bird_id=bird_id, name=bird_id.title(),
+                               updated_at=datetime(2020, 1, day))))
+        db.commit()
+    return engine, session
+
+
+def read(directory, path):
+    with open(os.path.join(directory, path)) as f:
+        return json.load(f)
+
+
+class TestStaticExport:
+
+    def test_export(self, tmp_path, catalog):
+        """Test every bird, list page and index is exported under content
+        hashed names, with a manifest of the routes they serve."""
+        engine, _ = catalog
+        directory = str(tmp_path / "static")
+        result = export(directory, bind=engine)
+        assert result["birds"] == result["birds_rendered"] == 3
+        assert result["pages"] == 2
+
+        manifest = read_manifest(directory)
+        routes = manifest["routes"]
+        falcon = routes[f"{PREFIX}/falcon"]
+        assert falcon.startswith("birds/falcon.")
+        response = read(directory, falcon)
+        assert response["success"] is True
+        assert response["data"]["bird_id"] == "falcon"
+        assert routes[f"{PREFIX}/"] == routes[f"{PREFIX}/?skip=0&limit=2"]
+        assert [bird["bird_id"] for bird in read(
+            directory, routes[f"{PREFIX}/?skip=2&limit=2"])] == ["owl"]
+        assert read(directory, manifest["indexes"]["search"])[0] == [
+            "falcon", "Falcon", "Falco peregrinus"]
+        assert read(directory, manifest["indexes"]["status"][
+            "least-concern"]) == ["falcon", "kestrel", "owl"]
+
+    def test_incremental(self, tmp_path, catalog):
+        """Test a later export renders only the birds updated since, keeps
+        the previous export's files, and removes older ones."""
+        engine, session = catalog
+        directory = str(tmp_path / "static")
+        export(directory, bind=engine)
+        first = read_manifest(directory)["routes"]
+
+        with session() as db:
+            db.query(Bird).filter(Bird.bird_id == "falcon").one(
+                ).name = "Renamed"
+            db.commit()
+        result = export(directory, bind=engine)
+        assert result["birds_rendered"] == 1
+        assert result["pages_rendered"] == 1
+        second = read_manifest(directory)["routes"]
+        assert second[f"{PREFIX}/falcon"] != first[f"{PREFIX}/falcon"]
+        assert second[f"{PREFIX}/owl"] == first[f"{PREFIX}/owl"]
+        assert second[f"{PREFIX}/kestrel"] == first[f"{PREFIX}/kestrel"]
+        assert read(directory, second[f"{PREFIX}/"])[0]["name"] == "Renamed"
+        # Still referenced by the previous manifest
+        assert os.path.exists(os.path.join(directory,
+                                           first[f"{PREFIX}/falcon"]))
+
+        with session() as db:
+            db.delete(db.query(Bird).filter(Bird.bird_id == "kestrel").one())
+            db.commit()
+        result = export(directory, bind=engine)
+        assert result["birds_removed"] == 1
+        third = read_manifest(directory)["routes"]
+        assert f"{PREFIX}/kestrel" not in third
+        assert f"{PREFIX}/?skip=2&limit=2" not in third
+        assert [bird["bird_id"] for bird in read(
+            directory, third[f"{PREFIX}/"])] == ["falcon", "owl"]
+        assert not os.path.exists(os.path.join(directory,
+                                               first[f"{PREFIX}/falcon"]))
+
+    def test_process_pool(self, tmp_path, catalog):
+        """Test a pool of worker processes exports the same files."""
+        engine, _ = catalog
+        export(str(tmp_path / "one"), bind=engine)
+        export(str(tmp_path / "pool"), bind=engine, workers=2)
+        assert (read_manifest(str(tmp_path / "one"))["routes"]
+                == read_manifest(str(tmp_path / "pool"))["routes"])
+
+
+class TestBenchmark:
+
+    def test_smoke(self, tmp_path):
+        """Test the export benchmark runs at a tiny scale."""
+        results = bench_export.run(count=30, workers=1, changed=3, seed=1,
+                                   data_dir=str(tmp_path))
+        assert results["birds"] == 30
+        assert results["incremental"]["birds_rendered"] == 3
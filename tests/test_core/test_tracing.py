@@ -0,0 +1,152 @@
+import json
+
+import pytest
+
+from app.core import tracing
+from app.core.ai_agent import BirdNestAIAgent
+from app.core.config import settings
+from app.core.resilience import AdaptiveConcurrencyLimiter, CircuitBreaker
+from app.core.tracing import (
+    FileSpanExporter,
+    NOOP_SPAN,
+    current_span,
+    format_traceparent,
+    parse_traceparent,
+    span,
+    tracer,
+)
+from benchmarks.fake_agent import FakeAgentConfig, FakeAgentServer
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+@pytest.fixture
+def traces(tmp_path, monkeypatch):
+    """Trace every request into a temporary file; yields a reader."""
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracer, "enabled", True)
+    monkeypatch.setattr(tracer, "sample_rate", 1.0)
+    monkeypatch.setattr(tracer, "exporter", FileSpanExporter(str(path)))
+
+    def read():
+        if not path.exists():
+            return []
+        return [json.loads(line)["resourceSpans"][0]["scopeSpans"][0][
+            "spans"] for line in path.read_text().splitlines()]
+    return read
+
+
+def by_name(spans):
+    return {s["name"]: s for s in spans}
+
+
+class TestTraceparent:
+
+    def test_round_trip(self):
+        """Test W3C traceparent headers are parsed and formatted."""
+        header = format_traceparent(TRACE_ID, PARENT_ID, True)
+        assert header == f"00-{TRACE_ID}-{PARENT_ID}-01"
+        assert parse_traceparent(header) == (TRACE_ID, PARENT_ID, True)
+        assert parse_traceparent(header[:-1] + "0") == (
+            TRACE_ID, PARENT_ID, False)
+
+    @pytest.mark.parametrize("value", [
+        None, "", "garbage", f"01-{TRACE_ID}-{PARENT_ID}-01",
+        f"00-{'0' * 32}-{PARENT_ID}-01", f"00-{TRACE_ID}-{'0' * 16}-01"])
+    def test_invalid_headers_ignored(self, value):
+        """Test malformed or all-zero ids start a new trace."""
+        assert parse_traceparent(value) is None
+
+    def test_noop_outside_trace(self):
+        """Test spans outside a sampled trace are the shared no-op."""
+        assert current_span.get() is None
+        with span("anything", key="value") as s:
+            assert s is NOOP_SPAN
+        assert tracing.outgoing_headers() == {}
+
+
+class TestTracingMiddleware:
+
+    def test_request_spans_exported(self, client, traces):
+        """Test endpoint and CRUD spans nest under the request span."""
+        response = client.get(f"{settings.API_V1_STR}/birds/no-such-bird")
+        assert response.status_code == 404
+
+        [spans] = traces()
+        spans = by_name(spans)
+        root = spans[f"GET {settings.API_V1_STR}/birds/{{bird_id}}"]
+        endpoint = spans["birds.read_bird"]
+        crud = spans["CRUDBird.get_with_version"]
+        assert "parentSpanId" not in root
+        assert endpoint["parentSpanId"] == root["spanId"]
+        assert crud["parentSpanId"] == endpoint["spanId"]
+        assert endpoint["status"]["code"] == tracing.STATUS_ERROR
+        assert {"key": "http.status_code", "value": {"intValue": "404"}} in (
+            root["attributes"])
+        assert response.headers["traceparent"] == format_traceparent(
+            root["traceId"], root["spanId"], True)
+
+    def test_incoming_trace_continued(self, client, traces):
+        """Test a sampled incoming traceparent keeps its trace id."""
+        response = client.get(
+            f"{settings.API_V1_STR}/birds/",
+            headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+        assert parse_traceparent(response.headers["traceparent"])[0] == (
+            TRACE_ID)
+        [spans] = traces()
+        root = by_name(spans)[f"GET {settings.API_V1_STR}/birds/"]
+        assert root["traceId"] == TRACE_ID
+        assert root["parentSpanId"] == PARENT_ID
+
+    def test_unsampled_request(self, client, traces, monkeypatch):
+        """Test unsampled requests propagate ids but export nothing."""
+        monkeypatch.setattr(tracer, "sample_rate", 0.0)
+        response = client.get(f"{settings.API_V1_STR}/birds/")
+        assert response.headers["traceparent"].endswith("-00")
+        response = client.get(
+            f"{settings.API_V1_STR}/birds/",
+            headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"})
+        trace_id, _, sampled = parse_traceparent(
+            response.headers["traceparent"])
+        assert trace_id == TRACE_ID and not sampled
+        assert traces() == []
+
+    def test_disabled(self, client, traces, monkeypatch):
+        """Test nothing is traced or added while disabled."""
+        monkeypatch.setattr(tracer, "enabled", False)
+        response = client.get(f"{settings.API_V1_STR}/birds/")
+        assert "traceparent" not in response.headers
+        assert traces() == []
+
+
+class TestAgentSpans:
+
+    def test_query_phases(self, traces, monkeypatch):
+        """Test validation, upstream wait and processing get spans."""
+        upstream = FakeAgentServer(FakeAgentConfig()).start()
+        monkeypatch.setattr(settings, "AGENT_ENDPOINT", upstream.url)
+        monkeypatch.setattr(settings, "AGENT_ACCESS_KEY", "test-key")
+        try:
+            agent = BirdNestAIAgent(
+                breaker=CircuitBreaker(failure_threshold=100),
+                limiter=AdaptiveConcurrencyLimiter(initial_limit=2))
+            root, _ = tracer.start_root("test")
+            token = current_span.set(root)
+            try:
+                assert agent.query_agent("Hello")["success"]
+            finally:
+                current_span.reset(token)
+            tracer.finish(root)
+        finally:
+            upstream.stop()
+
+        [spans] = traces()
+        spans = by_name(spans)
+        for name in ("ai.validate_input", "ai.sanitize_input",
+                     "ai.upstream_wait", "ai.process_response"):
+            assert spans[name]["parentSpanId"] == root.span_id
+        call = spans["ai.upstream_call"]
+        assert call["kind"] == tracing.KIND_CLIENT
+        # Through the hedger's executor when hedging is enabled
+        assert call["traceId"] == root.trace_id
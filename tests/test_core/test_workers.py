@@ -0,0 +1,95 @@
+import os
+import signal
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+from app.core.database import ensure_schema, schema_lock_path
+from app.core.workers import Supervisor, worker_state
+from app.main import app
+from benchmarks import bench_workers
+
+
+class TestSchema:
+
+    def test_creates_tables_and_missing_indexes(self, tmp_path):
+        """Test ensure_schema adds indexes to a table created without them."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE birds (id INTEGER PRIMARY KEY, "
+                              "bird_id VARCHAR, name VARCHAR)"))
+        ensure_schema(engine)
+        inspector = inspect(engine)
+        assert "conversation_logs" in inspector.get_table_names()
+        names = {index["name"] for index in inspector.get_indexes("birds")}
+        assert "ix_birds_bird_id" in names
+
+        # Idempotent
+        ensure_schema(engine)
+        assert {index["name"] for index in inspect(engine).get_indexes(
+            "birds")} == names
+
+    def test_lock_path_per_database(self):
+        """Test each database URL gets its own schema lock file."""
+        assert schema_lock_path("sqlite:///a.db") == schema_lock_path(
+            "sqlite:///a.db")
+        assert schema_lock_path("sqlite:///a.db") != schema_lock_path(
+            "sqlite:///b.db")
+
+
+class TestReadiness:
+
+    def test_ready_after_startup(self):
+        """Test /health/ready answers 200 once startup has run."""
+        with TestClient(app) as client:
+            response = client.get("/health/ready")
+            assert response.status_code == 200
+            assert response.json()["pid"] == os.getpid()
+            assert client.get("/health").json()["worker"]["ready"] is True
+        assert worker_state.draining
+
+    def test_not_ready_while_draining(self):
+        """Test /health/ready answers 503 while the worker drains."""
+        with TestClient(app) as client:
+            worker_state.mark_draining()
+            response = client.get("/health/ready")
+            assert response.status_code == 503
+            assert response.json()["draining"] is True
+
+    def test_max_requests_jitter(self):
+        """Test recycle limits stay within max_requests plus the jitter."""
+        supervisor = Supervisor("app.main:app", max_requests=100,
+                                max_requests_jitter=10)
+        limits = {supervisor._worker_max_requests() for _ in range(200)}
+        assert min(limits) >= 100 and max(limits) <= 110
+        assert len(limits) > 1
+        assert Supervisor("app.main:app")._worker_max_requests() is None
+
+
+def test_workers_serve_and_recycle(tmp_path):
+    """Test the supervisor serves from several workers and recycles them."""
+    database = str(tmp_path / "workers.db")
+    port = bench_workers._free_port()
+    server = bench_workers.start_server(database, workers=2, port=port,
+                                        max_requests=3)
+    try:
+        pids = set()
+        deadline = time.monotonic() + 20
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            # Two workers that each exit after three requests; uvicorn
+            # checks the limit every 0.1s
+            while len(pids) < 4 and time.monotonic() < deadline:
+                try:
+                    response = client.get("/health",
+                                          headers={"Connection": "close"})
+                except httpx.TransportError:
+                    continue
+                assert response.status_code == 200
+                pids.add(response.json()["worker"]["pid"])
+                time.sleep(0.05)
+        assert len(pids) >= 4
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
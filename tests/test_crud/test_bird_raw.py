@@ -0,0 +1,86 @@
+import datetime
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import crud, schemas
+from app.core.serialization import bird_list, bird_response, dumps
+from benchmarks.catalog import generate_bird, populate
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool,
+                           connect_args={"check_same_thread": False})
+    populate(engine, 30, seed=7)
+    return engine
+
+
+@pytest.fixture
+def db(engine):
+    with Session(engine) as session:
+        yield session
+
+
+def orm_json(content):
+    return json.loads(dumps(content))
+
+
+class TestRawReadPath:
+
+    @pytest.mark.parametrize("skip, limit", [(0, 100), (5, 10), (25, 10),
+                                             (100, 10)])
+    def test_list_matches_orm(self, db, skip, limit):
+        """Test the raw list equals the ORM list page."""
+        raw = json.loads(crud.bird.get_multi_raw(db, skip=skip, limit=limit))
+        orm = crud.bird.get_multi(db, skip=skip, limit=limit)
+        assert raw == orm_json(bird_list(orm))
+
+    def test_document_matches_orm(self, db):
+        """Test the raw document equals the BirdResponse content."""
+        for bird in crud.bird.get_multi(db, limit=30):
+            id_, version, document = crud.bird.get_document_raw(
+                db, bird_id=bird.bird_id)
+            assert id_ == bird.id
+            assert json.loads(document) == orm_json(bird_response(bird))
+        assert crud.bird.get_document_raw(db, bird_id="no-such-bird") is None
+
+    def test_batch_matches_orm(self, db):
+        """Test batches keep the requested order and skip unknown ids."""
+        birds = crud.bird.get_multi(db, limit=30)
+        ids = [birds[7].bird_id, "no-such-bird", birds[2].bird_id,
+               birds[7].bird_id]
+        orm = crud.bird.get_batch(db, bird_ids=ids)
+        assert [b.bird_id for b in orm] == [birds[7].bird_id,
+                                            birds[2].bird_id]
+        raw = json.loads(crud.bird.get_batch_raw(db, bird_ids=ids))
+        assert raw == orm_json(bird_list(orm))
+        assert crud.bird.get_batch_raw(db, bird_ids=["missing"]) == "[]"
+
+    def test_timestamps_like_pydantic(self, db):
+        """Test stored timestamps render like the response model."""
+        bird = crud.bird.get_multi(db, limit=1)[0]
+        for value in (datetime.datetime(2025, 3, 4, 5, 6, 7),
+                      datetime.datetime(2025, 3, 4, 5, 6, 7, 120000)):
+            bird.updated_at = value
+            db.commit()
+            document = json.loads(crud.bird.get_document_raw(
+                db, bird_id=bird.bird_id)[2])
+            expected = schemas.Bird.model_validate(bird).model_dump(
+                mode="json")
+            assert document["data"]["updated_at"] == expected["updated_at"]
+            assert document["data"] == expected
+
+    def test_database_default_timestamps(self, db):
+        """Test CURRENT_TIMESTAMP defaults render like the response model."""
+        data = dict(generate_bird(1000, seed=7))
+        bird = crud.bird.create(db, obj_in=schemas.BirdCreate(**data))
+        try:
+            document = json.loads(crud.bird.get_document_raw(
+                db, bird_id=bird.bird_id)[2])
+            assert document == orm_json(bird_response(bird))
+        finally:
+            crud.bird.remove(db, id=bird.id)